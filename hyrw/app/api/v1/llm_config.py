@@ -12,6 +12,10 @@ from app.schemas.llm_config import (
 from app.schemas.common import APIResponse
 from app.schemas.pagination import PaginatedResponse
 from app.services.llm_config import llm_config_service
+from app.services.llm_gateway import llm_gateway
+from app.services.llm_response_cache import llm_response_cache
+from app.services.llm_router import llm_router
+from app.services.token_budget import output_token_stats
 
 router = APIRouter()
 
@@ -191,4 +195,81 @@ async def disable_llm_config(
         'code': 200,
         'message': '禁用成功',
         'data': LlmConfigResponse.model_validate(obj)
-    }
\ No newline at end of file
+    }
+
+@router.get("/gateway/stats", response_model=APIResponse[dict])
+async def get_llm_gateway_stats():
+    """
+    当前 worker 进程内共享的 LLM 客户端
+    """
+    return {
+        'code': 200,
+        'message': '查询成功',
+        'data': llm_gateway.stats()
+    }
+
+
+@router.get("/router/health", response_model=APIResponse[dict])
+async def get_llm_router_health():
+    """
+    当前 worker 进程内各 LLM 配置的路由健康度（延迟、错误率、冷却状态）
+    """
+    return {
+        'code': 200,
+        'message': '查询成功',
+        'data': llm_router.stats()
+    }
+
+
+@router.delete("/router/health", response_model=APIResponse[dict])
+async def reset_llm_router_health(
+    llm_config_id: Optional[int] = Query(None, description="LLM配置ID，不传则重置全部")
+):
+    """
+    重置路由健康统计，端点恢复后可立即重新参与路由
+    """
+    llm_router.reset(llm_config_id)
+    return {
+        'code': 200,
+        'message': '重置成功',
+        'data': llm_router.stats()
+    }
+
+
+@router.get("/output-tokens/stats", response_model=APIResponse[dict])
+async def get_llm_output_token_stats():
+    """
+    当前 worker 进程内各调用点的补全 token 分布与自适应 max_tokens
+    """
+    return {
+        'code': 200,
+        'message': '查询成功',
+        'data': output_token_stats.stats()
+    }
+
+
+@router.get("/response-cache/stats", response_model=APIResponse[dict])
+async def get_llm_response_cache_stats():
+    """
+    LLM 补全结果磁盘缓存统计（按调用点）
+    """
+    return {
+        'code': 200,
+        'message': '查询成功',
+        'data': llm_response_cache.stats()
+    }
+
+
+@router.delete("/response-cache/entries", response_model=APIResponse[dict])
+async def clear_llm_response_cache(
+    call_site: Optional[str] = Query(None, description="调用点，不传则清空全部")
+):
+    """
+    清除 LLM 补全结果缓存
+    """
+    cleared = llm_response_cache.clear(call_site=call_site)
+    return {
+        'code': 200,
+        'message': f'已清除 {cleared} 条缓存',
+        'data': {'cleared_count': cleared}
+    }
@@ -1,6 +1,7 @@
 from typing import List, Optional
 from fastapi import APIRouter, Query
 
+from app.schemas.background_job import BackgroundJobItem
 from app.schemas.common import APIResponse
 from app.schemas.pagination import PaginatedResponse
 from app.schemas.qa_embedding import (
@@ -9,11 +10,14 @@ from app.schemas.qa_embedding import (
     QaEmbeddingInDB,
     QaEmbeddingBatchDelete,
     QaEmbeddingImportRequest,
+    QaEmbeddingBulkImportRequest,
     QaEmbeddingWhereGenerationRequest,
     QaEmbeddingExportRequest,
+    QaEmbeddingRebuildRequest,
     QaJsonItem,
 )
-from app.services.qa_embedding import qa_embedding_service
+from app.services.job_runner import job_runner
+from app.services.qa_embedding import QA_ENRICH_JOB_TYPE, qa_embedding_service
 
 
 router = APIRouter()
@@ -84,13 +88,49 @@ def import_qa_embedding(request: QaEmbeddingImportRequest):
     return {"code": 200, "message": "导入成功", "data": result}
 
 
-@router.post("/generate-where-conditions", response_model=APIResponse[dict])
-def generate_where_conditions(request: QaEmbeddingWhereGenerationRequest):
-    result = qa_embedding_service.generate_where_conditions(
+@router.post("/bulk-import", response_model=APIResponse[dict])
+async def bulk_import_qa_embedding(request: QaEmbeddingBulkImportRequest):
+    """批量导入：同步写入问答对后立即返回，WHERE 条件与问题向量由后台任务补充，通过 /jobs/{job_id} 查询进度。"""
+    result = await qa_embedding_service.bulk_import(
+        task_id=request.task_id,
+        qa_json=request.qa_json,
+        generate_where_conditions=request.generate_where_conditions,
+        llm_config_id=request.llm_config_id,
+    )
+    if result["job"] is not None:
+        result["job"] = BackgroundJobItem.model_validate(result["job"])
+    return {"code": 200, "message": f"成功导入 {result['created_count']} 条记录", "data": result}
+
+
+@router.get("/jobs/{job_id}", response_model=APIResponse[BackgroundJobItem])
+async def get_qa_job(job_id: str):
+    """后台任务状态，progress 中为已处理条数与 WHERE 条件、向量的完成情况。"""
+    item = await job_runner.get_job(job_id, job_type=QA_ENRICH_JOB_TYPE)
+    return {"code": 200, "message": "查询成功", "data": BackgroundJobItem.model_validate(item)}
+
+
+@router.post("/jobs/{job_id}/cancel", response_model=APIResponse[BackgroundJobItem])
+async def cancel_qa_job(job_id: str):
+    """取消后台任务，已提交的批次保留。"""
+    item = await job_runner.cancel(job_id, job_type=QA_ENRICH_JOB_TYPE)
+    return {"code": 200, "message": "已请求取消", "data": BackgroundJobItem.model_validate(item)}
+
+
+@router.post("/rebuild-embeddings", response_model=APIResponse[dict])
+def rebuild_embeddings(request: QaEmbeddingRebuildRequest):
+    result = qa_embedding_service.rebuild_embeddings(task_id=request.task_id, only_missing=request.only_missing)
+    return {"code": 200, "message": f"成功计算 {result['embedded_count']} 条问题向量", "data": result}
+
+
+@router.post("/generate-where-conditions", response_model=APIResponse[BackgroundJobItem])
+async def generate_where_conditions(request: QaEmbeddingWhereGenerationRequest):
+    """提交后台任务并发生成WHERE条件，通过 /jobs/{job_id} 查询进度，结果逐批写入。"""
+    item = await qa_embedding_service.submit_where_generation(
         qa_embedding_ids=request.qa_embedding_ids,
         llm_config_id=request.llm_config_id,
+        concurrency=request.concurrency,
     )
-    return {"code": 200, "message": "生成完成", "data": result}
+    return {"code": 200, "message": "提交成功", "data": BackgroundJobItem.model_validate(item)}
 
 
 @router.post("/export", response_model=APIResponse[List[QaJsonItem]])
@@ -1,10 +1,16 @@
-from typing import List, Optional
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+import json
+import logging
 
 from fastapi import APIRouter, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
 
+from app.schemas.background_job import BackgroundJobItem
 from app.schemas.common import APIResponse
 from app.schemas.pagination import PaginatedResponse
 from app.schemas.task_chat import (
+    AnswerCacheStats,
     BatchDeleteRequest,
     ChatSessionCreateRequest,
     ChatSessionItem,
@@ -12,23 +18,34 @@ from app.schemas.task_chat import (
     ConversationFeedbackUpdateRequest,
     ConversationItem,
     TaskChatAskRequest,
+    TaskChatBatchAskRequest,
     TaskChatAskResponse,
 )
-from app.services.task_chat import task_chat_service
+from app.services.admission import admission_controller
+from app.services.answer_cache import answer_cache
+from app.services.job_runner import job_runner
+from app.services.task_chat import ASK_JOB_TYPE, task_chat_service
+from app.services.shot_gate import shot_gate
+from app.services.shot_index import shot_index_store
+from app.services.task_context import task_context_store
 
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 
 @router.post("/ask", response_model=APIResponse[TaskChatAskResponse])
-def ask_with_task(request: TaskChatAskRequest):
-    result = task_chat_service.ask(
+async def ask_with_task(request: TaskChatAskRequest):
+    result = await task_chat_service.ask(
         task_id=request.task_id,
         question=request.question,
         session_id=request.session_id,
         session_title=request.session_title,
         description=request.description,
         is_right=request.is_right,
+        speculative=request.speculative,
+        use_cache=request.use_cache,
+        refresh_result=request.refresh_result,
     )
     return {
         "code": 200,
@@ -37,6 +54,164 @@ def ask_with_task(request: TaskChatAskRequest):
     }
 
 
+@router.post("/ask/stream")
+async def ask_with_task_stream(request: TaskChatAskRequest):
+    """以 Server-Sent Events 逐阶段推送问答结果，客户端断开连接即取消本次问答。"""
+    events = task_chat_service.iter_ask_events(
+        task_id=request.task_id,
+        question=request.question,
+        session_id=request.session_id,
+        session_title=request.session_title,
+        description=request.description,
+        is_right=request.is_right,
+        speculative=request.speculative,
+        use_cache=request.use_cache,
+        refresh_result=request.refresh_result,
+    )
+    # 先取 start 事件：任务、配置、会话校验失败时仍返回普通的错误响应
+    first_event = await events.__anext__()
+    return StreamingResponse(
+        _to_sse(first_event, events),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.post("/ask/batch")
+async def ask_batch(request: TaskChatBatchAskRequest):
+    """批量问答，以 NDJSON 逐行返回：start、每个问题的 result（按完成顺序），最后是 summary 汇总。"""
+    records = task_chat_service.iter_batch_ask(
+        task_id=request.task_id,
+        questions=[item.model_dump() for item in request.questions],
+        concurrency=request.concurrency,
+        session_id=request.session_id,
+        session_title=request.session_title,
+        speculative=request.speculative,
+        use_cache=request.use_cache,
+        include_data=request.include_data,
+    )
+    first_record = await records.__anext__()
+    return StreamingResponse(
+        _to_ndjson(first_record, records),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.post("/jobs", response_model=APIResponse[BackgroundJobItem])
+async def submit_ask_job(request: TaskChatAskRequest):
+    """提交后台问答任务，立即返回任务ID，之后轮询状态并获取结果。"""
+    item = await task_chat_service.submit_ask_job(
+        task_id=request.task_id,
+        question=request.question,
+        session_id=request.session_id,
+        session_title=request.session_title,
+        description=request.description,
+        is_right=request.is_right,
+        speculative=request.speculative,
+        use_cache=request.use_cache,
+        refresh_result=request.refresh_result,
+    )
+    return {
+        "code": 200,
+        "message": "提交成功",
+        "data": BackgroundJobItem.model_validate(item),
+    }
+
+
+@router.get("/jobs", response_model=PaginatedResponse[List[BackgroundJobItem]])
+async def get_ask_jobs(
+    task_id: Optional[int] = Query(None, description="任务ID"),
+    status: Optional[str] = Query(None, description="queued/running/succeeded/failed/cancelled"),
+    page: int = Query(1, ge=1),
+    page_size: int = Query(20, ge=1, le=100),
+):
+    result = await job_runner.list_jobs(
+        job_type=ASK_JOB_TYPE,
+        task_id=task_id,
+        status=status,
+        page=page,
+        page_size=page_size,
+    )
+    items = [BackgroundJobItem.model_validate(item) for item in result["items"]]
+    return {
+        "code": 200,
+        "message": "查询成功",
+        "data": items,
+        "pagination": {
+            "page": result["page"],
+            "page_size": result["page_size"],
+            "total": result["total"],
+            "pages": result["pages"],
+        },
+    }
+
+
+@router.get("/jobs/{job_id}", response_model=APIResponse[BackgroundJobItem])
+async def get_ask_job(job_id: str):
+    """任务状态与阶段进度。"""
+    item = await job_runner.get_job(job_id, job_type=ASK_JOB_TYPE)
+    return {
+        "code": 200,
+        "message": "查询成功",
+        "data": BackgroundJobItem.model_validate(item),
+    }
+
+
+@router.get("/jobs/{job_id}/result", response_model=APIResponse[TaskChatAskResponse])
+async def get_ask_job_result(job_id: str):
+    """任务成功后返回与 /ask 相同的结果，未完成或失败时返回 409。"""
+    result = await task_chat_service.get_ask_job_result(job_id=job_id)
+    return {
+        "code": 200,
+        "message": "查询成功",
+        "data": TaskChatAskResponse.model_validate(result),
+    }
+
+
+@router.post("/jobs/{job_id}/cancel", response_model=APIResponse[BackgroundJobItem])
+async def cancel_ask_job(job_id: str):
+    """取消任务：执行中的任务会中断正在进行的 LLM 调用与目标库查询。"""
+    item = await job_runner.cancel(job_id, job_type=ASK_JOB_TYPE)
+    return {
+        "code": 200,
+        "message": "已请求取消",
+        "data": BackgroundJobItem.model_validate(item),
+    }
+
+
+async def _to_ndjson(first_record: Dict[str, Any], records: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[str]:
+    yield json.dumps(jsonable_encoder(first_record), ensure_ascii=False) + "\n"
+    try:
+        async for record in records:
+            yield json.dumps(jsonable_encoder(record), ensure_ascii=False) + "\n"
+    except Exception as exc:
+        logger.exception("[task_chat] batch stream failed")
+        yield json.dumps({"type": "error", "message": str(exc)}, ensure_ascii=False) + "\n"
+
+
+async def _to_sse(
+    first_event: Tuple[str, Dict[str, Any]],
+    events: AsyncIterator[Tuple[str, Dict[str, Any]]],
+) -> AsyncIterator[str]:
+    yield _format_sse(*first_event)
+    try:
+        async for event, payload in events:
+            if event == "done":
+                payload = TaskChatAskResponse.model_validate(payload).model_dump(mode="json")
+            yield _format_sse(event, payload)
+    except Exception as exc:
+        logger.exception("[task_chat] ask stream failed")
+        yield _format_sse("error", {"message": getattr(exc, "detail", None) or str(exc)})
+    finally:
+        await events.aclose()
+
+
+def _format_sse(event: str, payload: Any) -> str:
+    data = json.dumps(jsonable_encoder(payload), ensure_ascii=False)
+    return f"event: {event}\ndata: {data}\n\n"
+
+
 @router.post("/sessions", response_model=APIResponse[ChatSessionItem])
 def create_session(request: ChatSessionCreateRequest):
     item = task_chat_service.create_session(
@@ -158,3 +333,83 @@ def update_conversation_feedback(conversation_id: int, request: ConversationFeed
         "message": "更新成功",
         "data": ConversationItem.model_validate(item),
     }
+
+
+@router.get("/answer-cache/stats", response_model=APIResponse[AnswerCacheStats])
+def get_answer_cache_stats():
+    """当前 worker 进程内的问答缓存命中统计。"""
+    return {
+        "code": 200,
+        "message": "查询成功",
+        "data": answer_cache.stats(),
+    }
+
+
+@router.delete("/answer-cache", response_model=APIResponse[dict])
+def clear_answer_cache(task_id: Optional[int] = Query(None, description="任务ID，不传则清空全部")):
+    cleared = answer_cache.clear(task_id=task_id)
+    return {
+        "code": 200,
+        "message": f"已清除 {cleared} 条缓存",
+        "data": {"cleared_count": cleared},
+    }
+
+
+@router.get("/trace-stats", response_model=APIResponse[dict])
+def get_trace_stats(
+    task_id: Optional[int] = Query(None, description="任务ID，不传则统计全部任务"),
+    limit: int = Query(500, ge=1, le=5000, description="统计最近多少条对话"),
+):
+    """按阶段汇总最近问答的耗时分位数与 token 消耗。"""
+    return {
+        "code": 200,
+        "message": "查询成功",
+        "data": task_chat_service.get_trace_stats(task_id=task_id, limit=limit),
+    }
+
+
+@router.get("/admission/stats", response_model=APIResponse[dict])
+def get_admission_stats():
+    """当前 worker 进程内的问答准入与排队情况。"""
+    return {
+        "code": 200,
+        "message": "查询成功",
+        "data": admission_controller.stats(),
+    }
+
+
+@router.get("/task-context/stats", response_model=APIResponse[dict])
+def get_task_context_stats():
+    """当前 worker 进程内缓存的任务上下文快照及其版本。"""
+    return {
+        "code": 200,
+        "message": "查询成功",
+        "data": task_context_store.stats(),
+    }
+
+
+@router.get("/shot-index/stats", response_model=APIResponse[dict])
+def get_shot_index_stats():
+    """当前 worker 进程内缓存的问答对向量索引。"""
+    return {
+        "code": 200,
+        "message": "查询成功",
+        "data": shot_index_store.stats(),
+    }
+
+
+@router.get("/shot-gate/stats", response_model=APIResponse[dict])
+def get_shot_gate_stats():
+    """当前 worker 进程内问答对匹配预筛的阈值、得分分布与跳过情况。"""
+    return {
+        "code": 200,
+        "message": "查询成功",
+        "data": shot_gate.stats(),
+    }
+
+
+@router.delete("/shot-gate/stats", response_model=APIResponse[None])
+def reset_shot_gate_stats():
+    """清空预筛样本，阈值重新校准（如更换向量模型或大批量修改问答对后）。"""
+    shot_gate.reset()
+    return {"code": 200, "message": "已重置", "data": None}
@@ -29,5 +29,143 @@ class Settings(BaseSettings):
     # SQLite Database
     SQLITE_URL: str = "sqlite:///./app.db"
 
+    # 问答推测执行：问答对匹配与选表代理并行，命中高相似度问答对时取消选表
+    ASK_SPECULATIVE_ENABLED: bool = False
+    # 单次问答中推测执行允许额外消耗的 token 上限（选表提示词 + 补全上限）
+    ASK_SPECULATIVE_MAX_TOKENS: int = 16000
+
+    # 生成 SQL 时流式解析，【SQL】段结束即开始执行；关闭保留理由时拿到 SQL 后直接中断生成
+    ASK_CREATE_SQL_STREAM: bool = True
+    ASK_CREATE_SQL_KEEP_REASON: bool = True
+
+    # 提示词 token 预算：LlmConfig.context_window 为空时使用默认窗口，预留安全余量防止估算偏小
+    LLM_DEFAULT_CONTEXT_WINDOW: int = 32768
+    LLM_CONTEXT_SAFETY_MARGIN: float = 0.1
+    LLM_MIN_COMPLETION_TOKENS: int = 512
+
+    # 自适应 max_tokens：列出的调用点按近期补全 token 数的高分位数加余量请求，被截断时按调用方给的上限重试一次
+    LLM_ADAPTIVE_MAX_TOKENS_ENABLED: bool = True
+    LLM_ADAPTIVE_MAX_TOKENS_CALL_SITES: str = "shot_match,select_table,query_context,column_patch,create_sql,sql_fix"
+    LLM_ADAPTIVE_MAX_TOKENS_PERCENTILE: float = 99
+    LLM_ADAPTIVE_MAX_TOKENS_MARGIN: float = 0.25
+    # 样本不足时仍按调用方给的上限请求
+    LLM_ADAPTIVE_MAX_TOKENS_MIN_SAMPLES: int = 30
+    LLM_ADAPTIVE_MAX_TOKENS_FLOOR: int = 256
+    LLM_ADAPTIVE_MAX_TOKENS_WINDOW: int = 500
+
+    # 问答结果缓存：相同任务下归一化后相同的问题直接复用已生成的 SQL
+    ANSWER_CACHE_ENABLED: bool = True
+    ANSWER_CACHE_MAX_ENTRIES: int = 1000
+    ANSWER_CACHE_TTL_SECONDS: int = 86400
+    # 命中缓存时是否重新执行 SQL 获取最新数据，关闭则直接返回缓存的结果
+    ANSWER_CACHE_REEXECUTE: bool = True
+
+    # 任务上下文快照（表元数据、提示词、表关系）在每个 worker 内最多缓存的任务数
+    TASK_CONTEXT_MAX_TASKS: int = 64
+
+    # 问答对示例检索：LLM 配置设置了 embedding_model 时按问题向量取最相似的 SHOT_TOP_K 条放入提示词，
+    # 没有可用向量时按问题的中文二元/三元字组做 BM25 检索；两者都关闭时放入全部问答对
+    SHOT_TOP_K: int = 8
+    SHOT_LEXICAL_ENABLED: bool = True
+    QA_EMBEDDING_BATCH_SIZE: int = 64
+    # 问题与问答对只在 where_conditions 的取值（日期、代码、数字、名称）上不同时，本地填入新取值，不调用模型
+    SHOT_TEMPLATE_ENABLED: bool = True
+
+    # 问答对批量导入：每批写入条数与单次导入上限；WHERE 条件提取与向量计算在后台任务中按批处理
+    QA_IMPORT_BATCH_SIZE: int = 1000
+    QA_IMPORT_MAX_ITEMS: int = 50000
+    QA_ENRICH_BATCH_SIZE: int = 50
+    # 后台提取 WHERE 条件的并发数：请求未指定时取 LlmConfig.max_concurrency，再为空时使用默认值
+    QA_WHERE_DEFAULT_CONCURRENCY: int = 4
+    QA_WHERE_MAX_CONCURRENCY: int = 16
+
+    # 问答对匹配预筛：本地检索最高得分低于阈值时跳过匹配的 LLM 调用直接选表。阈值按检索方式取
+    # SHOT_GATE_MIN_SCORES 中的固定值（格式 "embedding=0.6,bm25=0.35"），未配置时按近期命中样本得分的
+    # 低分位数减去余量自动校准，命中样本不足时不跳过；判定跳过的请求按比例抽样照常调用，用于统计误跳过
+    SHOT_GATE_ENABLED: bool = True
+    SHOT_GATE_MIN_SCORES: str = ""
+    SHOT_GATE_MIN_HITS: int = 20
+    SHOT_GATE_HIT_PERCENTILE: float = 5
+    SHOT_GATE_MARGIN: float = 0.2
+    SHOT_GATE_AUDIT_RATIO: float = 0.05
+    SHOT_GATE_WINDOW: int = 1000
+
+    # 目标库查询结果缓存，DbConfig.result_cache_ttl 为空时使用默认过期时间
+    SQL_RESULT_CACHE_ENABLED: bool = True
+    SQL_RESULT_CACHE_DEFAULT_TTL_SECONDS: int = 60
+    SQL_RESULT_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    SQL_RESULT_CACHE_MAX_ENTRY_BYTES: int = 4 * 1024 * 1024
+
+    # 批量问答：单个批次同时进行的问题数
+    ASK_BATCH_DEFAULT_CONCURRENCY: int = 4
+    ASK_BATCH_MAX_CONCURRENCY: int = 16
+    ASK_BATCH_MAX_QUESTIONS: int = 2000
+
+    # 合并进行中的相同问答（同任务、归一化后相同的问题），跨 worker 通过 ask_flight 表协调
+    ASK_SINGLE_FLIGHT_ENABLED: bool = True
+    ASK_SINGLE_FLIGHT_LEASE_SECONDS: int = 30
+    ASK_SINGLE_FLIGHT_WAIT_SECONDS: int = 300
+    ASK_SINGLE_FLIGHT_POLL_SECONDS: float = 0.25
+
+    # 问答准入控制（每个 worker 进程）：任务上限可由 NlsqlTaskConfig.max_concurrency 覆盖，
+    # 同一 LLM 配置的问答上限可由 LlmConfig.admission_concurrency 覆盖（LlmConfig.max_concurrency 只限制单次 LLM 调用的并发）
+    ADMISSION_ENABLED: bool = True
+    ADMISSION_MAX_ACTIVE: int = 32
+    ADMISSION_TASK_DEFAULT_CONCURRENCY: int = 8
+    ADMISSION_LLM_DEFAULT_CONCURRENCY: int = 16
+    ADMISSION_MAX_QUEUE: int = 200
+    ADMISSION_MAX_QUEUE_PER_TASK: int = 50
+    ADMISSION_QUEUE_TIMEOUT_SECONDS: float = 30
+
+    # 后台任务（background_job 表）：每个 worker 同时执行的任务数、轮询间隔与租约
+    JOB_RUNNER_ENABLED: bool = True
+    JOB_MAX_CONCURRENCY: int = 4
+    JOB_POLL_SECONDS: float = 1.0
+    JOB_LEASE_SECONDS: int = 30
+    # worker 在任务完成前退出时，任务最多被重新领取的次数（含首次）
+    JOB_MAX_ATTEMPTS: int = 3
+    JOB_RETENTION_DAYS: int = 7
+    # 过期任务等记录的清理间隔（在轮询循环中执行，不在请求路径上）
+    JOB_PURGE_INTERVAL_SECONDS: int = 3600
+
+    # LLM 客户端（每个 LlmConfig 一组共享的长连接池）：超时、SDK 自动重试次数与连接池大小
+    LLM_TIMEOUT_SECONDS: float = 300
+    LLM_CONNECT_TIMEOUT_SECONDS: float = 10
+    LLM_MAX_RETRIES: int = 2
+    LLM_MAX_CONNECTIONS: int = 100
+    LLM_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    LLM_KEEPALIVE_EXPIRY_SECONDS: float = 60
+    # 流式补全时请求末尾返回 token 用量（部分 OpenAI 兼容服务不支持 stream_options，可关闭）
+    LLM_STREAM_INCLUDE_USAGE: bool = True
+
+    # LLM 补全结果磁盘缓存：只对列出的调用点生效（逗号分隔），请求头 X-LLM-Cache: bypass/refresh 可跳过读取
+    LLM_RESPONSE_CACHE_ENABLED: bool = True
+    LLM_RESPONSE_CACHE_PATH: str = "./llm_response_cache.db"
+    LLM_RESPONSE_CACHE_MAX_BYTES: int = 256 * 1024 * 1024
+    LLM_RESPONSE_CACHE_CALL_SITES: str = "table_prompt,field_prompt,field_relation,qa_where_conditions"
+
+    # 任务配置多个 LLM 时的路由：按延迟与错误率的滑动平均排序，429/5xx/超时自动切换到下一个
+    LLM_ROUTER_EWMA_ALPHA: float = 0.3
+    # 错误率对排序分数的放大系数：分数 = 平均延迟 * (1 + 系数 * 错误率)
+    LLM_ROUTER_ERROR_PENALTY: float = 4.0
+    # 熔断：连续失败达到该次数（或收到 429）后打开，冷却期内直接失败；冷却结束后只放行一个探测请求
+    LLM_ROUTER_FAILURE_THRESHOLD: int = 3
+    LLM_ROUTER_COOLDOWN_SECONDS: float = 30
+    # 以该概率把请求分给非首选的健康端点，使其延迟统计保持更新
+    LLM_ROUTER_EXPLORE_RATIO: float = 0.05
+    # 每个端点保留最近多少次成功调用的延迟，用于计算对冲等待时间
+    LLM_ROUTER_LATENCY_WINDOW: int = 200
+
+    # 按调用点的截止时间（秒），格式 "select_table=45,create_sql=90"；未列出的调用点使用默认值，0 表示只受客户端超时限制
+    LLM_DEADLINE_SECONDS: float = 0
+    LLM_CALL_SITE_DEADLINES: str = "shot_embedding=5,shot_match=30,select_table=45,query_context=45,column_patch=45,create_sql=90,sql_fix=60"
+    # 对冲请求：列出的调用点在首个请求超过近期延迟分位数仍未返回时，再发一个相同请求（优先发往池中另一个配置），取先成功的结果
+    LLM_HEDGE_ENABLED: bool = False
+    LLM_HEDGE_CALL_SITES: str = "shot_match,select_table,query_context,column_patch,sql_fix"
+    LLM_HEDGE_PERCENTILE: float = 95
+    # 延迟样本不足时不对冲
+    LLM_HEDGE_MIN_SAMPLES: int = 20
+    LLM_HEDGE_MIN_DELAY_MS: float = 200
+
 
 settings = Settings()
\ No newline at end of file
@@ -1,9 +1,15 @@
+from typing import Callable, TypeVar
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
 
 from app.core.config import settings
 
+T = TypeVar("T")
+
 engine = create_async_engine(
     settings.SQLITE_URL.replace("sqlite://", "sqlite+aiosqlite://"),
     connect_args={"check_same_thread": False}
@@ -24,6 +30,15 @@ async def get_db() -> AsyncSession:
         yield session
 
 
+async def run_sync_session(fn: Callable[[Session], T]) -> T:
+    """在一个短生命周期的异步会话里执行同步 ORM 代码，执行完立即释放 SQLite 连接。
+
+    问答链路会在 LLM 调用之间穿插读库，不能让一个会话跨越整次问答持有连接和读锁。
+    """
+    async with SessionLocal() as session:
+        return await session.run_sync(fn)
+
+
 async def init_db():
     async with engine.begin() as conn:
         # 导入所有模型以确保它们被注册
@@ -39,5 +54,29 @@ async def init_db():
         from app.models.chat_session import ChatSession
         from app.models.conversation import Conversation
         from app.models.user_prompt_config import UserPromptConfig
+        from app.models.task_context_version import TaskContextVersion
+        from app.models.ask_flight import AskFlight
+        from app.models.background_job import BackgroundJob
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_add_missing_columns)
         print("Database tables created successfully!")
+
+
+def _add_missing_columns(conn: Connection) -> None:
+    """create_all 不会修改已存在的表，这里为旧库补齐模型中新增的可空列。"""
+    inspector = inspect(conn)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=conn.dialect)}"
+            default = getattr(column.default, "arg", None)
+            if isinstance(default, (bool, int, float)):
+                ddl += f" DEFAULT {int(default) if isinstance(default, bool) else default}"
+            elif isinstance(default, str):
+                ddl += " DEFAULT '" + default.replace("'", "''") + "'"
+            conn.execute(text(ddl))
+            print(f"Added column {table.name}.{column.name}")
@@ -50,4 +50,27 @@ class InternalServerError(BaseAPIError):
     """内部服务器错误"""
 
     def __init__(self, message: str = "内部服务器错误"):
-        super().__init__(message=message, status_code=500)
\ No newline at end of file
+        super().__init__(message=message, status_code=500)
+
+
+class TooManyRequestsError(BaseAPIError):
+    """请求过多异常，retry_after 为建议的重试等待秒数"""
+
+    def __init__(self, message: str = "请求过多，请稍后重试", retry_after: int = 1, details: Any = None):
+        self.retry_after = retry_after
+        super().__init__(message=message, status_code=429, details=details)
+
+
+class ServiceUnavailableError(BaseAPIError):
+    """依赖的服务暂不可用（如 LLM 端点熔断中），retry_after 为建议的重试等待秒数"""
+
+    def __init__(self, message: str = "服务暂不可用，请稍后重试", retry_after: int = 1, details: Any = None):
+        self.retry_after = retry_after
+        super().__init__(message=message, status_code=503, details=details)
+
+
+class GatewayTimeoutError(BaseAPIError):
+    """上游服务未在截止时间内响应"""
+
+    def __init__(self, message: str = "上游服务响应超时", details: Any = None):
+        super().__init__(message=message, status_code=504, details=details)
@@ -2,6 +2,7 @@ from typing import List, Optional, Dict, Any
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, delete, and_, func
 from app.models.table_level_prompt import TableLevelPrompt
+from app.models.task_context_version import bump_task_versions
 
 
 class CRUDTableLevelPrompt:
@@ -91,6 +92,9 @@ class CRUDTableLevelPrompt:
             return {"deleted_count": 0, "deleted_ids": []}
 
         await db.execute(delete(self.model).where(self.model.id.in_(ids)))
+        # 批量 delete 不经过 flush 事件，需要手动递增任务版本
+        task_ids = [obj.task_id for obj in objs]
+        await db.run_sync(lambda session: bump_task_versions(session, task_ids))
         await db.commit()
 
         return {
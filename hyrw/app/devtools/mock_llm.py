@@ -0,0 +1,476 @@
+"""
+本地 OpenAI 兼容的模拟 LLM 服务，用于离线压测和回归测试。
+
+- 按提示词哈希回放录制的补全（JSONL，每行 {"key", "agent", "content"}）
+- 未录制的提示词按各代理的输出协议返回脚本化结果（【相似度】/【SQL】、selected_tables JSON、
+  KEY=VALUE 行协议、[TABLE]/WHERE 段等），结果只取决于提示词，可重复
+- /v1/embeddings 按字符二元组哈希返回确定性的向量，字面相近的文本向量也相近
+- 可按代理配置延迟分布；配置 upstream 时未命中的提示词转发给真实模型并追加到录制文件
+
+把 LlmConfig.base_url 指向 http://127.0.0.1:<port>/v1 即可让完整问答链路在本机确定性地运行：
+
+    python -m app.devtools.mock_llm --port 8001 --recordings qa/llm_recordings.jsonl \\
+        --latency '{"default": {"distribution": "lognormal", "mean_ms": 800, "sigma": 0.4}}'
+"""
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import os
+import random
+import re
+import socket
+import threading
+import time
+import uuid
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from app.services.token_budget import estimate_message_tokens, estimate_tokens
+
+
+logger = logging.getLogger(__name__)
+
+
+def prompt_key(messages: List[Dict[str, Any]]) -> str:
+    """录制键只取消息内容，与模型名、温度无关，便于同一份录制在不同 LlmConfig 下复用。"""
+    payload = json.dumps(
+        [{"role": m.get("role"), "content": m.get("content")} for m in messages],
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+MOCK_EMBEDDING_DIMENSIONS = 64
+
+
+def mock_embedding(text: str, dimensions: int = MOCK_EMBEDDING_DIMENSIONS) -> List[float]:
+    """字符二元组哈希到固定维度的计数向量（未归一化）。"""
+    vector = [0.0] * dimensions
+    padded = f" {text} "
+    for index in range(len(padded) - 1):
+        digest = hashlib.md5(padded[index:index + 2].encode("utf-8")).digest()
+        vector[int.from_bytes(digest[:4], "little") % dimensions] += 1.0
+    return vector
+
+
+@dataclass
+class LatencyModel:
+    """单次请求的延迟：首字延迟按分布抽样，流式输出时每个 token 再加 per_token_ms。"""
+
+    distribution: str = "fixed"
+    mean_ms: float = 0
+    jitter_ms: float = 0
+    sigma: float = 0.5
+    per_token_ms: float = 0
+
+    def sample_ms(self, rng: random.Random) -> float:
+        if self.mean_ms <= 0:
+            return 0
+        if self.distribution == "uniform":
+            return max(0.0, rng.uniform(self.mean_ms - self.jitter_ms, self.mean_ms + self.jitter_ms))
+        if self.distribution == "lognormal":
+            # 取 mu 使分布均值等于 mean_ms
+            mu = math.log(self.mean_ms) - self.sigma ** 2 / 2
+            return rng.lognormvariate(mu, self.sigma)
+        return self.mean_ms
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "LatencyModel":
+        return cls(**{key: value for key, value in data.items() if key in cls.__dataclass_fields__})
+
+
+def detect_agent(messages: List[Dict[str, Any]]) -> str:
+    system = str(messages[0].get("content") or "") if messages else ""
+    user = str(messages[-1].get("content") or "") if messages else ""
+    if "SQL 查询匹配专家" in user:
+        return "shot_match"
+    if "选表" in system:
+        return "select_table"
+    if "查询上下文" in system:
+        return "query_context"
+    if "WHERE条件生成" in system:
+        return "column_patch"
+    if "SQL生成专家" in system:
+        return "create_sql"
+    if "SQL修复专家" in system:
+        return "sql_fix"
+    if "SQL条件提取专家" in system:
+        return "qa_where_conditions"
+    if "所有字段" in system:
+        return "field_prompt"
+    if "数据建模专家" in system:
+        return "field_relation"
+    if "数据表生成精确的提示词" in system:
+        return "table_prompt"
+    return "chat"
+
+
+_TABLE_LINE = re.compile(r"表[：:]\s*([A-Za-z0-9_.]+)")
+_FIELD_LINE = re.compile(r"•\s*([A-Za-z0-9_]+)\([^)]*\)\s*\|\s*样例:([^|\n]+)")
+_FROM_JOIN = re.compile(r"\b(?:FROM|JOIN)\s+([A-Za-z0-9_.\"`]+)", re.I)
+
+
+def _unique(items: List[str]) -> List[str]:
+    return list(dict.fromkeys(items))
+
+
+def _user_question(text: str) -> str:
+    match = re.search(r"用户(?:问题|输入)[:：]?\s*\n?(.+)", text)
+    return match.group(1).strip() if match else ""
+
+
+def scripted_reply(agent: str, messages: List[Dict[str, Any]]) -> str:
+    """按代理的输出协议构造确定性的回复，内容只依赖提示词。"""
+    user = str(messages[-1].get("content") or "") if messages else ""
+
+    if agent == "shot_match":
+        question = user.split("【用户问题】", 1)[-1].strip().split("\n", 1)[0]
+        example = re.search(r"问题: (.*?)\nSQL:\n(.*?)\n(?:WHERE 条件结构:|-{40})", user, re.S)
+        if not example:
+            return "【相似度】\n0\n\n【SQL】\n\n【匹配说明】\n没有示例"
+        shared = set(question) & set(example.group(1))
+        similarity = int(100 * len(shared) / max(1, len(set(question) | set(example.group(1)))))
+        return f"【相似度】\n{similarity}\n\n【SQL】\n{example.group(2).strip()}\n\n【匹配说明】\n选择了示例1"
+
+    if agent == "select_table":
+        tables = re.findall(r"table_name=(\S+)", user)
+        question = _user_question(user)
+        selected = [table for table in tables if table in question] or tables[:1]
+        return json.dumps({"selected_tables": selected, "reason": "模拟选表"}, ensure_ascii=False)
+
+    if agent == "query_context":
+        tables = _unique(_TABLE_LINE.findall(user))
+        question = user.rsplit("用户输入:", 1)[-1].split("\n", 1)[0]
+        lines = [f"ALLOWED_TABLES={','.join(tables)}"]
+        if tables:
+            lines.append(f"DRIVER_TABLE={tables[0]}")
+        current_table = None
+        where_fields: Dict[str, List[str]] = {}
+        for line in user.splitlines():
+            table = _TABLE_LINE.search(line)
+            if table:
+                current_table = table.group(1)
+                continue
+            field = _FIELD_LINE.search(line)
+            if field and current_table and field.group(2).strip() and field.group(2).strip() in question:
+                where_fields.setdefault(current_table, []).append(field.group(1))
+        for table, fields in where_fields.items():
+            lines.append(f"TABLE_USAGE.{table}.WHERE_FIELDS={','.join(_unique(fields))}")
+        return "\n".join(lines)
+
+    if agent == "column_patch":
+        tables = _unique(_TABLE_LINE.findall(user))
+        return "\n\n".join(f"[TABLE] {table}\nWHERE 1=1\nREASON: 模拟条件" for table in tables)
+
+    if agent == "create_sql":
+        tables = _unique(re.findall(r"\n表: ([A-Za-z0-9_.]+)", user)) or _unique(_TABLE_LINE.findall(user))
+        table = tables[0] if tables else "dual"
+        where = ""
+        patches = re.search(r"列补丁: (\{.*\})", user)
+        if patches:
+            try:
+                patch = json.loads(patches.group(1)).get("column_patches", {}).get(table, {})
+                where = str(patch.get("where") or "")
+            except (json.JSONDecodeError, AttributeError):
+                where = ""
+        sql = f"SELECT * FROM {table} {where}".strip() + " LIMIT 10"
+        return f"【SQL】\n{sql}\n\n【理由】\n1. 模拟生成，使用表 {table}"
+
+    if agent == "sql_fix":
+        return "SELECT 1"
+
+    if agent == "qa_where_conditions":
+        sql = user.split("SQL:\n", 1)[-1]
+        tables = _unique([name.strip("\"`") for name in _FROM_JOIN.findall(sql)])
+        return json.dumps({"where_conditions": [], "tables": tables}, ensure_ascii=False)
+
+    if agent == "field_prompt":
+        fields = re.findall(r"- 字段名: (\S+)", user)
+        return json.dumps(
+            {
+                "fields": [
+                    {
+                        "field_name": name,
+                        "business_meaning": f"{name} 的业务含义",
+                        "data_format": "",
+                        "field_description": f"{name} 字段",
+                        "query_scenarios": [],
+                        "aggregation_scenarios": [],
+                        "rules": [],
+                        "database_usage": [],
+                    }
+                    for name in fields
+                ]
+            },
+            ensure_ascii=False,
+        )
+
+    if agent == "field_relation":
+        return "[]"
+
+    if agent == "table_prompt":
+        table = re.search(r"表名：(\S+)", user)
+        name = table.group(1) if table else "table"
+        return json.dumps(
+            {
+                "table_description": f"{name} 表",
+                "query_scenarios": [f"查询 {name}"],
+                "aggregation_scenarios": [f"统计 {name} 数量"],
+                "data_role": ["事实表"],
+                "usage_not_scenarios": [],
+            },
+            ensure_ascii=False,
+        )
+
+    return "OK"
+
+
+class RecordingStore:
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self._lock = threading.Lock()
+        self._records: Dict[str, str] = {}
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as fp:
+                for line in fp:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    item = json.loads(line)
+                    self._records[item["key"]] = item["content"]
+
+    def get(self, key: str) -> Optional[str]:
+        return self._records.get(key)
+
+    def add(self, key: str, agent: str, content: str) -> None:
+        with self._lock:
+            self._records[key] = content
+            if not self.path:
+                return
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as fp:
+                fp.write(json.dumps({"key": key, "agent": agent, "content": content}, ensure_ascii=False) + "\n")
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+
+def truncate_to_tokens(content: str, max_tokens: Optional[int]) -> Tuple[str, str]:
+    """按 max_tokens 截断回复，返回 (内容, finish_reason)，与真实服务一样超出时为 length。"""
+    if not max_tokens or estimate_tokens(content) <= max_tokens:
+        return content, "stop"
+    low, high = 0, len(content)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if estimate_tokens(content[:middle]) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return content[:low], "length"
+
+
+def create_mock_llm_app(
+    *,
+    recordings: Optional[str] = None,
+    latency: Optional[Dict[str, Any]] = None,
+    seed: int = 0,
+    upstream_base_url: Optional[str] = None,
+    upstream_api_key: Optional[str] = None,
+) -> FastAPI:
+    """latency 形如 {"default": {...}, "create_sql": {...}}，键为代理名（与 OpenAIService 的 call_site 一致）。"""
+    store = RecordingStore(recordings)
+    latency_models = {name: LatencyModel.from_dict(value) for name, value in (latency or {}).items()}
+    rng = random.Random(seed)
+    stats: Dict[str, Dict[str, int]] = {}
+    app = FastAPI(title="mock-llm")
+
+    def latency_for(agent: str) -> LatencyModel:
+        return latency_models.get(agent) or latency_models.get("default") or LatencyModel()
+
+    async def resolve(body: Dict[str, Any], messages: List[Dict[str, Any]], agent: str) -> Dict[str, str]:
+        key = prompt_key(messages)
+        recorded = store.get(key)
+        if recorded is not None:
+            return {"content": recorded, "source": "recorded"}
+        if upstream_base_url:
+            async with httpx.AsyncClient(timeout=300) as client:
+                response = await client.post(
+                    upstream_base_url.rstrip("/") + "/chat/completions",
+                    headers={"Authorization": f"Bearer {upstream_api_key or ''}"},
+                    json={key: value for key, value in body.items() if key not in ("stream", "stream_options")},
+                )
+                response.raise_for_status()
+                content = response.json()["choices"][0]["message"]["content"] or ""
+            store.add(key, agent, content)
+            return {"content": content, "source": "upstream"}
+        return {"content": scripted_reply(agent, messages), "source": "scripted"}
+
+    @app.get("/v1/models")
+    async def list_models():
+        return {"object": "list", "data": [{"id": "mock-llm", "object": "model", "owned_by": "mock"}]}
+
+    @app.get("/mock/stats")
+    async def get_stats():
+        return {"recordings": len(store), "calls": stats}
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        inputs = body.get("input")
+        texts = [inputs] if isinstance(inputs, str) else list(inputs or [])
+        counter = stats.setdefault("embedding", {})
+        counter["scripted"] = counter.get("scripted", 0) + 1
+        await asyncio.sleep(latency_for("embedding").sample_ms(rng) / 1000)
+        prompt_tokens = sum(estimate_tokens(str(text)) for text in texts)
+        return JSONResponse({
+            "object": "list",
+            "model": body.get("model") or "mock-embedding",
+            "data": [
+                {"object": "embedding", "index": index, "embedding": mock_embedding(str(text))}
+                for index, text in enumerate(texts)
+            ],
+            "usage": {"prompt_tokens": prompt_tokens, "total_tokens": prompt_tokens},
+        })
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        messages = body.get("messages") or []
+        agent = detect_agent(messages)
+        resolved = await resolve(body, messages, agent)
+        content, finish_reason = truncate_to_tokens(resolved["content"], body.get("max_tokens"))
+        counter = stats.setdefault(agent, {})
+        counter[resolved["source"]] = counter.get(resolved["source"], 0) + 1
+
+        model = latency_for(agent)
+        await asyncio.sleep(model.sample_ms(rng) / 1000)
+        usage = {
+            "prompt_tokens": estimate_message_tokens(messages),
+            "completion_tokens": estimate_tokens(content),
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+        model_name = body.get("model") or "mock-llm"
+
+        if not body.get("stream"):
+            return JSONResponse({
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model_name,
+                "choices": [{
+                    "index": 0,
+                    "finish_reason": finish_reason,
+                    "message": {"role": "assistant", "content": content},
+                }],
+                "usage": usage,
+            })
+
+        include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+
+        async def events():
+            def chunk(delta: Dict[str, Any], finish_reason: Optional[str] = None) -> str:
+                return "data: " + json.dumps({
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model_name,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                }, ensure_ascii=False) + "\n\n"
+
+            yield chunk({"role": "assistant", "content": ""})
+            # 按约 4 个字符一段输出，模拟逐 token 生成
+            for index in range(0, len(content), 4):
+                if model.per_token_ms > 0:
+                    await asyncio.sleep(model.per_token_ms / 1000)
+                yield chunk({"content": content[index:index + 4]})
+            yield chunk({}, finish_reason)
+            if include_usage:
+                yield "data: " + json.dumps({
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model_name,
+                    "choices": [],
+                    "usage": usage,
+                }) + "\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def run_mock_llm_server(port: Optional[int] = None, **options: Any) -> Iterator[str]:
+    """在后台线程启动模拟服务，产出可直接填入 LlmConfig.base_url 的地址。"""
+    import uvicorn
+
+    port = port or _free_port()
+    server = uvicorn.Server(
+        uvicorn.Config(create_mock_llm_app(**options), host="127.0.0.1", port=port, log_level="warning")
+    )
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.time() + 10
+    while not server.started:
+        if time.time() > deadline:
+            raise RuntimeError("mock llm server failed to start")
+        time.sleep(0.02)
+    try:
+        yield f"http://127.0.0.1:{port}/v1"
+    finally:
+        server.should_exit = True
+        thread.join(timeout=5)
+
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="OpenAI 兼容的模拟 LLM 服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--recordings", help="录制文件（JSONL）")
+    parser.add_argument("--latency", help="延迟配置 JSON，或 JSON 文件路径")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--upstream-base-url", help="录制模式：未命中的提示词转发到该地址并写入录制文件")
+    parser.add_argument("--upstream-api-key")
+    args = parser.parse_args()
+
+    latency = None
+    if args.latency:
+        if os.path.exists(args.latency):
+            with open(args.latency, encoding="utf-8") as fp:
+                latency = json.load(fp)
+        else:
+            latency = json.loads(args.latency)
+
+    app = create_mock_llm_app(
+        recordings=args.recordings,
+        latency=latency,
+        seed=args.seed,
+        upstream_base_url=args.upstream_base_url,
+        upstream_api_key=args.upstream_api_key,
+    )
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -8,8 +8,11 @@ import logging
 from app.core.config import settings
 from app.api.v1.router import api_router
 from app.core.database import init_db
+from app.services.job_runner import job_runner
+from app.services.llm_gateway import llm_gateway
+from app.services.llm_response_cache import LlmCacheModeMiddleware
 from app.models import *  # 导入所有模型
-from app.core.exceptions import NotFoundError, ValidationError, BaseAPIError
+from app.core.exceptions import NotFoundError, ValidationError, BaseAPIError, ServiceUnavailableError, TooManyRequestsError
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -20,9 +23,12 @@ async def lifespan(app: FastAPI):
     # Startup
     logger.info("Starting up...")
     await init_db()
+    await job_runner.start()
     yield
     # Shutdown
     logger.info("Shutting down...")
+    await job_runner.stop()
+    await llm_gateway.aclose()
 
 
 app = FastAPI(
@@ -41,6 +47,8 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(LlmCacheModeMiddleware)
+
 # Include API router
 app.include_router(api_router, prefix=settings.API_V1_STR)
 
@@ -70,6 +78,32 @@ async def validation_exception_handler(request: Request, exc: ValidationError):
     )
 
 
+@app.exception_handler(TooManyRequestsError)
+async def too_many_requests_exception_handler(request: Request, exc: TooManyRequestsError):
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={
+            "code": exc.status_code,
+            "message": exc.message,
+            "data": exc.details
+        },
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+
+@app.exception_handler(ServiceUnavailableError)
+async def service_unavailable_exception_handler(request: Request, exc: ServiceUnavailableError):
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={
+            "code": exc.status_code,
+            "message": exc.message,
+            "data": exc.details
+        },
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+
 @app.exception_handler(BaseAPIError)
 async def base_api_exception_handler(request: Request, exc: BaseAPIError):
     return JSONResponse(
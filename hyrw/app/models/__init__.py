@@ -10,6 +10,10 @@ from .table_field_relation import TableFieldRelation
 from .qa_embedding import QaEmbedding
 from .chat_session import ChatSession
 from .conversation import Conversation
+from .task_context_version import TaskContextVersion
+from .ask_flight import AskFlight
+from .background_job import BackgroundJob
 
 __all__ = ["DbConfig", "LlmConfig", "TableMetadata", "UserPromptConfig", "NlsqlTaskConfig",
-           "TableMetadataBasic", "TableSampleData", "TableFieldMetadata", "TableLevelPrompt", "TableFieldPrompt", "TableFieldRelation", "QaEmbedding", "ChatSession", "Conversation"]
+           "TableMetadataBasic", "TableSampleData", "TableFieldMetadata", "TableLevelPrompt", "TableFieldPrompt", "TableFieldRelation", "QaEmbedding", "ChatSession", "Conversation",
+           "TaskContextVersion", "AskFlight", "BackgroundJob"]
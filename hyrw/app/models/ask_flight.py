@@ -0,0 +1,18 @@
+from sqlalchemy import Column, String, Text, DateTime
+
+from app.core.database import Base
+
+
+class AskFlight(Base):
+    """进行中的问答：相同任务 + 相同问题的并发请求（包括其他 worker）只由持有租约的一方计算"""
+    __tablename__ = "ask_flight"
+
+    flight_key = Column(String(64), primary_key=True, comment="任务ID与归一化问题的摘要")
+    owner = Column(String(100), nullable=False, comment="当前计算方标识")
+    status = Column(String(20), nullable=False, comment="running/done/failed")
+    result = Column(Text, comment="计算结果(JSON)")
+    lease_until = Column(DateTime, nullable=False, comment="租约到期时间，计算方需定期续约")
+    updated_at = Column(DateTime, nullable=False, comment="更新时间")
+
+    class Config:
+        from_attributes = True
@@ -0,0 +1,29 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, ForeignKey, text
+
+from app.core.database import Base
+
+
+class BackgroundJob(Base):
+    """后台任务：由各 worker 的 job_runner 抢占执行，worker 重启后租约过期的任务会被重新领取"""
+    __tablename__ = "background_job"
+
+    id = Column(String(32), primary_key=True, comment="任务ID")
+    job_type = Column(String(50), nullable=False, comment="任务类型，如 ask")
+    nlsql_task_id = Column(Integer, ForeignKey("nlsql_task_config.id", ondelete="CASCADE"), comment="nlsql任务id外键")
+    status = Column(String(20), nullable=False, default="queued", comment="queued/running/succeeded/failed/cancelled")
+    params = Column(Text, comment="任务参数(JSON)")
+    stage = Column(String(50), comment="当前阶段")
+    progress = Column(Text, comment="进度(JSON)")
+    result = Column(Text, comment="执行结果(JSON)")
+    error = Column(Text, comment="失败原因")
+    cancel_requested = Column(Boolean, nullable=False, default=False, comment="是否已请求取消")
+    owner = Column(String(100), comment="执行方标识")
+    lease_until = Column(DateTime, comment="租约到期时间，执行方需定期续约")
+    attempts = Column(Integer, nullable=False, default=0, comment="已领取次数")
+    created_at = Column(DateTime, server_default=text("CURRENT_TIMESTAMP"))
+    started_at = Column(DateTime, comment="开始执行时间")
+    finished_at = Column(DateTime, comment="结束时间")
+    updated_at = Column(DateTime, server_default=text("CURRENT_TIMESTAMP"))
+
+    class Config:
+        from_attributes = True
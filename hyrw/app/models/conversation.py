@@ -20,6 +20,7 @@ class Conversation(Base):
     query_context = Column(Text, comment="查询上下文(JSON)")
     column_patch = Column(Text, comment="列补丁(JSON)")
     feedback = Column(Text, comment="反馈信息")
+    trace = Column(Text, comment="各阶段耗时与token统计(JSON)")
     created_at = Column(DateTime, server_default=text("CURRENT_TIMESTAMP"))
 
     session = relationship("ChatSession", back_populates="conversations")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, text
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, text
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.core.database import Base
@@ -15,6 +15,9 @@ class DbConfig(Base):
     port = Column(Integer, nullable=False, comment='端口')
     username = Column(String(100), nullable=False, comment='用户名')
     password = Column(String(255), nullable=False, comment='密码')
+    result_cache_ttl = Column(Integer, comment='查询结果缓存秒数，为空使用全局配置，0 不缓存')
+    result_cache_freshness_check = Column(Boolean, default=False, comment='命中缓存前是否检查表数据是否变更')
+    max_concurrency = Column(Integer, comment='每个进程内同时执行的查询上限，为空不限制')
     created_at = Column(DateTime, server_default=text('CURRENT_TIMESTAMP'), comment='创建时间')
     updated_at = Column(DateTime, server_default=text('CURRENT_TIMESTAMP'), comment='更新时间')
 
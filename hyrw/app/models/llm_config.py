@@ -15,6 +15,10 @@ class LlmConfig(Base):
     provider = Column(String(100), nullable=False, comment='供应商')
     model_name = Column(String(100), nullable=False, comment='模型名称')
     status = Column(Integer, default=1, comment='状态：1-启用，2-禁用')
+    max_concurrency = Column(Integer, comment='每个进程内同时进行的请求上限，为空不限制')
+    admission_concurrency = Column(Integer, comment='每个进程内同时处理的使用该配置的问答上限（准入控制），为空使用全局配置')
+    context_window = Column(Integer, comment='模型上下文窗口（token，提示词+补全），为空使用全局默认值')
+    embedding_model = Column(String(100), comment='向量模型名称，用于问答对检索，为空时不计算向量')
     created_at = Column(DateTime, server_default=func.now(), comment='创建时间')
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now(), comment='更新时间')
 
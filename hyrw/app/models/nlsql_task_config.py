@@ -8,11 +8,13 @@ class NlsqlTaskConfig(Base):
 
     id = Column(Integer, primary_key=True, autoincrement=True, nullable=False)
     llm_config_id = Column(Integer, ForeignKey("llm_config.id", ondelete="CASCADE"), nullable=False, comment="llm配置外键")
+    llm_config_ids = Column(JSON, comment="备用llm配置ID列表，按优先级排列，与llm_config_id组成调用池")
     db_config_id = Column(Integer, ForeignKey("db_config.id", ondelete="CASCADE"), nullable=False, comment="数据库配置外键")
     user_prompt_config_id = Column(Integer, ForeignKey("user_prompt_config.id", ondelete="CASCADE"), nullable=False, comment="提示词生成配置ID")
     select_tables = Column(JSON, comment="选中的表元数据ID列表，格式为数组如[1,2,3]，用于限制NL2SQL查询的表范围")
     description = Column(Text, comment="任务描述")
     status = Column(Integer, default=1, nullable=False, comment="任务状态：1-初始化，2-提取元数据，3-生成表提示词，4-生成字段提示词，5-生成关联关系，6-完成")
+    max_concurrency = Column(Integer, comment="每个进程内同时处理的问答上限，为空使用全局配置")
     created_at = Column(DateTime, server_default=text('CURRENT_TIMESTAMP'), comment='创建时间')
     updated_at = Column(DateTime, server_default=text('CURRENT_TIMESTAMP'), comment='更新时间')
 
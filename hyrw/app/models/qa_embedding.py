@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, Text, DateTime, Boolean, ForeignKey, text
+from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, LargeBinary, ForeignKey, text
 from sqlalchemy.orm import relationship
 from app.core.database import Base
 
@@ -13,6 +13,8 @@ class QaEmbedding(Base):
     where_conditions = Column(Text, comment="WHERE条件")
     tables = Column(Text, comment="使用的表")
     is_enabled = Column(Boolean, default=True, comment="是否启用")
+    question_embedding = Column(LargeBinary, comment="问题向量（float32，已归一化）")
+    embedding_model = Column(String(100), comment="计算问题向量所用的模型")
     created_at = Column(DateTime, server_default=text('CURRENT_TIMESTAMP'))
     updated_at = Column(DateTime, server_default=text('CURRENT_TIMESTAMP'))
 
@@ -0,0 +1,111 @@
+from typing import Iterable, Set
+
+from sqlalchemy import Column, Integer, DateTime, ForeignKey, event, select, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from app.core.database import Base
+
+
+class TaskContextVersion(Base):
+    """任务上下文版本号：任务下提示词、问答对等数据每次变更都会递增，用于让各进程内的缓存失效"""
+    __tablename__ = "task_context_version"
+
+    task_id = Column(Integer, ForeignKey("nlsql_task_config.id", ondelete="CASCADE"), primary_key=True, comment="任务ID")
+    version = Column(Integer, nullable=False, default=0, comment="版本号")
+    updated_at = Column(DateTime, server_default=text("CURRENT_TIMESTAMP"), comment="更新时间")
+
+    class Config:
+        from_attributes = True
+
+
+# 变更后需要递增任务版本的模型及其任务ID字段名
+TRACKED_TASK_ATTRIBUTES = {
+    "TableLevelPrompt": "task_id",
+    "TableFieldPrompt": "nlsql_task_id",
+    "TableFieldRelation": "nlsql_task_id",
+    "TableMetadataBasic": "table_task_id",
+    "QaEmbedding": "nlsql_task_id",
+    # 任务本身只关心修改（换库、换模型、改提示词配置）
+    "NlsqlTaskConfig": "id",
+}
+
+# 没有任务ID字段、需要通过关联表找到任务的模型
+_METADATA_CHILD_MODELS = ("TableSampleData", "TableFieldMetadata")
+
+
+def get_task_version(db: Session, task_id: int) -> int:
+    version = db.execute(
+        select(TaskContextVersion.version).where(TaskContextVersion.task_id == task_id)
+    ).scalar()
+    return int(version or 0)
+
+
+def bump_task_versions(db: Session, task_ids: Iterable[int]) -> None:
+    """在当前事务内递增任务版本，随业务数据一起提交或回滚。"""
+    for task_id in sorted({int(item) for item in task_ids if item is not None}):
+        stmt = sqlite_insert(TaskContextVersion).values(task_id=task_id, version=1)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[TaskContextVersion.task_id],
+            set_={
+                "version": TaskContextVersion.version + 1,
+                "updated_at": text("CURRENT_TIMESTAMP"),
+            },
+        )
+        db.connection().execute(stmt)
+
+
+def _resolve_related_task_ids(session: Session, obj) -> Set[int]:
+    # flush 过程中不能触发懒加载或 autoflush，直接在当前连接上查询
+    from app.models.nlsql_task_config import NlsqlTaskConfig
+    from app.models.table_metadata_extended import TableMetadataBasic
+
+    name = type(obj).__name__
+    if name in _METADATA_CHILD_MODELS:
+        parent = obj.__dict__.get("table_metadata")
+        if parent is not None and parent.table_task_id is not None:
+            return {parent.table_task_id}
+        if obj.table_metadata_id is None:
+            return set()
+        task_id = session.connection().execute(
+            select(TableMetadataBasic.table_task_id).where(TableMetadataBasic.id == obj.table_metadata_id)
+        ).scalar()
+        return {task_id} if task_id is not None else set()
+    if name == "DbConfig" and obj in session.dirty and obj.id is not None:
+        # 数据库类型等配置被修改，使用该配置的任务都需要刷新
+        rows = session.connection().execute(
+            select(NlsqlTaskConfig.id).where(NlsqlTaskConfig.db_config_id == obj.id)
+        )
+        return {row[0] for row in rows}
+    return set()
+
+
+def _collect_changed_task_ids(session: Session) -> Set[int]:
+    task_ids: Set[int] = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if obj in session.dirty and not session.is_modified(obj):
+            continue
+        attribute = TRACKED_TASK_ATTRIBUTES.get(type(obj).__name__)
+        if attribute is None:
+            task_ids.update(_resolve_related_task_ids(session, obj))
+            continue
+        if attribute == "id" and obj not in session.dirty:
+            continue
+        task_id = getattr(obj, attribute, None)
+        if task_id is not None:
+            task_ids.add(task_id)
+    return task_ids
+
+
+@event.listens_for(Session, "before_flush")
+def _remember_changed_tasks(session: Session, flush_context, instances) -> None:
+    changed = _collect_changed_task_ids(session)
+    if changed:
+        session.info.setdefault("changed_task_ids", set()).update(changed)
+
+
+@event.listens_for(Session, "after_flush")
+def _bump_changed_tasks(session: Session, flush_context) -> None:
+    changed = session.info.pop("changed_task_ids", None)
+    if changed:
+        bump_task_versions(session, changed)
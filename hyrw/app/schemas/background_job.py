@@ -0,0 +1,23 @@
+from datetime import datetime
+from typing import Any, Optional
+
+from pydantic import BaseModel
+
+
+class BackgroundJobItem(BaseModel):
+    id: str
+    job_type: str
+    nlsql_task_id: Optional[int] = None
+    status: str
+    stage: Optional[str] = None
+    progress: Optional[Any] = None
+    error: Optional[str] = None
+    cancel_requested: bool = False
+    attempts: int = 0
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
@@ -11,6 +11,9 @@ class DbConfigBase(BaseModel):
     port: int = Field(..., description="端口", gt=0, le=65535)
     username: str = Field(..., description="用户名", max_length=100)
     password: str = Field(..., description="密码", max_length=255)
+    result_cache_ttl: Optional[int] = Field(None, description="查询结果缓存秒数，为空使用全局配置，0 不缓存", ge=0)
+    result_cache_freshness_check: Optional[bool] = Field(False, description="命中缓存前是否检查表数据是否变更")
+    max_concurrency: Optional[int] = Field(None, description="每个进程内同时执行的查询上限，为空不限制", ge=1)
 
 
 class DbConfigCreate(DbConfigBase):
@@ -25,6 +28,9 @@ class DbConfigUpdate(BaseModel):
     port: Optional[int] = Field(None, description="端口", gt=0, le=65535)
     username: Optional[str] = Field(None, description="用户名", max_length=100)
     password: Optional[str] = Field(None, description="密码", max_length=255)
+    result_cache_ttl: Optional[int] = Field(None, description="查询结果缓存秒数，为空使用全局配置，0 不缓存", ge=0)
+    result_cache_freshness_check: Optional[bool] = Field(None, description="命中缓存前是否检查表数据是否变更")
+    max_concurrency: Optional[int] = Field(None, description="每个进程内同时执行的查询上限，为空不限制", ge=1)
 
 
 class DbConfig(DbConfigBase):
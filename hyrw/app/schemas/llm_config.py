@@ -12,6 +12,10 @@ class LlmConfigBase(BaseModel):
     provider: str = Field(..., description="供应商", max_length=100)
     model_name: str = Field(..., description="模型名称", max_length=100)
     status: Optional[int] = Field(1, description="状态：1-启用，2-禁用", ge=1, le=2)
+    max_concurrency: Optional[int] = Field(None, description="每个进程内同时进行的请求上限，为空不限制", ge=1)
+    admission_concurrency: Optional[int] = Field(None, description="每个进程内同时处理的使用该配置的问答上限（准入控制），为空使用全局配置", ge=1)
+    context_window: Optional[int] = Field(None, description="模型上下文窗口（token），为空使用全局默认值", ge=256)
+    embedding_model: Optional[str] = Field(None, description="向量模型名称，用于问答对检索，为空时不计算向量", max_length=100)
 
 
 class LlmConfigCreate(LlmConfigBase):
@@ -27,6 +31,10 @@ class LlmConfigUpdate(BaseModel):
     provider: Optional[str] = Field(None, description="供应商", max_length=100)
     model_name: Optional[str] = Field(None, description="模型名称", max_length=100)
     status: Optional[int] = Field(None, description="状态：1-启用，2-禁用", ge=1, le=2)
+    max_concurrency: Optional[int] = Field(None, description="每个进程内同时进行的请求上限，为空不限制", ge=1)
+    admission_concurrency: Optional[int] = Field(None, description="每个进程内同时处理的使用该配置的问答上限（准入控制），为空使用全局配置", ge=1)
+    context_window: Optional[int] = Field(None, description="模型上下文窗口（token），为空使用全局默认值", ge=256)
+    embedding_model: Optional[str] = Field(None, description="向量模型名称，用于问答对检索，为空时不计算向量", max_length=100)
 
 
 class LlmConfigResponse(LlmConfigBase):
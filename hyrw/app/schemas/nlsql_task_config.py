@@ -5,11 +5,13 @@ from pydantic import BaseModel, Field
 
 class NlsqlTaskConfigBase(BaseModel):
     llm_config_id: int = Field(..., description="LLM配置ID")
+    llm_config_ids: Optional[List[int]] = Field(None, description="备用LLM配置ID列表，按优先级排列，与llm_config_id组成调用池")
     db_config_id: int = Field(..., description="数据库配置ID")
     user_prompt_config_id: int = Field(..., description="用户提示词配置ID")
     select_tables: Optional[List[int]] = Field(None, description="选中的表元数据ID列表")
     description: Optional[str] = Field(None, description="任务描述")
     status: Optional[int] = Field(1, description="任务状态：1-初始化，2-提取元数据，3-生成表提示词，4-生成字段提示词，5-生成关联关系，6-完成")
+    max_concurrency: Optional[int] = Field(None, ge=1, description="每个进程内同时处理的问答上限，为空使用全局配置")
 
 
 class NlsqlTaskConfigCreate(NlsqlTaskConfigBase):
@@ -18,11 +20,13 @@ class NlsqlTaskConfigCreate(NlsqlTaskConfigBase):
 
 class NlsqlTaskConfigUpdate(BaseModel):
     llm_config_id: Optional[int] = Field(None, description="LLM配置ID")
+    llm_config_ids: Optional[List[int]] = Field(None, description="备用LLM配置ID列表，按优先级排列，与llm_config_id组成调用池")
     db_config_id: Optional[int] = Field(None, description="数据库配置ID")
     user_prompt_config_id: Optional[int] = Field(None, description="用户提示词配置ID")
     select_tables: Optional[List[int]] = Field(None, description="选中的表元数据ID列表")
     description: Optional[str] = Field(None, description="任务描述")
     status: Optional[int] = Field(None, description="任务状态")
+    max_concurrency: Optional[int] = Field(None, ge=1, description="每个进程内同时处理的问答上限，为空使用全局配置")
 
 
 class NlsqlTaskConfig(NlsqlTaskConfigBase):
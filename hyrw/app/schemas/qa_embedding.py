@@ -1,4 +1,4 @@
-from typing import List, Optional, Any
+from typing import Dict, List, Optional, Any
 from datetime import datetime
 from pydantic import BaseModel, Field
 
@@ -40,6 +40,7 @@ class QaEmbeddingUpdate(BaseModel):
 
 class QaEmbeddingInDB(QaEmbeddingBase):
     id: int
+    embedding_model: Optional[str] = Field(default=None, description="问题向量所用模型，为空表示尚未计算向量")
     created_at: datetime
     updated_at: datetime
 
@@ -56,10 +57,24 @@ class QaEmbeddingImportRequest(BaseModel):
     qa_json: List[QaJsonItem] = Field(..., description="问答对JSON列表")
 
 
+class QaEmbeddingBulkImportRequest(BaseModel):
+    task_id: int = Field(..., description="任务ID")
+    # 逐条校验，格式错误的条目计入 invalid_items 而不是使整个请求失败
+    qa_json: List[Dict[str, Any]] = Field(..., description="问答对JSON列表，格式同 QaJsonItem")
+    generate_where_conditions: bool = Field(default=True, description="是否在后台为未带WHERE条件的问答对提取条件")
+    llm_config_id: Optional[int] = Field(default=None, description="提取WHERE条件所用的LLM配置ID，默认使用任务的LLM配置")
+
+
 class QaEmbeddingWhereGenerationRequest(BaseModel):
     qa_embedding_ids: List[int] = Field(..., description="qa_embedding ID列表")
     llm_config_id: int = Field(..., description="LLM配置ID")
+    concurrency: Optional[int] = Field(default=None, ge=1, description="并发请求数，为空时取LLM配置的max_concurrency")
 
 
 class QaEmbeddingExportRequest(BaseModel):
     ids: List[int] = Field(..., description="要导出的ID列表")
+
+
+class QaEmbeddingRebuildRequest(BaseModel):
+    task_id: int = Field(..., description="任务ID")
+    only_missing: bool = Field(default=True, description="只计算缺少向量或向量模型已变更的问答对")
@@ -11,6 +11,25 @@ class TaskChatAskRequest(BaseModel):
     session_title: Optional[str] = Field(None, description="会话标题")
     description: Optional[str] = Field(None, description="用户描述")
     is_right: Optional[bool] = Field(None, description="是否正确")
+    speculative: Optional[bool] = Field(None, description="是否并行执行问答对匹配与选表，不传则使用服务端配置")
+    use_cache: Optional[bool] = Field(None, description="是否使用问答缓存，不传则使用服务端配置")
+    refresh_result: Optional[bool] = Field(None, description="命中缓存时是否重新执行SQL，不传则使用服务端配置")
+
+
+class TaskChatBatchQuestion(BaseModel):
+    question: str = Field(..., description="用户问题")
+    sql: Optional[str] = Field(None, description="参考SQL，原样返回便于比对（兼容 qa/*.json 格式）")
+
+
+class TaskChatBatchAskRequest(BaseModel):
+    task_id: int = Field(..., description="任务ID")
+    questions: List[TaskChatBatchQuestion] = Field(..., description="问题列表")
+    concurrency: Optional[int] = Field(None, ge=1, description="本批次同时进行的问题数，不传则使用服务端配置")
+    session_id: Optional[int] = Field(None, description="会话ID，不传则为本批次创建新会话")
+    session_title: Optional[str] = Field(None, description="会话标题")
+    speculative: Optional[bool] = Field(None, description="是否并行执行问答对匹配与选表，不传则使用服务端配置")
+    use_cache: Optional[bool] = Field(None, description="是否使用问答缓存，不传则使用服务端配置")
+    include_data: bool = Field(False, description="结果中是否包含SQL返回数据")
 
 
 class ChatSessionCreateRequest(BaseModel):
@@ -59,6 +78,7 @@ class ConversationItem(BaseModel):
     query_context: Optional[Any] = None
     column_patch: Optional[Any] = None
     feedback: Optional[str] = None
+    trace: Optional[Any] = None
     created_at: datetime
 
     class Config:
@@ -73,3 +93,19 @@ class TaskChatAskResponse(BaseModel):
     column_patch: Optional[Any] = None
     qColumnPatch: Optional[Any] = None
     create_sql_result: Optional[Any] = None
+    cache_hit: bool = False
+    trace: Optional[Dict[str, Any]] = None
+
+
+class AnswerCacheStats(BaseModel):
+    enabled: bool
+    size: int
+    max_entries: int
+    ttl_seconds: int
+    hits: int
+    misses: int
+    stale: int
+    puts: int
+    evictions: int
+    invalidations: int
+    hit_rate: float
@@ -0,0 +1,198 @@
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, Optional
+import asyncio
+import logging
+import math
+import time
+
+from app.core.config import settings
+from app.core.exceptions import TooManyRequestsError
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Waiter:
+    task_id: int
+    llm_config_id: Optional[int]
+    task_limit: int
+    llm_limit: int
+    future: "asyncio.Future[None]"
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class AdmissionPermit:
+    def __init__(self, controller: Optional["AdmissionController"], waiter: Optional[_Waiter]):
+        self._controller = controller
+        self._waiter = waiter
+        self._admitted_at = time.monotonic()
+        self.queued_ms = round((self._admitted_at - waiter.enqueued_at) * 1000, 1) if waiter else 0.0
+
+    def release(self) -> None:
+        if self._controller is None or self._waiter is None:
+            return
+        controller, waiter = self._controller, self._waiter
+        self._controller = self._waiter = None
+        controller._release(waiter, time.monotonic() - self._admitted_at)
+
+
+class AdmissionController:
+    """
+    问答准入控制：按任务、按 LLM 配置限制同时处理的问答数，超出的请求排队，
+    各任务的队列轮流放行，避免一个任务的大量请求饿死其他任务。
+    队列已满或排队超时直接返回 429，并根据近期平均耗时给出 Retry-After。
+    限制在单个 worker 进程内生效。
+    """
+
+    def __init__(self):
+        self._active_total = 0
+        self._active_by_task: Dict[int, int] = {}
+        self._active_by_llm: Dict[Any, int] = {}
+        # 有排队请求的任务，按轮转顺序排列
+        self._queues: "OrderedDict[int, Deque[_Waiter]]" = OrderedDict()
+        self._queued_total = 0
+        self._avg_service_seconds = 10.0
+        self._admitted = 0
+        self._rejected = 0
+        self._timed_out = 0
+
+    async def acquire(
+        self,
+        *,
+        task_id: int,
+        llm_config_id: Optional[int],
+        task_limit: Optional[int] = None,
+        llm_limit: Optional[int] = None,
+    ) -> AdmissionPermit:
+        if not settings.ADMISSION_ENABLED:
+            return AdmissionPermit(None, None)
+
+        waiter = _Waiter(
+            task_id=task_id,
+            llm_config_id=llm_config_id,
+            task_limit=task_limit or settings.ADMISSION_TASK_DEFAULT_CONCURRENCY,
+            llm_limit=llm_limit or settings.ADMISSION_LLM_DEFAULT_CONCURRENCY,
+            future=asyncio.get_running_loop().create_future(),
+        )
+        # 同任务已有排队时不插队，保持任务内先到先得
+        if task_id not in self._queues and self._can_admit(waiter):
+            self._admit(waiter)
+            return AdmissionPermit(self, waiter)
+
+        task_queue = self._queues.get(task_id)
+        task_queued = len(task_queue) if task_queue is not None else 0
+        if self._queued_total >= settings.ADMISSION_MAX_QUEUE or task_queued >= settings.ADMISSION_MAX_QUEUE_PER_TASK:
+            self._rejected += 1
+            retry_after = self._retry_after(task_queued, waiter.task_limit)
+            logger.warning(
+                "[admission] rejected task_id=%s queued_total=%s retry_after=%s",
+                task_id,
+                self._queued_total,
+                retry_after,
+            )
+            raise TooManyRequestsError(message="问答请求排队已满，请稍后重试", retry_after=retry_after)
+
+        self._queues.setdefault(task_id, deque()).append(waiter)
+        self._queued_total += 1
+        try:
+            await asyncio.wait({waiter.future}, timeout=settings.ADMISSION_QUEUE_TIMEOUT_SECONDS)
+        except asyncio.CancelledError:
+            if waiter.future.done():
+                self._release(waiter, 0.0)
+            else:
+                self._remove_waiter(waiter)
+            raise
+
+        if not waiter.future.done():
+            self._remove_waiter(waiter)
+            self._timed_out += 1
+            task_queue = self._queues.get(task_id)
+            retry_after = self._retry_after(len(task_queue) if task_queue else 0, waiter.task_limit)
+            raise TooManyRequestsError(message="问答请求排队超时，请稍后重试", retry_after=retry_after)
+        return AdmissionPermit(self, waiter)
+
+    def _can_admit(self, waiter: _Waiter) -> bool:
+        return (
+            self._active_total < settings.ADMISSION_MAX_ACTIVE
+            and self._active_by_task.get(waiter.task_id, 0) < waiter.task_limit
+            and self._active_by_llm.get(waiter.llm_config_id, 0) < waiter.llm_limit
+        )
+
+    def _admit(self, waiter: _Waiter) -> None:
+        self._active_total += 1
+        self._active_by_task[waiter.task_id] = self._active_by_task.get(waiter.task_id, 0) + 1
+        self._active_by_llm[waiter.llm_config_id] = self._active_by_llm.get(waiter.llm_config_id, 0) + 1
+        self._admitted += 1
+        if not waiter.future.done():
+            waiter.future.set_result(None)
+
+    def _release(self, waiter: _Waiter, service_seconds: float) -> None:
+        self._active_total -= 1
+        self._decrement(self._active_by_task, waiter.task_id)
+        self._decrement(self._active_by_llm, waiter.llm_config_id)
+        if service_seconds > 0:
+            self._avg_service_seconds = 0.8 * self._avg_service_seconds + 0.2 * service_seconds
+        self._dispatch()
+
+    def _remove_waiter(self, waiter: _Waiter) -> None:
+        task_queue = self._queues.get(waiter.task_id)
+        if task_queue is not None and waiter in task_queue:
+            task_queue.remove(waiter)
+            self._queued_total -= 1
+            if not task_queue:
+                del self._queues[waiter.task_id]
+        if not waiter.future.done():
+            waiter.future.cancel()
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """轮询各任务队列的队首，能放行就放行，并把该任务移到轮转末尾。"""
+        progressed = True
+        while progressed and self._queues:
+            progressed = False
+            for task_id in list(self._queues):
+                task_queue = self._queues[task_id]
+                head = task_queue[0]
+                if not self._can_admit(head):
+                    continue
+                task_queue.popleft()
+                self._queued_total -= 1
+                del self._queues[task_id]
+                if task_queue:
+                    self._queues[task_id] = task_queue
+                self._admit(head)
+                progressed = True
+
+    @staticmethod
+    def _decrement(counter: Dict[Any, int], key: Any) -> None:
+        remaining = counter.get(key, 0) - 1
+        if remaining > 0:
+            counter[key] = remaining
+        else:
+            counter.pop(key, None)
+
+    def _retry_after(self, task_queued: int, task_limit: int) -> int:
+        """按近期平均耗时估算排到本请求需要几轮：取全局队列和本任务队列中更慢的一个。"""
+        waves = max(
+            (self._queued_total + 1) / max(1, settings.ADMISSION_MAX_ACTIVE),
+            (task_queued + 1) / max(1, task_limit),
+        )
+        return max(1, min(60, math.ceil(self._avg_service_seconds * waves)))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": settings.ADMISSION_ENABLED,
+            "active": self._active_total,
+            "queued": self._queued_total,
+            "active_by_task": dict(self._active_by_task),
+            "queued_by_task": {task_id: len(queue) for task_id, queue in self._queues.items()},
+            "admitted": self._admitted,
+            "rejected": self._rejected,
+            "timed_out": self._timed_out,
+            "avg_service_seconds": round(self._avg_service_seconds, 2),
+        }
+
+
+admission_controller = AdmissionController()
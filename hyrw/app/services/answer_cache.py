@@ -0,0 +1,114 @@
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+import threading
+import time
+
+from app.core.config import settings
+from app.utils.text_normalize import normalize_question
+
+
+CacheKey = Tuple[int, str]
+
+
+@dataclass
+class CachedAnswer:
+    sql: str
+    sql_data: Any
+    context_version: int
+    selected_tables: List[Any] = field(default_factory=list)
+    query_context: Optional[Dict[str, Any]] = None
+    column_patch: Optional[Dict[str, Any]] = None
+    created_at: float = field(default_factory=time.time)
+
+
+class AnswerCache:
+    """
+    问答结果缓存：按 (任务ID, 归一化问题) 缓存生成的 SQL。
+    条目记录写入时的任务上下文版本，版本变化（提示词、问答对被修改）或过期后视为失效。
+    缓存和计数器都在进程内，多 worker 时各自独立。
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: int):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[CacheKey, CachedAnswer]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._stale = 0
+        self._puts = 0
+        self._evictions = 0
+        self._invalidations = 0
+
+    @staticmethod
+    def make_key(task_id: int, question: str) -> CacheKey:
+        return int(task_id), normalize_question(question)
+
+    def get(self, key: CacheKey, *, context_version: int) -> Optional[CachedAnswer]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            expired = self.ttl_seconds > 0 and time.time() - entry.created_at > self.ttl_seconds
+            if expired or entry.context_version != context_version:
+                del self._entries[key]
+                self._stale += 1
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry
+
+    def put(self, key: CacheKey, entry: CachedAnswer) -> None:
+        if not key[1] or self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            self._puts += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def invalidate(self, key: CacheKey) -> bool:
+        with self._lock:
+            removed = self._entries.pop(key, None) is not None
+            if removed:
+                self._invalidations += 1
+            return removed
+
+    def clear(self, task_id: Optional[int] = None) -> int:
+        with self._lock:
+            if task_id is None:
+                keys = list(self._entries)
+            else:
+                keys = [key for key in self._entries if key[0] == task_id]
+            for key in keys:
+                del self._entries[key]
+            self._invalidations += len(keys)
+            return len(keys)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "enabled": settings.ANSWER_CACHE_ENABLED,
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self._hits,
+                "misses": self._misses,
+                "stale": self._stale,
+                "puts": self._puts,
+                "evictions": self._evictions,
+                "invalidations": self._invalidations,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+answer_cache = AnswerCache(
+    max_entries=settings.ANSWER_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.ANSWER_CACHE_TTL_SECONDS,
+)
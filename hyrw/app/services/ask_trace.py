@@ -0,0 +1,170 @@
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Awaitable, Dict, List, Optional, TypeVar
+import asyncio
+import math
+import time
+
+
+T = TypeVar("T")
+
+_current_stage: "ContextVar[Optional[TraceStage]]" = ContextVar("ask_trace_stage", default=None)
+
+
+@dataclass
+class TraceStage:
+    trace: "AskTrace"
+    name: str
+    parent: Optional[str]
+    started_ms: float
+    duration_ms: Optional[float] = None
+    status: str = "running"
+    error: Optional[str] = None
+    attrs: Dict[str, Any] = field(default_factory=dict)
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    llm_calls: int = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "parent": self.parent,
+            "started_ms": self.started_ms,
+            "duration_ms": self.duration_ms,
+            "status": self.status,
+            "error": self.error,
+            "attrs": self.attrs,
+            "llm_calls": self.llm_calls,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+        }
+
+
+class AskTrace:
+    """
+    一次问答的阶段耗时与 token 记录。
+    阶段通过 run() 包裹协程计时；阶段内的 LLM 调用由 record_llm_usage 记到当前阶段，
+    当前阶段保存在 ContextVar 中，并发的子任务各自独立。
+    """
+
+    def __init__(self, task_id: Optional[int] = None):
+        self.task_id = task_id
+        self.started_at = datetime.utcnow()
+        self._started = time.perf_counter()
+        self.stages: List[TraceStage] = []
+
+    def _elapsed_ms(self) -> float:
+        return round((time.perf_counter() - self._started) * 1000, 1)
+
+    async def run(self, name: str, awaitable: Awaitable[T], *, parent: Optional[str] = None, **attrs: Any) -> T:
+        stage = TraceStage(trace=self, name=name, parent=parent, started_ms=self._elapsed_ms(), attrs=dict(attrs))
+        self.stages.append(stage)
+        token = _current_stage.set(stage)
+        begin = time.perf_counter()
+        try:
+            result = await awaitable
+            stage.status = "ok"
+            return result
+        except asyncio.CancelledError:
+            stage.status = "cancelled"
+            raise
+        except Exception as exc:
+            stage.status = "error"
+            stage.error = str(exc)[:500]
+            raise
+        finally:
+            stage.duration_ms = round((time.perf_counter() - begin) * 1000, 1)
+            _current_stage.reset(token)
+
+    def to_dict(self) -> Dict[str, Any]:
+        stages = [stage.to_dict() for stage in self.stages]
+        prompt_tokens = sum(stage.prompt_tokens for stage in self.stages)
+        completion_tokens = sum(stage.completion_tokens for stage in self.stages)
+        return {
+            "task_id": self.task_id,
+            "started_at": self.started_at.isoformat(),
+            "total_ms": self._elapsed_ms(),
+            "llm_calls": sum(stage.llm_calls for stage in self.stages),
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "stages": stages,
+        }
+
+
+async def traced(name: str, awaitable: Awaitable[T], **attrs: Any) -> T:
+    """在当前阶段所属的 trace 中记录一个子阶段；不在问答链路中调用时直接执行。"""
+    stage = _current_stage.get()
+    if stage is None:
+        return await awaitable
+    return await stage.trace.run(name, awaitable, parent=stage.name, **attrs)
+
+
+def annotate(**attrs: Any) -> None:
+    stage = _current_stage.get()
+    if stage is not None:
+        stage.attrs.update(attrs)
+
+
+def record_llm_usage(response: Any) -> None:
+    stage = _current_stage.get()
+    if stage is None:
+        return
+    stage.llm_calls += 1
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return
+    stage.prompt_tokens += int(getattr(usage, "prompt_tokens", 0) or 0)
+    stage.completion_tokens += int(getattr(usage, "completion_tokens", 0) or 0)
+
+
+def percentile(values: List[float], percent: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(percent / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize_traces(traces: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """按阶段汇总多次问答的 trace：调用次数、p50/p95 耗时、token 消耗。"""
+    totals: List[float] = []
+    per_stage: Dict[str, Dict[str, Any]] = {}
+    for trace in traces:
+        if trace.get("total_ms") is not None:
+            totals.append(float(trace["total_ms"]))
+        for stage in trace.get("stages") or []:
+            item = per_stage.setdefault(
+                stage.get("name") or "unknown",
+                {"durations": [], "count": 0, "errors": 0, "llm_calls": 0, "prompt_tokens": 0, "completion_tokens": 0},
+            )
+            item["count"] += 1
+            if stage.get("status") == "error":
+                item["errors"] += 1
+            if stage.get("duration_ms") is not None:
+                item["durations"].append(float(stage["duration_ms"]))
+            item["llm_calls"] += int(stage.get("llm_calls") or 0)
+            item["prompt_tokens"] += int(stage.get("prompt_tokens") or 0)
+            item["completion_tokens"] += int(stage.get("completion_tokens") or 0)
+
+    stages = []
+    for name, item in per_stage.items():
+        durations = item.pop("durations")
+        stages.append(
+            {
+                "name": name,
+                **item,
+                "total_tokens": item["prompt_tokens"] + item["completion_tokens"],
+                "p50_ms": percentile(durations, 50),
+                "p95_ms": percentile(durations, 95),
+                "max_ms": max(durations) if durations else None,
+            }
+        )
+    stages.sort(key=lambda stage: stage["p95_ms"] or 0, reverse=True)
+    return {
+        "sample_count": len(traces),
+        "p50_ms": percentile(totals, 50),
+        "p95_ms": percentile(totals, 95),
+        "stages": stages,
+    }
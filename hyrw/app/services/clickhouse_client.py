@@ -1,3 +1,5 @@
+import asyncio
+import logging
 import time
 import uuid
 from typing import Dict, Any, Optional
@@ -5,6 +7,9 @@ from typing import Dict, Any, Optional
 import clickhouse_connect
 
 
+logger = logging.getLogger(__name__)
+
+
 class ClickHouseClient:
     def __init__(
         self,
@@ -85,3 +90,115 @@ class ClickHouseClient:
                 self.client.close()
             finally:
                 self.client = None
+
+
+class AsyncClickHouseClient:
+    """clickhouse_connect 异步客户端的封装，返回结构与 ClickHouseClient.execute_sql 保持一致。"""
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        username: str,
+        password: str,
+        database: str,
+        settings: Optional[Dict[str, Any]] = None,
+    ):
+        self.host = host
+        self.port = int(port)
+        self.username = username
+        self.password = password
+        self.database = database
+        self.settings = settings or {}
+        self.client = None
+        self.session_id: Optional[str] = None
+
+    async def _connect(self, timeout: int = 20) -> None:
+        try:
+            self.session_id = f"session_{uuid.uuid4().hex[:8]}_{int(time.time())}"
+            merged_settings = {"session_id": self.session_id}
+            merged_settings.update(self.settings)
+            self.client = await clickhouse_connect.get_async_client(
+                host=self.host,
+                port=self.port,
+                username=self.username,
+                password=self.password,
+                database=self.database,
+                connect_timeout=5,
+                send_receive_timeout=timeout,
+                settings=merged_settings,
+            )
+        except Exception as e:
+            raise Exception(f"ClickHouse连接失败: {e}")
+
+    async def execute_sql(self, sql: str, parameters: Dict[str, Any] = None, timeout: int = 20) -> Dict[str, Any]:
+        if not self.client:
+            await self._connect(timeout=timeout)
+
+        start_time = time.time()
+        query_id = uuid.uuid4().hex
+        try:
+            result = await self.client.query(sql, parameters, settings={"query_id": query_id})
+            data = result.result_rows
+            columns = getattr(result, "column_names", None) or []
+            execution_time = round(time.time() - start_time, 3)
+
+            return {
+                "success": True,
+                "result": {
+                    "data": data,
+                    "columns": columns,
+                    "row_count": len(data),
+                    "execution_time": execution_time,
+                },
+                "error": None,
+                "sql": sql,
+                "session_id": self.session_id,
+                "timeout": False,
+            }
+        except asyncio.CancelledError:
+            # 异步客户端在线程中等待结果，取消协程不会中断服务端查询，需要显式 KILL
+            await self._kill_query(query_id)
+            raise
+        except Exception as e:
+            execution_time = round(time.time() - start_time, 3)
+            return {
+                "success": False,
+                "result": None,
+                "error": f"SQL执行错误 (session={self.session_id}): {str(e)}",
+                "sql": sql,
+                "session_id": self.session_id,
+                "timeout": False,
+                "execution_time": execution_time,
+            }
+
+    async def _kill_query(self, query_id: str) -> None:
+        # 原会话仍被执行中的查询占用，使用独立连接发送 KILL
+        killer = None
+        try:
+            killer = await clickhouse_connect.get_async_client(
+                host=self.host,
+                port=self.port,
+                username=self.username,
+                password=self.password,
+                database=self.database,
+                connect_timeout=5,
+                send_receive_timeout=5,
+            )
+            await killer.command(
+                "KILL QUERY WHERE query_id = {query_id:String} ASYNC",
+                parameters={"query_id": query_id},
+            )
+            logger.info("[clickhouse_client] killed cancelled query query_id=%s", query_id)
+        except Exception as exc:
+            logger.warning("[clickhouse_client] kill query failed query_id=%s error=%s", query_id, str(exc))
+        finally:
+            if killer is not None:
+                killer.close()
+
+    def close(self) -> None:
+        if self.client:
+            try:
+                self.client.close()
+            finally:
+                self.client = None
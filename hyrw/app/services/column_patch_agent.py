@@ -1,32 +1,32 @@
-from typing import Any, Dict, List
-
-from sqlalchemy.orm import Session
+from typing import Any, Dict, List, Optional, Sequence
 
 from app.models.llm_config import LlmConfig
 from app.services.generate_prompt import GeneratePrompt
 from app.services.openai_service import OpenAIService
+from app.services.task_context import TaskContext, task_context_store
 
 
 class ColumnPatchAgent:
     def __init__(
         self,
         *,
-        db: Session,
         task_id: int,
         user_input: str,
         llm_config: LlmConfig,
         query_context: Dict[str, Any],
         table_names: List[str],
+        context: Optional[TaskContext] = None,
+        llm_pool: Optional[Sequence[LlmConfig]] = None,
     ):
-        self.db = db
         self.task_id = task_id
         self.user_input = user_input
         self.llm_config = llm_config
         self.query_context = query_context
         self.table_names = table_names
-        self.openai_service = OpenAIService(llm_config)
+        self.context = context
+        self.openai_service = OpenAIService(llm_config, pool=llm_pool)
 
-    def generate_column_patch(self) -> Dict[str, Any]:
+    async def generate_column_patch(self) -> Dict[str, Any]:
         filtered_tables = self._filter_tables_by_fields()
         if not filtered_tables:
             return {
@@ -34,15 +34,16 @@ class ColumnPatchAgent:
                 "reason": "没有找到需要过滤的表或字段",
             }
 
-        prompt = self._build_column_patch_prompt(filtered_tables)
-        response = self.openai_service.client.chat.completions.create(
-            model=str(self.llm_config.model_name),
-            messages=[
+        context = self.context or await task_context_store.get(self.task_id)
+        prompt = self._build_column_patch_prompt(context, filtered_tables)
+        response = await self.openai_service.async_chat_completion(
+            [
                 {"role": "system", "content": "你是SQL WHERE条件生成专家。仅输出每表WHERE和原因。"},
                 {"role": "user", "content": prompt},
             ],
             temperature=float(getattr(self.llm_config, "temperature", 0.2) or 0.2),
             max_tokens=min(int(getattr(self.llm_config, "max_tokens", 2048) or 2048), 4096),
+            call_site="column_patch",
         )
 
         content = response.choices[0].message.content or ""
@@ -64,13 +65,12 @@ class ColumnPatchAgent:
 
         return filtered
 
-    def _build_column_patch_prompt(self, filtered_tables: Dict[str, List[str]]) -> str:
-        generator = GeneratePrompt(self.db)
+    def _build_column_patch_prompt(self, context: TaskContext, filtered_tables: Dict[str, List[str]]) -> str:
+        generator = GeneratePrompt(context)
         return generator.build_column_patch_prompt(
             user_input=self.user_input,
             query_context=self.query_context,
             table_names=list(filtered_tables.keys()),
-            task_id=self.task_id,
         )
 
     def _parse_response(self, content: str) -> Dict[str, Any]:
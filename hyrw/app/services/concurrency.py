@@ -0,0 +1,50 @@
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+import asyncio
+import time
+
+from app.services.ask_trace import annotate
+
+
+class KeyedLimiter:
+    """
+    按键（LlmConfig ID / DbConfig ID）限制同时进行的调用数，限制为空时不限制。
+    信号量在当前 worker 进程内生效；配置的上限变化后，新的调用使用新的信号量。
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._semaphores: Dict[Any, Tuple[int, asyncio.Semaphore]] = {}
+        self._in_flight: Dict[Any, int] = {}
+
+    @asynccontextmanager
+    async def slot(self, key: Any, limit: Optional[int]) -> AsyncIterator[None]:
+        if key is None or not limit or limit <= 0:
+            yield
+            return
+
+        entry = self._semaphores.get(key)
+        if entry is None or entry[0] != limit:
+            entry = (limit, asyncio.Semaphore(limit))
+            self._semaphores[key] = entry
+
+        begin = time.perf_counter()
+        async with entry[1]:
+            waited_ms = round((time.perf_counter() - begin) * 1000, 1)
+            if waited_ms >= 1:
+                annotate(**{f"{self.name}_wait_ms": waited_ms})
+            self._in_flight[key] = self._in_flight.get(key, 0) + 1
+            try:
+                yield
+            finally:
+                self._in_flight[key] -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            str(key): {"limit": limit, "in_flight": self._in_flight.get(key, 0)}
+            for key, (limit, _) in self._semaphores.items()
+        }
+
+
+llm_limiter = KeyedLimiter("llm")
+db_limiter = KeyedLimiter("db")
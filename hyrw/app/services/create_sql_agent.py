@@ -1,17 +1,74 @@
-from typing import Any, Dict, List
+from contextlib import aclosing
+from typing import Any, Callable, Dict, List, Optional, Sequence
 import json
+import logging
 import re
 
-from sqlalchemy.orm import Session
-
-from app.models.db_config import DbConfig
+from app.core.config import settings
 from app.models.llm_config import LlmConfig
-from app.models.nlsql_task_config import NlsqlTaskConfig
-from app.models.table_field_prompt import TableFieldPrompt
-from app.models.table_level_prompt import TableLevelPrompt
-from app.models.table_metadata_extended import TableMetadataBasic, TableSampleData
+from app.services.ask_trace import annotate
 from app.services.generate_prompt import GeneratePrompt
-from app.services.openai_service import OpenAIService
+from app.services.openai_service import CompletionTruncatedError, OpenAIService
+from app.services.task_context import TaskContext, task_context_store
+
+
+logger = logging.getLogger(__name__)
+
+SQL_MARKER = "【SQL】"
+REASON_MARKER = "【理由】"
+
+
+def parse_sql_response(content: str) -> Dict[str, Any]:
+    text = content.strip()
+    sql_match = re.search(r"【SQL】\s*(.*?)\s*(【理由】|$)", text, re.S)
+    reason_match = re.search(r"【理由】\s*(.*)$", text, re.S)
+
+    sql = sql_match.group(1).strip() if sql_match else ""
+    reason = reason_match.group(1).strip() if reason_match else ""
+
+    if not sql:
+        code = re.search(r"```sql\s*(.*?)\s*```", text, re.S | re.I)
+        if code:
+            sql = code.group(1).strip()
+
+    return {"sql": sql, "reason": reason}
+
+
+class SqlStreamParser:
+    """增量解析流式返回：【SQL】段之后出现【理由】即认为 SQL 已完整，结果与整体解析一致。"""
+
+    def __init__(self):
+        self._parts: List[str] = []
+        self._text = ""
+        self._scan_from = 0
+        self.sql: Optional[str] = None
+
+    def feed(self, delta: str) -> Optional[str]:
+        """追加一段文本；SQL 段刚完整时返回 SQL，其余情况返回 None。"""
+        self._parts.append(delta)
+        if self.sql is not None:
+            return None
+        self._text += delta
+        sql_at = self._text.find(SQL_MARKER)
+        if sql_at < 0:
+            return None
+        # 标记可能被拆在两段之间，从上次位置往前回退一个标记长度再找
+        reason_at = self._text.find(REASON_MARKER, max(sql_at + len(SQL_MARKER), self._scan_from - len(REASON_MARKER)))
+        self._scan_from = len(self._text)
+        if reason_at < 0:
+            return None
+        self.sql = parse_sql_response(self._text)["sql"]
+        return self.sql
+
+    @property
+    def text(self) -> str:
+        return "".join(self._parts)
+
+    def result(self) -> Dict[str, Any]:
+        parsed = parse_sql_response(self.text)
+        if self.sql:
+            parsed["sql"] = self.sql
+        return parsed
 
 
 class CreateSqlAgent:
@@ -20,74 +77,69 @@ class CreateSqlAgent:
     def __init__(
         self,
         *,
-        db: Session,
         task_id: int,
         user_input: str,
         llm_config: LlmConfig,
         query_context: Dict[str, Any],
         column_patches: Dict[str, Any],
         selected_tables: List[str],
+        context: Optional[TaskContext] = None,
+        llm_pool: Optional[Sequence[LlmConfig]] = None,
     ):
-        self.db = db
         self.task_id = task_id
         self.user_input = user_input
         self.llm_config = llm_config
         self.query_context = query_context
         self.column_patches = column_patches
         self.selected_tables = selected_tables
-        self.openai_service = OpenAIService(llm_config)
+        self.context = context
+        self.openai_service = OpenAIService(llm_config, pool=llm_pool)
 
-    def generate_sql(self) -> Dict[str, Any]:
-        database_type = self._get_database_type()
-        table_metadata = self._get_table_metadata()
-        table_level_info = self._get_table_level_info()
-        field_level_info = self._get_field_level_info()
+    async def generate_sql(self, on_sql: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+        """生成 SQL；流式模式下【SQL】段一结束就回调 on_sql，调用方可以先去执行，理由继续生成。"""
+        context = self.context or await task_context_store.get(self.task_id)
+        prepared = self._prepare_prompt(context)
+        if settings.ASK_CREATE_SQL_STREAM:
+            result = await self._stream_ai_generate_sql(prepared["prompt"], on_sql)
+        else:
+            result = await self._call_ai_generate_sql(prepared["prompt"])
+        return {
+            "sql": result.get("sql", ""),
+            "reason": result.get("reason", ""),
+            "database_type": prepared["database_type"],
+            "table_level_info": prepared["table_level_info"],
+            "field_level_info": prepared["field_level_info"],
+        }
+
+    def _prepare_prompt(self, context: TaskContext) -> Dict[str, Any]:
+        database_type = context.db_type or "unknown"
+        table_metadata = self._get_table_metadata(context)
+        table_level_info = self._get_table_level_info(context)
+        field_level_info = self._get_field_level_info(context)
 
         prompt = self._build_sql_prompt(
+            context,
             table_metadata=table_metadata,
             table_level_info=table_level_info,
             field_level_info=field_level_info,
             database_type=database_type,
         )
-
-        result = self._call_ai_generate_sql(prompt)
         return {
-            "sql": result.get("sql", ""),
-            "reason": result.get("reason", ""),
+            "prompt": prompt,
             "database_type": database_type,
             "table_level_info": table_level_info,
             "field_level_info": field_level_info,
         }
 
-    def _get_database_type(self) -> str:
-        task = self.db.query(NlsqlTaskConfig).filter(NlsqlTaskConfig.id == self.task_id).first()
-        if not task:
-            return "unknown"
-        db_config = self.db.query(DbConfig).filter(DbConfig.id == task.db_config_id).first()
-        if not db_config or not db_config.type:
-            return "unknown"
-        return str(db_config.type)
-
-    def _get_table_metadata(self) -> Dict[str, Any]:
+    def _get_table_metadata(self, context: TaskContext) -> Dict[str, Any]:
         result: Dict[str, Any] = {}
         for table_name in self.selected_tables:
             info: Dict[str, Any] = {"table_ddl": None, "sample_data": []}
-            metadata = (
-                self.db.query(TableMetadataBasic)
-                .filter(TableMetadataBasic.table_task_id == self.task_id, TableMetadataBasic.table_name == table_name)
-                .first()
-            )
+            metadata = context.table(table_name)
             if metadata:
                 info["table_ddl"] = metadata.table_ddl
-                samples = (
-                    self.db.query(TableSampleData)
-                    .filter(TableSampleData.table_metadata_id == metadata.id)
-                    .limit(2)
-                    .all()
-                )
                 sample_data: List[Any] = []
-                for sample in samples:
-                    value = sample.sample_data
+                for value in metadata.samples[:2]:
                     if isinstance(value, str):
                         try:
                             parsed = json.loads(value)
@@ -103,18 +155,12 @@ class CreateSqlAgent:
             result[table_name] = info
         return result
 
-    def _get_table_level_info(self) -> Dict[str, Any]:
-        rows = (
-            self.db.query(TableLevelPrompt)
-            .filter(
-                TableLevelPrompt.task_id == self.task_id,
-                TableLevelPrompt.table_name.in_(self.selected_tables),
-                TableLevelPrompt.is_active.is_(True),
-            )
-            .all()
-        )
+    def _get_table_level_info(self, context: TaskContext) -> Dict[str, Any]:
         data: Dict[str, Any] = {}
-        for row in rows:
+        for table_name in self.selected_tables:
+            row = context.prompt(table_name)
+            if row is None:
+                continue
             data[row.table_name] = {
                 "table_description": row.table_description,
                 "query_scenarios": row.query_scenarios,
@@ -124,38 +170,23 @@ class CreateSqlAgent:
             }
         return data
 
-    def _get_field_level_info(self) -> Dict[str, Any]:
+    def _get_field_level_info(self, context: TaskContext) -> Dict[str, Any]:
         data: Dict[str, Any] = {}
         table_usage = self.query_context.get("table_usage", {}) if isinstance(self.query_context, dict) else {}
-        prompts = (
-            self.db.query(TableLevelPrompt)
-            .filter(
-                TableLevelPrompt.task_id == self.task_id,
-                TableLevelPrompt.table_name.in_(self.selected_tables),
-                TableLevelPrompt.is_active.is_(True),
-            )
-            .all()
-        )
-        table_prompt_map = {p.table_name: p for p in prompts}
 
         for table_name in self.selected_tables:
             table_fields: Dict[str, Any] = {}
-            prompt = table_prompt_map.get(table_name)
+            prompt = context.prompt(table_name)
             if not prompt:
                 data[table_name] = table_fields
                 continue
 
-            query = self.db.query(TableFieldPrompt).filter(
-                TableFieldPrompt.nlsql_task_id == self.task_id,
-                TableFieldPrompt.table_level_prompt_id == prompt.id,
-            )
-
+            fields = list(prompt.fields)
             usage = table_usage.get(table_name, {}) if isinstance(table_usage, dict) else {}
             filter_fields = usage.get("filter_fields", []) if isinstance(usage, dict) else []
             if isinstance(filter_fields, list) and filter_fields:
-                query = query.filter(TableFieldPrompt.field_name.in_(filter_fields))
+                fields = [field for field in fields if field.field_name in filter_fields]
 
-            fields = query.all()
             for field in fields:
                 table_fields[field.field_name] = {
                     "business_meaning": field.business_meaning,
@@ -172,13 +203,14 @@ class CreateSqlAgent:
 
     def _build_sql_prompt(
         self,
+        context: TaskContext,
         *,
         table_metadata: Dict[str, Any],
         table_level_info: Dict[str, Any],
         field_level_info: Dict[str, Any],
         database_type: str,
     ) -> str:
-        generator = GeneratePrompt(self.db)
+        generator = GeneratePrompt(context)
         extras: List[str] = [f"数据库类型: {database_type}"]
         if self.query_context:
             extras.append(f"查询上下文: {json.dumps(self.query_context, ensure_ascii=False)}")
@@ -190,39 +222,63 @@ class CreateSqlAgent:
             table_names=self.selected_tables,
             other_messages="\n".join(extras),
             database_type=database_type,
-            task_id=self.task_id,
             table_metadata=table_metadata,
             table_level_info=table_level_info,
             field_level_info=field_level_info,
             query_context=self.query_context,
         )
 
-    def _call_ai_generate_sql(self, prompt: str) -> Dict[str, Any]:
-        response = self.openai_service.client.chat.completions.create(
-            model=str(self.llm_config.model_name),
-            messages=[
-                {
-                    "role": "system",
-                    "content": "你是SQL生成专家。请按格式返回【SQL】和【理由】。",
-                },
-                {"role": "user", "content": prompt},
-            ],
+    def _messages(self, prompt: str) -> List[Dict[str, str]]:
+        return [
+            {
+                "role": "system",
+                "content": "你是SQL生成专家。请按格式返回【SQL】和【理由】。",
+            },
+            {"role": "user", "content": prompt},
+        ]
+
+    async def _call_ai_generate_sql(self, prompt: str, adaptive_max_tokens: Optional[bool] = None) -> Dict[str, Any]:
+        response = await self.openai_service.async_chat_completion(
+            self._messages(prompt),
             temperature=float(getattr(self.llm_config, "temperature", 0.2) or 0.2),
             max_tokens=min(int(getattr(self.llm_config, "max_tokens", 2048) or 2048), 4096),
+            call_site="create_sql",
+            adaptive_max_tokens=adaptive_max_tokens,
         )
-        return self._parse_sql_response(response.choices[0].message.content or "")
-
-    def _parse_sql_response(self, content: str) -> Dict[str, Any]:
-        text = content.strip()
-        sql_match = re.search(r"【SQL】\s*(.*?)\s*(【理由】|$)", text, re.S)
-        reason_match = re.search(r"【理由】\s*(.*)$", text, re.S)
-
-        sql = sql_match.group(1).strip() if sql_match else ""
-        reason = reason_match.group(1).strip() if reason_match else ""
-
-        if not sql:
-            code = re.search(r"```sql\s*(.*?)\s*```", text, re.S | re.I)
-            if code:
-                sql = code.group(1).strip()
+        return parse_sql_response(response.choices[0].message.content or "")
 
-        return {"sql": sql, "reason": reason}
+    async def _stream_ai_generate_sql(
+        self,
+        prompt: str,
+        on_sql: Optional[Callable[[str], None]],
+    ) -> Dict[str, Any]:
+        parser = SqlStreamParser()
+        stream = self.openai_service.async_chat_completion_stream(
+            self._messages(prompt),
+            temperature=float(getattr(self.llm_config, "temperature", 0.2) or 0.2),
+            max_tokens=min(int(getattr(self.llm_config, "max_tokens", 2048) or 2048), 4096),
+            call_site="create_sql",
+        )
+        try:
+            async with aclosing(stream):
+                async for delta in stream:
+                    sql = parser.feed(delta)
+                    if sql is None:
+                        continue
+                    annotate(sql_ready_chars=len(parser.text))
+                    if on_sql is not None and sql:
+                        on_sql(sql)
+                    if not settings.ASK_CREATE_SQL_KEEP_REASON:
+                        break
+        except CompletionTruncatedError:
+            if parser.sql is None:
+                # 【SQL】段还没生成完就被截断，按原上限重新生成
+                logger.info("[create_sql] stream truncated before sql, retry task_id=%s", self.task_id)
+                return await self._call_ai_generate_sql(prompt, adaptive_max_tokens=False)
+            # 只截断了理由，SQL 不受影响
+        except Exception as exc:
+            # SQL 已交给调用方执行时，理由生成失败不影响本次问答
+            if parser.sql is None:
+                raise
+            logger.warning("[create_sql] reason stream failed task_id=%s error=%s", self.task_id, exc)
+        return parser.result()
@@ -2,6 +2,7 @@ from typing import List, Dict, Any, Optional
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.crud.db_config import crud_db_config
 from app.models.db_config import DbConfig
+from app.services.sql_result_cache import sql_result_cache
 
 
 class DbConfigService:
@@ -55,12 +56,16 @@ class DbConfigService:
             return None
 
         # 移除IP+端口唯一性限制，允许更新为重复的IP:端口配置
+        sql_result_cache.clear(db_config_id=id)
         return await crud_db_config.update(db=db, db_obj=db_obj, obj_in=obj_in)
 
     async def delete(self, db: AsyncSession, *, id: int) -> Optional[DbConfig]:
+        sql_result_cache.clear(db_config_id=id)
         return await crud_db_config.delete(db, id=id)
 
     async def delete_multiple(self, db: AsyncSession, *, ids: List[int]) -> int:
+        for id in ids:
+            sql_result_cache.clear(db_config_id=id)
         return await crud_db_config.delete_multiple(db, ids=ids)
 
     async def search(
@@ -1,25 +1,18 @@
 import json
 from typing import List, Dict, Any, Optional
-from sqlalchemy.orm import Session
-from app.models.table_level_prompt import TableLevelPrompt
-from app.models.table_field_prompt import TableFieldPrompt
-from app.models.nlsql_task_config import NlsqlTaskConfig
-from app.models.db_config import DbConfig
-from app.models.table_metadata_extended import TableMetadataBasic, TableSampleData, TableFieldMetadata
-from app.models.table_field_relation import TableFieldRelation
+from app.services.task_context import TaskContext
 
 
 class GeneratePrompt:
-    """生成表选择提示词的类"""
+    """生成表选择提示词的类，表信息全部来自任务上下文快照，不访问数据库"""
+
+    def __init__(self, context: TaskContext):
+        self.context = context
 
-    def __init__(self, db: Session):
-        self.db = db
-    
     def build_query_context_prompt(
         self,
         user_input: str,
         table_names: List[str],
-        task_id: int
     ) -> str:
         """
         构建完整的查询上下文提示词（用于 QueryContextTool）
@@ -27,7 +20,6 @@ class GeneratePrompt:
         Args:
             user_input: 用户输入
             table_names: 相关表名列表
-            task_id: PromptGenerationTask 的 ID
 
         Returns:
             str: 完整的查询上下文提示词
@@ -60,13 +52,10 @@ class GeneratePrompt:
 
         # ====================== 第一步：获取表提示词 TableLevelPrompt ======================
         table_prompts = {}
-        prompts = self.db.query(TableLevelPrompt).filter(
-            TableLevelPrompt.task_id == task_id,
-            TableLevelPrompt.table_name.in_(table_names),
-            TableLevelPrompt.is_active.is_(True),
-        ).all()
-        for prompt in prompts:
-            table_prompts[prompt.table_name] = prompt
+        for table_name in table_names:
+            prompt = self.context.prompt(table_name)
+            if prompt:
+                table_prompts[table_name] = prompt
 
         # ====================== 第二步：获取字段样例数据 TableFieldMetadata ======================
         # 需要将 TableMetadataBasic 与 TableFieldMetadata 关联并进行筛选
@@ -74,22 +63,14 @@ class GeneratePrompt:
         table_fields_data = {}
 
         for table_name in table_names:
-            # 获取 TableMetadataBasic（使用task_id过滤）
-            metadata = self.db.query(TableMetadataBasic).filter(
-                TableMetadataBasic.table_name == table_name,
-                TableMetadataBasic.table_task_id == task_id,
-            ).first()
+            metadata = self.context.table(table_name)
 
             if metadata:
                 table_metadata_map[table_name] = metadata
 
-                # 获取 TableFieldMetadata 的字段信息（每个字段只取1行样例数据）
-                fields = self.db.query(TableFieldMetadata).filter(
-                    TableFieldMetadata.table_metadata_id == metadata.id
-                ).all()
-
+                # TableFieldMetadata 的字段信息（每个字段只取1行样例数据）
                 table_fields_data[table_name] = []
-                for field in fields:
+                for field in metadata.fields:
                     # 解析样例数据，只取1行
                     sample_data = ""
                     if field.sample_data:
@@ -118,13 +99,8 @@ class GeneratePrompt:
         for table_name in table_names:
             if table_name in table_prompts:
                 table_prompt = table_prompts[table_name]
-                # 获取字段提示词
-                field_prompt_list = self.db.query(TableFieldPrompt).filter(
-                    TableFieldPrompt.table_level_prompt_id == table_prompt.id
-                ).all()
-
                 field_prompts[table_name] = {}
-                for fp in field_prompt_list:
+                for fp in table_prompt.fields:
                     field_prompts[table_name][fp.field_name] = {
                         'business_meaning': fp.business_meaning or '',
                         'data_format': fp.data_format or '',
@@ -264,7 +240,6 @@ TABLE_USAGE.CCC.JOIN_KEY=person_id
         user_input,
         query_context: Dict[str, Any],
         table_names: List[str],
-        task_id: Optional[int] = None,
     ) -> str:
         role_prompt = """
 你是一个【SQL WHERE 条件生成器】🧠，只负责生成 WHERE 条件。
@@ -340,26 +315,20 @@ REASON: 无可用字段或不满足 RULE
             columns_patch_prompt.append("\n═ 字段详细信息 ═")
             for table_name in table_names:
                 # 获取该表的字段提示词（按 table_level_prompt 关联过滤）
-                relevant_prompts = self.db.query(TableLevelPrompt).filter(
-                    TableLevelPrompt.table_name == table_name,
-                    TableLevelPrompt.is_active.is_(True)
-                )
-                if task_id is not None:
-                    relevant_prompts = relevant_prompts.filter(TableLevelPrompt.task_id == task_id)
-                relevant_prompts = relevant_prompts.all()
+                relevant_prompts = [
+                    prompt for prompt in self.context.prompts if prompt.table_name == table_name
+                ]
 
                 if relevant_prompts:
                     columns_patch_prompt.append(f"\n📋 表：{table_name}")
                     columns_patch_prompt.append("─" * 40)
 
                     for prompt in relevant_prompts:
-                        fields_query = self.db.query(TableFieldPrompt).filter(
-                            TableFieldPrompt.table_level_prompt_id == prompt.id
-                        )
+                        fields = list(prompt.fields)
                         filter_fields = table_usage.get(table_name, {}).get("filter_fields", []) if table_usage else []
                         if filter_fields:
-                            fields_query = fields_query.filter(TableFieldPrompt.field_name.in_(filter_fields))
-                        fields = fields_query.limit(5).all()  # 限制字段数量
+                            fields = [field for field in fields if field.field_name in filter_fields]
+                        fields = fields[:5]  # 限制字段数量
 
                         for field in fields:
                             columns_patch_prompt.append(f"\n🔹 字段：{field.field_name}")
@@ -393,7 +362,7 @@ REASON: 无可用字段或不满足 RULE
 
         # 添加数据库类型说明
         # 尝试获取第一个表的数据库类型
-        db_type_prompt = self._get_database_type_prompt(table_names[0], task_id=task_id) if table_names else ""
+        db_type_prompt = self._get_database_type_prompt(table_names[0]) if table_names else ""
         if db_type_prompt:
             columns_patch_prompt.append(db_type_prompt)
 
@@ -402,7 +371,7 @@ REASON: 无可用字段或不满足 RULE
 
         return "\n".join(columns_patch_prompt)
 
-    def _get_database_type_prompt(self, table_name: str, task_id: Optional[int] = None) -> str:
+    def _get_database_type_prompt(self, table_name: str) -> str:
         """
         获取数据库类型的特定提示词
 
@@ -415,31 +384,11 @@ REASON: 无可用字段或不满足 RULE
         if not table_name:
             return ""
 
-        # 通过 table_level_prompt -> nlsql_task_config -> db_config 获取数据库类型
-        table_prompt_query = self.db.query(TableLevelPrompt).filter(
-            TableLevelPrompt.table_name == table_name,
-            TableLevelPrompt.is_active.is_(True)
-        )
-        if task_id is not None:
-            table_prompt_query = table_prompt_query.filter(TableLevelPrompt.task_id == task_id)
-        table_prompt = table_prompt_query.first()
-
-        if not table_prompt:
-            return ""
-
-        task = self.db.query(NlsqlTaskConfig).filter(
-            NlsqlTaskConfig.id == table_prompt.task_id
-        ).first()
-        if not task:
+        # 只有该表有启用的表级提示词时才追加数据库类型说明
+        if not self.context.prompt(table_name) or not self.context.db_type:
             return ""
 
-        db_config = self.db.query(DbConfig).filter(
-            DbConfig.id == task.db_config_id
-        ).first()
-        if not db_config or not db_config.type:
-            return ""
-
-        db_type = db_config.type
+        db_type = self.context.db_type
 
         db_type_lower = str(db_type).lower()
 
@@ -512,7 +461,6 @@ REASON: 无可用字段或不满足 RULE
         table_names: List[str],
         other_messages: str,
         database_type: str = "unknown",
-        task_id: Optional[int] = None,
         table_metadata: Optional[Dict[str, Any]] = None,
         table_level_info: Optional[Dict[str, Any]] = None,
         field_level_info: Optional[Dict[str, Any]] = None,
@@ -555,18 +503,18 @@ REASON: 无可用字段或不满足 RULE
             ))
         else:
             # 否则使用基本的表信息
-            prompt_parts.append(self.build_table_detail_prompt(table_names, task_id=task_id))
+            prompt_parts.append(self.build_table_detail_prompt(table_names))
 
         # 表关系信息
         prompt_parts.append("\n" + "=" * 50)
         prompt_parts.append("表的关联关系：")
-        prompt_parts.append(self.build_table_relationship_prompt(table_names, task_id))
+        prompt_parts.append(self.build_table_relationship_prompt(table_names))
 
 
         # SQL生成规则
         prompt_parts.append("\n" + "=" * 50)
         prompt_parts.append("创建sql的规则：")
-        prompt_parts.append(self.build_table_size_join_order_prompt(table_names, task_id=task_id))
+        prompt_parts.append(self.build_table_size_join_order_prompt(table_names))
 
         # 用户输入
         prompt_parts.append("\n" + "=" * 50)
@@ -598,7 +546,7 @@ GROUP BY ...
         prompt_parts.append(output_requirements)
         return "\n".join(prompt_parts)
 
-    def build_table_detail_prompt(self, table_names: List[str], task_id: Optional[int] = None) -> str:
+    def build_table_detail_prompt(self, table_names: List[str]) -> str:
         """
         构建表详细信息提示词
 
@@ -615,12 +563,7 @@ GROUP BY ...
             prompt_parts.append("-" * 40)
 
             # 获取表元数据
-            metadata_query = self.db.query(TableMetadataBasic).filter(
-                TableMetadataBasic.table_name == table_name
-            )
-            if task_id is not None:
-                metadata_query = metadata_query.filter(TableMetadataBasic.table_task_id == task_id)
-            metadata = metadata_query.first()
+            metadata = self.context.table(table_name)
 
             if metadata:
                 # 显示DDL（截取前500字符）
@@ -629,26 +572,23 @@ GROUP BY ...
                     prompt_parts.append(f"DDL: {ddl}")
 
                 # 显示样例数据（最多2条）
-                sample_data_list = self.db.query(TableSampleData).filter(
-                    TableSampleData.table_metadata_id == metadata.id
-                ).limit(1).all()
+                sample_data_list = metadata.samples[:1]
 
                 if sample_data_list:
                     prompt_parts.append("\n样例数据:")
                     for i, sample in enumerate(sample_data_list, 1):
-                        prompt_parts.append(f"  样例{i}: {sample.sample_data}")
+                        prompt_parts.append(f"  样例{i}: {sample}")
 
             prompt_parts.append("")
 
         return "\n".join(prompt_parts)
 
-    def build_table_relationship_prompt(self, table_names: List[str] = None, task_id: Optional[int] = None) -> str:
+    def build_table_relationship_prompt(self, table_names: List[str] = None) -> str:
         """
-        构建表关系提示词，从数据库中获取真实的表关联关系
+        构建表关系提示词，使用任务中维护的真实表关联关系
 
         Args:
             table_names: 需要查询关系的表名列表（可选）
-            task_id: 任务ID（可选，用于隔离同名表跨任务干扰）
 
         Returns:
             str: 表关系信息
@@ -657,7 +597,7 @@ GROUP BY ...
             return "未指定表名，无法获取表关系信息。"
 
         # 获取表之间的关联关系
-        relationships = self._get_table_relationships(table_names, task_id)
+        relationships = self.context.relationships(table_names)
 
         if not relationships:
             return "未找到表之间的关联关系，请根据字段名推断可能的JOIN条件。"
@@ -691,68 +631,6 @@ GROUP BY ...
 
         return "\n".join(prompt_parts)
 
-    def _get_table_relationships(self, table_names: List[str], task_id: Optional[int] = None) -> List[Dict[str, Any]]:
-        """
-        获取指定表名列表之间的关联关系
-
-        Args:
-            table_names: 表名列表
-            task_id: 任务ID（可选）
-
-        Returns:
-            List[Dict]: 关联关系列表
-        """
-        relationships = []
-
-        # 首先获取这些表对应的 TableLevelPrompt
-        table_tasks = {}
-        for table_name in table_names:
-            query = self.db.query(TableLevelPrompt).filter(
-                TableLevelPrompt.table_name == table_name,
-                TableLevelPrompt.is_active.is_(True)
-            )
-            if task_id is not None:
-                query = query.filter(TableLevelPrompt.task_id == task_id)
-            table_prompt = query.first()
-            if table_prompt:
-                table_tasks[table_name] = table_prompt.id
-
-        if not table_tasks:
-            return relationships
-
-        # 获取项目ID列表
-        table_prompt_ids = list(table_tasks.values())
-
-        # 查询表字段关联关系
-        relations = self.db.query(TableFieldRelation).filter(
-            TableFieldRelation.source_table_level_prompt_id.in_(table_prompt_ids),
-            TableFieldRelation.target_table_level_prompt_id.in_(table_prompt_ids)
-        )
-        if task_id is not None:
-            relations = relations.filter(TableFieldRelation.nlsql_task_id == task_id)
-        relations = relations.all()
-
-        # 创建 task_id 到表名的映射
-        id_to_table = {v: k for k, v in table_tasks.items()}
-
-        # 整理关联关系
-        for relation in relations:
-            source_table = id_to_table.get(relation.source_table_level_prompt_id)
-            target_table = id_to_table.get(relation.target_table_level_prompt_id)
-
-            # 只保留两个表都在请求列表中的关系
-            if source_table in table_names and target_table in table_names:
-                relationships.append({
-                    'source_table': source_table,
-                    'target_table': target_table,
-                    'source_field': relation.source_field_name,
-                    'target_field': relation.target_field_name,
-                    'relation_type': relation.relation_type,
-                    'description': relation.relation_description
-                })
-
-        return relationships
-
     def _build_detailed_table_info(
         self,
         table_names: List[str],
@@ -994,7 +872,7 @@ GROUP BY ...
 
         return relevant_fields
 
-    def build_table_size_join_order_prompt(self, table_names: List[str], task_id: Optional[int] = None) -> str:
+    def build_table_size_join_order_prompt(self, table_names: List[str]) -> str:
         """
         构建表大小和连接顺序提示词
 
@@ -1009,12 +887,7 @@ GROUP BY ...
         # 获取表的大小信息
         table_sizes = {}
         for table_name in table_names:
-            metadata_query = self.db.query(TableMetadataBasic).filter(
-                TableMetadataBasic.table_name == table_name
-            )
-            if task_id is not None:
-                metadata_query = metadata_query.filter(TableMetadataBasic.table_task_id == task_id)
-            metadata = metadata_query.first()
+            metadata = self.context.table(table_name)
             if metadata and metadata.table_row_count:
                 table_sizes[table_name] = metadata.table_row_count
             else:
@@ -0,0 +1,410 @@
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+import asyncio
+import json
+import logging
+import os
+import socket
+import uuid
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import and_, delete, or_, update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import run_sync_session
+from app.models.background_job import BackgroundJob
+
+
+logger = logging.getLogger(__name__)
+
+FINISHED_STATUSES = ("succeeded", "failed", "cancelled")
+
+
+class JobContext:
+    """传给任务处理函数：读取参数、上报阶段与进度。"""
+
+    def __init__(self, runner: "JobRunner", job: BackgroundJob):
+        self.runner = runner
+        self.job_id = job.id
+        self.job_type = job.job_type
+        self.task_id = job.nlsql_task_id
+        self.params: Dict[str, Any] = json.loads(job.params) if job.params else {}
+        self.attempts = job.attempts
+
+    async def report(self, *, stage: Optional[str] = None, progress: Optional[Dict[str, Any]] = None) -> None:
+        values: Dict[str, Any] = {"updated_at": datetime.utcnow()}
+        if stage is not None:
+            values["stage"] = stage
+        if progress is not None:
+            values["progress"] = _dumps(progress)
+        try:
+            await run_sync_session(lambda db: self.runner._update_owned(db, self.job_id, values))
+        except Exception as exc:
+            logger.warning("[job_runner] report progress failed job_id=%s error=%s", self.job_id, str(exc))
+
+
+JobHandler = Callable[[JobContext], Awaitable[Any]]
+# 定期清理函数：在同一个会话中删除过期记录，由执行器统一提交
+PurgeHandler = Callable[[Session, datetime], None]
+
+
+class JobRunner:
+    """
+    持久化的后台任务执行器：任务写入 background_job 表，各 worker 轮询抢占并持有租约执行。
+    worker 退出或崩溃后租约过期，其他 worker 会重新领取（最多 JOB_MAX_ATTEMPTS 次）。
+    """
+
+    def __init__(self):
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._handlers: Dict[str, JobHandler] = {}
+        self._purges: List[PurgeHandler] = []
+        self._last_purge: Optional[float] = None
+        self._running: Dict[str, asyncio.Task] = {}
+        self._cancelled: set = set()
+        self._loop_task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._last_renew = 0.0
+
+    def register(self, job_type: str, handler: JobHandler) -> None:
+        self._handlers[job_type] = handler
+
+    def register_purge(self, handler: PurgeHandler) -> None:
+        """登记随过期任务一起按 JOB_PURGE_INTERVAL_SECONDS 定期执行的清理，避免在请求路径上删除旧记录。"""
+        self._purges.append(handler)
+
+    async def start(self) -> None:
+        if not settings.JOB_RUNNER_ENABLED or self._loop_task is not None:
+            return
+        self._wakeup = asyncio.Event()
+        self._loop_task = asyncio.create_task(self._run_loop())
+        logger.info("[job_runner] started owner=%s types=%s", self.owner, ",".join(sorted(self._handlers)))
+
+    async def stop(self) -> None:
+        """停止轮询并中断本进程正在执行的任务，任务退回队列由其他 worker 继续。"""
+        if self._loop_task is not None:
+            self._loop_task.cancel()
+            await asyncio.gather(self._loop_task, return_exceptions=True)
+            self._loop_task = None
+        tasks = list(self._running.values())
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def submit(
+        self,
+        job_type: str,
+        params: Dict[str, Any],
+        *,
+        task_id: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        if job_type not in self._handlers:
+            raise HTTPException(status_code=400, detail=f"不支持的任务类型 {job_type}")
+        now = datetime.utcnow()
+        job = BackgroundJob(
+            id=uuid.uuid4().hex,
+            job_type=job_type,
+            nlsql_task_id=task_id,
+            status="queued",
+            params=_dumps(params),
+            cancel_requested=False,
+            attempts=0,
+            created_at=now,
+            updated_at=now,
+        )
+
+        def save(db: Session) -> Dict[str, Any]:
+            db.add(job)
+            db.commit()
+            db.refresh(job)
+            return self._to_dict(job)
+
+        item = await run_sync_session(save)
+        logger.info("[job_runner] submitted job_id=%s type=%s task_id=%s", job.id, job_type, task_id)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return item
+
+    def _get_row(self, db: Session, job_id: str, *, job_type: Optional[str] = None) -> BackgroundJob:
+        job = db.get(BackgroundJob, job_id)
+        if job is None or (job_type is not None and job.job_type != job_type):
+            raise HTTPException(status_code=404, detail=f"后台任务 {job_id} 不存在")
+        return job
+
+    async def get_job(self, job_id: str, *, job_type: Optional[str] = None, with_result: bool = False) -> Dict[str, Any]:
+        return await run_sync_session(
+            lambda db: self._to_dict(self._get_row(db, job_id, job_type=job_type), with_result=with_result)
+        )
+
+    async def list_jobs(
+        self,
+        *,
+        job_type: Optional[str] = None,
+        task_id: Optional[int] = None,
+        status: Optional[str] = None,
+        page: int = 1,
+        page_size: int = 20,
+    ) -> Dict[str, Any]:
+        def query(db: Session) -> Dict[str, Any]:
+            rows = db.query(BackgroundJob)
+            if job_type is not None:
+                rows = rows.filter(BackgroundJob.job_type == job_type)
+            if task_id is not None:
+                rows = rows.filter(BackgroundJob.nlsql_task_id == task_id)
+            if status is not None:
+                rows = rows.filter(BackgroundJob.status == status)
+            total = rows.count()
+            items = (
+                rows.order_by(BackgroundJob.created_at.desc())
+                .offset((page - 1) * page_size)
+                .limit(page_size)
+                .all()
+            )
+            return {
+                "items": [self._to_dict(item) for item in items],
+                "total": total,
+                "page": page,
+                "page_size": page_size,
+                "pages": (total + page_size - 1) // page_size,
+            }
+
+        return await run_sync_session(query)
+
+    async def cancel(self, job_id: str, *, job_type: Optional[str] = None) -> Dict[str, Any]:
+        """排队中的任务直接取消；执行中的任务由持有方在下一次心跳时中断（本进程内立即中断）。"""
+
+        def request_cancel(db: Session) -> Dict[str, Any]:
+            job = self._get_row(db, job_id, job_type=job_type)
+            if job.status in FINISHED_STATUSES:
+                raise HTTPException(status_code=409, detail=f"后台任务 {job_id} 已结束，状态为 {job.status}")
+            now = datetime.utcnow()
+            job.cancel_requested = True
+            job.updated_at = now
+            if job.status == "queued":
+                job.status = "cancelled"
+                job.finished_at = now
+            db.commit()
+            db.refresh(job)
+            return self._to_dict(job)
+
+        item = await run_sync_session(request_cancel)
+        local = self._running.get(job_id)
+        if local is not None:
+            self._cancelled.add(job_id)
+            local.cancel()
+        logger.info("[job_runner] cancel requested job_id=%s status=%s", job_id, item["status"])
+        return item
+
+    async def _run_loop(self) -> None:
+        while True:
+            try:
+                await self._heartbeat()
+                await self._claim_jobs()
+                await self._purge()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("[job_runner] poll failed")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=settings.JOB_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def _heartbeat(self) -> None:
+        """续约本进程持有的任务，并中断其他 worker 上请求取消的任务。"""
+        job_ids = list(self._running)
+        if not job_ids:
+            return
+        loop = asyncio.get_running_loop()
+        renew = loop.time() - self._last_renew >= max(1.0, settings.JOB_LEASE_SECONDS / 3)
+        if renew:
+            self._last_renew = loop.time()
+        cancel_ids = await run_sync_session(lambda db: self._heartbeat_rows(db, job_ids, renew))
+        for job_id in cancel_ids:
+            task = self._running.get(job_id)
+            if task is not None and job_id not in self._cancelled:
+                self._cancelled.add(job_id)
+                task.cancel()
+
+    def _heartbeat_rows(self, db: Session, job_ids: List[str], renew: bool) -> List[str]:
+        if renew:
+            db.execute(
+                update(BackgroundJob)
+                .where(BackgroundJob.id.in_(job_ids), BackgroundJob.owner == self.owner)
+                .values(lease_until=datetime.utcnow() + timedelta(seconds=settings.JOB_LEASE_SECONDS))
+            )
+            db.commit()
+        rows = (
+            db.query(BackgroundJob.id)
+            .filter(BackgroundJob.id.in_(job_ids), BackgroundJob.cancel_requested.is_(True))
+            .all()
+        )
+        return [row[0] for row in rows]
+
+    async def _claim_jobs(self) -> None:
+        free = settings.JOB_MAX_CONCURRENCY - len(self._running)
+        if free <= 0 or not self._handlers:
+            return
+        jobs = await run_sync_session(lambda db: self._claim_rows(db, free))
+        for job in jobs:
+            context = JobContext(self, job)
+            task = asyncio.create_task(self._execute(context))
+            self._running[job.id] = task
+
+    async def _purge(self) -> None:
+        now = asyncio.get_running_loop().time()
+        if self._last_purge is not None and now - self._last_purge < settings.JOB_PURGE_INTERVAL_SECONDS:
+            return
+        self._last_purge = now
+        await run_sync_session(self._purge_rows)
+
+    def _purge_rows(self, db: Session) -> None:
+        now = datetime.utcnow()
+        db.execute(
+            delete(BackgroundJob).where(
+                BackgroundJob.status.in_(FINISHED_STATUSES),
+                BackgroundJob.finished_at < now - timedelta(days=settings.JOB_RETENTION_DAYS),
+            )
+        )
+        for handler in self._purges:
+            handler(db, now)
+        db.commit()
+
+    def _claim_rows(self, db: Session, limit: int) -> List[BackgroundJob]:
+        now = datetime.utcnow()
+        claimable = or_(
+            BackgroundJob.status == "queued",
+            and_(BackgroundJob.status == "running", BackgroundJob.lease_until < now),
+        )
+        candidates = (
+            db.query(BackgroundJob)
+            .filter(BackgroundJob.job_type.in_(list(self._handlers)), claimable)
+            .order_by(BackgroundJob.created_at)
+            .limit(limit)
+            .all()
+        )
+        claimed: List[BackgroundJob] = []
+        for job in candidates:
+            if job.cancel_requested:
+                # 执行方退出前已请求取消（租约过期后才被看到），直接结束而不是重新执行
+                db.execute(
+                    update(BackgroundJob)
+                    .where(BackgroundJob.id == job.id, BackgroundJob.status == job.status, claimable)
+                    .values(status="cancelled", error="已取消", finished_at=now, updated_at=now, lease_until=None)
+                )
+                continue
+            if job.status == "running" and job.attempts >= settings.JOB_MAX_ATTEMPTS:
+                # 执行方多次在完成前退出，不再重试
+                job.status = "failed"
+                job.error = f"执行方 {job.owner} 未完成任务且已达到最大尝试次数"
+                job.finished_at = now
+                job.updated_at = now
+                continue
+            # 条件更新保证多个 worker 同时轮询时只有一方领取成功
+            result = db.execute(
+                update(BackgroundJob)
+                .where(BackgroundJob.id == job.id, BackgroundJob.status == job.status, claimable)
+                .values(
+                    status="running",
+                    owner=self.owner,
+                    lease_until=now + timedelta(seconds=settings.JOB_LEASE_SECONDS),
+                    attempts=BackgroundJob.attempts + 1,
+                    started_at=now,
+                    updated_at=now,
+                )
+            )
+            if result.rowcount == 1:
+                claimed.append(job.id)
+        db.commit()
+        if not claimed:
+            return []
+        jobs = db.query(BackgroundJob).filter(BackgroundJob.id.in_(claimed)).all()
+        for job in jobs:
+            if job.attempts > 1:
+                logger.warning("[job_runner] recovered job_id=%s attempts=%s", job.id, job.attempts)
+        return sorted(jobs, key=lambda item: item.created_at)
+
+    async def _execute(self, context: JobContext) -> None:
+        job_id = context.job_id
+        logger.info("[job_runner] job started job_id=%s type=%s attempts=%s", job_id, context.job_type, context.attempts)
+        try:
+            result = await self._handlers[context.job_type](context)
+        except asyncio.CancelledError:
+            if job_id in self._cancelled:
+                await self._finish(job_id, "cancelled", error="已取消")
+            else:
+                # 进程退出时中断：退回队列
+                await self._finish(job_id, "queued")
+                raise
+        except Exception as exc:
+            logger.exception("[job_runner] job failed job_id=%s", job_id)
+            await self._finish(job_id, "failed", error=str(getattr(exc, "detail", None) or exc))
+        else:
+            await self._finish(job_id, "succeeded", result=result)
+        finally:
+            self._running.pop(job_id, None)
+            self._cancelled.discard(job_id)
+            if self._wakeup is not None:
+                self._wakeup.set()
+
+    async def _finish(self, job_id: str, status: str, *, result: Any = None, error: Optional[str] = None) -> None:
+        now = datetime.utcnow()
+        values: Dict[str, Any] = {"status": status, "updated_at": now, "lease_until": None}
+        if status == "queued":
+            values.update(owner=None, started_at=None)
+        else:
+            values.update(finished_at=now, error=error)
+            if result is not None:
+                values["result"] = _dumps(result)
+        try:
+            await asyncio.shield(run_sync_session(lambda db: self._update_owned(db, job_id, values)))
+        except Exception as exc:
+            logger.warning("[job_runner] finish failed job_id=%s status=%s error=%s", job_id, status, str(exc))
+        logger.info("[job_runner] job finished job_id=%s status=%s", job_id, status)
+
+    def _update_owned(self, db: Session, job_id: str, values: Dict[str, Any]) -> None:
+        db.execute(
+            update(BackgroundJob)
+            .where(BackgroundJob.id == job_id, BackgroundJob.owner == self.owner, BackgroundJob.status == "running")
+            .values(**values)
+        )
+        db.commit()
+
+    def _to_dict(self, job: BackgroundJob, *, with_result: bool = False) -> Dict[str, Any]:
+        item = {
+            "id": job.id,
+            "job_type": job.job_type,
+            "nlsql_task_id": job.nlsql_task_id,
+            "status": job.status,
+            "stage": job.stage,
+            "progress": _loads(job.progress),
+            "error": job.error,
+            "cancel_requested": bool(job.cancel_requested),
+            "attempts": job.attempts or 0,
+            "created_at": job.created_at,
+            "started_at": job.started_at,
+            "finished_at": job.finished_at,
+            "updated_at": job.updated_at,
+        }
+        if with_result:
+            item["result"] = _loads(job.result)
+        return item
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(jsonable_encoder(value), ensure_ascii=False)
+
+
+def _loads(raw: Optional[str]) -> Any:
+    if raw in (None, ""):
+        return None
+    try:
+        return json.loads(raw)
+    except json.JSONDecodeError:
+        return None
+
+
+job_runner = JobRunner()
@@ -0,0 +1,99 @@
+from typing import Dict, List, Sequence, Tuple
+import re
+import unicodedata
+
+import numpy as np
+
+
+_TOKEN_RUN_PATTERN = re.compile(r"[0-9a-z_]+|[\u3400-\u4dbf\u4e00-\u9fff]+")
+_CJK_PATTERN = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff]")
+
+
+def tokenize(text: str) -> List[str]:
+    """中文按连续汉字取二元、三元字组（单字时取单字），英文和数字按整词，均先做 NFKC 与小写归一化。"""
+    normalized = unicodedata.normalize("NFKC", text or "").lower()
+    terms: List[str] = []
+    for run in _TOKEN_RUN_PATTERN.findall(normalized):
+        if not _CJK_PATTERN.match(run):
+            terms.append(run)
+            continue
+        if len(run) == 1:
+            terms.append(run)
+            continue
+        for size in (2, 3):
+            terms.extend(run[index:index + size] for index in range(len(run) - size + 1))
+    return terms
+
+
+class LexicalIndex:
+    """
+    BM25 倒排索引，构建后只读。倒排表按词项拼成连续数组（offsets 切分），
+    构建时已把每个 (词项, 文档) 的 BM25 分量算好，查询只需按文档累加。
+    """
+
+    def __init__(self, documents: Sequence[str], k1: float = 1.2, b: float = 0.75):
+        self.size = len(documents)
+        postings: Dict[str, Dict[int, int]] = {}
+        lengths = np.zeros(self.size, dtype=np.float32)
+        for doc_id, document in enumerate(documents):
+            terms = tokenize(document)
+            lengths[doc_id] = len(terms)
+            for term in terms:
+                counts = postings.setdefault(term, {})
+                counts[doc_id] = counts.get(doc_id, 0) + 1
+
+        self.vocabulary: Dict[str, int] = {}
+        offsets = [0]
+        doc_ids: List[int] = []
+        tfs: List[int] = []
+        for term, counts in postings.items():
+            self.vocabulary[term] = len(offsets) - 1
+            doc_ids.extend(counts.keys())
+            tfs.extend(counts.values())
+            offsets.append(len(doc_ids))
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.doc_ids = np.asarray(doc_ids, dtype=np.int32)
+
+        document_frequency = np.diff(self.offsets).astype(np.float32)
+        self.idf = np.log1p((self.size - document_frequency + 0.5) / (document_frequency + 0.5))
+        tf = np.asarray(tfs, dtype=np.float32)
+        average_length = float(lengths.mean()) if self.size and lengths.any() else 1.0
+        norm = k1 * (1 - b + b * lengths[self.doc_ids] / average_length)
+        self.weights = (np.repeat(self.idf, np.diff(self.offsets)) * tf * (k1 + 1) / (tf + norm)).astype(np.float32)
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.offsets.nbytes + self.doc_ids.nbytes + self.weights.nbytes)
+
+    def scores(self, query: str) -> np.ndarray:
+        scores = np.zeros(self.size, dtype=np.float32)
+        for term in set(tokenize(query)):
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                continue
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            scores[self.doc_ids[start:end]] += self.weights[start:end]
+        return scores
+
+    def max_score(self, query: str) -> float:
+        """
+        查询的参考满分：每个词项按在平均长度文档中出现一次计分（即 idf），索引中没有的词项按只出现过一次的 idf 计。
+        用于把 BM25 得分换算到 0~1，使不同问题、不同任务的得分可以比较。
+        """
+        unseen_idf = float(np.log1p((self.size - 1 + 0.5) / (1 + 0.5)))
+        total = 0.0
+        for term in set(tokenize(query)):
+            term_id = self.vocabulary.get(term)
+            total += float(self.idf[term_id]) if term_id is not None else unseen_idf
+        return total
+
+    def top_k(self, query: str, k: int) -> List[Tuple[int, float]]:
+        """得分从高到低的 (文档下标, 得分)，只返回与查询有共同词项的文档。"""
+        if not self.size or k <= 0:
+            return []
+        scores = self.scores(query)
+        matched = np.flatnonzero(scores > 0)
+        if matched.size > k:
+            matched = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        ordered = matched[np.argsort(-scores[matched], kind="stable")]
+        return [(int(doc_id), float(scores[doc_id])) for doc_id in ordered]
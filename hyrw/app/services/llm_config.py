@@ -4,6 +4,8 @@ from app.crud.llm_config import crud_llm_config
 from app.schemas.llm_config import LlmConfigCreate, LlmConfigUpdate
 from app.models.llm_config import LlmConfig
 from app.core.exceptions import NotFoundError, ValidationError
+from app.services.llm_gateway import llm_gateway
+from app.services.llm_router import llm_router
 
 
 class LlmConfigService:
@@ -82,6 +84,8 @@ class LlmConfigService:
 
         # 调用CRUD层删除
         await crud_llm_config.delete(db, id=id)
+        llm_gateway.invalidate(id)
+        llm_router.reset(id)
         return obj
 
     async def delete_multi(self, db: AsyncSession, *, ids: List[int]) -> Dict[str, Any]:
@@ -94,7 +98,11 @@ class LlmConfigService:
             await self.get(db, id)
 
         # 调用CRUD层批量删除
-        return await crud_llm_config.delete_multi(db, ids=ids)
+        result = await crud_llm_config.delete_multi(db, ids=ids)
+        for id in ids:
+            llm_gateway.invalidate(id)
+            llm_router.reset(id)
+        return result
 
     async def get_by_provider(self, db: AsyncSession, *, provider: str) -> List[LlmConfig]:
         """根据供应商获取LLM配置列表"""
@@ -0,0 +1,161 @@
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Set, Tuple
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+
+import httpx
+from openai import AsyncOpenAI, OpenAI
+
+from app.core.config import settings
+from app.models.llm_config import LlmConfig
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_OPENAI_BASE_URL = "https://api.openai.com/v1"
+
+
+@dataclass
+class _ClientEntry:
+    fingerprint: str
+    client: OpenAI
+    async_client: AsyncOpenAI
+    created_at: float
+    acquired: int = 0
+    retired_at: Optional[float] = None
+
+
+class LlmGateway:
+    """
+    进程内共享的 LLM 客户端：每个 LlmConfig 一组同步/异步客户端，底层 httpx 连接池保持长连接复用。
+    base_url 或 api_key 变化时重建；旧客户端可能仍有请求在用，退役超过一次调用可能持续的最长时间
+    （超时 ×（重试次数 + 1））后，在事件循环中再次取用客户端时关闭，进程退出时关闭其余的。
+    超时、重试次数与连接池大小统一在这里设置。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[Any, _ClientEntry] = {}
+        self._retired: List[_ClientEntry] = []
+        self._closing: Set[asyncio.Task] = set()
+        self._rebuilds = 0
+        self._closed = 0
+
+    def clients(self, model_config: LlmConfig) -> Tuple[OpenAI, AsyncOpenAI]:
+        base_url = getattr(model_config, "base_url", None)
+        api_key = getattr(model_config, "api_key", None)
+        key = getattr(model_config, "id", None)
+        if key is None:
+            # 未入库的配置（如临时测试连接）按连接参数区分
+            key = ("adhoc", base_url)
+        fingerprint = hashlib.sha256(f"{base_url}\n{api_key}".encode("utf-8")).hexdigest()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.fingerprint != fingerprint:
+                if entry is not None:
+                    self._retire(entry)
+                    self._rebuilds += 1
+                    logger.info("[llm_gateway] rebuild clients llm_config_id=%s", key)
+                entry = self._build(fingerprint, base_url, api_key)
+                self._entries[key] = entry
+            entry.acquired += 1
+            expired = self._pop_expired()
+        self._close_expired(expired)
+        return entry.client, entry.async_client
+
+    def _retire(self, entry: _ClientEntry) -> None:
+        entry.retired_at = time.time()
+        self._retired.append(entry)
+
+    def _pop_expired(self) -> List[_ClientEntry]:
+        """取出退役已超过宽限期的客户端；只在事件循环线程中关闭（异步客户端须在所属的事件循环中关闭）。"""
+        if not self._retired:
+            return []
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return []
+        grace = settings.LLM_TIMEOUT_SECONDS * (settings.LLM_MAX_RETRIES + 1)
+        now = time.time()
+        expired = [entry for entry in self._retired if now - entry.retired_at >= grace]
+        if expired:
+            self._retired = [entry for entry in self._retired if now - entry.retired_at < grace]
+        return expired
+
+    def _close_expired(self, entries: List[_ClientEntry]) -> None:
+        for entry in entries:
+            task = asyncio.get_running_loop().create_task(self._close_entry(entry))
+            self._closing.add(task)
+            task.add_done_callback(self._closing.discard)
+        if entries:
+            self._closed += len(entries)
+            logger.info("[llm_gateway] closed retired clients count=%s", len(entries))
+
+    async def _close_entry(self, entry: _ClientEntry) -> None:
+        try:
+            entry.client.close()
+            await entry.async_client.close()
+        except Exception as exc:
+            logger.warning("[llm_gateway] close client failed error=%s", exc)
+
+    def _build(self, fingerprint: str, base_url: Optional[str], api_key: Optional[str]) -> _ClientEntry:
+        timeout = httpx.Timeout(settings.LLM_TIMEOUT_SECONDS, connect=settings.LLM_CONNECT_TIMEOUT_SECONDS)
+        limits = httpx.Limits(
+            max_connections=settings.LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.LLM_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.LLM_KEEPALIVE_EXPIRY_SECONDS,
+        )
+        client_kwargs = {
+            "api_key": api_key,
+            "base_url": base_url if base_url != DEFAULT_OPENAI_BASE_URL else None,
+            "timeout": timeout,
+            "max_retries": settings.LLM_MAX_RETRIES,
+        }
+        return _ClientEntry(
+            fingerprint=fingerprint,
+            client=OpenAI(http_client=httpx.Client(timeout=timeout, limits=limits), **client_kwargs),
+            async_client=AsyncOpenAI(http_client=httpx.AsyncClient(timeout=timeout, limits=limits), **client_kwargs),
+            created_at=time.time(),
+        )
+
+    def invalidate(self, llm_config_id: Optional[int] = None) -> None:
+        with self._lock:
+            if llm_config_id is None:
+                for entry in self._entries.values():
+                    self._retire(entry)
+                self._entries.clear()
+            else:
+                entry = self._entries.pop(llm_config_id, None)
+                if entry is not None:
+                    self._retire(entry)
+            expired = self._pop_expired()
+        self._close_expired(expired)
+
+    async def aclose(self) -> None:
+        with self._lock:
+            entries = list(self._entries.values()) + self._retired
+            self._entries.clear()
+            self._retired = []
+        for entry in entries:
+            await self._close_entry(entry)
+        if self._closing:
+            await asyncio.gather(*self._closing, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "clients": {
+                    str(key): {"acquired": entry.acquired, "created_at": entry.created_at}
+                    for key, entry in self._entries.items()
+                },
+                "rebuilds": self._rebuilds,
+                "retired": len(self._retired),
+                "closed": self._closed,
+            }
+
+
+llm_gateway = LlmGateway()
@@ -0,0 +1,214 @@
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from app.core.config import settings
+
+
+logger = logging.getLogger(__name__)
+
+LLM_CACHE_HEADER = "X-LLM-Cache"
+# use：正常读写；refresh：不读但写入新结果；bypass：不读也不写
+LLM_CACHE_MODES = ("use", "refresh", "bypass")
+
+llm_cache_mode: ContextVar[str] = ContextVar("llm_cache_mode", default="use")
+
+
+def parse_cache_mode(value: Optional[str]) -> str:
+    mode = (value or "").strip().lower()
+    return mode if mode in LLM_CACHE_MODES else "use"
+
+
+class LlmCacheModeMiddleware:
+    """把请求头 X-LLM-Cache 写入上下文，对本次请求内（含线程池中）的所有 LLM 调用生效。"""
+
+    def __init__(self, app: Any):
+        self.app = app
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        header = LLM_CACHE_HEADER.lower().encode("latin-1")
+        value = next((v.decode("latin-1") for k, v in scope.get("headers", []) if k == header), None)
+        token = llm_cache_mode.set(parse_cache_mode(value))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            llm_cache_mode.reset(token)
+
+
+class LlmResponseCache:
+    """
+    LLM 补全结果的磁盘缓存（SQLite），键为 (base_url, model, messages, temperature, max_tokens) 的哈希。
+    只有在 LLM_RESPONSE_CACHE_CALL_SITES 中或调用方显式开启的调用点才会读写；
+    总大小超过上限时按最近访问时间淘汰。多个 worker 进程共用同一个文件。
+    """
+
+    def __init__(self, path: str, max_bytes: int, call_sites: List[str]):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.call_sites = {site.strip() for site in call_sites if site.strip()}
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._hits = 0
+        self._misses = 0
+        self._writes = 0
+        self._evicted = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_response_cache ("
+                "cache_key TEXT PRIMARY KEY, call_site TEXT, model TEXT, response TEXT NOT NULL, "
+                "size INTEGER NOT NULL, hits INTEGER NOT NULL DEFAULT 0, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_llm_response_cache_accessed ON llm_response_cache (accessed_at)"
+            )
+            self._conn = conn
+        return self._conn
+
+    def enabled_for(self, call_site: Optional[str], use_cache: Optional[bool] = None) -> bool:
+        if not settings.LLM_RESPONSE_CACHE_ENABLED or llm_cache_mode.get() == "bypass":
+            return False
+        if use_cache is not None:
+            return use_cache
+        return call_site is not None and call_site in self.call_sites
+
+    def make_key(
+        self,
+        *,
+        base_url: Optional[str],
+        model: str,
+        messages: List[Dict[str, Any]],
+        temperature: Optional[float],
+        max_tokens: Optional[int],
+    ) -> str:
+        payload = json.dumps(
+            {
+                "base_url": base_url,
+                "model": model,
+                "messages": messages,
+                "temperature": temperature,
+                "max_tokens": max_tokens,
+            },
+            ensure_ascii=False,
+            sort_keys=True,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        if llm_cache_mode.get() != "use":
+            return None
+        try:
+            with self._lock:
+                conn = self._connection()
+                row = conn.execute(
+                    "SELECT response FROM llm_response_cache WHERE cache_key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    self._misses += 1
+                    return None
+                conn.execute(
+                    "UPDATE llm_response_cache SET hits = hits + 1, accessed_at = ? WHERE cache_key = ?",
+                    (time.time(), key),
+                )
+                self._hits += 1
+                return row[0]
+        except sqlite3.Error as exc:
+            logger.warning("[llm_response_cache] read failed error=%s", exc)
+            return None
+
+    def put(self, key: str, response: str, *, call_site: Optional[str], model: str) -> None:
+        size = len(response.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        try:
+            with self._lock:
+                conn = self._connection()
+                conn.execute(
+                    "INSERT OR REPLACE INTO llm_response_cache "
+                    "(cache_key, call_site, model, response, size, hits, created_at, accessed_at) "
+                    "VALUES (?, ?, ?, ?, ?, 0, ?, ?)",
+                    (key, call_site, model, response, size, now, now),
+                )
+                self._writes += 1
+                self._evict(conn)
+        except sqlite3.Error as exc:
+            logger.warning("[llm_response_cache] write failed error=%s", exc)
+
+    def discard(self, key: str) -> None:
+        """调用方解析缓存内容失败时删除该条，避免一直命中坏结果。"""
+        try:
+            with self._lock:
+                self._connection().execute("DELETE FROM llm_response_cache WHERE cache_key = ?", (key,))
+        except sqlite3.Error as exc:
+            logger.warning("[llm_response_cache] discard failed error=%s", exc)
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_response_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # 一次淘汰到上限的 90%，避免每次写入都触发淘汰
+        target = int(self.max_bytes * 0.9)
+        removed = 0
+        for cache_key, size in conn.execute(
+            "SELECT cache_key, size FROM llm_response_cache ORDER BY accessed_at"
+        ).fetchall():
+            if total <= target:
+                break
+            conn.execute("DELETE FROM llm_response_cache WHERE cache_key = ?", (cache_key,))
+            total -= size
+            removed += 1
+        self._evicted += removed
+        logger.info("[llm_response_cache] evicted count=%s total_bytes=%s", removed, total)
+
+    def clear(self, call_site: Optional[str] = None) -> int:
+        with self._lock:
+            conn = self._connection()
+            if call_site is None:
+                cursor = conn.execute("DELETE FROM llm_response_cache")
+            else:
+                cursor = conn.execute("DELETE FROM llm_response_cache WHERE call_site = ?", (call_site,))
+            return cursor.rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT call_site, COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(hits), 0) "
+                "FROM llm_response_cache GROUP BY call_site"
+            ).fetchall()
+        return {
+            "enabled": settings.LLM_RESPONSE_CACHE_ENABLED,
+            "path": self.path,
+            "max_bytes": self.max_bytes,
+            "call_sites": sorted(self.call_sites),
+            "entries": {
+                str(call_site): {"count": count, "bytes": size, "hits": hits}
+                for call_site, count, size, hits in rows
+            },
+            "hits": self._hits,
+            "misses": self._misses,
+            "writes": self._writes,
+            "evicted": self._evicted,
+        }
+
+
+llm_response_cache = LlmResponseCache(
+    path=settings.LLM_RESPONSE_CACHE_PATH,
+    max_bytes=settings.LLM_RESPONSE_CACHE_MAX_BYTES,
+    call_sites=settings.LLM_RESPONSE_CACHE_CALL_SITES.split(","),
+)
@@ -0,0 +1,257 @@
+from collections import deque
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Deque, Dict, List, Optional, Sequence
+import logging
+import random
+import threading
+import time
+
+from openai import APIConnectionError, APIStatusError
+
+from app.core.config import settings
+from app.models.llm_config import LlmConfig
+from app.services.ask_trace import percentile
+
+
+logger = logging.getLogger(__name__)
+
+
+def is_failover_error(exc: BaseException) -> bool:
+    """429、5xx、超时与连接错误换一个端点可能成功；其余错误（如 400）换端点也一样失败。"""
+    if isinstance(exc, APIConnectionError):
+        return True
+    if isinstance(exc, APIStatusError):
+        return exc.status_code == 429 or exc.status_code >= 500
+    return False
+
+
+def _retry_after_seconds(exc: BaseException) -> Optional[float]:
+    response = getattr(exc, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+@lru_cache(maxsize=8)
+def _parse_call_site_seconds(value: str) -> Dict[str, float]:
+    result: Dict[str, float] = {}
+    for item in value.split(","):
+        name, _, seconds = item.partition("=")
+        if name.strip() and seconds.strip():
+            result[name.strip()] = float(seconds)
+    return result
+
+
+def call_site_deadline(call_site: Optional[str]) -> Optional[float]:
+    """调用点的截止时间（秒），None 表示不限制。"""
+    seconds = _parse_call_site_seconds(settings.LLM_CALL_SITE_DEADLINES).get(call_site or "", settings.LLM_DEADLINE_SECONDS)
+    return seconds if seconds and seconds > 0 else None
+
+
+def hedge_enabled(call_site: Optional[str]) -> bool:
+    if not settings.LLM_HEDGE_ENABLED or not call_site:
+        return False
+    return call_site in {site.strip() for site in settings.LLM_HEDGE_CALL_SITES.split(",")}
+
+
+def load_llm_pool(db: Any, primary: LlmConfig, backup_ids: Optional[Sequence[int]]) -> List[LlmConfig]:
+    """主配置在前，其后按任务配置的顺序排列已启用的备用配置。"""
+    ids = [int(item) for item in backup_ids or [] if int(item) != primary.id]
+    if not ids:
+        return [primary]
+    rows = db.query(LlmConfig).filter(LlmConfig.id.in_(ids), LlmConfig.status == 1).all()
+    by_id = {row.id: row for row in rows}
+    pool = [primary]
+    for llm_config_id in dict.fromkeys(ids):
+        if llm_config_id in by_id:
+            pool.append(by_id[llm_config_id])
+    return pool
+
+
+@dataclass
+class EndpointHealth:
+    latency_ms: Optional[float] = None
+    error_rate: float = 0.0
+    calls: int = 0
+    failures: int = 0
+    consecutive_failures: int = 0
+    # 熔断打开后到 cooldown_until 之前直接跳过；之后半开，只放行一个探测请求
+    tripped: bool = False
+    cooldown_until: float = 0.0
+    probe_in_flight: bool = False
+    rejected: int = 0
+    last_error: Optional[str] = None
+    last_error_at: Optional[float] = None
+    latencies: Deque[float] = field(default_factory=lambda: deque(maxlen=settings.LLM_ROUTER_LATENCY_WINDOW))
+
+    def state(self, now: float) -> str:
+        if not self.tripped:
+            return "closed"
+        return "open" if now < self.cooldown_until else "half_open"
+
+    def available(self, now: float) -> bool:
+        state = self.state(now)
+        return state == "closed" or (state == "half_open" and not self.probe_in_flight)
+
+    def score(self) -> float:
+        # 还没调用过的端点分数为 0，先分到请求以得到延迟数据；只失败过的排在有延迟数据的之后
+        if self.latency_ms is None:
+            return float("inf") if self.failures else 0.0
+        return self.latency_ms * (1 + settings.LLM_ROUTER_ERROR_PENALTY * self.error_rate)
+
+
+class LlmRouter:
+    """
+    按 LlmConfig 记录调用延迟与错误率的滑动平均，为一组可互换的配置给出本次调用的尝试顺序，
+    并为每个配置维护熔断状态：熔断中的端点不参与路由，整池都熔断时调用方直接失败。
+    统计只在当前 worker 进程内生效。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._health: Dict[int, EndpointHealth] = {}
+
+    def _entry(self, llm_config_id: int) -> EndpointHealth:
+        entry = self._health.get(llm_config_id)
+        if entry is None:
+            entry = EndpointHealth()
+            self._health[llm_config_id] = entry
+        return entry
+
+    def _rank(self, pool: Sequence[LlmConfig], now: float) -> List[LlmConfig]:
+        available = [
+            (index, config)
+            for index, config in enumerate(pool)
+            if config.id is None or self._entry(config.id).available(now)
+        ]
+        available.sort(key=lambda item: (self._entry(item[1].id).score() if item[1].id is not None else 0.0, item[0]))
+        return [config for _, config in available]
+
+    def order(self, pool: Sequence[LlmConfig]) -> List[LlmConfig]:
+        """本次调用的尝试顺序，已去掉熔断中的端点；可能为空。"""
+        with self._lock:
+            ordered = self._rank(pool, time.time())
+        if len(ordered) > 1 and random.random() < settings.LLM_ROUTER_EXPLORE_RATIO:
+            explored = random.choice(ordered[1:])
+            ordered.remove(explored)
+            ordered.insert(0, explored)
+        return ordered
+
+    def begin(self, llm_config_id: Optional[int]) -> bool:
+        """尝试调用前确认端点可用；半开状态下占用唯一的探测名额。"""
+        if llm_config_id is None:
+            return True
+        now = time.time()
+        with self._lock:
+            entry = self._entry(llm_config_id)
+            if not entry.available(now):
+                entry.rejected += 1
+                return False
+            if entry.state(now) == "half_open":
+                entry.probe_in_flight = True
+            return True
+
+    def abandon(self, llm_config_id: Optional[int]) -> None:
+        """调用被取消或因请求本身出错而结束时释放探测名额，不计入健康统计。"""
+        if llm_config_id is None:
+            return
+        with self._lock:
+            self._entry(llm_config_id).probe_in_flight = False
+
+    def retry_after(self, pool: Sequence[LlmConfig]) -> float:
+        """整池不可用时，最早恢复探测的等待秒数。"""
+        now = time.time()
+        with self._lock:
+            waits = [
+                max(0.0, self._entry(config.id).cooldown_until - now)
+                for config in pool
+                if config.id is not None
+            ]
+        return min(waits) if waits else 0.0
+
+    def hedge_delay(self, pool: Sequence[LlmConfig]) -> Optional[float]:
+        """首选端点近期延迟的分位数（秒）；样本不足时返回 None，表示不对冲。"""
+        with self._lock:
+            ranked = self._rank(pool, time.time())
+            if not ranked or ranked[0].id is None:
+                return None
+            samples = list(self._entry(ranked[0].id).latencies)
+        if len(samples) < settings.LLM_HEDGE_MIN_SAMPLES:
+            return None
+        delay_ms = max(percentile(samples, settings.LLM_HEDGE_PERCENTILE) or 0.0, settings.LLM_HEDGE_MIN_DELAY_MS)
+        return delay_ms / 1000
+
+    def record_success(self, llm_config_id: Optional[int], latency_ms: float) -> None:
+        if llm_config_id is None:
+            return
+        alpha = settings.LLM_ROUTER_EWMA_ALPHA
+        with self._lock:
+            entry = self._entry(llm_config_id)
+            entry.calls += 1
+            entry.latency_ms = latency_ms if entry.latency_ms is None else entry.latency_ms + alpha * (latency_ms - entry.latency_ms)
+            entry.error_rate -= alpha * entry.error_rate
+            entry.latencies.append(latency_ms)
+            entry.consecutive_failures = 0
+            entry.tripped = False
+            entry.cooldown_until = 0.0
+            entry.probe_in_flight = False
+
+    def record_failure(self, llm_config_id: Optional[int], exc: BaseException) -> None:
+        if llm_config_id is None:
+            return
+        alpha = settings.LLM_ROUTER_EWMA_ALPHA
+        now = time.time()
+        with self._lock:
+            entry = self._entry(llm_config_id)
+            entry.calls += 1
+            entry.failures += 1
+            entry.consecutive_failures += 1
+            entry.error_rate += alpha * (1 - entry.error_rate)
+            entry.last_error = f"{type(exc).__name__}: {exc}"[:500]
+            entry.last_error_at = now
+            rate_limited = isinstance(exc, APIStatusError) and exc.status_code == 429
+            # 半开状态下探测失败立即重新打开
+            if rate_limited or entry.tripped or entry.consecutive_failures >= settings.LLM_ROUTER_FAILURE_THRESHOLD:
+                cooldown = _retry_after_seconds(exc) or settings.LLM_ROUTER_COOLDOWN_SECONDS
+                entry.tripped = True
+                entry.cooldown_until = now + cooldown
+                entry.probe_in_flight = False
+                logger.warning(
+                    "[llm_router] circuit open llm_config_id=%s seconds=%s error=%s",
+                    llm_config_id,
+                    cooldown,
+                    entry.last_error,
+                )
+
+    def reset(self, llm_config_id: Optional[int] = None) -> None:
+        with self._lock:
+            if llm_config_id is None:
+                self._health.clear()
+            else:
+                self._health.pop(llm_config_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            return {
+                str(llm_config_id): {
+                    "state": entry.state(now),
+                    "latency_ms": round(entry.latency_ms, 1) if entry.latency_ms is not None else None,
+                    "p95_latency_ms": percentile(list(entry.latencies), 95),
+                    "error_rate": round(entry.error_rate, 3),
+                    "calls": entry.calls,
+                    "failures": entry.failures,
+                    "rejected": entry.rejected,
+                    "consecutive_failures": entry.consecutive_failures,
+                    "cooldown_remaining_seconds": max(0.0, round(entry.cooldown_until - now, 1)),
+                    "last_error": entry.last_error,
+                    "last_error_at": entry.last_error_at,
+                }
+                for llm_config_id, entry in self._health.items()
+            }
+
+
+llm_router = LlmRouter()
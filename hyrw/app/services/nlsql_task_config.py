@@ -133,6 +133,7 @@ class NlsqlTaskConfigService:
         llm_config = await crud_llm_config.get(db, id=obj_in.get('llm_config_id'))
         if not llm_config:
             raise HTTPException(status_code=404, detail=f"LLM配置ID {obj_in.get('llm_config_id')} 不存在")
+        await self._validate_llm_config_ids(db, obj_in.get('llm_config_ids'))
 
         db_config = await crud_db_config.get(db, id=obj_in.get('db_config_id'))
         if not db_config:
@@ -161,6 +162,9 @@ class NlsqlTaskConfigService:
             if not llm_config:
                 raise HTTPException(status_code=404, detail=f"LLM配置ID {obj_in['llm_config_id']} 不存在")
 
+        if obj_in.get('llm_config_ids'):
+            await self._validate_llm_config_ids(db, obj_in['llm_config_ids'])
+
         if 'db_config_id' in obj_in:
             db_config = await crud_db_config.get(db, id=obj_in['db_config_id'])
             if not db_config:
@@ -173,6 +177,12 @@ class NlsqlTaskConfigService:
 
         return await crud_nlsql_task_config.update(db, db_obj=db_obj, obj_in=obj_in)
 
+    async def _validate_llm_config_ids(self, db: AsyncSession, llm_config_ids: Optional[List[int]]) -> None:
+        for llm_config_id in llm_config_ids or []:
+            llm_config = await crud_llm_config.get(db, id=llm_config_id)
+            if not llm_config:
+                raise HTTPException(status_code=404, detail=f"LLM配置ID {llm_config_id} 不存在")
+
     async def delete(self, db: AsyncSession, *, id: int) -> NlsqlTaskConfig:
         db_obj = await crud_nlsql_task_config.get(db, id=id)
         if not db_obj:
@@ -1,19 +1,329 @@
-from typing import Dict, Any, List, Tuple
+from contextlib import asynccontextmanager
+from typing import Dict, Any, AsyncIterator, Callable, List, Optional, Sequence, Tuple, TypeVar
+import asyncio
 import json
-from openai import OpenAI, BadRequestError
+import logging
+import math
+import time
+from openai import NOT_GIVEN, APITimeoutError, BadRequestError
+from openai.types.chat import ChatCompletion
+from app.core.config import settings
+from app.core.exceptions import GatewayTimeoutError, ServiceUnavailableError
 from app.models.llm_config import LlmConfig
+from app.services.ask_trace import annotate, record_llm_usage
+from app.services.concurrency import llm_limiter
+from app.services.llm_gateway import llm_gateway
+from app.services.llm_response_cache import llm_response_cache
+from app.services.llm_router import call_site_deadline, hedge_enabled, is_failover_error, llm_router
+from app.services.token_budget import (
+    TokenBudget,
+    estimate_message_tokens,
+    estimate_tokens,
+    output_token_stats,
+    token_calibration,
+)
+
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class CompletionTruncatedError(Exception):
+    """流式补全在自适应 max_tokens 处被截断；已产出的内容不完整，调用方可按原上限重新请求。"""
+
+    def __init__(self, call_site: Optional[str], max_tokens: Optional[int]):
+        self.call_site = call_site
+        self.max_tokens = max_tokens
+        super().__init__(f"completion truncated call_site={call_site} max_tokens={max_tokens}")
 
 
 class OpenAIService:
-    def __init__(self, model_config: LlmConfig):
+    def __init__(self, model_config: LlmConfig, pool: Optional[Sequence[LlmConfig]] = None):
         self.model_config = model_config
-        base_url = getattr(model_config, "base_url", None)
-        api_key = getattr(model_config, "api_key", None)
-        self.client = OpenAI(
-            api_key=api_key,
-            base_url=base_url if base_url != "https://api.openai.com/v1" else None
+        # 调用池：主配置在前，其后为可互换的备用配置，每次调用由路由决定尝试顺序
+        self.pool: List[LlmConfig] = [model_config] + [
+            config for config in pool or [] if config.id is None or config.id != model_config.id
+        ]
+
+    def _failover_or_raise(
+        self,
+        config: LlmConfig,
+        exc: Exception,
+        is_last: bool,
+        call_site: Optional[str],
+        deadline_at: Optional[float],
+    ) -> None:
+        if not is_failover_error(exc):
+            llm_router.abandon(config.id)
+            raise exc
+        llm_router.record_failure(config.id, exc)
+        if is_last:
+            if deadline_at is not None and isinstance(exc, APITimeoutError):
+                self._raise_deadline_exceeded(call_site, exc)
+            raise exc
+        logger.warning(
+            "[openai_service] llm call failed, fail over llm_config_id=%s error=%s",
+            config.id,
+            type(exc).__name__,
+        )
+
+    def _raise_circuit_open(self) -> None:
+        retry_after = llm_router.retry_after(self.pool)
+        raise ServiceUnavailableError(
+            f"LLM配置 {','.join(str(config.id) for config in self.pool)} 熔断中，请稍后重试",
+            retry_after=max(1, math.ceil(retry_after)),
+        )
+
+    def _raise_deadline_exceeded(self, call_site: Optional[str], exc: Optional[BaseException] = None) -> None:
+        raise GatewayTimeoutError(f"LLM调用超过截止时间 call_site={call_site}") from exc
+
+    def _deadline_at(self, call_site: Optional[str]) -> Optional[float]:
+        deadline = call_site_deadline(call_site)
+        return time.monotonic() + deadline if deadline is not None else None
+
+    def _attempt_timeout(self, call_site: Optional[str], deadline_at: Optional[float], attempts_left: int) -> Any:
+        """截止时间内剩余的时间平均分给还能尝试的端点，某个端点超时后仍有时间切换。"""
+        if deadline_at is None:
+            return NOT_GIVEN
+        remaining = deadline_at - time.monotonic()
+        if remaining <= 0:
+            self._raise_deadline_exceeded(call_site)
+        return remaining / attempts_left
+
+    def _candidates(self, rotate: bool = False) -> List[LlmConfig]:
+        candidates = llm_router.order(self.pool)
+        if not candidates:
+            self._raise_circuit_open()
+        # 对冲请求优先发往另一个端点
+        if rotate and len(candidates) > 1:
+            candidates = candidates[1:] + candidates[:1]
+        return candidates
+
+    def _routed_create(self, *, call_site: Optional[str] = None, **kwargs: Any) -> ChatCompletion:
+        """
+        同步补全；池中有多个配置时按路由顺序尝试，非最后一个端点（或有截止时间时）不做 SDK 重试以便尽快切换。
+        客户端由网关按 LlmConfig 共享，不会每次调用新建连接池。
+        """
+        deadline_at = self._deadline_at(call_site)
+        candidates = self._candidates()
+        last_exc: Optional[Exception] = None
+        for index, config in enumerate(candidates):
+            is_last = index == len(candidates) - 1
+            timeout = self._attempt_timeout(call_site, deadline_at, len(candidates) - index)
+            if not llm_router.begin(config.id):
+                continue
+            client, _ = llm_gateway.clients(config)
+            if not is_last or deadline_at is not None:
+                client = client.with_options(max_retries=0)
+            begin = time.perf_counter()
+            try:
+                response = client.chat.completions.create(model=str(config.model_name), timeout=timeout, **kwargs)
+            except Exception as exc:
+                self._failover_or_raise(config, exc, is_last, call_site, deadline_at)
+                last_exc = exc
+                continue
+            llm_router.record_success(config.id, (time.perf_counter() - begin) * 1000)
+            return response
+        if last_exc is not None:
+            raise last_exc
+        self._raise_circuit_open()
+
+    @asynccontextmanager
+    async def _routed_acreate(
+        self,
+        *,
+        call_site: Optional[str],
+        deadline_at: Optional[float],
+        rotate: bool = False,
+        **kwargs: Any,
+    ) -> AsyncIterator[Any]:
+        """
+        异步补全，返回值在并发槽位内使用（流式调用需要在槽位内读完）。
+        流式调用只在建立连接前切换端点，延迟按收到响应头的时间计。
+        """
+        candidates = self._candidates(rotate)
+        last_exc: Optional[Exception] = None
+        for index, config in enumerate(candidates):
+            is_last = index == len(candidates) - 1
+            timeout = self._attempt_timeout(call_site, deadline_at, len(candidates) - index)
+            if not llm_router.begin(config.id):
+                continue
+            _, client = llm_gateway.clients(config)
+            if not is_last or deadline_at is not None:
+                client = client.with_options(max_retries=0)
+            try:
+                async with llm_limiter.slot(config.id, getattr(config, "max_concurrency", None)):
+                    begin = time.perf_counter()
+                    try:
+                        response = await client.chat.completions.create(
+                            model=str(config.model_name),
+                            timeout=timeout,
+                            **kwargs,
+                        )
+                    except Exception as exc:
+                        self._failover_or_raise(config, exc, is_last, call_site, deadline_at)
+                        last_exc = exc
+                        continue
+                    llm_router.record_success(config.id, (time.perf_counter() - begin) * 1000)
+                    if config is not self.model_config:
+                        annotate(llm_config_id=config.id)
+                    yield response
+                    return
+            except asyncio.CancelledError:
+                llm_router.abandon(config.id)
+                raise
+        if last_exc is not None:
+            raise last_exc
+        self._raise_circuit_open()
+
+    async def _routed_acomplete(
+        self,
+        *,
+        call_site: Optional[str],
+        deadline_at: Optional[float],
+        rotate: bool = False,
+        **kwargs: Any,
+    ) -> ChatCompletion:
+        async with self._routed_acreate(call_site=call_site, deadline_at=deadline_at, rotate=rotate, **kwargs) as response:
+            return response
+
+    async def _hedged_acomplete(
+        self,
+        *,
+        call_site: Optional[str],
+        deadline_at: Optional[float],
+        **kwargs: Any,
+    ) -> ChatCompletion:
+        """首个请求超过近期延迟分位数仍未返回时再发一个相同请求，取先成功的结果并取消另一个。"""
+        delay = llm_router.hedge_delay(self.pool) if hedge_enabled(call_site) else None
+        if delay is None:
+            return await self._routed_acomplete(call_site=call_site, deadline_at=deadline_at, **kwargs)
+
+        primary = asyncio.create_task(self._routed_acomplete(call_site=call_site, deadline_at=deadline_at, **kwargs))
+        pending = {primary}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if primary in done:
+                return primary.result()
+            hedge = asyncio.create_task(
+                self._routed_acomplete(call_site=call_site, deadline_at=deadline_at, rotate=True, **kwargs)
+            )
+            pending.add(hedge)
+            annotate(llm_hedged=True, llm_hedge_delay_ms=round(delay * 1000, 1))
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            annotate(llm_hedge_won=True)
+                        return task.result()
+            # 两个请求都失败时抛出首个请求的异常
+            return primary.result()
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+    def _adaptive_max_tokens(
+        self,
+        call_site: Optional[str],
+        max_tokens: Optional[int],
+        adaptive_max_tokens: Optional[bool],
+    ) -> Optional[int]:
+        enabled = output_token_stats.enabled_for(call_site) if adaptive_max_tokens is None else adaptive_max_tokens
+        return output_token_stats.suggest(call_site, max_tokens) if enabled else max_tokens
+
+    def _observe_output(self, call_site: Optional[str], response: ChatCompletion) -> None:
+        if not response.choices:
+            return
+        usage = getattr(response, "usage", None)
+        completion_tokens = getattr(usage, "completion_tokens", None) or estimate_tokens(
+            response.choices[0].message.content or ""
+        )
+        output_token_stats.observe(call_site, completion_tokens, truncated=response.choices[0].finish_reason == "length")
+
+    async def _complete_before_deadline(
+        self,
+        *,
+        call_site: Optional[str],
+        deadline_at: Optional[float],
+        **kwargs: Any,
+    ) -> ChatCompletion:
+        try:
+            response = await asyncio.wait_for(
+                self._hedged_acomplete(call_site=call_site, deadline_at=deadline_at, **kwargs),
+                timeout=deadline_at - time.monotonic() if deadline_at is not None else None,
+            )
+        except asyncio.TimeoutError as exc:
+            self._raise_deadline_exceeded(call_site, exc)
+        record_llm_usage(response)
+        self._observe_output(call_site, response)
+        return response
+
+    def token_budget(self, max_tokens: Optional[int] = None) -> TokenBudget:
+        return TokenBudget.for_config(self.model_config, max_tokens)
+
+    def _calibrate(self, messages: List[Dict[str, str]], response: ChatCompletion) -> None:
+        usage = getattr(response, "usage", None)
+        token_calibration.observe(
+            str(getattr(self.model_config, "model_name", "") or ""),
+            estimate_message_tokens(messages),
+            getattr(usage, "prompt_tokens", None),
+        )
+
+    def _cache_key(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: Optional[float],
+        max_tokens: Optional[int],
+    ) -> str:
+        return llm_response_cache.make_key(
+            base_url=getattr(self.model_config, "base_url", None),
+            model=str(getattr(self.model_config, "model_name", "")),
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
         )
 
+    def _cached_chat(
+        self,
+        *,
+        call_site: str,
+        messages: List[Dict[str, str]],
+        temperature: Optional[float],
+        max_tokens: Optional[int],
+        parse: Callable[[str], T],
+        use_cache: Optional[bool] = None,
+    ) -> T:
+        """同步补全并解析内容；开启缓存的调用点只缓存解析成功且未被截断的结果。"""
+        model_name = getattr(self.model_config, "model_name", None)
+        if model_name is None:
+            raise ValueError("模型名称不能为空")
+
+        cache_key = None
+        if llm_response_cache.enabled_for(call_site, use_cache):
+            cache_key = self._cache_key(messages, temperature, max_tokens)
+            cached = llm_response_cache.get(cache_key)
+            if cached is not None:
+                try:
+                    return parse(ChatCompletion.model_validate_json(cached).choices[0].message.content or "")
+                except Exception:
+                    llm_response_cache.discard(cache_key)
+
+        response = self._routed_create(
+            call_site=call_site,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+        )
+        self._calibrate(messages, response)
+        result = parse(response.choices[0].message.content or "")
+        if cache_key is not None and response.choices[0].finish_reason != "length":
+            llm_response_cache.put(cache_key, response.model_dump_json(), call_site=call_site, model=str(model_name))
+        return result
+
     def _is_context_window_error(self, exc: BadRequestError) -> bool:
         message = str(exc).lower()
         return (
@@ -34,46 +344,197 @@ class OpenAIService:
         *,
         max_tokens_override: int | None = None,
     ) -> Dict[str, Any]:
-        system_prompt = self._build_system_prompt()
-        user_prompt = self._build_user_prompt(prompt_data)
-
         temperature_value = getattr(self.model_config, "temperature", None)
         temperature = float(temperature_value) if temperature_value is not None else 0.7
 
-        model_name = getattr(self.model_config, "model_name", None)
-        if model_name is None:
-            raise ValueError("模型名称不能为空")
         max_tokens = max_tokens_override if max_tokens_override is not None else getattr(self.model_config, "max_tokens", None)
 
-        response = self.client.chat.completions.create(
-            model=str(model_name),
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
+        return self._cached_chat(
+            call_site="table_prompt",
+            messages=self.build_table_prompt_messages(prompt_data),
             temperature=temperature,
-            max_tokens=max_tokens
+            max_tokens=max_tokens,
+            parse=self._parse_json_content,
         )
 
-        content = response.choices[0].message.content or ""
-        return self._parse_json_content(content)
+    def build_table_prompt_messages(self, prompt_data: Dict[str, Any]) -> List[Dict[str, str]]:
+        return [
+            {"role": "system", "content": self._build_system_prompt()},
+            {"role": "user", "content": self._build_user_prompt(prompt_data)}
+        ]
 
     def generate_chat_response(self, messages: List[Dict[str, str]]) -> str:
         temperature_value = getattr(self.model_config, "temperature", None)
         temperature = float(temperature_value) if temperature_value is not None else 0.7
 
+        max_tokens = getattr(self.model_config, "max_tokens", None)
+
+        return self._cached_chat(
+            call_site="chat_response",
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            parse=lambda content: content,
+        )
+
+    async def async_chat_completion(
+        self,
+        messages: List[Dict[str, str]],
+        *,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        call_site: Optional[str] = None,
+        use_cache: Optional[bool] = None,
+        adaptive_max_tokens: Optional[bool] = None,
+    ) -> ChatCompletion:
+        """
+        问答链路各代理共用的异步补全调用，不阻塞事件循环。
+        max_tokens 为上限，开启自适应的调用点先按近期输出长度请求，被截断时再按上限重试一次。
+        """
         model_name = getattr(self.model_config, "model_name", None)
         if model_name is None:
             raise ValueError("模型名称不能为空")
-        max_tokens = getattr(self.model_config, "max_tokens", None)
 
-        response = self.client.chat.completions.create(
-            model=str(model_name),
+        cache_key = None
+        if llm_response_cache.enabled_for(call_site, use_cache):
+            cache_key = self._cache_key(messages, temperature, max_tokens)
+            cached = await asyncio.to_thread(llm_response_cache.get, cache_key)
+            if cached is not None:
+                annotate(llm_cache="hit")
+                return ChatCompletion.model_validate_json(cached)
+
+        deadline_at = self._deadline_at(call_site)
+        requested = self._adaptive_max_tokens(call_site, max_tokens, adaptive_max_tokens)
+        response = await self._complete_before_deadline(
+            call_site=call_site,
+            deadline_at=deadline_at,
             messages=messages,
             temperature=temperature,
-            max_tokens=max_tokens,
+            max_tokens=requested,
         )
-        return response.choices[0].message.content or ""
+        if requested != max_tokens and response.choices and response.choices[0].finish_reason == "length":
+            output_token_stats.record_retry(call_site)
+            annotate(max_tokens_retry=requested)
+            response = await self._complete_before_deadline(
+                call_site=call_site,
+                deadline_at=deadline_at,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+            )
+        self._calibrate(messages, response)
+        if cache_key is not None and response.choices and response.choices[0].finish_reason != "length":
+            await asyncio.to_thread(
+                llm_response_cache.put,
+                cache_key,
+                response.model_dump_json(),
+                call_site=call_site,
+                model=str(model_name),
+            )
+        return response
+
+    async def async_chat_completion_stream(
+        self,
+        messages: List[Dict[str, str]],
+        *,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        call_site: Optional[str] = None,
+        use_cache: Optional[bool] = None,
+        adaptive_max_tokens: Optional[bool] = None,
+    ) -> AsyncIterator[str]:
+        """
+        流式补全，逐段产出文本。调用方可提前关闭生成器以中断生成（此时不写缓存）；
+        完整结束后按非流式调用同样记录 token 用量并写缓存。
+        已产出的内容无法撤回，在自适应 max_tokens 处被截断时抛出 CompletionTruncatedError，由调用方决定是否重试。
+        """
+        model_name = getattr(self.model_config, "model_name", None)
+        if model_name is None:
+            raise ValueError("模型名称不能为空")
+
+        cache_key = None
+        if llm_response_cache.enabled_for(call_site, use_cache):
+            cache_key = self._cache_key(messages, temperature, max_tokens)
+            cached = await asyncio.to_thread(llm_response_cache.get, cache_key)
+            if cached is not None:
+                annotate(llm_cache="hit")
+                yield ChatCompletion.model_validate_json(cached).choices[0].message.content or ""
+                return
+
+        parts: List[str] = []
+        finish_reason: Optional[str] = None
+        usage: Any = None
+        deadline_at = self._deadline_at(call_site)
+        requested = self._adaptive_max_tokens(call_site, max_tokens, adaptive_max_tokens)
+        async with self._routed_acreate(
+            call_site=call_site,
+            deadline_at=deadline_at,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=requested,
+            stream=True,
+            stream_options={"include_usage": True} if settings.LLM_STREAM_INCLUDE_USAGE else NOT_GIVEN,
+        ) as stream:
+            try:
+                async for chunk in self._iter_before_deadline(stream, call_site, deadline_at):
+                    if chunk.usage is not None:
+                        usage = chunk.usage
+                    for choice in chunk.choices:
+                        if choice.finish_reason:
+                            finish_reason = choice.finish_reason
+                        if choice.delta and choice.delta.content:
+                            parts.append(choice.delta.content)
+                            yield choice.delta.content
+            finally:
+                await stream.close()
+
+        response = ChatCompletion.model_validate({
+            "id": "stream",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": str(model_name),
+            "choices": [{
+                "index": 0,
+                "finish_reason": finish_reason or "stop",
+                "message": {"role": "assistant", "content": "".join(parts)},
+            }],
+            "usage": usage.model_dump() if usage is not None else None,
+        })
+        record_llm_usage(response)
+        self._observe_output(call_site, response)
+        self._calibrate(messages, response)
+        if finish_reason == "length" and requested != max_tokens:
+            output_token_stats.record_retry(call_site)
+            raise CompletionTruncatedError(call_site, requested)
+        if cache_key is not None and finish_reason == "stop":
+            await asyncio.to_thread(
+                llm_response_cache.put,
+                cache_key,
+                response.model_dump_json(),
+                call_site=call_site,
+                model=str(model_name),
+            )
+
+    async def _iter_before_deadline(
+        self,
+        stream: Any,
+        call_site: Optional[str],
+        deadline_at: Optional[float],
+    ) -> AsyncIterator[Any]:
+        """逐块读取流式响应，超过截止时间仍未读完时中断。"""
+        if deadline_at is None:
+            async for chunk in stream:
+                yield chunk
+            return
+        iterator = stream.__aiter__()
+        while True:
+            try:
+                chunk = await asyncio.wait_for(iterator.__anext__(), timeout=max(0.0, deadline_at - time.monotonic()))
+            except StopAsyncIteration:
+                return
+            except asyncio.TimeoutError as exc:
+                self._raise_deadline_exceeded(call_site, exc)
+            yield chunk
 
     def _parse_json_content(self, content: str) -> Dict[str, Any]:
         content = content.strip()
@@ -204,59 +665,57 @@ class OpenAIService:
         *,
         max_tokens_override: int | None = None,
     ) -> List[Dict[str, Any]]:
-        system_prompt = self._build_all_fields_system_prompt()
-        user_prompt = self._build_all_fields_user_prompt(prompt_data)
-
         temperature_value = getattr(self.model_config, "temperature", None)
         temperature = float(temperature_value) if temperature_value is not None else 0.7
-        model_name = getattr(self.model_config, "model_name", None)
-        if model_name is None:
-            raise ValueError("模型名称不能为空")
         max_tokens = max_tokens_override if max_tokens_override is not None else getattr(self.model_config, "max_tokens", None)
 
-        response = self.client.chat.completions.create(
-            model=str(model_name),
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
+        def parse(content: str) -> List[Dict[str, Any]]:
+            print("ai 返回未json序列化的字段提示词")
+            print(content)
+            parsed = self._parse_json_content(content)
+            if isinstance(parsed, dict) and isinstance(parsed.get("fields"), list):
+                return parsed["fields"]
+            if isinstance(parsed, list):
+                return parsed
+            raise ValueError("字段提示词返回格式错误")
+
+        return self._cached_chat(
+            call_site="field_prompt",
+            messages=self.build_all_fields_messages(prompt_data),
             temperature=temperature,
-            max_tokens=max_tokens
+            max_tokens=max_tokens,
+            parse=parse,
         )
 
-        content = response.choices[0].message.content or ""
-        print("ai 返回未json序列化的字段提示词")
-        print(content)
-        parsed = self._parse_json_content(content)
-        if isinstance(parsed, dict) and isinstance(parsed.get("fields"), list):
-            return parsed["fields"]
-        if isinstance(parsed, list):
-            return parsed
-        raise ValueError("字段提示词返回格式错误")
+    def build_all_fields_messages(self, prompt_data: Dict[str, Any]) -> List[Dict[str, str]]:
+        return [
+            {"role": "system", "content": self._build_all_fields_system_prompt()},
+            {"role": "user", "content": self._build_all_fields_user_prompt(prompt_data)}
+        ]
 
     def generate_field_relations(self, prompt_data: Dict[str, Any]) -> List[Dict[str, Any]]:
-        system_prompt = self._build_field_relations_system_prompt()
-        user_prompt = self._build_field_relations_user_prompt(prompt_data)
-
         temperature_value = getattr(self.model_config, "temperature", None)
         temperature = float(temperature_value) if temperature_value is not None else 0.4
-        model_name = getattr(self.model_config, "model_name", None)
-        if model_name is None:
-            raise ValueError("模型名称不能为空")
-        max_tokens = getattr(self.model_config, "max_tokens", None)
 
-        current_max_tokens = int(max_tokens) if max_tokens is not None else None
+        # 先按预算裁剪字段样例/字段数并确定补全上限，超窗报错后的逐步缩减只作兜底
+        fitted = self.token_budget().fit(
+            prompt_data,
+            self._field_relations_messages,
+            [self._drop_relation_sample_values, self._halve_relation_fields],
+        )
+        prompt_data = fitted.payload
+        messages = self._field_relations_messages(prompt_data)
+
+        current_max_tokens = fitted.max_tokens
         retry_times = 0
         while True:
             try:
-                response = self.client.chat.completions.create(
-                    model=str(model_name),
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": user_prompt}
-                    ],
+                parsed = self._cached_chat(
+                    call_site="field_relation",
+                    messages=messages,
                     temperature=temperature,
-                    max_tokens=current_max_tokens
+                    max_tokens=current_max_tokens,
+                    parse=lambda content: self._parse_json_flexible(content or "[]"),
                 )
                 break
             except BadRequestError as exc:
@@ -267,14 +726,43 @@ class OpenAIService:
                 current_max_tokens = self._reduce_max_tokens_by_one_third(current_max_tokens)
                 retry_times += 1
 
-        content = response.choices[0].message.content or "[]"
-        parsed = self._parse_json_flexible(content)
         if isinstance(parsed, list):
             return parsed
         if isinstance(parsed, dict) and isinstance(parsed.get("relations"), list):
             return parsed["relations"]
         return []
 
+    def _field_relations_messages(self, prompt_data: Dict[str, Any]) -> List[Dict[str, str]]:
+        return [
+            {"role": "system", "content": self._build_field_relations_system_prompt()},
+            {"role": "user", "content": self._build_field_relations_user_prompt(prompt_data)}
+        ]
+
+    def _drop_relation_sample_values(self, prompt_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        changed = False
+        reduced = dict(prompt_data)
+        for side in ("source", "target"):
+            table = dict(reduced[side])
+            fields = []
+            for field in table.get("fields", []):
+                if field.get("sample_values"):
+                    field = {**field, "sample_values": ""}
+                    changed = True
+                fields.append(field)
+            table["fields"] = fields
+            reduced[side] = table
+        return reduced if changed else None
+
+    def _halve_relation_fields(self, prompt_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        changed = False
+        reduced = dict(prompt_data)
+        for side in ("source", "target"):
+            fields = reduced[side].get("fields", [])
+            if len(fields) > 1:
+                reduced[side] = {**reduced[side], "fields": fields[: (len(fields) + 1) // 2]}
+                changed = True
+        return reduced if changed else None
+
     def generate_where_conditions_from_qa(self, question: str, sql: str) -> Tuple[List[Dict[str, Any]], List[str]]:
         system_prompt = (
             "你是SQL条件提取专家。请完成两个任务："
@@ -295,23 +783,18 @@ class OpenAIService:
 
         temperature_value = getattr(self.model_config, "temperature", None)
         temperature = float(temperature_value) if temperature_value is not None else 0.2
-        model_name = getattr(self.model_config, "model_name", None)
-        if model_name is None:
-            raise ValueError("模型名称不能为空")
         max_tokens = getattr(self.model_config, "max_tokens", None)
 
-        response = self.client.chat.completions.create(
-            model=str(model_name),
+        parsed = self._cached_chat(
+            call_site="qa_where_conditions",
             messages=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_prompt},
             ],
             temperature=temperature,
             max_tokens=max_tokens,
+            parse=lambda content: self._parse_json_flexible(content or "{}"),
         )
-
-        content = response.choices[0].message.content or "{}"
-        parsed = self._parse_json_flexible(content)
         if not isinstance(parsed, dict):
             return [], []
 
@@ -1,8 +1,10 @@
+import re
 import time
 from datetime import date, datetime
 from decimal import Decimal
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
+import asyncpg
 import psycopg2
 import psycopg2.extras
 
@@ -84,3 +86,82 @@ class PostgreSQLClient:
         finally:
             if conn:
                 conn.close()
+
+
+
+class AsyncPostgreSQLClient:
+    """基于 asyncpg 的异步客户端，返回结构与 PostgreSQLClient.execute_sql 保持一致。"""
+
+    _NAMED_PARAM_PATTERN = re.compile(r"%\((\w+)\)s")
+
+    def __init__(self, host: str, port: int, user: str, password: str, database: str):
+        self.host = host
+        self.port = int(port)
+        self.user = user
+        self.password = password
+        self.database = database
+
+    async def _get_connection(self, command_timeout: Optional[float] = None) -> asyncpg.Connection:
+        return await asyncpg.connect(
+            host=self.host,
+            port=self.port,
+            user=self.user,
+            password=self.password,
+            database=self.database,
+            timeout=30,
+            command_timeout=command_timeout,
+        )
+
+    def _to_asyncpg_query(self, sql: str, parameters: Optional[Dict[str, Any]]) -> Tuple[str, List[Any]]:
+        """把 psycopg2 风格的 %(name)s 占位符转换为 asyncpg 的 $n 占位符。"""
+        if not parameters:
+            return sql, []
+
+        names: List[str] = []
+
+        def replace(match: "re.Match[str]") -> str:
+            name = match.group(1)
+            if name not in names:
+                names.append(name)
+            return f"${names.index(name) + 1}"
+
+        converted = self._NAMED_PARAM_PATTERN.sub(replace, sql).replace("%%", "%")
+        return converted, [parameters[name] for name in names]
+
+    async def execute_sql(
+        self,
+        sql: str,
+        parameters: Optional[Dict[str, Any]] = None,
+        timeout: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        conn = None
+        try:
+            conn = await self._get_connection(command_timeout=timeout)
+            query, args = self._to_asyncpg_query(sql, parameters)
+
+            start_time = time.time()
+            rows = await conn.fetch(query, *args)
+            execution_time = round(time.time() - start_time, 3)
+
+            result_data = [json_serializable(dict(row)) for row in rows]
+            return {
+                "success": True,
+                "result": {
+                    "data": result_data,
+                    "row_count": len(result_data),
+                    "affected_rows": len(result_data),
+                    "execution_time": execution_time,
+                },
+                "error": None,
+                "sql": sql,
+            }
+        except Exception as e:
+            return {
+                "success": False,
+                "result": None,
+                "error": str(e),
+                "sql": sql,
+            }
+        finally:
+            if conn:
+                await conn.close()
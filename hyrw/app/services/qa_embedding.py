@@ -1,6 +1,9 @@
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Set, Tuple
+import asyncio
 import json
 import logging
+import re
+from pydantic import ValidationError
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from fastapi import HTTPException
@@ -9,11 +12,20 @@ from app.core.config import settings
 from app.models.nlsql_task_config import NlsqlTaskConfig
 from app.models.llm_config import LlmConfig
 from app.models.qa_embedding import QaEmbedding
+from app.schemas.qa_embedding import QaJsonItem
+from app.services.concurrency import llm_limiter
+from app.services.job_runner import JobContext, job_runner
 from app.services.openai_service import OpenAIService
+from app.services.shot_index import embed_texts
+from app.utils.text_normalize import normalize_question
 
 
 logger = logging.getLogger(__name__)
 
+QA_ENRICH_JOB_TYPE = "qa_enrich"
+
+_SQL_WHITESPACE = re.compile(r"\s+")
+
 sync_engine = create_engine(
     settings.SQLITE_URL,
     connect_args={"check_same_thread": False}
@@ -25,6 +37,47 @@ SyncSessionLocal = sessionmaker(
 )
 
 
+def qa_dedupe_key(question: str, sql: str) -> str:
+    """去重键：问题按答案缓存的规则归一化，SQL 合并空白并去掉末尾分号（不改大小写，避免误合并字面量不同的 SQL）。"""
+    normalized_sql = _SQL_WHITESPACE.sub(" ", sql or "").strip().rstrip(";").strip()
+    return f"{normalize_question(question)}\n{normalized_sql}"
+
+
+def prepare_import_items(
+    qa_json: List[Dict[str, Any]],
+    existing_keys: Set[str],
+) -> Tuple[List[QaJsonItem], int, List[Dict[str, Any]]]:
+    """
+    校验并去重待导入的问答对，返回 (可导入的问答对, 重复条数, 无效条目)。
+    与任务下已有问答对或本批中更早的条目重复的计为重复；无效条目记录下标与原因。
+    """
+    accepted: List[QaJsonItem] = []
+    invalid: List[Dict[str, Any]] = []
+    seen = set(existing_keys)
+    duplicate_count = 0
+    for index, raw in enumerate(qa_json):
+        try:
+            item = QaJsonItem.model_validate(raw)
+        except ValidationError as exc:
+            reason = "; ".join(
+                f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in exc.errors()
+            )
+            invalid.append({"index": index, "reason": reason})
+            continue
+        item.question = item.question.strip()
+        item.sql = item.sql.strip()
+        if not item.question or not item.sql:
+            invalid.append({"index": index, "reason": "问题或SQL为空"})
+            continue
+        key = qa_dedupe_key(item.question, item.sql)
+        if key in seen:
+            duplicate_count += 1
+            continue
+        seen.add(key)
+        accepted.append(item)
+    return accepted, duplicate_count, invalid
+
+
 class QaEmbeddingService:
     def get_multi_with_pagination(
         self,
@@ -73,6 +126,7 @@ class QaEmbeddingService:
             where_conditions = obj_in.get("where_conditions")
             obj_in["where_conditions"] = self._dump_where_conditions(where_conditions)
             db_obj = QaEmbedding(**obj_in)
+            self._embed_questions(self._embedding_config(db, db_obj.nlsql_task_id), [db_obj])
             db.add(db_obj)
             db.commit()
             db.refresh(db_obj)
@@ -91,9 +145,15 @@ class QaEmbeddingService:
             if "where_conditions" in obj_in:
                 obj_in["where_conditions"] = self._dump_where_conditions(obj_in.get("where_conditions"))
 
+            question_changed = "question" in obj_in and obj_in["question"] != db_obj.question
             for field, value in obj_in.items():
                 if hasattr(db_obj, field):
                     setattr(db_obj, field, value)
+            if question_changed:
+                # 旧向量已与问题不符，计算失败时宁可不参与检索
+                db_obj.question_embedding = None
+                db_obj.embedding_model = None
+                self._embed_questions(self._embedding_config(db, db_obj.nlsql_task_id), [db_obj])
 
             db.commit()
             db.refresh(db_obj)
@@ -162,7 +222,7 @@ class QaEmbeddingService:
                 raise HTTPException(status_code=404, detail=f"任务ID {task_id} 不存在")
 
             logger.info("[qa_embedding] import start task_id=%s count=%s", task_id, len(qa_json))
-            created_ids: List[int] = []
+            created: List[QaEmbedding] = []
             for item in qa_json:
                 question = item.get("question")
                 sql = item.get("sql")
@@ -177,15 +237,23 @@ class QaEmbeddingService:
                     tables=self._dump_tables(item.get("tables")),
                     is_enabled=True,
                 )
-                db.add(db_obj)
-                db.flush()
-                created_ids.append(db_obj.id)
+                created.append(db_obj)
 
+            embedded = self._embed_questions(self._embedding_config(db, task_id), created)
+            db.add_all(created)
+            db.flush()
+            created_ids = [obj.id for obj in created]
             db.commit()
-            logger.info("[qa_embedding] import finished task_id=%s created=%s", task_id, len(created_ids))
+            logger.info(
+                "[qa_embedding] import finished task_id=%s created=%s embedded=%s",
+                task_id,
+                len(created_ids),
+                embedded,
+            )
             return {
                 "created_count": len(created_ids),
                 "created_ids": created_ids,
+                "embedded_count": embedded,
             }
         except Exception:
             db.rollback()
@@ -194,54 +262,380 @@ class QaEmbeddingService:
         finally:
             db.close()
 
-    def generate_where_conditions(self, qa_embedding_ids: List[int], llm_config_id: int) -> Dict[str, Any]:
+    async def bulk_import(
+        self,
+        task_id: int,
+        qa_json: List[Dict[str, Any]],
+        *,
+        generate_where_conditions: bool = True,
+        llm_config_id: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """
+        批量导入：校验、去重后分批写入，WHERE 条件提取与问题向量计算放到后台任务（qa_enrich）中执行，
+        返回导入统计与后台任务；没有需要补充的内容时不提交任务。
+        """
+        result = await asyncio.to_thread(
+            self._bulk_insert,
+            task_id,
+            qa_json,
+            generate_where_conditions,
+            llm_config_id,
+        )
+        created_ids = result.pop("created_ids")
+        embedding_enabled = result.pop("embedding_enabled")
+        job = None
+        if created_ids and (result["llm_config_id"] is not None or embedding_enabled):
+            params = {
+                "task_id": task_id,
+                "qa_embedding_ids": created_ids,
+                "llm_config_id": result["llm_config_id"],
+                "overwrite": False,
+                "embed": True,
+            }
+            job = await job_runner.submit(QA_ENRICH_JOB_TYPE, params, task_id=task_id)
+        return {**result, "job": job}
+
+    def _bulk_insert(
+        self,
+        task_id: int,
+        qa_json: List[Dict[str, Any]],
+        generate_where_conditions: bool,
+        llm_config_id: Optional[int],
+    ) -> Dict[str, Any]:
+        if not qa_json:
+            raise HTTPException(status_code=400, detail="qa_json不能为空")
+        if len(qa_json) > settings.QA_IMPORT_MAX_ITEMS:
+            raise HTTPException(status_code=400, detail=f"单次最多导入 {settings.QA_IMPORT_MAX_ITEMS} 条问答对")
         db = SyncSessionLocal()
         try:
-            if not qa_embedding_ids:
-                raise HTTPException(status_code=400, detail="qa_embedding_ids不能为空")
+            task = db.query(NlsqlTaskConfig).filter(NlsqlTaskConfig.id == task_id).first()
+            if not task:
+                raise HTTPException(status_code=404, detail=f"任务ID {task_id} 不存在")
+            where_llm_config_id = None
+            if generate_where_conditions:
+                where_llm_config_id = llm_config_id or task.llm_config_id
+                if not db.query(LlmConfig.id).filter(LlmConfig.id == where_llm_config_id).first():
+                    raise HTTPException(status_code=404, detail=f"LLM配置ID {where_llm_config_id} 不存在")
+
+            existing = {
+                qa_dedupe_key(question, sql)
+                for question, sql in db.query(QaEmbedding.question, QaEmbedding.sql)
+                .filter(QaEmbedding.nlsql_task_id == task_id)
+            }
+            accepted, duplicate_count, invalid = prepare_import_items(qa_json, existing)
+            logger.info(
+                "[qa_embedding] bulk import start task_id=%s count=%s accepted=%s duplicates=%s invalid=%s",
+                task_id,
+                len(qa_json),
+                len(accepted),
+                duplicate_count,
+                len(invalid),
+            )
 
-            llm_config = db.query(LlmConfig).filter(LlmConfig.id == llm_config_id).first()
-            if not llm_config:
-                raise HTTPException(status_code=404, detail=f"LLM配置ID {llm_config_id} 不存在")
+            created_ids: List[int] = []
+            batch_size = max(1, settings.QA_IMPORT_BATCH_SIZE)
+            # 每批一次 flush（多行 INSERT）并提交，缩短写锁的持有时间；走 ORM 以便递增任务上下文版本
+            for start in range(0, len(accepted), batch_size):
+                rows = [
+                    QaEmbedding(
+                        question=item.question,
+                        nlsql_task_id=task_id,
+                        sql=item.sql,
+                        where_conditions=self._dump_where_conditions(
+                            [condition.model_dump() for condition in item.where_conditions]
+                            if item.where_conditions is not None else None
+                        ),
+                        tables=self._dump_tables(item.tables),
+                        is_enabled=True,
+                    )
+                    for item in accepted[start:start + batch_size]
+                ]
+                db.add_all(rows)
+                db.flush()
+                created_ids.extend(row.id for row in rows)
+                db.commit()
+            logger.info("[qa_embedding] bulk import finished task_id=%s created=%s", task_id, len(created_ids))
+            return {
+                "created_count": len(created_ids),
+                "duplicate_count": duplicate_count,
+                "invalid_count": len(invalid),
+                "invalid_items": invalid,
+                "llm_config_id": where_llm_config_id,
+                "created_ids": created_ids,
+                "embedding_enabled": self._embedding_config(db, task_id) is not None,
+            }
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
 
-            rows = db.query(QaEmbedding).filter(QaEmbedding.id.in_(qa_embedding_ids)).all()
-            if not rows:
-                raise HTTPException(status_code=404, detail="未找到qa_embedding记录")
+    async def run_enrich_job(self, job: JobContext) -> Dict[str, Any]:
+        """
+        后台补充问答对：按 QA_ENRICH_BATCH_SIZE 分批提取 WHERE 条件、计算问题向量，每批单独提交并上报进度。
+        WHERE 条件由最多 concurrency 个请求并发生成；未指定 overwrite 时跳过已有 WHERE 条件的问答对。
+        任务被重新领取时从上次上报的进度处继续，已提交的批次不会重复调用模型。
+        """
+        ids: List[int] = job.params.get("qa_embedding_ids") or []
+        overwrite = bool(job.params.get("overwrite"))
+        llm_config, embedding_config = await asyncio.to_thread(
+            self._enrich_configs,
+            job.task_id if job.params.get("embed", True) else None,
+            job.params.get("llm_config_id"),
+        )
+        openai_service = OpenAIService(llm_config) if llm_config is not None else None
+        concurrency = self._where_concurrency(llm_config, job.params.get("concurrency"))
+        progress: Dict[str, Any] = {
+            "total": len(ids),
+            "processed": 0,
+            "concurrency": concurrency,
+            "where_generated": 0,
+            "where_skipped": 0,
+            "where_failed": 0,
+            "embedded": 0,
+            "failed_items": [],
+        }
+        if job.attempts > 1:
+            checkpoint = (await job_runner.get_job(job.job_id)).get("progress")
+            if isinstance(checkpoint, dict) and checkpoint.get("total") == len(ids):
+                progress.update({key: checkpoint[key] for key in progress if key in checkpoint and key != "concurrency"})
+                logger.info("[qa_embedding] enrich resume job_id=%s processed=%s", job.job_id, progress["processed"])
+        await job.report(stage="enriching", progress=progress)
+
+        batch_size = max(1, settings.QA_ENRICH_BATCH_SIZE)
+        for start in range(progress["processed"], len(ids), batch_size):
+            batch_ids = ids[start:start + batch_size]
+            rows = await asyncio.to_thread(self._load_enrich_rows, batch_ids)
+            updates: Dict[int, Dict[str, Any]] = {}
+
+            if openai_service is not None:
+                pending = [row for row in rows if overwrite or not row["has_where_conditions"]]
+                progress["where_skipped"] += len(rows) - len(pending)
+                results = await self._generate_where_concurrently(openai_service, llm_config, pending, concurrency)
+                for row, result in zip(pending, results):
+                    if isinstance(result, Exception):
+                        logger.warning("[qa_embedding] enrich where failed id=%s error=%s", row["id"], result)
+                        progress["failed_items"].append({"id": row["id"], "error": str(result)})
+                        progress["where_failed"] += 1
+                        continue
+                    where_conditions, tables = result
+                    updates.setdefault(row["id"], {}).update(
+                        where_conditions=self._dump_where_conditions(where_conditions),
+                        tables=self._dump_tables(tables),
+                    )
+                    progress["where_generated"] += 1
+
+            if embedding_config is not None:
+                pending = [row for row in rows if row["embedding_model"] != embedding_config.embedding_model]
+                if pending:
+                    try:
+                        vectors = await asyncio.to_thread(embed_texts, embedding_config, [row["question"] for row in pending])
+                    except Exception as exc:
+                        logger.warning("[qa_embedding] enrich embedding failed count=%s error=%s", len(pending), exc)
+                        vectors = []
+                    for row, vector in zip(pending, vectors):
+                        updates.setdefault(row["id"], {}).update(
+                            question_embedding=vector,
+                            embedding_model=embedding_config.embedding_model,
+                        )
+                    progress["embedded"] += len(vectors)
+
+            if updates:
+                await asyncio.to_thread(self._save_enrich_updates, updates)
+            # 先提交再上报，上报的 processed 之前的批次都已落库
+            progress["processed"] = start + len(batch_ids)
+            await job.report(progress=progress)
+
+        logger.info(
+            "[qa_embedding] enrich finished task_id=%s total=%s where_generated=%s where_failed=%s embedded=%s",
+            job.task_id,
+            progress["total"],
+            progress["where_generated"],
+            progress["where_failed"],
+            progress["embedded"],
+        )
+        return progress
+
+    async def _generate_where_concurrently(
+        self,
+        openai_service: OpenAIService,
+        llm_config: LlmConfig,
+        rows: List[Dict[str, Any]],
+        concurrency: int,
+    ) -> List[Any]:
+        """并发提取一批问答对的 WHERE 条件，按 rows 的顺序返回 (where_conditions, tables) 或异常。"""
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run_one(row: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], List[str]]:
+            async with semaphore:
+                # 同时受 LlmConfig.max_concurrency 的进程级上限约束，与问答请求共用
+                async with llm_limiter.slot(llm_config.id, llm_config.max_concurrency):
+                    return await asyncio.to_thread(
+                        openai_service.generate_where_conditions_from_qa,
+                        question=row["question"],
+                        sql=row["sql"],
+                    )
 
-            openai_service = OpenAIService(llm_config)
-            success_ids: List[int] = []
-            failed: List[Dict[str, Any]] = []
-            logger.info("[qa_embedding] ai where generation start ids=%s", len(qa_embedding_ids))
+        return await asyncio.gather(*(run_one(row) for row in rows), return_exceptions=True)
 
-            for row in rows:
-                try:
-                    where_conditions, tables = openai_service.generate_where_conditions_from_qa(
-                        question=row.question,
-                        sql=row.sql,
-                    )
-                    row.where_conditions = self._dump_where_conditions(where_conditions)
-                    row.tables = self._dump_tables(tables)
-                    db.flush()
-                    success_ids.append(row.id)
-                    logger.info("[qa_embedding] ai where generation success id=%s", row.id)
-                except Exception as exc:
-                    logger.exception("[qa_embedding] ai where generation failed id=%s", row.id)
-                    failed.append({"id": row.id, "error": str(exc)})
+    def _where_concurrency(self, llm_config: Optional[LlmConfig], requested: Optional[int]) -> int:
+        """并发数：请求指定的值，否则取 LlmConfig.max_concurrency，都为空时使用默认值；不超过 QA_WHERE_MAX_CONCURRENCY。"""
+        configured = requested or (llm_config.max_concurrency if llm_config is not None else None)
+        return max(1, min(configured or settings.QA_WHERE_DEFAULT_CONCURRENCY, settings.QA_WHERE_MAX_CONCURRENCY))
 
+    def _enrich_configs(
+        self,
+        task_id: Optional[int],
+        llm_config_id: Optional[int],
+    ) -> Tuple[Optional[LlmConfig], Optional[LlmConfig]]:
+        db = SyncSessionLocal()
+        try:
+            llm_config = None
+            if llm_config_id is not None:
+                llm_config = db.query(LlmConfig).filter(LlmConfig.id == llm_config_id).first()
+                if not llm_config:
+                    raise HTTPException(status_code=404, detail=f"LLM配置ID {llm_config_id} 不存在")
+            embedding_config = self._embedding_config(db, task_id) if task_id is not None else None
+            return llm_config, embedding_config
+        finally:
+            db.close()
+
+    def _load_enrich_rows(self, ids: List[int]) -> List[Dict[str, Any]]:
+        db = SyncSessionLocal()
+        try:
+            rows = db.query(QaEmbedding).filter(QaEmbedding.id.in_(ids)).order_by(QaEmbedding.id).all()
+            return [
+                {
+                    "id": row.id,
+                    "question": row.question,
+                    "sql": row.sql,
+                    "has_where_conditions": row.where_conditions is not None,
+                    "embedding_model": row.embedding_model if row.question_embedding else None,
+                }
+                for row in rows
+            ]
+        finally:
+            db.close()
+
+    def _save_enrich_updates(self, updates: Dict[int, Dict[str, Any]]) -> None:
+        db = SyncSessionLocal()
+        try:
+            for row in db.query(QaEmbedding).filter(QaEmbedding.id.in_(list(updates))).all():
+                for field, value in updates[row.id].items():
+                    setattr(row, field, value)
             db.commit()
-            logger.info("[qa_embedding] ai where generation finished success=%s failed=%s", len(success_ids), len(failed))
-            return {
-                "success_count": len(success_ids),
-                "failed_count": len(failed),
-                "updated_ids": success_ids,
-                "failed_items": failed,
-            }
         except Exception:
             db.rollback()
             raise
         finally:
             db.close()
 
+    def rebuild_embeddings(self, task_id: int, only_missing: bool = True) -> Dict[str, Any]:
+        """为任务下的问答对补算（或全部重算）问题向量，用于设置向量模型之前已有的数据。"""
+        db = SyncSessionLocal()
+        try:
+            task = db.query(NlsqlTaskConfig).filter(NlsqlTaskConfig.id == task_id).first()
+            if not task:
+                raise HTTPException(status_code=404, detail=f"任务ID {task_id} 不存在")
+            llm_config = self._embedding_config(db, task_id)
+            if llm_config is None:
+                raise HTTPException(status_code=422, detail=f"任务ID {task_id} 的LLM配置未设置向量模型")
+
+            rows = db.query(QaEmbedding).filter(QaEmbedding.nlsql_task_id == task_id).order_by(QaEmbedding.id).all()
+            if only_missing:
+                rows = [
+                    row for row in rows
+                    if not row.question_embedding or row.embedding_model != llm_config.embedding_model
+                ]
+            embedded = 0
+            batch_size = max(1, settings.QA_EMBEDDING_BATCH_SIZE)
+            # 每批单独提交，中途失败时已完成的部分保留
+            for start in range(0, len(rows), batch_size):
+                count = self._embed_questions(llm_config, rows[start:start + batch_size])
+                if not count:
+                    break
+                db.commit()
+                embedded += count
+            logger.info(
+                "[qa_embedding] rebuild embeddings task_id=%s candidates=%s embedded=%s",
+                task_id,
+                len(rows),
+                embedded,
+            )
+            return {"candidate_count": len(rows), "embedded_count": embedded}
+        finally:
+            db.close()
+
+    async def submit_where_generation(
+        self,
+        qa_embedding_ids: List[int],
+        llm_config_id: int,
+        *,
+        concurrency: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        """提交后台任务，为指定问答对重新生成 WHERE 条件与使用的表，通过 /jobs/{job_id} 查询进度。"""
+        task_id = await asyncio.to_thread(self._validate_where_generation, qa_embedding_ids, llm_config_id)
+        params = {
+            "task_id": task_id,
+            # 去重并按 ID 排序，重新领取时按同一顺序从进度处继续
+            "qa_embedding_ids": sorted(set(qa_embedding_ids)),
+            "llm_config_id": llm_config_id,
+            "overwrite": True,
+            "embed": False,
+            "concurrency": concurrency,
+        }
+        job = await job_runner.submit(QA_ENRICH_JOB_TYPE, params, task_id=task_id)
+        logger.info("[qa_embedding] ai where generation submitted job_id=%s ids=%s", job["id"], len(params["qa_embedding_ids"]))
+        return job
+
+    def _validate_where_generation(self, qa_embedding_ids: List[int], llm_config_id: int) -> Optional[int]:
+        """校验参数，返回问答对所属的任务ID（跨多个任务时为空）。"""
+        if not qa_embedding_ids:
+            raise HTTPException(status_code=400, detail="qa_embedding_ids不能为空")
+        db = SyncSessionLocal()
+        try:
+            if not db.query(LlmConfig.id).filter(LlmConfig.id == llm_config_id).first():
+                raise HTTPException(status_code=404, detail=f"LLM配置ID {llm_config_id} 不存在")
+            task_ids = {
+                task_id
+                for (task_id,) in db.query(QaEmbedding.nlsql_task_id)
+                .filter(QaEmbedding.id.in_(qa_embedding_ids))
+                .distinct()
+            }
+            if not task_ids:
+                raise HTTPException(status_code=404, detail="未找到qa_embedding记录")
+            return task_ids.pop() if len(task_ids) == 1 else None
+        finally:
+            db.close()
+
+    def _embedding_config(self, db, task_id: int) -> Optional[LlmConfig]:
+        task = db.query(NlsqlTaskConfig).filter(NlsqlTaskConfig.id == task_id).first()
+        if not task:
+            return None
+        llm_config = db.query(LlmConfig).filter(LlmConfig.id == task.llm_config_id).first()
+        if not llm_config or not llm_config.embedding_model:
+            return None
+        return llm_config
+
+    def _embed_questions(self, llm_config: Optional[LlmConfig], rows: List[QaEmbedding]) -> int:
+        """计算问题向量；失败时只记录日志，问答对照常保存，可稍后通过重建补算。"""
+        if llm_config is None or not rows:
+            return 0
+        try:
+            vectors = embed_texts(llm_config, [row.question for row in rows])
+        except Exception as exc:
+            logger.warning(
+                "[qa_embedding] embedding failed llm_config_id=%s count=%s error=%s",
+                llm_config.id,
+                len(rows),
+                exc,
+            )
+            return 0
+        for row, vector in zip(rows, vectors):
+            row.question_embedding = vector
+            row.embedding_model = llm_config.embedding_model
+        return len(vectors)
+
     def _to_dict(self, obj: QaEmbedding) -> Dict[str, Any]:
         return {
             "id": obj.id,
@@ -251,6 +645,7 @@ class QaEmbeddingService:
             "where_conditions": self._load_where_conditions(obj.where_conditions),
             "tables": self._load_tables(obj.tables),
             "is_enabled": obj.is_enabled,
+            "embedding_model": obj.embedding_model if obj.question_embedding else None,
             "created_at": obj.created_at,
             "updated_at": obj.updated_at,
         }
@@ -289,3 +684,4 @@ class QaEmbeddingService:
 
 
 qa_embedding_service = QaEmbeddingService()
+job_runner.register(QA_ENRICH_JOB_TYPE, qa_embedding_service.run_enrich_job)
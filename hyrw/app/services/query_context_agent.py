@@ -1,53 +1,52 @@
 from collections import defaultdict
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Sequence
 import re
 
-from sqlalchemy.orm import Session
-
 from app.models.llm_config import LlmConfig
 from app.services.generate_prompt import GeneratePrompt
 from app.services.openai_service import OpenAIService
+from app.services.task_context import TaskContext, task_context_store
 
 
 class QueryContextAgent:
     def __init__(
         self,
         *,
-        db: Session,
         task_id: int,
         user_input: str,
         llm_config: LlmConfig,
         table_names: List[str],
+        context: Optional[TaskContext] = None,
+        llm_pool: Optional[Sequence[LlmConfig]] = None,
     ):
-        self.db = db
         self.task_id = task_id
         self.user_input = user_input
         self.llm_config = llm_config
         self.table_names = table_names
-        self.openai_service = OpenAIService(llm_config)
+        self.context = context
+        self.openai_service = OpenAIService(llm_config, pool=llm_pool)
 
-    def generate_query_context(self) -> Dict[str, Any]:
-        prompt = self._build_query_context_prompt()
-        print(prompt)
-        response = self.openai_service.client.chat.completions.create(
-            model=str(self.llm_config.model_name),
-            messages=[
+    async def generate_query_context(self) -> Dict[str, Any]:
+        context = self.context or await task_context_store.get(self.task_id)
+        prompt = self._build_query_context_prompt(context)
+        response = await self.openai_service.async_chat_completion(
+            [
                 {"role": "system", "content": "你是一个查询上下文分析器，严格按行协议返回。"},
                 {"role": "user", "content": prompt},
             ],
             temperature=float(getattr(self.llm_config, "temperature", 0.2) or 0.2),
             max_tokens=min(int(getattr(self.llm_config, "max_tokens", 4096) or 4096), 4096),
+            call_site="query_context",
         )
 
         content = response.choices[0].message.content or ""
         return self._parse_response(content)
 
-    def _build_query_context_prompt(self) -> str:
-        generator = GeneratePrompt(self.db)
+    def _build_query_context_prompt(self, context: TaskContext) -> str:
+        generator = GeneratePrompt(context)
         return generator.build_query_context_prompt(
             user_input=self.user_input,
             table_names=self.table_names,
-            task_id=self.task_id,
         )
 
     def _parse_response(self, content: str) -> Dict[str, Any]:
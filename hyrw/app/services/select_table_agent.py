@@ -1,29 +1,44 @@
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional, Sequence
 import json
 
-from openai import OpenAI
-from sqlalchemy.orm import Session
-
 from app.models.llm_config import LlmConfig
-from app.models.table_level_prompt import TableLevelPrompt
-from app.models.table_metadata_extended import TableMetadataBasic
+from app.services.openai_service import OpenAIService
+from app.services.task_context import TaskContext, task_context_store
+from app.services.token_budget import estimate_tokens, output_token_stats
 
 
 class SelectTableAgent:
-    def __init__(self, *, task_id: int, user_input: str, llm_config: LlmConfig, db: Session):
+    def __init__(
+        self,
+        *,
+        task_id: int,
+        user_input: str,
+        llm_config: LlmConfig,
+        context: Optional[TaskContext] = None,
+        llm_pool: Optional[Sequence[LlmConfig]] = None,
+    ):
         self.task_id = task_id
         self.user_input = user_input
         self.llm_config = llm_config
-        self.db = db
-        base_url = getattr(llm_config, "base_url", None)
-        api_key = getattr(llm_config, "api_key", None)
-        self.client = OpenAI(
-            api_key=api_key,
-            base_url=base_url if base_url != "https://api.openai.com/v1" else None,
-        )
+        self.context = context
+        self.openai_service = OpenAIService(llm_config, pool=llm_pool)
+
+    async def load_table_contexts(self) -> List[Dict[str, Any]]:
+        context = self.context or await task_context_store.get(self.task_id)
+        return self._load_table_contexts(context)
 
-    def select_tables(self) -> Dict[str, Any]:
-        table_rows = self._load_table_contexts()
+    def estimate_token_cost(self, table_rows: List[Dict[str, Any]]) -> int:
+        """预估一次选表调用最多消耗的 token（提示词 + 补全上限）。"""
+        if not table_rows:
+            return 0
+        max_tokens = getattr(self.llm_config, "max_tokens", None)
+        if output_token_stats.enabled_for("select_table"):
+            max_tokens = output_token_stats.suggest("select_table", max_tokens)
+        return estimate_tokens(self._build_prompt(table_rows)) + int(max_tokens or 0)
+
+    async def select_tables(self, table_rows: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+        if table_rows is None:
+            table_rows = await self.load_table_contexts()
         if not table_rows:
             return {
                 "selected_tables": [],
@@ -31,8 +46,7 @@ class SelectTableAgent:
             }
 
         prompt = self._build_prompt(table_rows)
-        print(prompt)
-        content = self._chat(prompt)
+        content = await self._chat(prompt)
         parsed = self._parse_json(content)
 
         selected = parsed.get("selected_tables", []) if isinstance(parsed, dict) else []
@@ -59,19 +73,15 @@ class SelectTableAgent:
             "candidate_count": len(table_rows),
         }
 
-    def _load_table_contexts(self) -> List[Dict[str, Any]]:
-        rows = (
-            self.db.query(TableLevelPrompt, TableMetadataBasic)
-            .join(TableMetadataBasic, TableLevelPrompt.table_metadata_id == TableMetadataBasic.id)
-            .filter(TableLevelPrompt.task_id == self.task_id, TableLevelPrompt.is_active.is_(True))
-            .all()
-        )
-
+    def _load_table_contexts(self, context: TaskContext) -> List[Dict[str, Any]]:
         contexts: List[Dict[str, Any]] = []
-        for prompt, metadata in rows:
+        for prompt in context.prompts:
+            metadata = context.table_by_id(prompt.table_metadata_id)
+            if metadata is None:
+                continue
             contexts.append(
                 {
-                    "table_id": metadata.id,
+                    "table_id": metadata.metadata_id,
                     "table_name": prompt.table_name,
                     "table_description": prompt.table_description or metadata.table_description or "",
                     "query_scenarios": prompt.query_scenarios or [],
@@ -108,22 +118,19 @@ class SelectTableAgent:
         )
         return "\n".join(lines)
 
-    def _chat(self, prompt: str) -> str:
+    async def _chat(self, prompt: str) -> str:
         temperature_value = getattr(self.llm_config, "temperature", None)
         temperature = float(temperature_value) if temperature_value is not None else 0.2
-        model_name = getattr(self.llm_config, "model_name", None)
-        if model_name is None:
-            raise ValueError("模型名称不能为空")
         max_tokens = getattr(self.llm_config, "max_tokens", None)
 
-        response = self.client.chat.completions.create(
-            model=str(model_name),
-            messages=[
+        response = await self.openai_service.async_chat_completion(
+            [
                 {"role": "system", "content": "你是一个严谨的数据分析选表助手。"},
                 {"role": "user", "content": prompt},
             ],
             temperature=temperature,
             max_tokens=max_tokens,
+            call_site="select_table",
         )
         return response.choices[0].message.content or "{}"
 
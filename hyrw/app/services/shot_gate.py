@@ -0,0 +1,140 @@
+from collections import deque
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Deque, Dict, Optional, Tuple
+import logging
+import random
+import threading
+
+from app.core.config import settings
+from app.services.ask_trace import percentile
+
+
+logger = logging.getLogger(__name__)
+
+# 问答对匹配相似度高于该值时直接使用问答对生成的 SQL
+SHOT_SIMILARITY_THRESHOLD = 90
+
+
+@lru_cache(maxsize=8)
+def _parse_min_scores(value: str) -> Dict[str, float]:
+    result: Dict[str, float] = {}
+    for item in value.split(","):
+        name, _, score = item.partition("=")
+        if name.strip() and score.strip():
+            result[name.strip()] = float(score)
+    return result
+
+
+@dataclass(frozen=True)
+class GateDecision:
+    key: str
+    score: float
+    threshold: Optional[float]
+    # static：配置的固定阈值；calibrated：按样本校准；warmup：命中样本不足，不跳过
+    source: str
+    skip: bool
+    audit: bool = False
+
+
+class ShotGate:
+    """
+    问答对匹配的本地预筛。按检索方式（向量模型 / BM25）记录本地最高得分与模型给出的相似度，
+    以命中样本（相似度超过 SHOT_SIMILARITY_THRESHOLD）得分的低分位数再留出余量作为阈值，
+    本地得分低于阈值时跳过模型调用。判定跳过的请求按 SHOT_GATE_AUDIT_RATIO 抽样照常调用，
+    用来持续校准并统计误跳过。只在当前 worker 进程内生效。
+    """
+
+    def __init__(self, window: int):
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples: Dict[str, Deque[Tuple[float, int]]] = {}
+        self._counters: Dict[str, Dict[str, int]] = {}
+
+    def threshold(self, key: str) -> Tuple[Optional[float], str]:
+        static = _parse_min_scores(settings.SHOT_GATE_MIN_SCORES).get(key.split(":", 1)[0])
+        if static is not None:
+            return static, "static"
+        with self._lock:
+            hits = [score for score, similarity in self._samples.get(key, ()) if similarity > SHOT_SIMILARITY_THRESHOLD]
+        if len(hits) < settings.SHOT_GATE_MIN_HITS:
+            return None, "warmup"
+        low = percentile(hits, settings.SHOT_GATE_HIT_PERCENTILE) or 0.0
+        return low * (1 - settings.SHOT_GATE_MARGIN), "calibrated"
+
+    def decide(self, key: str, score: float) -> Optional[GateDecision]:
+        if not settings.SHOT_GATE_ENABLED:
+            return None
+        threshold, source = self.threshold(key)
+        skip = threshold is not None and score < threshold
+        audit = skip and random.random() < settings.SHOT_GATE_AUDIT_RATIO
+        self._count(key, "audited" if audit else "skipped" if skip else "passed")
+        decision = GateDecision(key=key, score=score, threshold=threshold, source=source, skip=skip, audit=audit)
+        if skip:
+            logger.info(
+                "[shot_gate] skip key=%s score=%.4f threshold=%.4f source=%s audit=%s",
+                key,
+                score,
+                threshold,
+                source,
+                audit,
+            )
+        return decision
+
+    def observe(self, decision: GateDecision, similarity: int) -> None:
+        """记录调用模型后的结果；抽样复核的请求命中时计为误跳过。"""
+        hit = similarity > SHOT_SIMILARITY_THRESHOLD
+        with self._lock:
+            samples = self._samples.get(decision.key)
+            if samples is None:
+                samples = deque(maxlen=self.window)
+                self._samples[decision.key] = samples
+            samples.append((decision.score, similarity))
+        if decision.audit and hit:
+            self._count(decision.key, "false_skips")
+        logger.info(
+            "[shot_gate] outcome key=%s score=%.4f threshold=%s similarity=%s hit=%s audit=%s",
+            decision.key,
+            decision.score,
+            f"{decision.threshold:.4f}" if decision.threshold is not None else None,
+            similarity,
+            hit,
+            decision.audit,
+        )
+
+    def _count(self, key: str, name: str) -> None:
+        with self._lock:
+            counters = self._counters.setdefault(key, {})
+            counters[name] = counters.get(name, 0) + 1
+
+    def reset(self) -> None:
+        with self._lock:
+            self._samples.clear()
+            self._counters.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            snapshot = {key: list(samples) for key, samples in self._samples.items()}
+            counters = {key: dict(value) for key, value in self._counters.items()}
+        result: Dict[str, Any] = {}
+        for key in sorted(set(snapshot) | set(counters)):
+            samples = snapshot.get(key, [])
+            hits = [score for score, similarity in samples if similarity > SHOT_SIMILARITY_THRESHOLD]
+            misses = [score for score, similarity in samples if similarity <= SHOT_SIMILARITY_THRESHOLD]
+            threshold, source = self.threshold(key)
+            result[key] = {
+                "threshold": round(threshold, 4) if threshold is not None else None,
+                "source": source,
+                "samples": len(samples),
+                "hits": len(hits),
+                # 命中与未命中样本的本地得分分布，用于人工调整阈值
+                "hit_score_p5": percentile(hits, 5),
+                "hit_score_p50": percentile(hits, 50),
+                "miss_score_p50": percentile(misses, 50),
+                "miss_score_p95": percentile(misses, 95),
+                **{name: counters.get(key, {}).get(name, 0) for name in ("passed", "skipped", "audited", "false_skips")},
+            }
+        return result
+
+
+shot_gate = ShotGate(window=settings.SHOT_GATE_WINDOW)
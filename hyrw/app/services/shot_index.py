@@ -0,0 +1,261 @@
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import asyncio
+import json
+import logging
+import time
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import run_sync_session
+from app.models.llm_config import LlmConfig
+from app.models.qa_embedding import QaEmbedding
+from app.models.task_context_version import get_task_version
+from app.services.concurrency import llm_limiter
+from app.services.lexical_index import LexicalIndex
+from app.services.llm_gateway import llm_gateway
+from app.services.llm_router import call_site_deadline
+from app.services.sql_template import SqlTemplate, build_template
+
+
+logger = logging.getLogger(__name__)
+
+
+def encode_vector(vector: Sequence[float]) -> bytes:
+    """L2 归一化后按 float32 存储，检索时点积即余弦相似度。"""
+    array = np.asarray(vector, dtype=np.float32)
+    norm = float(np.linalg.norm(array))
+    if norm > 0:
+        array = array / norm
+    return array.astype(np.float32).tobytes()
+
+
+def decode_vector(blob: bytes) -> np.ndarray:
+    return np.frombuffer(blob, dtype=np.float32)
+
+
+def embed_texts(llm_config: LlmConfig, texts: List[str]) -> List[bytes]:
+    """同步计算一批文本的向量（已编码），按 QA_EMBEDDING_BATCH_SIZE 分批请求。"""
+    client, _ = llm_gateway.clients(llm_config)
+    batch_size = max(1, settings.QA_EMBEDDING_BATCH_SIZE)
+    result: List[bytes] = []
+    for start in range(0, len(texts), batch_size):
+        batch = texts[start:start + batch_size]
+        response = client.embeddings.create(model=llm_config.embedding_model, input=batch)
+        for item in sorted(response.data, key=lambda data: data.index):
+            result.append(encode_vector(item.embedding))
+    return result
+
+
+async def embed_query(llm_config: LlmConfig, text: str) -> np.ndarray:
+    """
+    计算问题向量，受 shot_embedding 调用点截止时间（含等待并发槽位）约束且不自动重试，
+    超时或失败时由调用方尽快退回 BM25 检索。
+    """
+    _, client = llm_gateway.clients(llm_config)
+    deadline = call_site_deadline("shot_embedding")
+    client = client.with_options(max_retries=0, timeout=deadline) if deadline else client.with_options(max_retries=0)
+
+    async def create() -> Any:
+        async with llm_limiter.slot(llm_config.id, llm_config.max_concurrency):
+            return await client.embeddings.create(model=llm_config.embedding_model, input=[text])
+
+    response = await asyncio.wait_for(create(), timeout=deadline)
+    return decode_vector(encode_vector(response.data[0].embedding))
+
+
+def _load_conditions(raw: Any) -> List[Dict[str, Any]]:
+    if isinstance(raw, str):
+        try:
+            raw = json.loads(raw)
+        except json.JSONDecodeError:
+            return []
+    if not isinstance(raw, list):
+        return []
+    return [item for item in raw if isinstance(item, dict)]
+
+
+@dataclass(frozen=True)
+class ShotInfo:
+    id: int
+    question: str
+    sql: str
+    where_conditions: Any
+
+
+@dataclass(frozen=True)
+class ShotIndex:
+    """
+    任务下启用的问答对及其问题向量矩阵（每行一条，已归一化）与问题的 BM25 倒排索引。
+    没有向量或向量模型、维度与当前配置不一致的问答对不参与向量检索，但仍可被字面检索命中。
+    """
+
+    task_id: int
+    version: int
+    embedding_model: Optional[str]
+    shots: Tuple[ShotInfo, ...]
+    matrix: Optional[np.ndarray] = field(default=None, repr=False, compare=False)
+    # matrix 每一行对应 shots 中的下标
+    positions: Optional[np.ndarray] = field(default=None, repr=False, compare=False)
+    lexical: Optional[LexicalIndex] = field(default=None, repr=False, compare=False)
+    loaded_at: float = field(default_factory=time.time)
+    # 问答对 id -> SQL 模板（None 表示无法参数化），首次用到时构建
+    _templates: Dict[int, Optional[SqlTemplate]] = field(init=False, default_factory=dict, repr=False, compare=False)
+
+    @property
+    def indexed(self) -> int:
+        return 0 if self.matrix is None else int(self.matrix.shape[0])
+
+    def top_k(self, query: np.ndarray, k: int) -> List[Tuple[ShotInfo, float]]:
+        """按余弦相似度从高到低返回最多 k 条问答对。"""
+        if self.matrix is None or k <= 0 or query.shape[0] != self.matrix.shape[1]:
+            return []
+        scores = self.matrix @ query
+        if k < scores.shape[0]:
+            candidates = np.argpartition(-scores, k - 1)[:k]
+        else:
+            candidates = np.arange(scores.shape[0])
+        ordered = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(self.shots[int(self.positions[row])], float(scores[row])) for row in ordered]
+
+    def template(self, shot: ShotInfo) -> Optional[SqlTemplate]:
+        if shot.id not in self._templates:
+            self._templates[shot.id] = build_template(shot.question, shot.sql, _load_conditions(shot.where_conditions))
+        return self._templates[shot.id]
+
+    def lexical_top_k(self, query: str, k: int) -> List[Tuple[ShotInfo, float]]:
+        """按 BM25 得分从高到低返回最多 k 条与问题有共同字组的问答对，得分按查询的参考满分换算到 0~1。"""
+        if self.lexical is None:
+            return []
+        matched = self.lexical.top_k(query, k)
+        if not matched:
+            return []
+        full = self.lexical.max_score(query) or 1.0
+        return [(self.shots[doc_id], min(1.0, score / full)) for doc_id, score in matched]
+
+
+def load_shot_index(db: Session, task_id: int, embedding_model: Optional[str]) -> ShotIndex:
+    # 与任务上下文一样先读版本号再读数据
+    version = get_task_version(db, task_id)
+    rows = (
+        db.query(QaEmbedding)
+        .filter(QaEmbedding.nlsql_task_id == task_id, QaEmbedding.is_enabled.is_(True))
+        .order_by(QaEmbedding.id)
+        .all()
+    )
+    shots = tuple(
+        ShotInfo(id=row.id, question=row.question, sql=row.sql, where_conditions=row.where_conditions)
+        for row in rows
+    )
+
+    vectors: List[np.ndarray] = []
+    positions: List[int] = []
+    if embedding_model:
+        for position, row in enumerate(rows):
+            if not row.question_embedding or row.embedding_model != embedding_model:
+                continue
+            vector = decode_vector(row.question_embedding)
+            if vectors and vector.shape[0] != vectors[0].shape[0]:
+                continue
+            vectors.append(vector)
+            positions.append(position)
+    matrix = np.vstack(vectors) if vectors else None
+    return ShotIndex(
+        task_id=task_id,
+        version=version,
+        embedding_model=embedding_model,
+        shots=shots,
+        matrix=matrix,
+        positions=np.asarray(positions, dtype=np.int64) if vectors else None,
+        lexical=LexicalIndex([shot.question for shot in shots]) if settings.SHOT_LEXICAL_ENABLED else None,
+    )
+
+
+class ShotIndexStore:
+    """
+    进程内的问答对检索索引（向量矩阵与 BM25 倒排索引）缓存，与任务上下文快照相同，按 TaskContextVersion 判断是否过期；
+    任务的向量模型变化时也重新加载。
+    """
+
+    def __init__(self, max_tasks: int):
+        self.max_tasks = max_tasks
+        self._indexes: "OrderedDict[int, ShotIndex]" = OrderedDict()
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self._hits = 0
+        self._loads = 0
+
+    async def get(self, task_id: int, *, version: Optional[int] = None, embedding_model: Optional[str] = None) -> ShotIndex:
+        if version is None:
+            version = await run_sync_session(lambda db: get_task_version(db, task_id))
+        index = self._lookup(task_id, version, embedding_model)
+        if index is not None:
+            return index
+
+        lock = self._locks.setdefault(task_id, asyncio.Lock())
+        async with lock:
+            index = self._lookup(task_id, version, embedding_model)
+            if index is not None:
+                return index
+            begin = time.perf_counter()
+            index = await run_sync_session(lambda db: load_shot_index(db, task_id, embedding_model))
+            self._loads += 1
+            logger.info(
+                "[shot_index] loaded task_id=%s version=%s shots=%s indexed=%s elapsed_ms=%.1f",
+                task_id,
+                index.version,
+                len(index.shots),
+                index.indexed,
+                (time.perf_counter() - begin) * 1000,
+            )
+            self._store(index)
+            return index
+
+    def _lookup(self, task_id: int, version: int, embedding_model: Optional[str]) -> Optional[ShotIndex]:
+        index = self._indexes.get(task_id)
+        if index is None or index.version < version or index.embedding_model != embedding_model:
+            return None
+        self._indexes.move_to_end(task_id)
+        self._hits += 1
+        return index
+
+    def _store(self, index: ShotIndex) -> None:
+        current = self._indexes.get(index.task_id)
+        if current is not None and current.version > index.version and current.embedding_model == index.embedding_model:
+            return
+        self._indexes[index.task_id] = index
+        self._indexes.move_to_end(index.task_id)
+        while len(self._indexes) > max(1, self.max_tasks):
+            evicted, _ = self._indexes.popitem(last=False)
+            self._locks.pop(evicted, None)
+
+    def invalidate(self, task_id: Optional[int] = None) -> None:
+        if task_id is None:
+            self._indexes.clear()
+        else:
+            self._indexes.pop(task_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "size": len(self._indexes),
+            "max_tasks": self.max_tasks,
+            "hits": self._hits,
+            "loads": self._loads,
+            "tasks": {
+                task_id: {
+                    "version": index.version,
+                    "embedding_model": index.embedding_model,
+                    "shots": len(index.shots),
+                    "indexed": index.indexed,
+                    "matrix_bytes": index.matrix.nbytes if index.matrix is not None else 0,
+                    "lexical_terms": len(index.lexical.vocabulary) if index.lexical is not None else 0,
+                    "lexical_bytes": index.lexical.nbytes if index.lexical is not None else 0,
+                }
+                for task_id, index in self._indexes.items()
+            },
+        }
+
+
+shot_index_store = ShotIndexStore(max_tasks=settings.TASK_CONTEXT_MAX_TASKS)
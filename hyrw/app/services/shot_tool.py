@@ -1,59 +1,183 @@
 import json
+import logging
 import re
-from typing import Any, Dict, List, Optional, Tuple, cast
-
-from openai import OpenAI
-from openai.types.chat import ChatCompletionMessageParam
-
-from app.services.clickhouse_client import ClickHouseClient
-from app.services.postgresql_client import PostgreSQLClient
+from dataclasses import dataclass
+from functools import partial
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from app.core.config import settings
+from app.services.ask_trace import annotate, traced
+from app.services.clickhouse_client import AsyncClickHouseClient
+from app.services.concurrency import db_limiter
+from app.services.openai_service import OpenAIService
+from app.services.postgresql_client import AsyncPostgreSQLClient
+from app.services.shot_gate import shot_gate
+from app.services.shot_index import ShotIndex, embed_query
+from app.services.sql_result_cache import sql_result_cache
+from app.services.task_context import TaskContext
 from app.models.llm_config import LlmConfig
 from app.utils.database_field_json_format import ComprehensiveDatabaseJSONEncoder
 
 
+logger = logging.getLogger(__name__)
+
+@dataclass
+class ShotCandidates:
+    shots: List[Any]
+    # 检索方式（embedding / bm25）与本地最高得分，None 表示没有可用于预筛的得分
+    method: Optional[str]
+    top_score: Optional[float]
+    embedding_model: Optional[str] = None
+
+    @property
+    def gate_key(self) -> str:
+        # 不同向量模型的余弦相似度分布不同，分开校准
+        return f"{self.method}:{self.embedding_model}" if self.embedding_model else str(self.method)
+
+
 class ShotTool:
-    def __init__(self, llm_config: LlmConfig, db_config: Optional[Any] = None):
+    def __init__(
+        self,
+        llm_config: LlmConfig,
+        db_config: Optional[Any] = None,
+        llm_pool: Optional[Sequence[LlmConfig]] = None,
+    ):
         self.llm_config = llm_config
         self.db_config = db_config
-        base_url = getattr(llm_config, "base_url", None)
-        api_key = getattr(llm_config, "api_key", None)
-        self.open_ai_client = OpenAI(
-            api_key=api_key,
-            base_url=base_url if base_url != "https://api.openai.com/v1" else None,
-        )
+        self.openai_service = OpenAIService(llm_config, pool=llm_pool)
         self.model = str(getattr(llm_config, "model_name", ""))
         self.temperature = float(getattr(llm_config, "temperature", 0.1) or 0.1)
         self.max_tokens = int(getattr(llm_config, "max_tokens", 4000) or 4000)
         self.messages: List[Dict[str, str]] = []
-        self.ck_client: Optional[ClickHouseClient] = None
+        self.ck_client: Optional[AsyncClickHouseClient] = None
 
-    def chat(self, message: str) -> str:
+    async def chat(self, message: str) -> str:
         self.messages.append({"role": "user", "content": message})
-        typed_messages = [cast(ChatCompletionMessageParam, item) for item in self.messages]
-        response = self.open_ai_client.chat.completions.create(
-            model=self.model,
-            messages=typed_messages,
+        response = await self.openai_service.async_chat_completion(
+            list(self.messages),
             temperature=self.temperature,
             max_tokens=self.max_tokens,
+            call_site="shot_match",
         )
         reply = response.choices[0].message.content or ""
         self.messages.append({"role": "assistant", "content": reply})
         return reply
 
-    def create_sql(self, user_input: str, qa_rows: List[Any]) -> Tuple[str, int]:
+    async def match(
+        self,
+        user_input: str,
+        shot_index: ShotIndex,
+        context: Optional[TaskContext] = None,
+    ) -> Tuple[str, int]:
+        candidates = await self.retrieve_shots(user_input, shot_index)
+        if settings.SHOT_TEMPLATE_ENABLED:
+            known_values = context.column_values if context is not None else None
+            filled = self.fill_template(user_input, candidates.shots, shot_index, known_values)
+            if filled is not None:
+                return filled, 100
+        decision = None
+        if candidates.method is not None and candidates.top_score is not None:
+            decision = shot_gate.decide(candidates.gate_key, candidates.top_score)
+        if decision is not None:
+            annotate(
+                shot_gate="skip" if decision.skip and not decision.audit else "audit" if decision.audit else "pass",
+                shot_gate_threshold=round(decision.threshold, 4) if decision.threshold is not None else None,
+                shot_gate_source=decision.source,
+            )
+            if decision.skip and not decision.audit:
+                return "", 0
+        sql, similarity = await self.create_sql(user_input, candidates.shots)
+        if decision is not None and candidates.shots:
+            shot_gate.observe(decision, similarity)
+        return sql, similarity
+
+    def fill_template(
+        self,
+        user_input: str,
+        shots: List[Any],
+        shot_index: ShotIndex,
+        known_values: Optional[Callable[[str], Any]] = None,
+    ) -> Optional[str]:
+        """
+        问题与某个问答对只在 where_conditions 的取值上不同时，直接把新取值填入其 SQL，不调用模型。
+        按检索排序依次尝试，取第一个能完整对齐的问答对；known_values 为字段的已知取值（任务上下文的样例数据）。
+        """
+        for shot in shots:
+            template = shot_index.template(shot)
+            if template is None:
+                continue
+            sql = template.fill(user_input, known_values=known_values)
+            if sql is not None:
+                annotate(shot_template=shot.id)
+                logger.info("[shot_tool] template filled task_id=%s qa_id=%s", shot_index.task_id, shot.id)
+                return sql
+        return None
+
+    async def retrieve_shots(self, user_input: str, shot_index: ShotIndex) -> "ShotCandidates":
+        """
+        按问题向量取最相似的 SHOT_TOP_K 条问答对；没有可用向量或计算失败时按 BM25 字面检索，
+        字面索引也关闭时返回全部问答对。问答对不超过 SHOT_TOP_K 条时全部返回，只用字面检索给出预筛得分。
+        """
+        top_k = settings.SHOT_TOP_K
+        if top_k <= 0 or len(shot_index.shots) <= top_k:
+            top_score = None
+            if shot_index.lexical is not None:
+                matched = shot_index.lexical_top_k(user_input, 1)
+                top_score = matched[0][1] if matched else 0.0
+            annotate(
+                shot_retrieval="all",
+                shot_count=len(shot_index.shots),
+                shot_top_score=round(top_score, 4) if top_score is not None else None,
+            )
+            method = "bm25" if top_score is not None else None
+            return ShotCandidates(list(shot_index.shots), method, top_score)
+        if shot_index.indexed:
+            try:
+                query = await embed_query(self.llm_config, user_input)
+                matched = shot_index.top_k(query, top_k)
+            except Exception as exc:
+                logger.warning("[shot_tool] query embedding failed task_id=%s error=%s", shot_index.task_id, exc)
+                matched = []
+            if matched:
+                annotate(
+                    shot_retrieval="embedding",
+                    shot_count=len(matched),
+                    shot_indexed=shot_index.indexed,
+                    shot_top_score=round(matched[0][1], 4),
+                )
+                return ShotCandidates(
+                    [shot for shot, _ in matched],
+                    "embedding",
+                    matched[0][1],
+                    embedding_model=shot_index.embedding_model,
+                )
+        if shot_index.lexical is not None:
+            # 与问题没有任何共同字组的问答对不作为示例，全部不命中时不再调用模型匹配
+            matched = shot_index.lexical_top_k(user_input, top_k)
+            annotate(
+                shot_retrieval="bm25",
+                shot_count=len(matched),
+                shot_top_score=round(matched[0][1], 4) if matched else None,
+            )
+            return ShotCandidates([shot for shot, _ in matched], "bm25", matched[0][1] if matched else 0.0)
+        annotate(shot_retrieval="all", shot_count=len(shot_index.shots))
+        return ShotCandidates(list(shot_index.shots), None, None)
+
+    async def create_sql(self, user_input: str, qa_rows: List[Any]) -> Tuple[str, int]:
         prompt = self.build_complete_sql_prompt_by_shot(user_input, qa_rows)
         if not prompt:
             return "", 0
-        ai_result = self.chat(prompt)
+        ai_result = await self.chat(prompt)
         sql = self.extract_sql_from_template(ai_result)
         similarity = self.extract_similarity(ai_result)
         return sql, similarity
 
-    def execute_sql(
+    async def execute_sql(
         self,
         sql: str,
         parameters: Optional[Dict[str, Any]] = None,
         timeout: int = 20,
+        use_cache: bool = True,
     ) -> List[Dict[str, Any]]:
         if not self.db_config:
             raise ValueError("db_config 不能为空")
@@ -64,10 +188,52 @@ class ShotTool:
 
         db_type = (getattr(self.db_config, "type", "") or "").lower()
         if db_type in {"pg", "postgres", "postgresql"}:
-            return self._execute_pg_sql(sql, parameters=parameters)
-        if db_type in {"ck", "clickhouse"}:
-            return self._execute_ck_sql(sql, parameters=parameters, timeout=timeout)
-        raise ValueError(f"不支持的数据库类型: {db_type}")
+            execute = partial(self._execute_pg_sql, sql, parameters=parameters, timeout=timeout)
+            freshness = self._pg_freshness_token
+        elif db_type in {"ck", "clickhouse"}:
+            execute = partial(self._execute_ck_sql, sql, parameters=parameters, timeout=timeout)
+            freshness = self._ck_freshness_token
+        else:
+            raise ValueError(f"不支持的数据库类型: {db_type}")
+
+        return await traced(
+            "sql_execute",
+            self._execute_with_cache(sql, parameters, execute, freshness, use_cache=use_cache),
+            db_type=db_type,
+        )
+
+    async def _execute_with_cache(
+        self,
+        sql: str,
+        parameters: Optional[Dict[str, Any]],
+        execute: Callable[[], Awaitable[List[Dict[str, Any]]]],
+        freshness: Callable[[List[str]], Awaitable[Optional[str]]],
+        *,
+        use_cache: bool,
+    ) -> List[Dict[str, Any]]:
+        executed = False
+
+        async def execute_on_database() -> List[Dict[str, Any]]:
+            nonlocal executed
+            executed = True
+            async with db_limiter.slot(
+                getattr(self.db_config, "id", None),
+                getattr(self.db_config, "max_concurrency", None),
+            ):
+                return await execute()
+
+        if use_cache:
+            data = await sql_result_cache.get_or_execute(
+                self.db_config,
+                sql,
+                parameters,
+                execute_on_database,
+                freshness=freshness,
+            )
+        else:
+            data = await execute_on_database()
+        annotate(result_cache_hit=not executed, row_count=len(data) if isinstance(data, list) else None)
+        return data
 
     def build_complete_sql_prompt_by_shot(self, user_input: str, qa_rows: List[Any]) -> str:
         shots = self._to_shots(qa_rows)
@@ -254,52 +420,92 @@ WHERE day_key = '2025-12-06' AND aircraft_model LIKE '%C-17%'
                 return []
         return []
 
-    def _execute_pg_sql(self, sql: str, parameters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
-        cfg = self.db_config
-        if cfg is None:
-            raise ValueError("db_config 不能为空")
-        client = PostgreSQLClient(
-            host=cfg.ip,
-            port=cfg.port,
-            user=cfg.username,
-            password=cfg.password,
-            database=cfg.database_name,
-        )
-        result = client.execute_sql(sql, parameters=parameters)
+    async def _execute_pg_sql(
+        self,
+        sql: str,
+        parameters: Optional[Dict[str, Any]] = None,
+        timeout: int = 20,
+    ) -> List[Dict[str, Any]]:
+        result = await self._pg_client().execute_sql(sql, parameters=parameters, timeout=timeout)
         if not result.get("success"):
             raise RuntimeError(f"SQL执行错误: {result.get('error')}")
         data = (result.get("result") or {}).get("data") or []
         return self._to_jsonable(data)
 
-    def _execute_ck_sql(
+    async def _execute_ck_sql(
         self,
         sql: str,
         parameters: Optional[Dict[str, Any]] = None,
         timeout: int = 20,
     ) -> List[Dict[str, Any]]:
+        result = await self._get_ck_client().execute_sql(sql, parameters=parameters, timeout=timeout)
+        if not result.get("success"):
+            raise RuntimeError(f"SQL执行错误: {result.get('error')}")
+        data = (result.get("result") or {}).get("data") or []
+        columns = (result.get("result") or {}).get("columns") or []
+        if columns:
+            zipped = [dict(zip(columns, row)) for row in data]
+            return self._to_jsonable(zipped)
+        return self._to_jsonable(data)
+
+    def _pg_client(self) -> AsyncPostgreSQLClient:
         cfg = self.db_config
         if cfg is None:
             raise ValueError("db_config 不能为空")
+        return AsyncPostgreSQLClient(
+            host=cfg.ip,
+            port=cfg.port,
+            user=cfg.username,
+            password=cfg.password,
+            database=cfg.database_name,
+        )
 
+    def _get_ck_client(self) -> AsyncClickHouseClient:
+        cfg = self.db_config
+        if cfg is None:
+            raise ValueError("db_config 不能为空")
         if self.ck_client is None:
-            self.ck_client = ClickHouseClient(
+            self.ck_client = AsyncClickHouseClient(
                 host=cfg.ip,
                 port=cfg.port,
                 username=cfg.username,
                 password=cfg.password,
                 database=cfg.database_name,
             )
-
-        result = self.ck_client.execute_sql(sql, parameters=parameters, timeout=timeout)
-        print(result)
+        return self.ck_client
+
+    async def _pg_freshness_token(self, tables: List[str]) -> Optional[str]:
+        """PG 用 pg_stat_user_tables 的增删改计数判断表数据是否变更。"""
+        sql = (
+            "SELECT relname, n_tup_ins, n_tup_upd, n_tup_del, n_live_tup "
+            "FROM pg_stat_user_tables "
+            "WHERE schemaname = %(schema)s AND relname = ANY(%(tables)s) "
+            "ORDER BY relname"
+        )
+        parameters = {
+            "schema": getattr(self.db_config, "schema_name", None) or "public",
+            "tables": tables,
+        }
+        result = await self._pg_client().execute_sql(sql, parameters=parameters, timeout=5)
         if not result.get("success"):
-            raise RuntimeError(f"SQL执行错误: {result.get('error')}")
-        data = (result.get("result") or {}).get("data") or []
-        columns = (result.get("result") or {}).get("columns") or []
-        if columns:
-            zipped = [dict(zip(columns, row)) for row in data]
-            return self._to_jsonable(zipped)
-        return self._to_jsonable(data)
+            raise RuntimeError(result.get("error"))
+        rows = (result.get("result") or {}).get("data") or []
+        return json.dumps(rows, sort_keys=True, default=str)
+
+    async def _ck_freshness_token(self, tables: List[str]) -> Optional[str]:
+        """ClickHouse 用 system.parts 中活跃分区的最大修改时间和行数判断表数据是否变更。"""
+        sql = (
+            "SELECT table, max(modification_time), sum(rows) "
+            "FROM system.parts "
+            "WHERE active AND database = {database:String} AND table IN {tables:Array(String)} "
+            "GROUP BY table ORDER BY table"
+        )
+        parameters = {"database": self.db_config.database_name, "tables": tables}
+        result = await self._get_ck_client().execute_sql(sql, parameters=parameters, timeout=5)
+        if not result.get("success"):
+            raise RuntimeError(result.get("error"))
+        rows = (result.get("result") or {}).get("data") or []
+        return json.dumps([list(row) for row in rows], default=str)
 
     def close(self) -> None:
         if self.ck_client:
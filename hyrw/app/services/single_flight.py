@@ -0,0 +1,209 @@
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+
+from sqlalchemy import delete, or_, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import run_sync_session
+from app.models.ask_flight import AskFlight
+from app.services.job_runner import job_runner
+
+
+logger = logging.getLogger(__name__)
+
+# 已结束的记录保留时长，过期后由后台任务执行器定期清理
+_FINISHED_RETENTION = timedelta(hours=1)
+
+
+class FlightTicket:
+    """
+    一次问答在单飞中的身份：leader 负责计算并发布结果，follower 等待结果。
+    follower 拿到 None 表示计算方失败或超时，需要自行计算。
+    """
+
+    def __init__(
+        self,
+        flight: "SingleFlight",
+        digest: str,
+        future: "asyncio.Future[Optional[Dict[str, Any]]]",
+        *,
+        is_leader: bool,
+        owner: Optional[str] = None,
+        remote_owner: Optional[str] = None,
+    ):
+        self.flight = flight
+        self.digest = digest
+        self.future = future
+        self.is_leader = is_leader
+        self.owner = owner
+        self.remote_owner = remote_owner
+        self._heartbeat: Optional[asyncio.Task] = None
+        self._finished = False
+
+    async def wait(self) -> Optional[Dict[str, Any]]:
+        if self.remote_owner is not None:
+            return await self._wait_remote()
+        try:
+            return await asyncio.wait_for(asyncio.shield(self.future), timeout=settings.ASK_SINGLE_FLIGHT_WAIT_SECONDS)
+        except asyncio.TimeoutError:
+            return None
+
+    async def _wait_remote(self) -> Optional[Dict[str, Any]]:
+        """其他 worker 正在计算：轮询 ask_flight，同进程内的后续请求通过本地 future 共享结果。"""
+        result: Optional[Dict[str, Any]] = None
+        try:
+            deadline = time.monotonic() + settings.ASK_SINGLE_FLIGHT_WAIT_SECONDS
+            while time.monotonic() < deadline:
+                await asyncio.sleep(settings.ASK_SINGLE_FLIGHT_POLL_SECONDS)
+                row = await run_sync_session(lambda db: db.get(AskFlight, self.digest))
+                if row is None or row.owner != self.remote_owner or row.status == "failed":
+                    break
+                if row.status == "done":
+                    result = json.loads(row.result) if row.result else None
+                    break
+                if row.lease_until < datetime.utcnow():
+                    logger.warning("[single_flight] remote lease expired key=%s owner=%s", self.digest, row.owner)
+                    break
+            return result
+        finally:
+            self.flight._resolve(self.digest, self.future, result)
+
+    def start_heartbeat(self) -> None:
+        self._heartbeat = asyncio.create_task(self.flight._renew_lease(self.digest, self.owner))
+
+    async def publish(self, result: Dict[str, Any]) -> None:
+        await self._finish("done", result)
+
+    async def fail(self) -> None:
+        await self._finish("failed", None)
+
+    async def _finish(self, status: str, result: Optional[Dict[str, Any]]) -> None:
+        if not self.is_leader or self._finished:
+            return
+        self._finished = True
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+        self.flight._resolve(self.digest, self.future, result)
+        payload = json.dumps(result, ensure_ascii=False, default=str) if result is not None else None
+        try:
+            await run_sync_session(lambda db: self.flight._finish_row(db, self.digest, self.owner, status, payload))
+        except Exception as exc:
+            logger.warning("[single_flight] finish failed key=%s error=%s", self.digest, str(exc))
+
+
+class SingleFlight:
+    """
+    合并进行中的相同问答：同进程内用 future 共享，跨 worker 通过 ask_flight 表的租约协调。
+    """
+
+    def __init__(self):
+        self.process_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._local: Dict[str, "asyncio.Future[Optional[Dict[str, Any]]]"] = {}
+
+    @staticmethod
+    def make_digest(key: Tuple[int, str]) -> str:
+        return hashlib.sha256(f"{key[0]}:{key[1]}".encode("utf-8")).hexdigest()
+
+    async def acquire(self, key: Tuple[int, str]) -> FlightTicket:
+        digest = self.make_digest(key)
+        future = self._local.get(digest)
+        if future is not None and not future.done():
+            return FlightTicket(self, digest, future, is_leader=False)
+
+        # 先登记本地 future，抢占数据库租约期间到达的同进程请求直接等待它
+        future = asyncio.get_running_loop().create_future()
+        self._local[digest] = future
+        owner = f"{self.process_id}:{uuid.uuid4().hex[:8]}"
+        try:
+            claimed, current_owner = await run_sync_session(lambda db: self._claim(db, digest, owner))
+        except Exception as exc:
+            # 协调表不可用时退化为仅进程内合并
+            logger.warning("[single_flight] claim failed key=%s error=%s", digest, str(exc))
+            claimed, current_owner = True, owner
+        if claimed:
+            ticket = FlightTicket(self, digest, future, is_leader=True, owner=owner)
+            ticket.start_heartbeat()
+            return ticket
+        logger.info("[single_flight] waiting remote flight key=%s owner=%s", digest, current_owner)
+        return FlightTicket(self, digest, future, is_leader=False, remote_owner=current_owner)
+
+    def _resolve(self, digest: str, future: "asyncio.Future", result: Optional[Dict[str, Any]]) -> None:
+        if not future.done():
+            future.set_result(result)
+        if self._local.get(digest) is future:
+            del self._local[digest]
+
+    def _claim(self, db: Session, digest: str, owner: str) -> Tuple[bool, str]:
+        now = datetime.utcnow()
+        stmt = sqlite_insert(AskFlight).values(
+            flight_key=digest,
+            owner=owner,
+            status="running",
+            result=None,
+            lease_until=now + timedelta(seconds=settings.ASK_SINGLE_FLIGHT_LEASE_SECONDS),
+            updated_at=now,
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[AskFlight.flight_key],
+            set_={
+                "owner": stmt.excluded.owner,
+                "status": "running",
+                "result": None,
+                "lease_until": stmt.excluded.lease_until,
+                "updated_at": stmt.excluded.updated_at,
+            },
+            where=or_(AskFlight.status != "running", AskFlight.lease_until < now),
+        )
+        db.execute(stmt)
+        db.commit()
+        current_owner = db.get(AskFlight, digest).owner
+        return current_owner == owner, current_owner
+
+    async def _renew_lease(self, digest: str, owner: str) -> None:
+        interval = max(1.0, settings.ASK_SINGLE_FLIGHT_LEASE_SECONDS / 3)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await run_sync_session(lambda db: self._update_lease(db, digest, owner))
+            except Exception as exc:
+                logger.warning("[single_flight] renew lease failed key=%s error=%s", digest, str(exc))
+
+    def _update_lease(self, db: Session, digest: str, owner: str) -> None:
+        now = datetime.utcnow()
+        db.execute(
+            update(AskFlight)
+            .where(AskFlight.flight_key == digest, AskFlight.owner == owner, AskFlight.status == "running")
+            .values(lease_until=now + timedelta(seconds=settings.ASK_SINGLE_FLIGHT_LEASE_SECONDS), updated_at=now)
+        )
+        db.commit()
+
+    def _finish_row(self, db: Session, digest: str, owner: str, status: str, payload: Optional[str]) -> None:
+        db.execute(
+            update(AskFlight)
+            .where(AskFlight.flight_key == digest, AskFlight.owner == owner)
+            .values(status=status, result=payload, updated_at=datetime.utcnow())
+        )
+        db.commit()
+
+
+def purge_finished_flights(db: Session, now: datetime) -> None:
+    db.execute(
+        delete(AskFlight).where(
+            AskFlight.status != "running",
+            AskFlight.updated_at < now - _FINISHED_RETENTION,
+        )
+    )
+
+
+single_flight = SingleFlight()
+job_runner.register_purge(purge_finished_flights)
@@ -1,38 +1,36 @@
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 import re
 
-from sqlalchemy.orm import Session
-
-from app.models.db_config import DbConfig
 from app.models.llm_config import LlmConfig
-from app.models.nlsql_task_config import NlsqlTaskConfig
-from app.models.table_metadata_extended import TableMetadataBasic
+from app.services.ask_trace import traced
 from app.services.openai_service import OpenAIService
 from app.services.shot_tool import ShotTool
+from app.services.task_context import TaskContext, task_context_store
 
 
 class SqlFixAgent:
     def __init__(
         self,
         *,
-        db: Session,
         task_id: int,
         llm_config: LlmConfig,
         user_input: str,
         sql: str,
         error_message: str,
         selected_tables: Optional[List[str]] = None,
+        context: Optional[TaskContext] = None,
+        llm_pool: Optional[Sequence[LlmConfig]] = None,
     ):
-        self.db = db
         self.task_id = task_id
         self.llm_config = llm_config
         self.user_input = user_input
         self.initial_sql = sql
         self.initial_error_message = error_message
         self.selected_tables = selected_tables or []
-        self.openai_service = OpenAIService(llm_config)
+        self.context = context
+        self.openai_service = OpenAIService(llm_config, pool=llm_pool)
 
-    def fix_and_execute(
+    async def fix_and_execute(
         self,
         *,
         shot_tool: ShotTool,
@@ -43,9 +41,10 @@ class SqlFixAgent:
         current_error = self.initial_error_message
         attempts: List[Dict[str, Any]] = []
 
-        db_type = self._get_database_type()
         table_names = self._resolve_table_names(current_sql)
-        table_ddls = self._get_table_ddls(table_names)
+        context = self.context or await task_context_store.get(self.task_id)
+        db_type = context.db_type or "unknown"
+        table_ddls = self._get_table_ddls(context, table_names)
 
         for attempt in range(1, max_retries + 1):
             prompt = self._build_fix_prompt(
@@ -56,7 +55,7 @@ class SqlFixAgent:
                 attempt=attempt,
                 max_retries=max_retries,
             )
-            fixed_sql, reason = self._call_ai_fix_sql(prompt)
+            fixed_sql, reason = await traced("sql_fix", self._call_ai_fix_sql(prompt), attempt=attempt)
             if not fixed_sql:
                 attempts.append(
                     {
@@ -69,7 +68,7 @@ class SqlFixAgent:
                 continue
 
             try:
-                sql_data = shot_tool.execute_sql(fixed_sql, timeout=timeout)
+                sql_data = await shot_tool.execute_sql(fixed_sql, timeout=timeout)
                 attempts.append(
                     {
                         "attempt": attempt,
@@ -106,15 +105,6 @@ class SqlFixAgent:
             "error": current_error,
         }
 
-    def _get_database_type(self) -> str:
-        task = self.db.query(NlsqlTaskConfig).filter(NlsqlTaskConfig.id == self.task_id).first()
-        if not task:
-            return "unknown"
-        db_config = self.db.query(DbConfig).filter(DbConfig.id == task.db_config_id).first()
-        if not db_config or not db_config.type:
-            return "unknown"
-        return str(db_config.type)
-
     def _resolve_table_names(self, sql: str) -> List[str]:
         if self.selected_tables:
             return self.selected_tables
@@ -130,20 +120,12 @@ class SqlFixAgent:
                 found.append(table)
         return found
 
-    def _get_table_ddls(self, table_names: List[str]) -> Dict[str, str]:
-        if not table_names:
-            return {}
-        rows = (
-            self.db.query(TableMetadataBasic)
-            .filter(
-                TableMetadataBasic.table_task_id == self.task_id,
-                TableMetadataBasic.table_name.in_(table_names),
-            )
-            .all()
-        )
+    def _get_table_ddls(self, context: TaskContext, table_names: List[str]) -> Dict[str, str]:
         result: Dict[str, str] = {}
-        for row in rows:
-            result[str(row.table_name)] = str(row.table_ddl or "")
+        for table_name in table_names:
+            table = context.table(table_name)
+            if table is not None:
+                result[str(table.table_name)] = str(table.table_ddl or "")
         return result
 
     def _build_fix_prompt(
@@ -175,10 +157,9 @@ class SqlFixAgent:
             "3. 尽量保持原查询意图不变，只修复报错相关问题。\n"
         )
 
-    def _call_ai_fix_sql(self, prompt: str) -> Tuple[str, str]:
-        response = self.openai_service.client.chat.completions.create(
-            model=str(self.llm_config.model_name),
-            messages=[
+    async def _call_ai_fix_sql(self, prompt: str) -> Tuple[str, str]:
+        response = await self.openai_service.async_chat_completion(
+            [
                 {
                     "role": "system",
                     "content": "你是SQL修复专家。只返回修复后的SQL语句。",
@@ -187,6 +168,7 @@ class SqlFixAgent:
             ],
             temperature=float(getattr(self.llm_config, "temperature", 0.1) or 0.1),
             max_tokens=min(int(getattr(self.llm_config, "max_tokens", 2048) or 2048), 4096),
+            call_site="sql_fix",
         )
         content = response.choices[0].message.content or ""
         sql = self._extract_sql(content)
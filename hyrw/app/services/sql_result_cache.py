@@ -0,0 +1,243 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+
+from app.core.config import settings
+
+
+logger = logging.getLogger(__name__)
+
+CacheKey = Tuple[int, str]
+
+# 一次扫描区分字符串字面量/带引号的标识符（第 1 组，原样保留）与注释（第 2 组，去掉），
+# 注释标记出现在字面量内部时不会被当作注释
+_TOKEN_PATTERN = re.compile(
+    r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|`[^`]*`)|(--[^\n]*|/\*.*?\*/)",
+    re.S,
+)
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+# 只折叠关键字的大小写：ClickHouse 等方言的标识符区分大小写
+_KEYWORD_PATTERN = re.compile(
+    r"\b(?:select|distinct|from|where|and|or|not|in|is|null|as|on|join|left|right|inner|outer|full|cross"
+    r"|group|by|order|having|limit|offset|union|all|case|when|then|else|end|between|like|asc|desc|with)\b",
+    re.I,
+)
+_TABLE_PATTERN = re.compile(r"\b(?:from|join)\s+([`\"\w.]+)", re.I)
+_READ_ONLY_PATTERN = re.compile(r"^\s*(select|with)\b", re.I)
+
+
+def _strip_comments(sql: str) -> str:
+    return _TOKEN_PATTERN.sub(lambda match: match.group(1) or " ", sql or "")
+
+
+def canonicalize_sql(sql: str) -> str:
+    """去掉注释、折叠空白、关键字转小写（引号内内容与标识符不变），得到语义相同 SQL 的统一写法。"""
+    text = sql or ""
+    if "\\" in text:
+        # 反斜杠在 ClickHouse/MySQL 字面量中是转义符、在 PostgreSQL 中不是，无法确定字面量边界时原样使用
+        return text.strip()
+    canonical: List[str] = []
+    # 未加引号的部分连同去掉注释后留下的空白一起规范化
+    pending: List[str] = []
+    cursor = 0
+    for match in _TOKEN_PATTERN.finditer(text):
+        pending.append(text[cursor:match.start()])
+        if match.group(1) is None:
+            pending.append(" ")
+        else:
+            canonical.append(_canonical_segment("".join(pending)))
+            canonical.append(match.group(1))
+            pending = []
+        cursor = match.end()
+    pending.append(text[cursor:])
+    canonical.append(_canonical_segment("".join(pending)))
+    result = "".join(canonical).strip()
+    while result.endswith(";"):
+        result = result[:-1].rstrip()
+    return result
+
+
+def _canonical_segment(segment: str) -> str:
+    return _KEYWORD_PATTERN.sub(lambda match: match.group(0).lower(), _WHITESPACE_PATTERN.sub(" ", segment))
+
+
+def sql_fingerprint(sql: str, parameters: Optional[Dict[str, Any]] = None) -> str:
+    payload = canonicalize_sql(sql)
+    if parameters:
+        payload += "\n" + json.dumps(parameters, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def is_cacheable_sql(sql: str) -> bool:
+    return bool(_READ_ONLY_PATTERN.match(_strip_comments(sql)))
+
+
+def extract_table_names(sql: str) -> List[str]:
+    """提取 FROM/JOIN 后的表名（去掉库名/schema 前缀和引号），用于数据新鲜度检查。"""
+    names: List[str] = []
+    for raw in _TABLE_PATTERN.findall(_strip_comments(sql)):
+        name = raw.split(".")[-1].strip('`"')
+        if name and name.lower() not in {"select", "lateral"} and name not in names:
+            names.append(name)
+    return names
+
+
+def connection_signature(db_config: Any) -> str:
+    fields = ("type", "ip", "port", "database_name", "schema_name", "username")
+    return "|".join(str(getattr(db_config, field, "") or "") for field in fields)
+
+
+@dataclass
+class CachedResult:
+    data: Any
+    size: int
+    expires_at: float
+    signature: str
+    freshness_token: Optional[str] = None
+
+
+class SqlResultCache:
+    """
+    目标库查询结果缓存：按 (DbConfig ID, SQL 指纹) 缓存，按结果序列化后的字节数做 LRU 淘汰。
+    过期时间取 DbConfig.result_cache_ttl，开启新鲜度检查时命中前会比对表的变更标记。
+    """
+
+    def __init__(self, max_bytes: int, max_entry_bytes: int):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self._entries: "OrderedDict[CacheKey, CachedResult]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._stale = 0
+        self._evictions = 0
+
+    def ttl_for(self, db_config: Any) -> int:
+        if not settings.SQL_RESULT_CACHE_ENABLED:
+            return 0
+        ttl = getattr(db_config, "result_cache_ttl", None)
+        return settings.SQL_RESULT_CACHE_DEFAULT_TTL_SECONDS if ttl is None else int(ttl)
+
+    async def get_or_execute(
+        self,
+        db_config: Any,
+        sql: str,
+        parameters: Optional[Dict[str, Any]],
+        execute: Callable[[], Awaitable[Any]],
+        freshness: Optional[Callable[[List[str]], Awaitable[Optional[str]]]] = None,
+    ) -> Any:
+        ttl = self.ttl_for(db_config)
+        db_config_id = getattr(db_config, "id", None)
+        if ttl <= 0 or db_config_id is None or not is_cacheable_sql(sql):
+            return await execute()
+
+        key = (int(db_config_id), sql_fingerprint(sql, parameters))
+        signature = connection_signature(db_config)
+        check_freshness = freshness is not None and bool(getattr(db_config, "result_cache_freshness_check", False))
+        tables = extract_table_names(sql) if check_freshness else []
+
+        token: Optional[str] = None
+        if check_freshness and tables:
+            token = await self._safe_freshness_token(freshness, tables, db_config_id)
+
+        entry = self._lookup(key, signature=signature, freshness_token=token if check_freshness else None)
+        if entry is not None:
+            return entry.data
+
+        data = await execute()
+        if check_freshness and tables and token is None:
+            # 新鲜度无法确认时不缓存，避免返回旧数据
+            return data
+        self._store(key, data, ttl=ttl, signature=signature, freshness_token=token)
+        return data
+
+    async def _safe_freshness_token(
+        self,
+        freshness: Callable[[List[str]], Awaitable[Optional[str]]],
+        tables: List[str],
+        db_config_id: Any,
+    ) -> Optional[str]:
+        try:
+            return await freshness(tables)
+        except Exception as exc:
+            logger.warning("[sql_result_cache] freshness check failed db_config_id=%s error=%s", db_config_id, str(exc))
+            return None
+
+    def _lookup(self, key: CacheKey, *, signature: str, freshness_token: Optional[str]) -> Optional[CachedResult]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            if (
+                entry.expires_at < time.time()
+                or entry.signature != signature
+                or entry.freshness_token != freshness_token
+            ):
+                self._remove(key)
+                self._stale += 1
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry
+
+    def _store(self, key: CacheKey, data: Any, *, ttl: int, signature: str, freshness_token: Optional[str]) -> None:
+        size = len(json.dumps(data, ensure_ascii=False, default=str).encode("utf-8"))
+        if size > self.max_entry_bytes or size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = CachedResult(
+                data=data,
+                size=size,
+                expires_at=time.time() + ttl,
+                signature=signature,
+                freshness_token=freshness_token,
+            )
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self._evictions += 1
+
+    def _remove(self, key: CacheKey) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    def clear(self, db_config_id: Optional[int] = None) -> int:
+        with self._lock:
+            keys = [key for key in self._entries if db_config_id is None or key[0] == db_config_id]
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "enabled": settings.SQL_RESULT_CACHE_ENABLED,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "stale": self._stale,
+                "evictions": self._evictions,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+sql_result_cache = SqlResultCache(
+    max_bytes=settings.SQL_RESULT_CACHE_MAX_BYTES,
+    max_entry_bytes=settings.SQL_RESULT_CACHE_MAX_ENTRY_BYTES,
+)
@@ -0,0 +1,283 @@
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Collection, Dict, List, Optional, Sequence, Tuple
+import re
+import unicodedata
+
+
+# 问题中的日期表达：带年份的绝对日期、月日与相对日期
+_DATE_EXPRESSION = (
+    r"\d{4}[-/.]\d{1,2}[-/.]\d{1,2}|\d{4}年\d{1,2}月\d{1,2}[日号]?|(?<!\d)\d{8}(?!\d)"
+    r"|\d{1,2}月\d{1,2}[日号]|今天|今日|昨天|昨日|前天|明天"
+)
+_DATE_PATTERN = re.compile(_DATE_EXPRESSION)
+_RELATIVE_DAYS = {"今天": 0, "今日": 0, "昨天": -1, "昨日": -1, "前天": -2, "明天": 1}
+# SQL 中日期值的格式，按顺序尝试；日期之后的部分（如 " 00:00:00"）原样保留
+_SQL_DATE_FORMATS = (
+    (re.compile(r"^(\d{4}-\d{2}-\d{2})(.*)$"), "%Y-%m-%d"),
+    (re.compile(r"^(\d{4}/\d{2}/\d{2})(.*)$"), "%Y/%m/%d"),
+    (re.compile(r"^(\d{8})$"), "%Y%m%d"),
+)
+_NUMBER_PATTERN = re.compile(r"^\d+(?:\.\d+)?$")
+_CODE_PATTERN = re.compile(r"^[A-Za-z0-9][A-Za-z0-9\-_]*$")
+# 各类槽位在问题中对应位置的匹配模式
+_SLOT_PATTERNS = {
+    "date": f"(?:{_DATE_EXPRESSION})",
+    "number": r"\d+(?:\.\d+)?",
+    "code": r"[A-Za-z0-9][A-Za-z0-9\-_]*",
+    "text": r".+?",
+}
+# 文本槽位的新值含这些字符时多半是多个取值（应改为 IN），交给模型
+_TEXT_SEPARATORS = re.compile(r"[,，、/和与及或]")
+# 否定、范围与修饰类的词：新值含这些词时多半是在原取值上加了限定（如“台湾以外地区”“不在台湾的”），交给模型
+_TEXT_QUALIFIERS = re.compile(r"不|非|无|没|除|以外|之外|以内|之内|以上|以下|的")
+_CJK_CHARACTER = re.compile(r"[\u3400-\u9fff\uf900-\ufaff]")
+_STRING_LITERAL = re.compile(r"'((?:[^']|'')*)'")
+# 反斜杠在 ClickHouse/MySQL 字面量中是转义符，控制字符同样不应进入 SQL，新值含这些字符时交给模型
+_UNSAFE_CHARACTERS = re.compile(r"[\\\x00-\x1f\x7f]")
+_COMPARISON = r"(?:=|<>|!=|>=|<=|>|<)"
+_TRAILING_PUNCTUATION = re.compile(r"[\s?？。.!！]+$")
+
+
+def normalize_question(text: str) -> str:
+    normalized = unicodedata.normalize("NFKC", text or "")
+    normalized = re.sub(r"\s+", " ", normalized).strip()
+    return _TRAILING_PUNCTUATION.sub("", normalized)
+
+
+def parse_date_expression(text: str, today: Optional[date] = None) -> Optional[date]:
+    """把问题中的日期表达解析为日期；月日未带年份时按今年。"""
+    today = today or date.today()
+    text = text.strip()
+    if text in _RELATIVE_DAYS:
+        return today + timedelta(days=_RELATIVE_DAYS[text])
+    numbers = [int(item) for item in re.findall(r"\d+", text)]
+    try:
+        if len(numbers) == 1 and len(text) == 8:
+            return datetime.strptime(text, "%Y%m%d").date()
+        if len(numbers) == 3:
+            return date(numbers[0], numbers[1], numbers[2])
+        if len(numbers) == 2 and "月" in text:
+            return date(today.year, numbers[0], numbers[1])
+    except ValueError:
+        return None
+    return None
+
+
+def _sql_date_format(value: str) -> Optional[Tuple[str, str]]:
+    for pattern, fmt in _SQL_DATE_FORMATS:
+        match = pattern.match(value)
+        if match is None:
+            continue
+        try:
+            parsed = datetime.strptime(match.group(1), fmt).date()
+        except ValueError:
+            continue
+        if 1900 <= parsed.year <= 2100:
+            return fmt, match.group(2) if pattern.groups > 1 else ""
+    return None
+
+
+def _slot_kind(value: str) -> str:
+    if _sql_date_format(value) is not None:
+        return "date"
+    if _NUMBER_PATTERN.match(value):
+        return "number"
+    if _CODE_PATTERN.match(value) and re.search(r"[A-Za-z]", value):
+        return "code"
+    return "text"
+
+
+@dataclass(frozen=True)
+class TemplateSlot:
+    field: str
+    value: str
+    kind: str
+    # value 在 SQL 中出现的位置（可能不止一处，如 BETWEEN 的两端相同）
+    spans: Tuple[Tuple[int, int], ...]
+    quoted: bool
+
+
+@dataclass(frozen=True)
+class SqlTemplate:
+    """把问答对的 SQL 按 where_conditions 参数化，再与问答对的问题对齐成匹配新问题的正则。"""
+
+    sql: str
+    slots: Tuple[TemplateSlot, ...]
+    question_pattern: "re.Pattern[str]"
+    # 正则分组名 -> 槽位下标
+    groups: Tuple[Tuple[str, int], ...]
+
+    def fill(
+        self,
+        question: str,
+        today: Optional[date] = None,
+        known_values: Optional[Callable[[str], Collection[str]]] = None,
+    ) -> Optional[str]:
+        """
+        新问题与问答对的问题只在槽位处不同时返回填好的 SQL，否则返回 None（交给模型）。
+        known_values(field) 返回字段的已知取值（样例数据），文本槽位的新值在其中时直接采用。
+        """
+        match = self.question_pattern.fullmatch(normalize_question(question))
+        if match is None:
+            return None
+        values: Dict[int, str] = {}
+        for group, slot_index in self.groups:
+            converted = self._convert(self.slots[slot_index], match.group(group), today, known_values)
+            if converted is None:
+                return None
+            if values.setdefault(slot_index, converted) != converted:
+                return None
+        replacements: List[Tuple[int, int, str]] = []
+        for slot_index, slot in enumerate(self.slots):
+            new_value = values.get(slot_index, slot.value)
+            if slot.quoted:
+                new_value = new_value.replace("'", "''")
+            replacements.extend((start, end, new_value) for start, end in slot.spans)
+        sql = self.sql
+        for start, end, new_value in sorted(replacements, reverse=True):
+            sql = sql[:start] + new_value + sql[end:]
+        return sql
+
+    def _convert(
+        self,
+        slot: TemplateSlot,
+        raw: str,
+        today: Optional[date],
+        known_values: Optional[Callable[[str], Collection[str]]],
+    ) -> Optional[str]:
+        raw = raw.strip()
+        if not raw or _UNSAFE_CHARACTERS.search(raw):
+            return None
+        if slot.kind == "date":
+            parsed = parse_date_expression(raw, today)
+            date_format = _sql_date_format(slot.value)
+            if parsed is None or date_format is None:
+                return None
+            return parsed.strftime(date_format[0]) + date_format[1]
+        if slot.kind == "number":
+            return raw if _NUMBER_PATTERN.match(raw) else None
+        if slot.kind == "code":
+            if not _CODE_PATTERN.match(raw):
+                return None
+            return raw.upper() if slot.value.isupper() else raw
+        if known_values is not None and raw in known_values(slot.field):
+            return raw
+        # 不是已知取值时只接受与原取值同类的单个词：文本槽位是非贪婪匹配，会把问题中多出的词一并吞入
+        if _TEXT_SEPARATORS.search(raw) and not _TEXT_SEPARATORS.search(slot.value):
+            return None
+        if len(raw) > max(2 * len(slot.value), len(slot.value) + 6):
+            return None
+        if raw.lower() != slot.value.lower() and slot.value.lower() in raw.lower():
+            return None
+        if _TEXT_QUALIFIERS.search(raw) and not _TEXT_QUALIFIERS.search(slot.value):
+            return None
+        if len(_CJK_CHARACTER.findall(raw)) > len(_CJK_CHARACTER.findall(slot.value)) + 2:
+            return None
+        return raw
+
+
+def _locate(sql: str, field: str, value: str, kind: str) -> Tuple[List[Tuple[int, int]], bool]:
+    """
+    value 在 SQL 中的位置：字符串字面量的内容（去掉 LIKE 的 %）等于 value；
+    数字还可以是不带引号的字面量，但只认该条件字段的比较（field op value）且须恰好一处，
+    避免改写 round(x, 2)、LIMIT 1 等处相同的数字。
+    """
+    spans: List[Tuple[int, int]] = []
+    for literal in _STRING_LITERAL.finditer(sql):
+        content = literal.group(1)
+        if content.strip("%") != value:
+            continue
+        start = literal.start(1) + content.index(value)
+        spans.append((start, start + len(value)))
+    if spans or kind != "number":
+        return spans, True
+    column = field.split(".")[-1].strip('`"')
+    if not re.fullmatch(r"\w+", column):
+        return [], False
+    masked = _STRING_LITERAL.sub(lambda item: " " * len(item.group(0)), sql)
+    comparison = re.compile(
+        rf"(?<![\w.])(?:[\w`\"]+\.)*[`\"]?{re.escape(column)}[`\"]?\s*{_COMPARISON}\s*({re.escape(value)})(?![\w.])",
+        re.IGNORECASE,
+    )
+    spans = [(match.start(1), match.end(1)) for match in comparison.finditer(masked)]
+    if len(spans) != 1:
+        return [], False
+    return spans, False
+
+
+def _surface(question: str, slot: TemplateSlot, date_slots: int) -> Optional[Tuple[int, int]]:
+    """槽位值在问答对问题中的位置；日期也可以写成其他形式（如“今天”），此时问题中须只有一个日期表达。"""
+    lowered = question.lower()
+    value = slot.value.lower()
+    index = lowered.find(value)
+    if index >= 0:
+        if lowered.find(value, index + 1) >= 0:
+            return None
+        return index, index + len(value)
+    if slot.kind == "date" and date_slots == 1:
+        expressions = list(_DATE_PATTERN.finditer(question))
+        if len(expressions) == 1:
+            return expressions[0].start(), expressions[0].end()
+    return None
+
+
+def build_template(question: str, sql: str, where_conditions: Sequence[Dict[str, Any]]) -> Optional[SqlTemplate]:
+    """
+    无法可靠参数化时返回 None：没有标量条件值、条件值在 SQL 中找不到、不同槽位占用同一处字面量，
+    或问题中两个槽位之间没有固定文字（无法确定分界）。
+    """
+    if not sql or not where_conditions:
+        return None
+    slots: List[TemplateSlot] = []
+    occupied: Dict[Tuple[int, int], int] = {}
+    for condition in where_conditions:
+        raw_value = condition.get("value")
+        if isinstance(raw_value, bool) or not isinstance(raw_value, (str, int, float)):
+            return None
+        value = str(raw_value).strip("%").strip()
+        if not value:
+            return None
+        kind = _slot_kind(value)
+        spans, quoted = _locate(sql, str(condition.get("field") or ""), value, kind)
+        if not spans:
+            return None
+        for span in spans:
+            if occupied.setdefault(span, len(slots)) != len(slots):
+                # 两个条件的值相同且落在同一处，无法区分
+                return None
+        slots.append(TemplateSlot(str(condition.get("field") or ""), value, kind, tuple(spans), quoted))
+    all_spans = sorted(occupied)
+    if any(left[1] > right[0] for left, right in zip(all_spans, all_spans[1:])):
+        return None
+
+    normalized = normalize_question(question)
+    date_slots = sum(1 for slot in slots if slot.kind == "date")
+    anchors: List[Tuple[int, int, int]] = []
+    for slot_index, slot in enumerate(slots):
+        surface = _surface(normalized, slot, date_slots)
+        if surface is not None:
+            anchors.append((surface[0], surface[1], slot_index))
+    anchors.sort()
+    if any(left[1] > right[0] for left, right in zip(anchors, anchors[1:])):
+        return None
+
+    parts: List[str] = []
+    groups: List[Tuple[str, int]] = []
+    cursor = 0
+    for start, end, slot_index in anchors:
+        literal = normalized[cursor:start]
+        if groups and not literal and "text" in (slots[groups[-1][1]].kind, slots[slot_index].kind):
+            return None
+        parts.append(re.escape(literal))
+        group = f"slot{len(groups)}"
+        parts.append(f"(?P<{group}>{_SLOT_PATTERNS[slots[slot_index].kind]})")
+        groups.append((group, slot_index))
+        cursor = end
+    parts.append(re.escape(normalized[cursor:]))
+    return SqlTemplate(
+        sql=sql,
+        slots=tuple(slots),
+        question_pattern=re.compile("".join(parts), re.IGNORECASE),
+        groups=tuple(groups),
+    )
@@ -13,6 +13,7 @@ from app.models.user_prompt_config import UserPromptConfig
 from app.models.table_level_prompt import TableLevelPrompt
 from app.models.table_field_prompt import TableFieldPrompt
 from app.models.table_metadata_extended import TableMetadataBasic
+from app.services.llm_router import load_llm_pool
 from app.services.openai_service import OpenAIService
 
 
@@ -182,7 +183,7 @@ class TableFieldPromptService:
                 llm_config.model_name,
             )
 
-            openai_service = OpenAIService(llm_config)
+            openai_service = OpenAIService(llm_config, pool=load_llm_pool(db, llm_config, task.llm_config_ids))
             created_or_updated_ids: List[int] = []
             initial_batch_size = 6
 
@@ -457,8 +458,30 @@ class TableFieldPromptService:
         table_name: str,
         batch_index: int,
     ) -> List[Dict[str, Any]]:
-        current_prompt_data = dict(prompt_data)
         current_max_tokens = self._normalize_int(getattr(openai_service.model_config, "max_tokens", None))
+        # 先按模型窗口在本地裁剪字段样例并确定补全上限；裁剪到底仍放不下时直接拆小批次，不再请求模型试错
+        fitted = openai_service.token_budget(current_max_tokens).fit(
+            dict(prompt_data),
+            openai_service.build_all_fields_messages,
+            [self._reduce_fields_sample_step],
+        )
+        if fitted.trimmed or not fitted.fits:
+            logger.info(
+                "[field_prompt] fit prompt to context window task_id=%s table=%s batch=%s trimmed=%s prompt_tokens=%s max_tokens=%s fits=%s",
+                task_id,
+                table_name,
+                batch_index,
+                fitted.trimmed,
+                fitted.prompt_tokens,
+                fitted.max_tokens,
+                fitted.fits,
+            )
+        if not fitted.fits and len(prompt_data.get("all_fields") or []) > 1:
+            raise ContextLengthExhaustedError(
+                f"estimated prompt tokens {fitted.prompt_tokens} exceed context window"
+            )
+        current_prompt_data = fitted.payload
+        current_max_tokens = fitted.max_tokens
         retry_count = 0
         transient_retry_count = 0
         max_transient_retries = 3
@@ -560,6 +583,10 @@ class TableFieldPromptService:
             "all_fields": reduced_all_fields,
         }, reduced_fields
 
+    def _reduce_fields_sample_step(self, prompt_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        reduced_prompt_data, reduced_fields = self._reduce_all_fields_sample_data(prompt_data)
+        return reduced_prompt_data if reduced_fields > 0 else None
+
     def _reduce_sample_payload(self, sample_data: Any) -> Optional[Any]:
         if isinstance(sample_data, list):
             if len(sample_data) <= 1:
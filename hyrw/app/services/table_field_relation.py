@@ -12,6 +12,7 @@ from app.models.table_metadata_extended import TableMetadataBasic
 from app.models.table_level_prompt import TableLevelPrompt
 from app.models.table_field_prompt import TableFieldPrompt
 from app.models.table_field_relation import TableFieldRelation
+from app.services.llm_router import load_llm_pool
 from app.services.openai_service import OpenAIService
 
 
@@ -200,7 +201,7 @@ class TableFieldRelationService:
                 len(field_prompts),
             )
 
-            openai_service = OpenAIService(llm_config)
+            openai_service = OpenAIService(llm_config, pool=load_llm_pool(db, llm_config, task.llm_config_ids))
             generated_ids: List[int] = []
             pair_count = 0
 
@@ -13,6 +13,7 @@ from app.models.nlsql_task_config import NlsqlTaskConfig
 from app.models.llm_config import LlmConfig
 from app.models.user_prompt_config import UserPromptConfig
 from app.models.table_metadata_extended import TableMetadataBasic
+from app.services.llm_router import load_llm_pool
 from app.services.openai_service import OpenAIService
 
 sync_engine = create_engine(
@@ -106,7 +107,7 @@ class TableLevelPromptService:
             table_notes = self._parse_json_list(user_prompt_config.table_notes)
             system_config = user_prompt_config.system_config or ""
 
-            openai_service = OpenAIService(llm_config)
+            openai_service = OpenAIService(llm_config, pool=load_llm_pool(sync_db, llm_config, task.llm_config_ids))
             created_ids: List[int] = []
             for table_metadata in table_metadata_list:
                 prompt_data = self._build_prompt_data(table_metadata, system_config, table_notes)
@@ -194,8 +195,25 @@ class TableLevelPromptService:
         task_id: int,
         table_name: str,
     ) -> Dict[str, Any]:
-        current_prompt_data = dict(prompt_data)
         current_max_tokens = self._normalize_int(getattr(openai_service.model_config, "max_tokens", None))
+        # 先按模型窗口在本地裁剪样例数据/字段并确定补全上限，超窗报错后的回退只作兜底
+        fitted = openai_service.token_budget(current_max_tokens).fit(
+            dict(prompt_data),
+            openai_service.build_table_prompt_messages,
+            [self._reduce_prompt_sample_data, self._reduce_prompt_fields],
+        )
+        if fitted.trimmed or not fitted.fits:
+            logger.info(
+                "[table_level_prompt] fit prompt to context window task_id=%s table=%s trimmed=%s prompt_tokens=%s max_tokens=%s fits=%s",
+                task_id,
+                table_name,
+                fitted.trimmed,
+                fitted.prompt_tokens,
+                fitted.max_tokens,
+                fitted.fits,
+            )
+        current_prompt_data = fitted.payload
+        current_max_tokens = fitted.max_tokens
 
         retry_count = 0
         while True:
@@ -249,6 +267,18 @@ class TableLevelPromptService:
                         "sample_data": reduced_sample_data,
                     }
 
+    def _reduce_prompt_sample_data(self, prompt_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        reduced_sample_data = self._reduce_sample_data_rows(prompt_data.get("sample_data"))
+        if reduced_sample_data is None:
+            return None
+        return {**prompt_data, "sample_data": reduced_sample_data}
+
+    def _reduce_prompt_fields(self, prompt_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        field_metadata = prompt_data.get("field_metadata") or []
+        if len(field_metadata) <= 1:
+            return None
+        return {**prompt_data, "field_metadata": field_metadata[: (len(field_metadata) + 1) // 2]}
+
     def _is_context_length_error(self, error: Exception) -> bool:
         error_message = str(error).lower()
         if "context_length_exceeded" in error_message:
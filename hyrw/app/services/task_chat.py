@@ -1,25 +1,38 @@
-from typing import Any, Dict, List, Optional
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 from datetime import datetime
+import asyncio
 import json
 import logging
+import time
 
 from fastapi import HTTPException
 from sqlalchemy import create_engine, or_
 from sqlalchemy.orm import sessionmaker
 
 from app.core.config import settings
+from app.core.database import run_sync_session
+from app.core.exceptions import TooManyRequestsError
 from app.models.chat_session import ChatSession
 from app.models.conversation import Conversation
 from app.models.db_config import DbConfig
 from app.models.llm_config import LlmConfig
 from app.models.nlsql_task_config import NlsqlTaskConfig
-from app.models.qa_embedding import QaEmbedding
+from app.models.task_context_version import get_task_version
+from app.services.admission import admission_controller
+from app.services.answer_cache import CachedAnswer, answer_cache
+from app.services.ask_trace import AskTrace, percentile, summarize_traces
 from app.services.column_patch_agent import ColumnPatchAgent
 from app.services.create_sql_agent import CreateSqlAgent
+from app.services.job_runner import JobContext, job_runner
+from app.services.llm_router import load_llm_pool
 from app.services.query_context_agent import QueryContextAgent
 from app.services.select_table_agent import SelectTableAgent
+from app.services.shot_gate import SHOT_SIMILARITY_THRESHOLD
+from app.services.shot_index import shot_index_store
 from app.services.shot_tool import ShotTool
+from app.services.single_flight import FlightTicket, single_flight
 from app.services.sql_fix_agent import SqlFixAgent
+from app.services.task_context import TaskContext, task_context_store
 
 
 sync_engine = create_engine(
@@ -35,9 +48,14 @@ SyncSessionLocal = sessionmaker(
 
 logger = logging.getLogger(__name__)
 
+# 批量问答单个问题被准入控制拒绝后的最多尝试次数
+BATCH_ADMISSION_RETRIES = 5
+# 后台问答任务类型
+ASK_JOB_TYPE = "ask"
+
 
 class TaskChatService:
-    def ask(
+    async def ask(
         self,
         *,
         task_id: int,
@@ -46,65 +64,258 @@ class TaskChatService:
         session_title: Optional[str] = None,
         description: Optional[str] = None,
         is_right: Optional[bool] = None,
+        speculative: Optional[bool] = None,
+        use_cache: Optional[bool] = None,
+        refresh_result: Optional[bool] = None,
     ) -> Dict[str, Any]:
-        db = SyncSessionLocal()
-        try:
-            task = db.query(NlsqlTaskConfig).filter(NlsqlTaskConfig.id == task_id).first()
-            if not task:
-                raise HTTPException(status_code=404, detail=f"任务ID {task_id} 不存在")
+        result: Dict[str, Any] = {}
+        async for event, payload in self.iter_ask_events(
+            task_id=task_id,
+            question=question,
+            session_id=session_id,
+            session_title=session_title,
+            description=description,
+            is_right=is_right,
+            speculative=speculative,
+            use_cache=use_cache,
+            refresh_result=refresh_result,
+        ):
+            if event == "done":
+                result = payload
+        return result
 
-            llm_config = db.query(LlmConfig).filter(LlmConfig.id == task.llm_config_id).first()
-            if not llm_config:
-                raise HTTPException(status_code=404, detail=f"LLM配置ID {task.llm_config_id} 不存在")
-            if llm_config.status != 1:
-                raise HTTPException(status_code=422, detail=f"LLM配置ID {llm_config.id} 未启用")
+    async def iter_ask_events(
+        self,
+        *,
+        task_id: int,
+        question: str,
+        session_id: Optional[int] = None,
+        session_title: Optional[str] = None,
+        description: Optional[str] = None,
+        is_right: Optional[bool] = None,
+        speculative: Optional[bool] = None,
+        use_cache: Optional[bool] = None,
+        refresh_result: Optional[bool] = None,
+    ) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """按阶段产出 (事件名, 数据)，最后一个事件为 done，携带与 ask 相同的完整结果。
 
-            db_config = db.query(DbConfig).filter(DbConfig.id == task.db_config_id).first()
-            if not db_config:
-                raise HTTPException(status_code=404, detail=f"数据库配置ID {task.db_config_id} 不存在")
+        第一个事件 start 在任务/配置校验、问答缓存与合并等待、准入排队都完成后产出，调用方可以先取它再开始流式响应，
+        这样 404/422/429 仍然以普通错误响应返回。只有实际计算答案的请求占用准入名额，
+        命中缓存或等待同一问题计算结果的请求不占用。
+        """
+        trace = AskTrace(task_id=task_id)
+        context = await trace.run(
+            "load_context",
+            run_sync_session(lambda db: self._load_ask_context(db, task_id=task_id, session_id=session_id)),
+        )
+        task: NlsqlTaskConfig = context["task"]
+        llm_config: LlmConfig = context["llm_config"]
+        db_config: DbConfig = context["db_config"]
+        start = {"task_id": task_id, "session_id": session_id, "question": question}
+
+        context_version: int = context["context_version"]
+        cache_enabled = settings.ANSWER_CACHE_ENABLED if use_cache is None else use_cache
+        cache_key = answer_cache.make_key(task_id, question)
+        cached = answer_cache.get(cache_key, context_version=context_version) if cache_enabled else None
+        if cached is not None:
+            reexecute = settings.ANSWER_CACHE_REEXECUTE if refresh_result is None else refresh_result
+            replayed, sql_data = await trace.run(
+                "answer_cache",
+                self._replay_cached_answer(
+                    task_id=task_id,
+                    cache_key=cache_key,
+                    cached=cached,
+                    llm_config=llm_config,
+                    db_config=db_config,
+                    reexecute=reexecute,
+                ),
+                reexecute=reexecute,
+            )
+            if replayed:
+                yield "start", start
+                yield "cache_hit", {
+                    "sql": cached.sql,
+                    "context_version": cached.context_version,
+                    "cached_at": datetime.utcfromtimestamp(cached.created_at),
+                    "reexecuted": reexecute,
+                }
+                shared = {
+                    "answer": "已命中问答缓存并返回SQL结果。",
+                    "sql_generated": cached.sql,
+                    "sql_data": sql_data,
+                    "selected_tables_list": cached.selected_tables,
+                    "query_context": cached.query_context,
+                    "column_patch": cached.column_patch,
+                }
+                async for item in self._iter_saved_answer(
+                    trace,
+                    shared,
+                    task_id=task_id,
+                    session_id=session_id,
+                    session_title=session_title,
+                    question=question,
+                    description=description,
+                    is_right=is_right,
+                    cache_hit=True,
+                    emit_result=True,
+                ):
+                    yield item
+                return
+
+        ticket: Optional[FlightTicket] = None
+        if settings.ASK_SINGLE_FLIGHT_ENABLED:
+            ticket = await single_flight.acquire(cache_key)
+            if not ticket.is_leader:
+                shared = await trace.run("single_flight_wait", ticket.wait())
+                if shared is not None:
+                    yield "start", start
+                    yield "coalesced", {"sql": shared.get("sql_generated")}
+                    async for item in self._iter_saved_answer(
+                        trace,
+                        shared,
+                        task_id=task_id,
+                        session_id=session_id,
+                        session_title=session_title,
+                        question=question,
+                        description=description,
+                        is_right=is_right,
+                        cache_hit=False,
+                        emit_result=True,
+                    ):
+                        yield item
+                    return
+                # 计算方失败或超时，自行计算
+                ticket = None
 
-            session = self._get_or_create_session(
-                db=db,
+        permit = None
+        try:
+            permit = await trace.run(
+                "admission",
+                admission_controller.acquire(
+                    task_id=task_id,
+                    llm_config_id=llm_config.id,
+                    task_limit=task.max_concurrency,
+                    llm_limit=llm_config.admission_concurrency,
+                ),
+            )
+            yield "start", start
+            async for item in self._iter_computed_ask_events(
+                trace,
+                context,
+                ticket,
                 task_id=task_id,
+                question=question,
                 session_id=session_id,
                 session_title=session_title,
-                question=question,
-            )
+                description=description,
+                is_right=is_right,
+                speculative=speculative,
+                cache_key=cache_key if cache_enabled else None,
+            ):
+                yield item
+        finally:
+            if permit is not None:
+                permit.release()
+            # 准入被拒绝或调用方提前退出时让等待的请求自行计算；已发布结果时不做任何事
+            if ticket is not None:
+                await ticket.fail()
 
-            qa_embeddings = (
-                db.query(QaEmbedding)
-                .filter(QaEmbedding.nlsql_task_id == task_id, QaEmbedding.is_enabled.is_(True))
-                .all()
+    async def _iter_computed_ask_events(
+        self,
+        trace: AskTrace,
+        context: Dict[str, Any],
+        ticket: Optional[FlightTicket],
+        *,
+        task_id: int,
+        question: str,
+        session_id: Optional[int],
+        session_title: Optional[str],
+        description: Optional[str],
+        is_right: Optional[bool],
+        speculative: Optional[bool],
+        cache_key: Optional[Tuple[int, str]],
+    ) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """完整问答流程；ticket 为合并计算的凭据，cache_key 为 None 时不写入问答缓存。"""
+        llm_config: LlmConfig = context["llm_config"]
+        llm_pool: List[LlmConfig] = context["llm_pool"]
+        db_config: DbConfig = context["db_config"]
+        context_version: int = context["context_version"]
+
+        sql_generated = ""
+        sql_data = None
+        select_table_result: Optional[Dict[str, Any]] = None
+        selected_tables_list: List[Any] = []
+        query_context: Optional[Dict[str, Any]] = None
+        column_patch: Optional[Dict[str, Any]] = None
+        create_sql_result: Optional[Dict[str, Any]] = None
+        sql_fix_result: Optional[Dict[str, Any]] = None
+        table_names: List[str] = []
+
+        # 各代理共享同一份上下文快照，版本未变时不再访问 SQLite
+        task_context = await trace.run(
+            "task_context",
+            task_context_store.get(task_id, version=context_version),
+        )
+        shot_tool = ShotTool(llm_config=llm_config, db_config=db_config, llm_pool=llm_pool)
+        select_agent = SelectTableAgent(
+            task_id=task_id,
+            user_input=question,
+            llm_config=llm_config,
+            context=task_context,
+            llm_pool=llm_pool,
+        )
+        use_speculation = settings.ASK_SPECULATIVE_ENABLED if speculative is None else speculative
+
+        async def match_shot() -> Tuple[str, int]:
+            shot_index = await shot_index_store.get(
+                task_id,
+                version=context_version,
+                embedding_model=llm_config.embedding_model,
             )
+            return await shot_tool.match(question, shot_index, task_context)
 
-            shot_tool = ShotTool(llm_config=llm_config, db_config=db_config)
-            sql_generated, similarity = shot_tool.create_sql(question, qa_embeddings)
-            sql_data = None
-            select_table_result: Optional[Dict[str, Any]] = None
-            selected_tables_list: List[Any] = []
-            query_context: Optional[Dict[str, Any]] = None
-            column_patch: Optional[Dict[str, Any]] = None
-            create_sql_result: Optional[Dict[str, Any]] = None
-            sql_fix_result: Optional[Dict[str, Any]] = None
-            if sql_generated and similarity > 90:
-                sql_data, sql_generated, sql_fix_result = self._execute_sql_with_auto_fix(
-                    db=db,
-                    task_id=task_id,
-                    user_input=question,
-                    llm_config=llm_config,
-                    shot_tool=shot_tool,
-                    sql=sql_generated,
-                    selected_tables=[],
+        shot_task = asyncio.create_task(trace.run("shot_match", match_shot()))
+        speculative_select: Optional[asyncio.Task] = None
+        create_sql_task: Optional[asyncio.Task] = None
+        execute_task: Optional[asyncio.Task] = None
+
+        def start_execution(sql: str) -> asyncio.Task:
+            return asyncio.create_task(
+                trace.run(
+                    "execute_sql",
+                    self._execute_sql_with_auto_fix(
+                        task_id=task_id,
+                        user_input=question,
+                        llm_config=llm_config,
+                        shot_tool=shot_tool,
+                        sql=sql,
+                        selected_tables=table_names,
+                        task_context=task_context,
+                        llm_pool=llm_pool,
+                    ),
                 )
+            )
+
+        try:
+            if use_speculation:
+                speculative_select = await self._start_speculative_select(select_agent, task_id=task_id, trace=trace)
+
+            shot_sql, similarity = await shot_task
+            yield "shot_result", {"sql": shot_sql, "similarity": similarity}
+
+            if shot_sql and similarity > SHOT_SIMILARITY_THRESHOLD:
+                sql_generated = shot_sql
                 answer = "已匹配到高相似度问答对并执行SQL。"
+                if speculative_select is not None:
+                    await self._cancel_task(speculative_select)
+                    logger.info("[task_chat] speculative select cancelled task_id=%s similarity=%s", task_id, similarity)
             else:
-                select_agent = SelectTableAgent(
-                    task_id=task_id,
-                    user_input=question,
-                    llm_config=llm_config,
-                    db=db,
-                )
-                select_table_result = select_agent.select_tables()
+                answer = "相似度低于阈值，已触发选表代理。"
+                if speculative_select is not None:
+                    select_table_result = await speculative_select
+                else:
+                    select_table_result = await trace.run("select_tables", select_agent.select_tables())
+                yield "select_table_result", select_table_result
                 if isinstance(select_table_result, dict):
                     selected_tables_list = select_table_result.get("selected_tables", [])
                     table_names = [
@@ -112,98 +323,539 @@ class TaskChatService:
                         for item in selected_tables_list
                         if isinstance(item, dict) and item.get("table_name")
                     ]
-                    if table_names:
-                        query_agent = QueryContextAgent(
-                            db=db,
-                            task_id=task_id,
-                            user_input=question,
-                            llm_config=llm_config,
-                            table_names=table_names,
+
+                if table_names:
+                    query_agent = QueryContextAgent(
+                        task_id=task_id,
+                        user_input=question,
+                        llm_config=llm_config,
+                        table_names=table_names,
+                        context=task_context,
+                        llm_pool=llm_pool,
+                    )
+                    query_context = await trace.run("query_context", query_agent.generate_query_context())
+                    yield "query_context", query_context
+
+                if table_names and query_context:
+                    patch_agent = ColumnPatchAgent(
+                        task_id=task_id,
+                        user_input=question,
+                        llm_config=llm_config,
+                        query_context=query_context,
+                        table_names=table_names,
+                        context=task_context,
+                        llm_pool=llm_pool,
+                    )
+                    column_patch = await trace.run("column_patch", patch_agent.generate_column_patch())
+                    yield "column_patch", column_patch
+
+                    create_sql_agent = CreateSqlAgent(
+                        task_id=task_id,
+                        user_input=question,
+                        llm_config=llm_config,
+                        query_context=query_context,
+                        column_patches=column_patch,
+                        selected_tables=table_names,
+                        context=task_context,
+                        llm_pool=llm_pool,
+                    )
+                    sql_ready: asyncio.Future = asyncio.get_running_loop().create_future()
+                    create_sql_task = asyncio.create_task(
+                        trace.run(
+                            "create_sql",
+                            create_sql_agent.generate_sql(
+                                on_sql=lambda sql: sql_ready.done() or sql_ready.set_result(sql)
+                            ),
                         )
-                        query_context = query_agent.generate_query_context()
-                        if query_context:
-                            patch_agent = ColumnPatchAgent(
-                                db=db,
-                                task_id=task_id,
-                                user_input=question,
-                                llm_config=llm_config,
-                                query_context=query_context,
-                                table_names=table_names,
-                            )
-                            column_patch = patch_agent.generate_column_patch()
-                            create_sql_agent = CreateSqlAgent(
-                                db=db,
-                                task_id=task_id,
-                                user_input=question,
-                                llm_config=llm_config,
-                                query_context=query_context,
-                                column_patches=column_patch,
-                                selected_tables=table_names,
-                            )
-                            create_sql_result = create_sql_agent.generate_sql()
-                            generated_sql_from_agent = ""
-                            if isinstance(create_sql_result, dict):
-                                generated_sql_from_agent = str(create_sql_result.get("sql") or "").strip()
-                            if generated_sql_from_agent:
-                                sql_generated = generated_sql_from_agent
-                                sql_data, sql_generated, sql_fix_result = self._execute_sql_with_auto_fix(
-                                    db=db,
-                                    task_id=task_id,
-                                    user_input=question,
-                                    llm_config=llm_config,
-                                    shot_tool=shot_tool,
-                                    sql=sql_generated,
-                                    selected_tables=table_names,
-                                )
-                answer = "相似度低于阈值，已触发选表代理。"
+                    )
+                    await asyncio.wait({create_sql_task, sql_ready}, return_when=asyncio.FIRST_COMPLETED)
+                    if sql_ready.done():
+                        # 【SQL】段已完整：理由继续流式生成的同时开始执行
+                        sql_generated = str(sql_ready.result()).strip()
+                        execute_task = start_execution(sql_generated)
+                    create_sql_result = await create_sql_task
+                    yield "create_sql_result", create_sql_result
+                    if execute_task is None and isinstance(create_sql_result, dict):
+                        sql_generated = str(create_sql_result.get("sql") or "").strip()
+
+            if sql_generated:
+                yield "sql", {"sql": sql_generated}
+                if execute_task is None:
+                    execute_task = start_execution(sql_generated)
+                sql_data, sql_generated, sql_fix_result = await execute_task
+                if sql_fix_result is not None:
+                    yield "sql_fix_result", sql_fix_result
+                yield "sql_result", {
+                    "sql": sql_generated,
+                    "sql_data": sql_data,
+                    "row_count": len(sql_data) if isinstance(sql_data, list) else None,
+                }
+                if cache_key is not None:
+                    answer_cache.put(
+                        cache_key,
+                        CachedAnswer(
+                            sql=sql_generated,
+                            sql_data=sql_data,
+                            context_version=context_version,
+                            selected_tables=selected_tables_list,
+                            query_context=query_context,
+                            column_patch=column_patch,
+                        ),
+                    )
+
+            shared = {
+                "answer": answer,
+                "sql_generated": sql_generated or shot_sql,
+                "sql_data": sql_data,
+                "selected_tables_list": selected_tables_list,
+                "query_context": query_context,
+                "column_patch": column_patch,
+                "select_table_result": select_table_result,
+                "create_sql_result": create_sql_result,
+                "sql_fix_result": sql_fix_result,
+            }
+            if ticket is not None:
+                await ticket.publish(shared)
+        finally:
+            if ticket is not None:
+                await ticket.fail()
+            if not shot_task.done():
+                await self._cancel_task(shot_task)
+            if speculative_select is not None and not speculative_select.done():
+                await self._cancel_task(speculative_select)
+            for task in (create_sql_task, execute_task):
+                if task is not None and not task.done():
+                    await self._cancel_task(task)
+            shot_tool.close()
+
+        async for item in self._iter_saved_answer(
+            trace,
+            shared,
+            task_id=task_id,
+            session_id=session_id,
+            session_title=session_title,
+            question=question,
+            description=description,
+            is_right=is_right,
+            cache_hit=False,
+            emit_result=False,
+        ):
+            yield item
+
+    async def _iter_saved_answer(
+        self,
+        trace: AskTrace,
+        shared: Dict[str, Any],
+        *,
+        task_id: int,
+        session_id: Optional[int],
+        session_title: Optional[str],
+        question: str,
+        description: Optional[str],
+        is_right: Optional[bool],
+        cache_hit: bool,
+        emit_result: bool,
+    ) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """保存本次对话并产出 done；复用缓存或合并结果时先补发 sql/sql_result 事件。"""
+        sql_generated = shared.get("sql_generated") or ""
+        sql_data = shared.get("sql_data")
+        if emit_result and sql_generated and sql_data is not None:
+            yield "sql", {"sql": sql_generated}
+            yield "sql_result", {
+                "sql": sql_generated,
+                "sql_data": sql_data,
+                "row_count": len(sql_data) if isinstance(sql_data, list) else None,
+            }
 
-            conversation = Conversation(
-                session_id=session.id,
+        saved = await run_sync_session(
+            lambda db: self._save_conversation(
+                db,
+                task_id=task_id,
+                session_id=session_id,
+                session_title=session_title,
                 question=question,
-                answer=answer,
+                answer=shared.get("answer") or "",
                 description=description,
-                nlsql_task_id=task_id,
                 is_right=is_right,
                 sql_generated=sql_generated,
-                sql_result=json.dumps(sql_data, ensure_ascii=False) if sql_data is not None else None,
-                selected_tables=json.dumps(selected_tables_list, ensure_ascii=False) if selected_tables_list else None,
-                query_context=json.dumps(query_context, ensure_ascii=False) if query_context is not None else None,
-                column_patch=json.dumps(column_patch, ensure_ascii=False) if column_patch is not None else None,
+                sql_data=sql_data,
+                selected_tables_list=shared.get("selected_tables_list") or [],
+                query_context=shared.get("query_context"),
+                column_patch=shared.get("column_patch"),
+                trace=self._finish_trace(trace),
             )
-            db.add(conversation)
-            db.flush()
+        )
+        yield "done", {
+            **saved,
+            "select_table_result": shared.get("select_table_result"),
+            "query_context": shared.get("query_context"),
+            "column_patch": shared.get("column_patch"),
+            "qColumnPatch": shared.get("column_patch"),
+            "create_sql_result": shared.get("create_sql_result"),
+            "sql_fix_result": shared.get("sql_fix_result"),
+            "cache_hit": cache_hit,
+            "trace": saved["conversation"]["trace"],
+        }
 
-            session.updated_at = datetime.utcnow()
-            db.commit()
-            db.refresh(conversation)
-            db.refresh(session)
+    def _finish_trace(self, trace: AskTrace) -> Dict[str, Any]:
+        data = trace.to_dict()
+        logger.info(
+            "[task_chat] ask finished task_id=%s total_ms=%s llm_calls=%s total_tokens=%s stages=%s",
+            trace.task_id,
+            data["total_ms"],
+            data["llm_calls"],
+            data["total_tokens"],
+            ",".join(f"{stage['name']}:{stage['duration_ms']}" for stage in data["stages"]),
+        )
+        return data
 
-            return {
-                "session": self._session_to_dict(db, session),
-                "conversation": self._conversation_to_dict(conversation, sql_data=sql_data),
-                "select_table_result": select_table_result,
-                "query_context": query_context,
-                "column_patch": column_patch,
-                "qColumnPatch": column_patch,
-                "create_sql_result": create_sql_result,
-                "sql_fix_result": sql_fix_result,
-            }
+    async def iter_batch_ask(
+        self,
+        *,
+        task_id: int,
+        questions: List[Dict[str, Any]],
+        concurrency: Optional[int] = None,
+        session_id: Optional[int] = None,
+        session_title: Optional[str] = None,
+        speculative: Optional[bool] = None,
+        use_cache: Optional[bool] = None,
+        include_data: bool = False,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """批量问答：校验任务并准备会话后产出 start，之后按完成顺序产出每个问题的结果，最后产出 summary。
+
+        并发由本批次的 concurrency 控制，LLM/数据库调用另受 LlmConfig/DbConfig.max_concurrency 限制。
+        """
+        if not questions:
+            raise HTTPException(status_code=400, detail="问题列表不能为空")
+        if len(questions) > settings.ASK_BATCH_MAX_QUESTIONS:
+            raise HTTPException(status_code=400, detail=f"单批最多 {settings.ASK_BATCH_MAX_QUESTIONS} 个问题")
+        limit = max(1, min(concurrency or settings.ASK_BATCH_DEFAULT_CONCURRENCY, settings.ASK_BATCH_MAX_CONCURRENCY))
+        batch_session_id = await run_sync_session(
+            lambda db: self._prepare_batch_session(
+                db,
+                task_id=task_id,
+                session_id=session_id,
+                session_title=session_title or f"批量问答-{len(questions)}条",
+            )
+        )
+        yield {
+            "type": "start",
+            "task_id": task_id,
+            "session_id": batch_session_id,
+            "total": len(questions),
+            "concurrency": limit,
+        }
+
+        semaphore = asyncio.Semaphore(limit)
+
+        async def run_one(index: int, item: Dict[str, Any]) -> Dict[str, Any]:
+            async with semaphore:
+                begin = time.perf_counter()
+                record: Dict[str, Any] = {
+                    "type": "result",
+                    "index": index,
+                    "question": item["question"],
+                    "expected_sql": item.get("sql"),
+                }
+                try:
+                    result = await self._ask_with_admission_retry(
+                        task_id=task_id,
+                        question=item["question"],
+                        session_id=batch_session_id,
+                        speculative=speculative,
+                        use_cache=use_cache,
+                    )
+                except Exception as exc:
+                    logger.warning("[task_chat] batch ask failed task_id=%s index=%s error=%s", task_id, index, str(exc))
+                    record.update(success=False, error=str(getattr(exc, "detail", None) or exc))
+                else:
+                    conversation = result.get("conversation") or {}
+                    sql_data = conversation.get("sql_data")
+                    record.update(
+                        success=bool(conversation.get("sql_generated")) and sql_data is not None,
+                        error=None,
+                        conversation_id=conversation.get("id"),
+                        sql=conversation.get("sql_generated"),
+                        row_count=len(sql_data) if isinstance(sql_data, list) else None,
+                        cache_hit=result.get("cache_hit", False),
+                    )
+                    if include_data:
+                        record["sql_data"] = sql_data
+                record["elapsed_ms"] = round((time.perf_counter() - begin) * 1000, 1)
+                return record
+
+        started = time.perf_counter()
+        latencies: List[float] = []
+        succeeded = 0
+        tasks = [asyncio.create_task(run_one(index, item)) for index, item in enumerate(questions)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                record = await next_done
+                latencies.append(record["elapsed_ms"])
+                if record["success"]:
+                    succeeded += 1
+                yield record
         finally:
-            db.close()
+            pending = [task for task in tasks if not task.done()]
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+        elapsed_seconds = time.perf_counter() - started
+        yield {
+            "type": "summary",
+            "task_id": task_id,
+            "session_id": batch_session_id,
+            "total": len(questions),
+            "succeeded": succeeded,
+            "failed": len(questions) - succeeded,
+            "elapsed_ms": round(elapsed_seconds * 1000, 1),
+            "avg_ms": round(sum(latencies) / len(latencies), 1) if latencies else None,
+            "p50_ms": percentile(latencies, 50),
+            "p95_ms": percentile(latencies, 95),
+            "max_ms": max(latencies) if latencies else None,
+            "questions_per_minute": round(len(questions) / elapsed_seconds * 60, 2) if elapsed_seconds > 0 else None,
+        }
 
-    def _execute_sql_with_auto_fix(
+    async def _ask_with_admission_retry(self, **kwargs: Any) -> Dict[str, Any]:
+        """批量问答遇到 429 时按 Retry-After 等待后重试，而不是直接记为失败。"""
+        attempt = 1
+        while True:
+            try:
+                return await self.ask(**kwargs)
+            except TooManyRequestsError as exc:
+                if attempt >= BATCH_ADMISSION_RETRIES:
+                    raise
+                attempt += 1
+                await asyncio.sleep(exc.retry_after)
+
+    async def submit_ask_job(
         self,
         *,
+        task_id: int,
+        question: str,
+        session_id: Optional[int] = None,
+        session_title: Optional[str] = None,
+        description: Optional[str] = None,
+        is_right: Optional[bool] = None,
+        speculative: Optional[bool] = None,
+        use_cache: Optional[bool] = None,
+        refresh_result: Optional[bool] = None,
+    ) -> Dict[str, Any]:
+        """提交后台问答任务，提交前校验任务与会话，避免无效任务进入队列。"""
+        await run_sync_session(lambda db: self._validate_job_request(db, task_id=task_id, session_id=session_id))
+        params = {
+            "task_id": task_id,
+            "question": question,
+            "session_id": session_id,
+            "session_title": session_title,
+            "description": description,
+            "is_right": is_right,
+            "speculative": speculative,
+            "use_cache": use_cache,
+            "refresh_result": refresh_result,
+        }
+        return await job_runner.submit(ASK_JOB_TYPE, params, task_id=task_id)
+
+    async def get_ask_job_result(self, *, job_id: str) -> Dict[str, Any]:
+        job = await job_runner.get_job(job_id, job_type=ASK_JOB_TYPE, with_result=True)
+        if job["status"] != "succeeded":
+            detail = f"后台任务 {job_id} 当前状态为 {job['status']}"
+            if job["error"]:
+                detail += f"：{job['error']}"
+            raise HTTPException(status_code=409, detail=detail)
+        return job["result"] or {}
+
+    async def run_ask_job(self, job: JobContext) -> Dict[str, Any]:
+        """后台问答任务的处理函数：逐阶段上报进度，done 事件的数据作为任务结果。"""
+        stages: List[Dict[str, Any]] = []
+        while True:
+            result: Dict[str, Any] = {}
+            try:
+                async for event, payload in self.iter_ask_events(**job.params):
+                    stages.append({"stage": event, "at": datetime.utcnow()})
+                    await job.report(stage=event, progress={"stages": stages})
+                    if event == "done":
+                        result = payload
+                return result
+            except TooManyRequestsError as exc:
+                # 后台任务本身已在排队，被准入控制拒绝时等待后重试
+                await job.report(stage="admission_wait")
+                await asyncio.sleep(exc.retry_after)
+
+    def _validate_job_request(self, db, *, task_id: int, session_id: Optional[int]) -> None:
+        task = db.query(NlsqlTaskConfig).filter(NlsqlTaskConfig.id == task_id).first()
+        if not task:
+            raise HTTPException(status_code=404, detail=f"任务ID {task_id} 不存在")
+        if session_id is not None:
+            self._get_session_for_task(db, task_id=task_id, session_id=session_id)
+
+    def _prepare_batch_session(
+        self,
         db,
+        *,
+        task_id: int,
+        session_id: Optional[int],
+        session_title: str,
+    ) -> int:
+        task = db.query(NlsqlTaskConfig).filter(NlsqlTaskConfig.id == task_id).first()
+        if not task:
+            raise HTTPException(status_code=404, detail=f"任务ID {task_id} 不存在")
+        if session_id is not None:
+            return self._get_session_for_task(db, task_id=task_id, session_id=session_id).id
+        session = ChatSession(nlsql_task_id=task_id, session_title=session_title)
+        db.add(session)
+        db.commit()
+        return session.id
+
+    async def _replay_cached_answer(
+        self,
+        *,
+        task_id: int,
+        cache_key: Tuple[int, str],
+        cached: CachedAnswer,
+        llm_config: LlmConfig,
+        db_config: DbConfig,
+        reexecute: bool,
+    ) -> Tuple[bool, Any]:
+        """复用缓存的 SQL；重新执行失败（如表结构已变化）时丢弃该条目，回到完整问答流程。"""
+        if not reexecute:
+            return True, cached.sql_data
+        shot_tool = ShotTool(llm_config=llm_config, db_config=db_config)
+        try:
+            return True, await shot_tool.execute_sql(cached.sql, use_cache=False)
+        except RuntimeError as exc:
+            answer_cache.invalidate(cache_key)
+            logger.warning(
+                "[task_chat] cached sql execute failed, fallback to full chain task_id=%s error=%s",
+                task_id,
+                str(exc),
+            )
+            return False, None
+        finally:
+            shot_tool.close()
+
+    async def _start_speculative_select(
+        self,
+        select_agent: SelectTableAgent,
+        *,
+        task_id: int,
+        trace: AskTrace,
+    ) -> Optional[asyncio.Task]:
+        """在等待问答对匹配的同时提前启动选表；预估 token 超过上限时不推测。"""
+        table_rows = await select_agent.load_table_contexts()
+        token_cost = select_agent.estimate_token_cost(table_rows)
+        if token_cost > settings.ASK_SPECULATIVE_MAX_TOKENS:
+            logger.info(
+                "[task_chat] speculative select skipped task_id=%s estimated_tokens=%s limit=%s",
+                task_id,
+                token_cost,
+                settings.ASK_SPECULATIVE_MAX_TOKENS,
+            )
+            return None
+        return asyncio.create_task(
+            trace.run("select_tables", select_agent.select_tables(table_rows=table_rows), speculative=True)
+        )
+
+    async def _cancel_task(self, task: asyncio.Task) -> None:
+        task.cancel()
+        try:
+            await task
+        except (asyncio.CancelledError, Exception):
+            pass
+
+    def _load_ask_context(self, db, *, task_id: int, session_id: Optional[int]) -> Dict[str, Any]:
+        task = db.query(NlsqlTaskConfig).filter(NlsqlTaskConfig.id == task_id).first()
+        if not task:
+            raise HTTPException(status_code=404, detail=f"任务ID {task_id} 不存在")
+
+        llm_config = db.query(LlmConfig).filter(LlmConfig.id == task.llm_config_id).first()
+        if not llm_config:
+            raise HTTPException(status_code=404, detail=f"LLM配置ID {task.llm_config_id} 不存在")
+        if llm_config.status != 1:
+            raise HTTPException(status_code=422, detail=f"LLM配置ID {llm_config.id} 未启用")
+
+        db_config = db.query(DbConfig).filter(DbConfig.id == task.db_config_id).first()
+        if not db_config:
+            raise HTTPException(status_code=404, detail=f"数据库配置ID {task.db_config_id} 不存在")
+
+        if session_id is not None:
+            self._get_session_for_task(db, task_id=task_id, session_id=session_id)
+
+        return {
+            "task": task,
+            "llm_config": llm_config,
+            "llm_pool": load_llm_pool(db, llm_config, task.llm_config_ids),
+            "db_config": db_config,
+            "context_version": get_task_version(db, task_id),
+        }
+
+    def _save_conversation(
+        self,
+        db,
+        *,
+        task_id: int,
+        session_id: Optional[int],
+        session_title: Optional[str],
+        question: str,
+        answer: str,
+        description: Optional[str],
+        is_right: Optional[bool],
+        sql_generated: Optional[str],
+        sql_data: Any,
+        selected_tables_list: List[Any],
+        query_context: Optional[Dict[str, Any]],
+        column_patch: Optional[Dict[str, Any]],
+        trace: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        session = self._get_or_create_session(
+            db=db,
+            task_id=task_id,
+            session_id=session_id,
+            session_title=session_title,
+            question=question,
+        )
+        conversation = Conversation(
+            session_id=session.id,
+            question=question,
+            answer=answer,
+            description=description,
+            nlsql_task_id=task_id,
+            is_right=is_right,
+            sql_generated=sql_generated,
+            sql_result=json.dumps(sql_data, ensure_ascii=False) if sql_data is not None else None,
+            selected_tables=json.dumps(selected_tables_list, ensure_ascii=False) if selected_tables_list else None,
+            query_context=json.dumps(query_context, ensure_ascii=False) if query_context is not None else None,
+            column_patch=json.dumps(column_patch, ensure_ascii=False) if column_patch is not None else None,
+            trace=json.dumps(trace, ensure_ascii=False) if trace is not None else None,
+        )
+        db.add(conversation)
+        db.flush()
+
+        session.updated_at = datetime.utcnow()
+        db.commit()
+        db.refresh(conversation)
+        db.refresh(session)
+        return {
+            "session": self._session_to_dict(db, session),
+            "conversation": self._conversation_to_dict(conversation, sql_data=sql_data),
+        }
+
+    async def _execute_sql_with_auto_fix(
+        self,
+        *,
         task_id: int,
         user_input: str,
         llm_config: LlmConfig,
         shot_tool: ShotTool,
         sql: str,
         selected_tables: List[str],
+        task_context: Optional[TaskContext] = None,
+        llm_pool: Optional[List[LlmConfig]] = None,
     ) -> tuple[Any, str, Optional[Dict[str, Any]]]:
         try:
-            sql_data = shot_tool.execute_sql(sql)
+            sql_data = await shot_tool.execute_sql(sql)
             return sql_data, sql, None
         except RuntimeError as exc:
             logger.warning(
@@ -213,15 +865,16 @@ class TaskChatService:
                 str(exc),
             )
             fixer = SqlFixAgent(
-                db=db,
                 task_id=task_id,
                 llm_config=llm_config,
                 user_input=user_input,
                 sql=sql,
                 error_message=str(exc),
                 selected_tables=selected_tables,
+                context=task_context,
+                llm_pool=llm_pool,
             )
-            fixed_result = fixer.fix_and_execute(shot_tool=shot_tool, max_retries=3)
+            fixed_result = await fixer.fix_and_execute(shot_tool=shot_tool, max_retries=3)
             if not fixed_result.get("fixed"):
                 raise RuntimeError(str(fixed_result.get("error") or exc))
             fixed_sql = str(fixed_result.get("sql") or sql)
@@ -381,6 +1034,9 @@ class TaskChatService:
 
             if is_right is not None:
                 conversation.is_right = is_right
+                if is_right is False:
+                    # 用户判定答案错误，后续相同问题重新走完整流程
+                    answer_cache.invalidate(answer_cache.make_key(conversation.nlsql_task_id, conversation.question))
             if description is not None:
                 conversation.description = description
             if feedback is not None:
@@ -392,6 +1048,24 @@ class TaskChatService:
         finally:
             db.close()
 
+    def get_trace_stats(self, *, task_id: Optional[int], limit: int) -> Dict[str, Any]:
+        db = SyncSessionLocal()
+        try:
+            query = db.query(Conversation.trace).filter(Conversation.trace.isnot(None))
+            if task_id is not None:
+                query = query.filter(Conversation.nlsql_task_id == task_id)
+            rows = query.order_by(Conversation.id.desc()).limit(limit).all()
+        finally:
+            db.close()
+
+        traces: List[Dict[str, Any]] = []
+        for (raw,) in rows:
+            try:
+                traces.append(json.loads(raw))
+            except (TypeError, json.JSONDecodeError):
+                continue
+        return {"task_id": task_id, **summarize_traces(traces)}
+
     def _get_or_create_session(
         self,
         *,
@@ -402,12 +1076,7 @@ class TaskChatService:
         question: str,
     ) -> ChatSession:
         if session_id is not None:
-            session = db.query(ChatSession).filter(ChatSession.id == session_id).first()
-            if not session:
-                raise HTTPException(status_code=404, detail=f"会话ID {session_id} 不存在")
-            if session.nlsql_task_id != task_id:
-                raise HTTPException(status_code=422, detail="会话与任务ID不匹配")
-            return session
+            return self._get_session_for_task(db, task_id=task_id, session_id=session_id)
 
         title = session_title or (question[:24] + "..." if len(question) > 24 else question)
         session = ChatSession(
@@ -418,6 +1087,14 @@ class TaskChatService:
         db.flush()
         return session
 
+    def _get_session_for_task(self, db, *, task_id: int, session_id: int) -> ChatSession:
+        session = db.query(ChatSession).filter(ChatSession.id == session_id).first()
+        if not session:
+            raise HTTPException(status_code=404, detail=f"会话ID {session_id} 不存在")
+        if session.nlsql_task_id != task_id:
+            raise HTTPException(status_code=422, detail="会话与任务ID不匹配")
+        return session
+
     def _session_to_dict(self, db, session: ChatSession) -> Dict[str, Any]:
         count = db.query(Conversation).filter(Conversation.session_id == session.id).count()
         return {
@@ -434,10 +1111,12 @@ class TaskChatService:
         persisted_selected_tables = None
         persisted_query_context = None
         persisted_column_patch = None
+        persisted_trace = None
         sql_result_raw = row.sql_result
         selected_tables_raw = row.selected_tables
         query_context_raw = row.query_context
         column_patch_raw = row.column_patch
+        trace_raw = row.trace
         if sql_data is None and sql_result_raw not in (None, ""):
             try:
                 persisted_sql_data = json.loads(str(sql_result_raw))
@@ -458,6 +1137,11 @@ class TaskChatService:
                 persisted_column_patch = json.loads(str(column_patch_raw))
             except json.JSONDecodeError:
                 persisted_column_patch = str(column_patch_raw)
+        if trace_raw not in (None, ""):
+            try:
+                persisted_trace = json.loads(str(trace_raw))
+            except json.JSONDecodeError:
+                persisted_trace = None
 
         return {
             "id": row.id,
@@ -474,8 +1158,10 @@ class TaskChatService:
             "query_context": persisted_query_context,
             "column_patch": persisted_column_patch,
             "feedback": row.feedback,
+            "trace": persisted_trace,
             "created_at": row.created_at,
         }
 
 
 task_chat_service = TaskChatService()
+job_runner.register(ASK_JOB_TYPE, task_chat_service.run_ask_job)
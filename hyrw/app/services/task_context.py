@@ -0,0 +1,395 @@
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Any, Dict, FrozenSet, Iterator, List, Mapping, Optional, Tuple
+import asyncio
+import json
+import logging
+import time
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import run_sync_session
+from app.models.db_config import DbConfig
+from app.models.nlsql_task_config import NlsqlTaskConfig
+from app.models.table_field_prompt import TableFieldPrompt
+from app.models.table_field_relation import TableFieldRelation
+from app.models.table_level_prompt import TableLevelPrompt
+from app.models.table_metadata_extended import TableFieldMetadata, TableMetadataBasic, TableSampleData
+from app.models.task_context_version import get_task_version
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class FieldMetadataInfo:
+    field_name: str
+    field_type: Optional[str]
+    sample_data: Any
+    null_rate: Optional[float]
+    unique_count: Optional[int]
+
+
+@dataclass(frozen=True)
+class TableInfo:
+    metadata_id: int
+    table_name: str
+    table_ddl: Optional[str]
+    table_row_count: Optional[int]
+    table_description: Optional[str]
+    samples: Tuple[Any, ...] = ()
+    fields: Tuple[FieldMetadataInfo, ...] = ()
+
+
+@dataclass(frozen=True)
+class FieldPromptInfo:
+    field_name: str
+    field_type: Optional[str]
+    business_meaning: Optional[str]
+    data_format: Optional[str]
+    field_description: Optional[str]
+    query_scenarios: Optional[str]
+    rules: Optional[str]
+    null_rate: Optional[str]
+    unique_count: Optional[int]
+    sample_values: Any
+
+
+@dataclass(frozen=True)
+class TablePromptInfo:
+    id: int
+    table_name: str
+    table_metadata_id: int
+    table_description: Optional[str]
+    query_scenarios: Any
+    aggregation_scenarios: Any
+    data_role: Any
+    usage_not_scenarios: Any
+    fields: Tuple[FieldPromptInfo, ...] = ()
+
+
+@dataclass(frozen=True)
+class RelationInfo:
+    source_table_level_prompt_id: Optional[int]
+    target_table_level_prompt_id: Optional[int]
+    source_field_name: Optional[str]
+    target_field_name: Optional[str]
+    relation_type: str
+    relation_description: Optional[str]
+
+
+@dataclass(frozen=True)
+class TaskContext:
+    """
+    任务上下文快照：一次性批量加载任务下的表元数据、提示词、表关系和数据库类型，供各代理共享。
+    快照不可变（JSON 字段内的列表/字典也不要修改），任务数据变更后以新版本号整体替换。
+    """
+
+    task_id: int
+    version: int
+    db_type: Optional[str]
+    tables: Tuple[TableInfo, ...]
+    prompts: Tuple[TablePromptInfo, ...]
+    relations: Tuple[RelationInfo, ...]
+    loaded_at: float = field(default_factory=time.time)
+    # 同名表/提示词取 id 最小的一条，与原来逐表 .first() 查询的结果一致
+    _tables_by_name: Mapping[str, TableInfo] = field(init=False, repr=False, compare=False)
+    _tables_by_id: Mapping[int, TableInfo] = field(init=False, repr=False, compare=False)
+    _prompts_by_name: Mapping[str, TablePromptInfo] = field(init=False, repr=False, compare=False)
+    # 字段名（小写）-> 样例数据中出现过的取值，首次用到时收集
+    _column_values: Dict[str, FrozenSet[str]] = field(init=False, default_factory=dict, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        tables_by_name: Dict[str, TableInfo] = {}
+        for table in self.tables:
+            tables_by_name.setdefault(table.table_name, table)
+        prompts_by_name: Dict[str, TablePromptInfo] = {}
+        for prompt in self.prompts:
+            prompts_by_name.setdefault(prompt.table_name, prompt)
+        object.__setattr__(self, "_tables_by_name", MappingProxyType(tables_by_name))
+        object.__setattr__(self, "_tables_by_id", MappingProxyType({table.metadata_id: table for table in self.tables}))
+        object.__setattr__(self, "_prompts_by_name", MappingProxyType(prompts_by_name))
+
+    def table(self, table_name: str) -> Optional[TableInfo]:
+        return self._tables_by_name.get(table_name)
+
+    def table_by_id(self, metadata_id: int) -> Optional[TableInfo]:
+        return self._tables_by_id.get(metadata_id)
+
+    def prompt(self, table_name: str) -> Optional[TablePromptInfo]:
+        return self._prompts_by_name.get(table_name)
+
+    def column_values(self, field_name: str) -> FrozenSet[str]:
+        """
+        字段在提示词样例、字段样例与表样例数据中出现过的取值，不区分表；
+        field_name 可以带表名前缀（如 t.region）。
+        """
+        column = field_name.split(".")[-1].strip('`"').lower()
+        values = self._column_values.get(column)
+        if values is None:
+            collected = set()
+            for prompt in self.prompts:
+                for item in prompt.fields:
+                    if item.field_name.lower() == column:
+                        collected.update(_scalar_values(item.sample_values))
+            for table in self.tables:
+                for item in table.fields:
+                    if item.field_name.lower() == column:
+                        collected.update(_scalar_values(item.sample_data))
+                for sample in table.samples:
+                    for row in _json_items(sample):
+                        if isinstance(row, dict):
+                            collected.update(
+                                value for key, value in _row_values(row) if str(key).lower() == column
+                            )
+            values = frozenset(collected)
+            self._column_values[column] = values
+        return values
+
+    def relationships(self, table_names: List[str]) -> List[Dict[str, Any]]:
+        """两端都在 table_names 中的表关联关系。"""
+        prompt_ids = {}
+        for table_name in table_names:
+            prompt = self.prompt(table_name)
+            if prompt is not None:
+                prompt_ids[prompt.id] = table_name
+        result: List[Dict[str, Any]] = []
+        for relation in self.relations:
+            source_table = prompt_ids.get(relation.source_table_level_prompt_id)
+            target_table = prompt_ids.get(relation.target_table_level_prompt_id)
+            if source_table is None or target_table is None:
+                continue
+            result.append({
+                "source_table": source_table,
+                "target_table": target_table,
+                "source_field": relation.source_field_name,
+                "target_field": relation.target_field_name,
+                "relation_type": relation.relation_type,
+                "description": relation.relation_description,
+            })
+        return result
+
+
+def _json_items(raw: Any) -> List[Any]:
+    """样例数据可能以 JSON 字符串保存，解析后统一为列表。"""
+    if isinstance(raw, str):
+        try:
+            raw = json.loads(raw)
+        except json.JSONDecodeError:
+            return [raw]
+    if raw is None:
+        return []
+    return list(raw) if isinstance(raw, (list, tuple)) else [raw]
+
+
+def _scalar_values(raw: Any) -> Iterator[str]:
+    for item in _json_items(raw):
+        if isinstance(item, (str, int, float)) and not isinstance(item, bool) and str(item).strip():
+            yield str(item).strip()
+
+
+def _row_values(row: Dict[str, Any]) -> Iterator[Tuple[str, str]]:
+    for key, value in row.items():
+        for item in _scalar_values([value]):
+            yield key, item
+
+
+def load_task_context(db: Session, task_id: int) -> TaskContext:
+    # 先读版本号再读数据：读取期间发生的修改最多让快照比版本号新，下一次问答会重新加载
+    version = get_task_version(db, task_id)
+
+    db_type = None
+    task = db.get(NlsqlTaskConfig, task_id)
+    if task is not None:
+        db_config = db.get(DbConfig, task.db_config_id)
+        if db_config is not None and db_config.type:
+            db_type = str(db_config.type)
+
+    metadata_rows = (
+        db.query(TableMetadataBasic)
+        .filter(TableMetadataBasic.table_task_id == task_id)
+        .order_by(TableMetadataBasic.id)
+        .all()
+    )
+    metadata_ids = [row.id for row in metadata_rows]
+    samples: Dict[int, List[Any]] = {}
+    fields: Dict[int, List[FieldMetadataInfo]] = {}
+    if metadata_ids:
+        for sample in (
+            db.query(TableSampleData)
+            .filter(TableSampleData.table_metadata_id.in_(metadata_ids))
+            .order_by(TableSampleData.id)
+        ):
+            samples.setdefault(sample.table_metadata_id, []).append(sample.sample_data)
+        for item in (
+            db.query(TableFieldMetadata)
+            .filter(TableFieldMetadata.table_metadata_id.in_(metadata_ids))
+            .order_by(TableFieldMetadata.id)
+        ):
+            fields.setdefault(item.table_metadata_id, []).append(
+                FieldMetadataInfo(
+                    field_name=item.field_name,
+                    field_type=item.field_type,
+                    sample_data=item.sample_data,
+                    null_rate=item.null_rate,
+                    unique_count=item.unique_count,
+                )
+            )
+    tables = tuple(
+        TableInfo(
+            metadata_id=row.id,
+            table_name=row.table_name,
+            table_ddl=row.table_ddl,
+            table_row_count=row.table_row_count,
+            table_description=row.table_description,
+            samples=tuple(samples.get(row.id, [])),
+            fields=tuple(fields.get(row.id, [])),
+        )
+        for row in metadata_rows
+    )
+
+    prompt_rows = (
+        db.query(TableLevelPrompt)
+        .filter(TableLevelPrompt.task_id == task_id, TableLevelPrompt.is_active.is_(True))
+        .order_by(TableLevelPrompt.id)
+        .all()
+    )
+    field_prompts: Dict[int, List[FieldPromptInfo]] = {}
+    prompt_ids = [row.id for row in prompt_rows]
+    if prompt_ids:
+        for item in (
+            db.query(TableFieldPrompt)
+            .filter(TableFieldPrompt.table_level_prompt_id.in_(prompt_ids))
+            .order_by(TableFieldPrompt.id)
+        ):
+            field_prompts.setdefault(item.table_level_prompt_id, []).append(
+                FieldPromptInfo(
+                    field_name=item.field_name,
+                    field_type=item.field_type,
+                    business_meaning=item.business_meaning,
+                    data_format=item.data_format,
+                    field_description=item.field_description,
+                    query_scenarios=item.query_scenarios,
+                    rules=item.rules,
+                    null_rate=item.null_rate,
+                    unique_count=item.unique_count,
+                    sample_values=item.sample_values,
+                )
+            )
+    prompts = tuple(
+        TablePromptInfo(
+            id=row.id,
+            table_name=row.table_name,
+            table_metadata_id=row.table_metadata_id,
+            table_description=row.table_description,
+            query_scenarios=row.query_scenarios,
+            aggregation_scenarios=row.aggregation_scenarios,
+            data_role=row.data_role,
+            usage_not_scenarios=row.usage_not_scenarios,
+            fields=tuple(field_prompts.get(row.id, [])),
+        )
+        for row in prompt_rows
+    )
+
+    relations = tuple(
+        RelationInfo(
+            source_table_level_prompt_id=row.source_table_level_prompt_id,
+            target_table_level_prompt_id=row.target_table_level_prompt_id,
+            source_field_name=row.source_field_name,
+            target_field_name=row.target_field_name,
+            relation_type=row.relation_type,
+            relation_description=row.relation_description,
+        )
+        for row in db.query(TableFieldRelation)
+        .filter(TableFieldRelation.nlsql_task_id == task_id)
+        .order_by(TableFieldRelation.id)
+    )
+
+    return TaskContext(
+        task_id=task_id,
+        version=version,
+        db_type=db_type,
+        tables=tables,
+        prompts=prompts,
+        relations=relations,
+    )
+
+
+class TaskContextStore:
+    """
+    进程内的任务上下文快照缓存，按 TaskContextVersion 判断是否过期。
+    调用方已读取版本号时（问答的 load_context 阶段）直接传入，快照命中时不再访问 SQLite。
+    """
+
+    def __init__(self, max_tasks: int):
+        self.max_tasks = max_tasks
+        self._snapshots: "OrderedDict[int, TaskContext]" = OrderedDict()
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self._hits = 0
+        self._loads = 0
+
+    async def get(self, task_id: int, *, version: Optional[int] = None) -> TaskContext:
+        if version is None:
+            version = await run_sync_session(lambda db: get_task_version(db, task_id))
+        snapshot = self._lookup(task_id, version)
+        if snapshot is not None:
+            return snapshot
+
+        lock = self._locks.setdefault(task_id, asyncio.Lock())
+        async with lock:
+            # 等锁期间其他请求可能已加载好同版本的快照
+            snapshot = self._lookup(task_id, version)
+            if snapshot is not None:
+                return snapshot
+            begin = time.perf_counter()
+            snapshot = await run_sync_session(lambda db: load_task_context(db, task_id))
+            self._loads += 1
+            logger.info(
+                "[task_context] loaded task_id=%s version=%s tables=%s prompts=%s elapsed_ms=%.1f",
+                task_id,
+                snapshot.version,
+                len(snapshot.tables),
+                len(snapshot.prompts),
+                (time.perf_counter() - begin) * 1000,
+            )
+            self._store(snapshot)
+            return snapshot
+
+    def _lookup(self, task_id: int, version: int) -> Optional[TaskContext]:
+        snapshot = self._snapshots.get(task_id)
+        # 快照可能比调用方读到的版本更新（加载期间有修改），此时同样可用
+        if snapshot is None or snapshot.version < version:
+            return None
+        self._snapshots.move_to_end(task_id)
+        self._hits += 1
+        return snapshot
+
+    def _store(self, snapshot: TaskContext) -> None:
+        current = self._snapshots.get(snapshot.task_id)
+        if current is not None and current.version > snapshot.version:
+            return
+        self._snapshots[snapshot.task_id] = snapshot
+        self._snapshots.move_to_end(snapshot.task_id)
+        while len(self._snapshots) > max(1, self.max_tasks):
+            evicted, _ = self._snapshots.popitem(last=False)
+            self._locks.pop(evicted, None)
+
+    def invalidate(self, task_id: Optional[int] = None) -> None:
+        if task_id is None:
+            self._snapshots.clear()
+        else:
+            self._snapshots.pop(task_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "size": len(self._snapshots),
+            "max_tasks": self.max_tasks,
+            "hits": self._hits,
+            "loads": self._loads,
+            "versions": {task_id: snapshot.version for task_id, snapshot in self._snapshots.items()},
+        }
+
+
+task_context_store = TaskContextStore(max_tasks=settings.TASK_CONTEXT_MAX_TASKS)
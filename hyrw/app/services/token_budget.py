@@ -0,0 +1,219 @@
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, Dict, Generic, List, Optional, Sequence, TypeVar
+import re
+import threading
+
+from app.core.config import settings
+from app.services.ask_trace import percentile
+
+_CJK_PATTERN = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]")
+# 每条消息的角色、分隔符等固定开销
+_MESSAGE_OVERHEAD_TOKENS = 4
+_REPLY_PRIMING_TOKENS = 3
+
+T = TypeVar("T")
+
+
+def estimate_tokens(text: str) -> int:
+    """按字符粗略估算 token 数：中日韩字符约 1 token/字，其余字符约 4 字符/token。"""
+    if not text:
+        return 0
+    cjk_count = len(_CJK_PATTERN.findall(text))
+    other_count = len(text) - cjk_count
+    return cjk_count + (other_count + 3) // 4
+
+
+def estimate_message_tokens(messages: Sequence[Dict[str, Any]]) -> int:
+    """未校准的对话消息 token 估算。"""
+    total = _REPLY_PRIMING_TOKENS
+    for message in messages:
+        total += _MESSAGE_OVERHEAD_TOKENS + estimate_tokens(str(message.get("content") or ""))
+    return total
+
+
+class TokenCalibration:
+    """
+    按模型校准字符估算：用接口返回的 usage.prompt_tokens 与本地估算之比做指数滑动平均。
+    只在当前 worker 进程内生效，重启后从 1.0 重新校准。
+    """
+
+    def __init__(self, alpha: float = 0.2, min_ratio: float = 0.5, max_ratio: float = 3.0):
+        self.alpha = alpha
+        self.min_ratio = min_ratio
+        self.max_ratio = max_ratio
+        self._lock = threading.Lock()
+        self._ratios: Dict[str, float] = {}
+        self._samples: Dict[str, int] = {}
+
+    def ratio(self, model: Optional[str]) -> float:
+        if not model:
+            return 1.0
+        return self._ratios.get(model, 1.0)
+
+    def observe(self, model: Optional[str], estimated: int, actual: Optional[int]) -> None:
+        if not model or not actual or estimated <= 0:
+            return
+        observed = min(self.max_ratio, max(self.min_ratio, actual / estimated))
+        with self._lock:
+            current = self._ratios.get(model)
+            self._ratios[model] = observed if current is None else current + self.alpha * (observed - current)
+            self._samples[model] = self._samples.get(model, 0) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                model: {"ratio": round(ratio, 3), "samples": self._samples.get(model, 0)}
+                for model, ratio in self._ratios.items()
+            }
+
+
+token_calibration = TokenCalibration()
+
+
+class OutputTokenStats:
+    """
+    按调用点记录补全 token 数，以高分位数加余量作为后续请求的 max_tokens。
+    被截断的调用按当时的上限记一个样本，只会把估计往上推。只在当前 worker 进程内生效。
+    """
+
+    def __init__(self, window: int):
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples: Dict[str, Deque[int]] = {}
+        self._truncated: Dict[str, int] = {}
+        self._retries: Dict[str, int] = {}
+
+    def enabled_for(self, call_site: Optional[str]) -> bool:
+        if not settings.LLM_ADAPTIVE_MAX_TOKENS_ENABLED or not call_site:
+            return False
+        return call_site in {site.strip() for site in settings.LLM_ADAPTIVE_MAX_TOKENS_CALL_SITES.split(",")}
+
+    def observe(self, call_site: Optional[str], completion_tokens: Optional[int], truncated: bool = False) -> None:
+        if not call_site or not completion_tokens:
+            return
+        with self._lock:
+            samples = self._samples.get(call_site)
+            if samples is None:
+                samples = deque(maxlen=self.window)
+                self._samples[call_site] = samples
+            samples.append(int(completion_tokens))
+            if truncated:
+                self._truncated[call_site] = self._truncated.get(call_site, 0) + 1
+
+    def record_retry(self, call_site: Optional[str]) -> None:
+        if not call_site:
+            return
+        with self._lock:
+            self._retries[call_site] = self._retries.get(call_site, 0) + 1
+
+    def suggest(self, call_site: Optional[str], cap: Optional[int]) -> Optional[int]:
+        """本次请求的 max_tokens，不超过调用方给的上限 cap；样本不足时返回 cap。"""
+        if not call_site:
+            return cap
+        with self._lock:
+            samples = list(self._samples.get(call_site, ()))
+        if len(samples) < settings.LLM_ADAPTIVE_MAX_TOKENS_MIN_SAMPLES:
+            return cap
+        high = percentile(samples, settings.LLM_ADAPTIVE_MAX_TOKENS_PERCENTILE) or 0
+        suggested = max(int(high * (1 + settings.LLM_ADAPTIVE_MAX_TOKENS_MARGIN)), settings.LLM_ADAPTIVE_MAX_TOKENS_FLOOR)
+        return min(suggested, cap) if cap else suggested
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            snapshot = {call_site: list(samples) for call_site, samples in self._samples.items()}
+            truncated = dict(self._truncated)
+            retries = dict(self._retries)
+        result: Dict[str, Any] = {}
+        for call_site, samples in snapshot.items():
+            # 按 2 的幂分桶的直方图，键为桶上界
+            histogram: Dict[str, int] = {}
+            for value in samples:
+                bound = 1 << max(0, value - 1).bit_length()
+                histogram[str(bound)] = histogram.get(str(bound), 0) + 1
+            result[call_site] = {
+                "samples": len(samples),
+                "p50": percentile(samples, 50),
+                "p95": percentile(samples, 95),
+                "p99": percentile(samples, 99),
+                "max": max(samples),
+                "truncated": truncated.get(call_site, 0),
+                "retries": retries.get(call_site, 0),
+                "adaptive": self.enabled_for(call_site),
+                "suggested_max_tokens": self.suggest(call_site, None) if self.enabled_for(call_site) else None,
+                "histogram": dict(sorted(histogram.items(), key=lambda item: int(item[0]))),
+            }
+        return result
+
+
+output_token_stats = OutputTokenStats(window=settings.LLM_ADAPTIVE_MAX_TOKENS_WINDOW)
+
+
+@dataclass
+class FitResult(Generic[T]):
+    payload: T
+    max_tokens: Optional[int]
+    prompt_tokens: int
+    fits: bool
+    trimmed: int
+
+
+@dataclass
+class TokenBudget:
+    """一次调用的 token 预算：提示词 + 补全不超过模型窗口扣除安全余量后的部分。"""
+
+    context_window: int
+    max_tokens: Optional[int]
+    model: Optional[str] = None
+
+    @classmethod
+    def for_config(cls, llm_config: Any, max_tokens: Optional[int] = None) -> "TokenBudget":
+        context_window = getattr(llm_config, "context_window", None) or settings.LLM_DEFAULT_CONTEXT_WINDOW
+        if max_tokens is None:
+            max_tokens = getattr(llm_config, "max_tokens", None)
+        model = getattr(llm_config, "model_name", None)
+        return cls(
+            context_window=int(context_window),
+            max_tokens=int(max_tokens) if max_tokens is not None else None,
+            model=str(model) if model else None,
+        )
+
+    @property
+    def usable_tokens(self) -> int:
+        return int(self.context_window * (1 - settings.LLM_CONTEXT_SAFETY_MARGIN))
+
+    def prompt_tokens(self, messages: Sequence[Dict[str, Any]]) -> int:
+        return int(estimate_message_tokens(messages) * token_calibration.ratio(self.model)) + 1
+
+    def completion_tokens(self, prompt_tokens: int) -> Optional[int]:
+        """提示词占用后还能给补全的 token 数；不足最小补全长度时返回 None。"""
+        room = self.usable_tokens - prompt_tokens
+        minimum = min(settings.LLM_MIN_COMPLETION_TOKENS, self.max_tokens or settings.LLM_MIN_COMPLETION_TOKENS)
+        if room < minimum:
+            return None
+        return min(self.max_tokens, room) if self.max_tokens is not None else room
+
+    def fit(
+        self,
+        payload: T,
+        build_messages: Callable[[T], List[Dict[str, Any]]],
+        reducers: Sequence[Callable[[T], Optional[T]]],
+    ) -> FitResult[T]:
+        """
+        本地反复估算并按顺序用 reducers 裁剪（每个 reducer 无法再裁剪时返回 None），直到放得进窗口。
+        裁剪到底仍放不下时 fits=False，由调用方决定拆批或照常请求。
+        """
+        trimmed = 0
+        while True:
+            prompt_tokens = self.prompt_tokens(build_messages(payload))
+            max_tokens = self.completion_tokens(prompt_tokens)
+            if max_tokens is not None:
+                return FitResult(payload, max_tokens, prompt_tokens, True, trimmed)
+            for reducer in reducers:
+                reduced = reducer(payload)
+                if reduced is not None:
+                    payload = reduced
+                    trimmed += 1
+                    break
+            else:
+                return FitResult(payload, self.max_tokens, prompt_tokens, False, trimmed)
@@ -0,0 +1,53 @@
+import re
+import unicodedata
+
+try:
+    # 可选依赖：安装了 opencc 时使用完整的繁简转换
+    from opencc import OpenCC
+    _opencc = OpenCC("t2s")
+except Exception:  # pragma: no cover - 取决于运行环境
+    _opencc = None
+
+
+# 未安装 opencc 时使用的常用繁体字对照表，覆盖问数场景中的高频字
+_TRADITIONAL = (
+    "臺灣華國東區縣鄉鎮軍員職業產銷營歷學體數據庫統計總額單價條項個們這裡裏"
+    "來時間會議經濟發現實際關係結點類別務與為後開門聯繫電話廣場機構網絡戶籍"
+    "從給讓記錄設備資訊號碼當前幾無買賣貨幣錢銀財報對應邊際況狀態導變動區間"
+    "門診醫療療藥價錶錄標準計劃劃勞動優質嚴重種屬級層面積點擊線傳輸運輸車輛"
+    "長園藝劇場館廠礦廳處倉儲庫滿額齡歲壽險雜誌媽爺親戚鄰舊業績團隊組織規劃"
+    "掌權兩萬億問題說話詢查驗證確認請問嗎麼"
+)
+_SIMPLIFIED = (
+    "台湾华国东区县乡镇军员职业产销营历学体数据库统计总额单价条项个们这里里"
+    "来时间会议经济发现实际关系结点类别务与为后开门联系电话广场机构网络户籍"
+    "从给让记录设备资讯号码当前几无买卖货币钱银财报对应边际况状态导变动区间"
+    "门诊医疗疗药价表录标准计划划劳动优质严重种属级层面积点击线传输运输车辆"
+    "长园艺剧场馆厂矿厅处仓储库满额龄岁寿险杂志妈爷亲戚邻旧业绩团队组织规划"
+    "掌权两万亿问题说话询查验证确认请问吗么"
+)
+_T2S_TABLE = str.maketrans(_TRADITIONAL, _SIMPLIFIED)
+
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+# 句末的问号、句号、感叹号等不影响语义
+_TRAILING_PUNCTUATION_PATTERN = re.compile(r"[?？!！.。~～…]+$")
+
+
+def to_simplified(text: str) -> str:
+    if _opencc is not None:
+        return _opencc.convert(text)
+    return text.translate(_T2S_TABLE)
+
+
+def normalize_question(question: str) -> str:
+    """
+    归一化用户问题，用于答案缓存的键：
+    全角转半角（NFKC）、去掉所有空白和句末标点、繁体转简体、英文转小写
+    """
+    if not question:
+        return ""
+    text = unicodedata.normalize("NFKC", question)
+    text = _WHITESPACE_PATTERN.sub("", text)
+    text = _TRAILING_PUNCTUATION_PATTERN.sub("", text)
+    text = to_simplified(text)
+    return text.lower()
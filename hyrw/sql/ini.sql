@@ -8,6 +8,9 @@ CREATE TABLE IF NOT EXISTS db_config (
     port INTEGER NOT NULL COMMENT '端口',
     username VARCHAR(100) NOT NULL COMMENT '用户名',
     password VARCHAR(255) NOT NULL COMMENT '密码',
+    result_cache_ttl INTEGER,
+    result_cache_freshness_check BOOLEAN DEFAULT FALSE,
+    max_concurrency INTEGER,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
@@ -21,6 +24,9 @@ COMMENT ON COLUMN db_config.ip IS 'IP地址';
 COMMENT ON COLUMN db_config.port IS '端口';
 COMMENT ON COLUMN db_config.username IS '用户名';
 COMMENT ON COLUMN db_config.password IS '密码';
+COMMENT ON COLUMN db_config.result_cache_ttl IS '查询结果缓存秒数，为空使用全局配置，0 不缓存';
+COMMENT ON COLUMN db_config.result_cache_freshness_check IS '命中缓存前是否检查表数据是否变更';
+COMMENT ON COLUMN db_config.max_concurrency IS '每个进程内同时执行的查询上限，为空不限制';
 
 -- 2. LLM配置表
 CREATE TABLE IF NOT EXISTS llm_config (
@@ -33,6 +39,10 @@ CREATE TABLE IF NOT EXISTS llm_config (
     description TEXT COMMENT '描述',
     provider VARCHAR(100) NOT NULL COMMENT '供应商',
     status INTEGER DEFAULT 1 COMMENT '状态：1-启用，2-禁用',
+    max_concurrency INTEGER,
+    admission_concurrency INTEGER,
+    context_window INTEGER,
+    embedding_model VARCHAR(100),
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
@@ -46,17 +56,23 @@ COMMENT ON COLUMN llm_config.max_tokens IS '最大token配置';
 COMMENT ON COLUMN llm_config.temperature IS '温度';
 COMMENT ON COLUMN llm_config.description IS '描述';
 COMMENT ON COLUMN llm_config.provider IS '供应商';
+COMMENT ON COLUMN llm_config.max_concurrency IS '每个进程内同时进行的请求上限，为空不限制';
+COMMENT ON COLUMN llm_config.admission_concurrency IS '每个进程内同时处理的使用该配置的问答上限（准入控制），为空使用全局配置';
+COMMENT ON COLUMN llm_config.context_window IS '模型上下文窗口（token，提示词+补全），为空使用全局默认值';
+COMMENT ON COLUMN llm_config.embedding_model IS '向量模型名称，用于问答对检索，为空时不计算向量';
 COMMENT ON COLUMN llm_config.status IS '状态（1，2）';
 
 -- 3. NL2SQL任务配置表（核心表）
 CREATE TABLE IF NOT EXISTS nlsql_task_config (
     id BIGSERIAL PRIMARY KEY,
     llm_config_id BIGINT NOT NULL REFERENCES llm_config(id) ON DELETE CASCADE,
+    llm_config_ids JSONB,
     db_config_id BIGINT NOT NULL REFERENCES db_config(id) ON DELETE CASCADE,
     user_prompt_config_id BIGINT NOT NULL REFERENCES user_prompt_config(id) ON DELETE CASCADE,
     select_tables JSONB COMMENT '选中的表元数据ID列表，格式为数组如[1,2,3]，用于限制NL2SQL查询的表范围 '
     description TEXT COMMENT '任务描述',
     status INTEGER DEFAULT 1 COMMENT '任务状态：1-初始化，2-提取元数据，3-生成表提示词，4-生成字段提示词，5-完成',
+    max_concurrency INTEGER,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
@@ -64,10 +80,12 @@ CREATE TABLE IF NOT EXISTS nlsql_task_config (
 COMMENT ON TABLE nlsql_task_config IS 'nl2sql任务配置表';
 COMMENT ON COLUMN nlsql_task_config.id IS '主键';
 COMMENT ON COLUMN nlsql_task_config.llm_config_id IS 'llm配置外键';
+COMMENT ON COLUMN nlsql_task_config.llm_config_ids IS '备用llm配置ID列表，按优先级排列，与llm_config_id组成调用池';
 COMMENT ON COLUMN nlsql_task_config.db_config_id IS '数据库配置外键';
 COMMENT ON COLUMN nlsql_task_config.user_prompt_config_id IS '提示词生成配置ID';
 COMMENT ON COLUMN nlsql_task_config.description IS '任务描述';
 COMMENT ON COLUMN nlsql_task_config.status IS '任务状态1，2，3，4，5，6，7';
+COMMENT ON COLUMN nlsql_task_config.max_concurrency IS '每个进程内同时处理的问答上限，为空使用全局配置';
 
 -- 4. 表元数据
 CREATE TABLE IF NOT EXISTS table_metadata (
@@ -247,6 +265,8 @@ CREATE TABLE IF NOT EXISTS qa_embedding (
     where_conditions JSONB COMMENT 'WHERE条件',
     tables JSONB COMMENT '使用的表',
     is_enabled BOOLEAN DEFAULT TRUE COMMENT '是否启用',
+    question_embedding BYTEA,
+    embedding_model VARCHAR(100),
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
@@ -259,6 +279,8 @@ COMMENT ON COLUMN qa_embedding.sql IS 'SQL';
 COMMENT ON COLUMN qa_embedding.where_conditions IS 'WHERE条件';
 COMMENT ON COLUMN qa_embedding.tables IS '使用的表';
 COMMENT ON COLUMN qa_embedding.is_enabled IS '是否启用';
+COMMENT ON COLUMN qa_embedding.question_embedding IS '问题向量（float32，已归一化）';
+COMMENT ON COLUMN qa_embedding.embedding_model IS '计算问题向量所用的模型';
 
 -- 12. 用户知识库
 CREATE TABLE IF NOT EXISTS knowledges (
@@ -307,6 +329,7 @@ CREATE TABLE IF NOT EXISTS conversation (
     query_context TEXT COMMENT '查询上下文(JSON)',
     column_patch TEXT COMMENT '列补丁(JSON)',
     feedback TEXT COMMENT '反馈信息',
+    trace TEXT COMMENT '各阶段耗时与token统计(JSON)',
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
 );
 
@@ -324,3 +347,70 @@ COMMENT ON COLUMN conversation.selected_tables IS '选表代理返回的表列
 COMMENT ON COLUMN conversation.query_context IS '查询上下文(JSON)';
 COMMENT ON COLUMN conversation.column_patch IS '列补丁(JSON)';
 COMMENT ON COLUMN conversation.feedback IS '反馈信息';
+COMMENT ON COLUMN conversation.trace IS '各阶段耗时与token统计(JSON)';
+
+-- 15. 任务上下文版本
+CREATE TABLE IF NOT EXISTS task_context_version (
+    task_id BIGINT PRIMARY KEY REFERENCES nlsql_task_config(id) ON DELETE CASCADE,
+    version INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+COMMENT ON TABLE task_context_version IS '任务上下文版本';
+COMMENT ON COLUMN task_context_version.task_id IS 'nlsql任务id外键';
+COMMENT ON COLUMN task_context_version.version IS '版本号，提示词/问答对变更时递增';
+
+-- 16. 进行中的问答（跨进程合并相同问题）
+CREATE TABLE IF NOT EXISTS ask_flight (
+    flight_key VARCHAR(64) PRIMARY KEY,
+    owner VARCHAR(100) NOT NULL,
+    status VARCHAR(20) NOT NULL,
+    result TEXT,
+    lease_until TIMESTAMP WITH TIME ZONE NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE NOT NULL
+);
+
+COMMENT ON TABLE ask_flight IS '进行中的问答';
+COMMENT ON COLUMN ask_flight.flight_key IS '任务ID与归一化问题的摘要';
+COMMENT ON COLUMN ask_flight.owner IS '当前计算方标识';
+COMMENT ON COLUMN ask_flight.status IS 'running/done/failed';
+COMMENT ON COLUMN ask_flight.result IS '计算结果(JSON)';
+COMMENT ON COLUMN ask_flight.lease_until IS '租约到期时间，计算方需定期续约';
+
+-- 17. 后台任务（异步问答等），各 worker 抢占执行并持有租约
+CREATE TABLE IF NOT EXISTS background_job (
+    id VARCHAR(32) PRIMARY KEY,
+    job_type VARCHAR(50) NOT NULL,
+    nlsql_task_id BIGINT REFERENCES nlsql_task_config(id) ON DELETE CASCADE,
+    status VARCHAR(20) NOT NULL DEFAULT 'queued',
+    params TEXT,
+    stage VARCHAR(50),
+    progress TEXT,
+    result TEXT,
+    error TEXT,
+    cancel_requested BOOLEAN NOT NULL DEFAULT FALSE,
+    owner VARCHAR(100),
+    lease_until TIMESTAMP WITH TIME ZONE,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP WITH TIME ZONE,
+    finished_at TIMESTAMP WITH TIME ZONE,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+COMMENT ON TABLE background_job IS '后台任务';
+COMMENT ON COLUMN background_job.id IS '任务ID';
+COMMENT ON COLUMN background_job.job_type IS '任务类型，如 ask';
+COMMENT ON COLUMN background_job.nlsql_task_id IS 'nlsql任务id外键';
+COMMENT ON COLUMN background_job.status IS 'queued/running/succeeded/failed/cancelled';
+COMMENT ON COLUMN background_job.params IS '任务参数(JSON)';
+COMMENT ON COLUMN background_job.stage IS '当前阶段';
+COMMENT ON COLUMN background_job.progress IS '进度(JSON)';
+COMMENT ON COLUMN background_job.result IS '执行结果(JSON)';
+COMMENT ON COLUMN background_job.error IS '失败原因';
+COMMENT ON COLUMN background_job.cancel_requested IS '是否已请求取消';
+COMMENT ON COLUMN background_job.owner IS '执行方标识';
+COMMENT ON COLUMN background_job.lease_until IS '租约到期时间，执行方需定期续约';
+COMMENT ON COLUMN background_job.attempts IS '已领取次数';
+COMMENT ON COLUMN background_job.started_at IS '开始执行时间';
+COMMENT ON COLUMN background_job.finished_at IS '结束时间';
@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+
+from app.core.config import settings
+from app.core.exceptions import TooManyRequestsError
+from app.services.admission import AdmissionController
+
+
+@pytest.fixture
+def admission_settings(monkeypatch):
+    monkeypatch.setattr(settings, "ADMISSION_ENABLED", True)
+    monkeypatch.setattr(settings, "ADMISSION_MAX_ACTIVE", 2)
+    monkeypatch.setattr(settings, "ADMISSION_MAX_QUEUE", 10)
+    monkeypatch.setattr(settings, "ADMISSION_MAX_QUEUE_PER_TASK", 3)
+    monkeypatch.setattr(settings, "ADMISSION_QUEUE_TIMEOUT_SECONDS", 1)
+
+
+async def test_queued_tasks_are_admitted_round_robin(admission_settings):
+    controller = AdmissionController()
+    first = await controller.acquire(task_id=1, llm_config_id=1)
+    second = await controller.acquire(task_id=1, llm_config_id=1)
+    order = []
+
+    async def ask(task_id: int):
+        permit = await controller.acquire(task_id=task_id, llm_config_id=1)
+        order.append(task_id)
+        await asyncio.sleep(0)
+        permit.release()
+
+    waiters = [asyncio.create_task(ask(task_id)) for task_id in (1, 1, 1, 2)]
+    await asyncio.sleep(0)
+    assert controller.stats()["queued"] == 4
+
+    first.release()
+    second.release()
+    await asyncio.gather(*waiters)
+    # 任务 2 只排了一个请求，但不需要等任务 1 的三个请求全部完成
+    assert order.index(2) < 3
+    assert controller.stats()["active"] == 0
+
+
+async def test_full_queue_is_rejected_with_retry_after(admission_settings):
+    controller = AdmissionController()
+    permits = [await controller.acquire(task_id=1, llm_config_id=1, task_limit=1)]
+    waiters = [asyncio.create_task(controller.acquire(task_id=1, llm_config_id=1, task_limit=1)) for _ in range(3)]
+    await asyncio.sleep(0)
+
+    with pytest.raises(TooManyRequestsError) as exc_info:
+        await controller.acquire(task_id=1, llm_config_id=1, task_limit=1)
+    assert exc_info.value.status_code == 429
+    assert exc_info.value.retry_after >= 1
+
+    # 其他任务不受任务 1 的队列影响
+    permits.append(await controller.acquire(task_id=2, llm_config_id=1))
+
+    for permit in permits:
+        permit.release()
+    for waiter in waiters:
+        (await waiter).release()
+    assert controller.stats()["rejected"] == 1
+
+
+async def test_queue_timeout_raises_429(admission_settings, monkeypatch):
+    monkeypatch.setattr(settings, "ADMISSION_QUEUE_TIMEOUT_SECONDS", 0.05)
+    controller = AdmissionController()
+    permit = await controller.acquire(task_id=1, llm_config_id=1, task_limit=1)
+    with pytest.raises(TooManyRequestsError):
+        await controller.acquire(task_id=1, llm_config_id=1, task_limit=1)
+    assert controller.stats()["queued"] == 0
+    permit.release()
@@ -0,0 +1,35 @@
+from app.services.answer_cache import AnswerCache, CachedAnswer
+from app.utils.text_normalize import normalize_question
+
+
+def test_normalize_question_ignores_width_space_and_script():
+    expected = normalize_question("目前掌握台湾多少人")
+    assert normalize_question(" 目前 掌握臺灣多少人？") == expected
+    assert normalize_question("目前掌握台湾多少人?") == expected
+    assert normalize_question("ＴＯＰ１０") == "top10"
+
+
+def test_answer_cache_hit_and_version_invalidation():
+    cache = AnswerCache(max_entries=10, ttl_seconds=60)
+    key = cache.make_key(1, "目前掌握台湾多少人")
+    cache.put(key, CachedAnswer(sql="select 1", sql_data=[], context_version=3))
+
+    assert cache.get(cache.make_key(1, "目前掌握臺灣多少人？"), context_version=3).sql == "select 1"
+    assert cache.get(cache.make_key(2, "目前掌握台湾多少人"), context_version=3) is None
+    assert cache.get(key, context_version=4) is None
+    assert cache.get(key, context_version=3) is None
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 3
+    assert stats["stale"] == 1
+
+
+def test_answer_cache_evicts_least_recently_used():
+    cache = AnswerCache(max_entries=2, ttl_seconds=0)
+    for index in range(3):
+        cache.put(cache.make_key(1, f"q{index}"), CachedAnswer(sql=f"select {index}", sql_data=[], context_version=0))
+
+    assert cache.get(cache.make_key(1, "q0"), context_version=0) is None
+    assert cache.get(cache.make_key(1, "q2"), context_version=0) is not None
+    assert cache.stats()["evictions"] == 1
@@ -0,0 +1,61 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.services.ask_trace import AskTrace, record_llm_usage, summarize_traces, traced
+
+
+def _response(prompt_tokens: int, completion_tokens: int):
+    return SimpleNamespace(usage=SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens))
+
+
+async def test_trace_records_stage_usage_and_nesting():
+    trace = AskTrace(task_id=1)
+
+    async def agent():
+        record_llm_usage(_response(100, 20))
+        return await traced("sql_execute", asyncio.sleep(0, result=[1]))
+
+    assert await trace.run("create_sql", agent()) == [1]
+    record_llm_usage(_response(999, 999))
+
+    data = trace.to_dict()
+    assert [stage["name"] for stage in data["stages"]] == ["create_sql", "sql_execute"]
+    assert data["stages"][1]["parent"] == "create_sql"
+    assert data["prompt_tokens"] == 100
+    assert data["completion_tokens"] == 20
+    assert data["llm_calls"] == 1
+
+
+async def test_trace_marks_failed_and_cancelled_stages():
+    trace = AskTrace()
+
+    async def fail():
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        await trace.run("select_tables", fail())
+    task = asyncio.create_task(trace.run("shot_match", asyncio.sleep(10)))
+    await asyncio.sleep(0)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    assert [stage["status"] for stage in trace.to_dict()["stages"]] == ["error", "cancelled"]
+
+
+def test_summarize_traces_orders_stages_by_p95():
+    traces = [
+        {"total_ms": 100 + index, "stages": [
+            {"name": "select_tables", "duration_ms": 10 + index, "prompt_tokens": 5},
+            {"name": "create_sql", "duration_ms": 50 + index, "completion_tokens": 3},
+        ]}
+        for index in range(20)
+    ]
+    summary = summarize_traces(traces)
+    assert summary["sample_count"] == 20
+    assert summary["p95_ms"] == 118
+    assert summary["stages"][0]["name"] == "create_sql"
+    assert summary["stages"][0]["p95_ms"] == 68
+    assert summary["stages"][1]["prompt_tokens"] == 100
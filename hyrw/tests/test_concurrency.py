@@ -0,0 +1,34 @@
+import asyncio
+
+from app.services.concurrency import KeyedLimiter
+
+
+async def test_keyed_limiter_bounds_each_key_independently():
+    limiter = KeyedLimiter("llm")
+    running = {1: 0, 2: 0}
+    peak = {1: 0, 2: 0}
+
+    async def call(key: int):
+        async with limiter.slot(key, 2):
+            running[key] += 1
+            peak[key] = max(peak[key], running[key])
+            await asyncio.sleep(0.01)
+            running[key] -= 1
+
+    await asyncio.gather(*(call(1) for _ in range(6)), *(call(2) for _ in range(6)))
+    assert peak == {1: 2, 2: 2}
+    assert limiter.stats()["1"] == {"limit": 2, "in_flight": 0}
+
+
+async def test_keyed_limiter_without_limit_does_not_block():
+    limiter = KeyedLimiter("db")
+    running = []
+
+    async def call():
+        async with limiter.slot(1, None):
+            running.append(1)
+            await asyncio.sleep(0.01)
+
+    await asyncio.gather(*(call() for _ in range(5)))
+    assert len(running) == 5
+    assert limiter.stats() == {}
@@ -0,0 +1,157 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+import app.models  # noqa: F401  注册所有表，外键引用的表也会建出来
+import app.services.job_runner as job_runner_module
+from app.core.config import settings
+from app.core.database import Base
+from app.models.background_job import BackgroundJob
+from app.services.job_runner import JobRunner
+
+
+@pytest.fixture
+async def runner(tmp_path, monkeypatch):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'jobs.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_local = async_sessionmaker(autocommit=False, autoflush=False, bind=engine, class_=AsyncSession)
+
+    async def run_sync_session(fn):
+        async with session_local() as session:
+            return await session.run_sync(fn)
+
+    monkeypatch.setattr(job_runner_module, "run_sync_session", run_sync_session)
+    monkeypatch.setattr(settings, "JOB_MAX_ATTEMPTS", 3)
+    runner = JobRunner()
+    yield runner
+    await runner.stop()
+    await engine.dispose()
+
+
+async def _set(job_id: str, **values) -> None:
+    def save(db):
+        db.execute(update(BackgroundJob).where(BackgroundJob.id == job_id).values(**values))
+        db.commit()
+
+    await job_runner_module.run_sync_session(save)
+
+
+async def _stale(job_id: str, **values) -> None:
+    """模拟另一个 worker 领取后退出：状态仍是 running，租约已过期。"""
+    await _set(
+        job_id,
+        status="running",
+        owner="other:1",
+        lease_until=datetime.utcnow() - timedelta(seconds=1),
+        **values,
+    )
+
+
+async def _run_claimed(runner: JobRunner) -> None:
+    await runner._claim_jobs()
+    await asyncio.gather(*runner._running.values())
+
+
+async def test_expired_lease_is_claimed_again(runner):
+    calls = []
+
+    async def handler(context):
+        calls.append(context.attempts)
+        return {"ok": True}
+
+    runner.register("demo", handler)
+    job = await runner.submit("demo", {})
+    await _stale(job["id"], attempts=1)
+    # 租约未过期时其他 worker 不能领取
+    await _set(job["id"], lease_until=datetime.utcnow() + timedelta(seconds=30))
+    await runner._claim_jobs()
+    assert not runner._running
+
+    await _set(job["id"], lease_until=datetime.utcnow() - timedelta(seconds=1))
+    await _run_claimed(runner)
+    item = await runner.get_job(job["id"], with_result=True)
+    assert calls == [2]
+    assert item["status"] == "succeeded" and item["attempts"] == 2
+    assert item["result"] == {"ok": True}
+
+
+async def test_expired_lease_at_max_attempts_fails(runner):
+    calls = []
+
+    async def handler(context):
+        calls.append(context.job_id)
+
+    runner.register("demo", handler)
+    job = await runner.submit("demo", {})
+    await _stale(job["id"], attempts=settings.JOB_MAX_ATTEMPTS)
+    await _run_claimed(runner)
+    item = await runner.get_job(job["id"])
+    assert calls == []
+    assert item["status"] == "failed" and "最大尝试次数" in item["error"]
+    assert item["finished_at"] is not None
+
+
+async def test_cancel_requested_is_finished_at_claim(runner):
+    calls = []
+
+    async def handler(context):
+        calls.append(context.job_id)
+
+    runner.register("demo", handler)
+    job = await runner.submit("demo", {})
+    await _stale(job["id"], attempts=1, cancel_requested=True)
+    await _run_claimed(runner)
+    item = await runner.get_job(job["id"])
+    assert calls == []
+    assert item["status"] == "cancelled" and item["finished_at"] is not None
+
+
+async def test_cancel_interrupts_local_running_job(runner):
+    started = asyncio.Event()
+
+    async def handler(context):
+        started.set()
+        await asyncio.sleep(60)
+
+    runner.register("demo", handler)
+    job = await runner.submit("demo", {})
+    await runner._claim_jobs()
+    task = runner._running[job["id"]]
+    await started.wait()
+
+    await runner.cancel(job["id"])
+    await asyncio.gather(task, return_exceptions=True)
+    item = await runner.get_job(job["id"])
+    assert item["status"] == "cancelled" and item["cancel_requested"]
+    assert not runner._running
+
+
+async def test_stop_requeues_running_job(runner):
+    started = asyncio.Event()
+
+    async def handler(context):
+        started.set()
+        await asyncio.sleep(60)
+
+    runner.register("demo", handler)
+    job = await runner.submit("demo", {})
+    await runner._claim_jobs()
+    await started.wait()
+
+    await runner.stop()
+    item = await runner.get_job(job["id"])
+    assert item["status"] == "queued" and item["attempts"] == 1
+    assert item["started_at"] is None and item["finished_at"] is None
+
+    # 重启后的 worker 继续执行，尝试次数累加
+    async def finish(context):
+        return context.attempts
+
+    runner.register("demo", finish)
+    await _run_claimed(runner)
+    item = await runner.get_job(job["id"], with_result=True)
+    assert item["status"] == "succeeded" and item["result"] == 2
@@ -0,0 +1,43 @@
+import asyncio
+
+from app.core.config import settings
+from app.models.llm_config import LlmConfig
+from app.services.llm_gateway import LlmGateway
+
+
+def _config(api_key: str = "k1") -> LlmConfig:
+    return LlmConfig(id=1, base_url="http://llm.local/v1", api_key=api_key, model_name="m", provider="p")
+
+
+async def test_clients_shared_per_config_and_rebuilt_on_change():
+    gateway = LlmGateway()
+    client, async_client = gateway.clients(_config())
+    assert gateway.clients(_config()) == (client, async_client)
+    assert str(async_client.base_url) == "http://llm.local/v1/"
+
+    _, rebuilt = gateway.clients(_config(api_key="k2"))
+    assert rebuilt is not async_client
+    assert gateway.stats()["rebuilds"] == 1
+
+    gateway.invalidate(1)
+    assert gateway.stats()["clients"] == {}
+    await gateway.aclose()
+    assert async_client.is_closed()
+
+
+async def test_retired_clients_closed_after_grace_period(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_TIMEOUT_SECONDS", 1.0)
+    monkeypatch.setattr(settings, "LLM_MAX_RETRIES", 0)
+    gateway = LlmGateway()
+    _, first = gateway.clients(_config())
+    _, second = gateway.clients(_config(api_key="k2"))
+    # 宽限期内可能仍有请求在用，不关闭
+    assert not first.is_closed() and gateway.stats()["retired"] == 1
+
+    await asyncio.sleep(1.05)
+    gateway.clients(_config(api_key="k2"))
+    await asyncio.sleep(0)
+    await asyncio.sleep(0)
+    assert first.is_closed() and not second.is_closed()
+    assert gateway.stats()["retired"] == 0 and gateway.stats()["closed"] == 1
+    await gateway.aclose()
@@ -0,0 +1,56 @@
+from app.services.llm_response_cache import LlmResponseCache, llm_cache_mode
+
+
+def _key(cache: LlmResponseCache, content: str, temperature: float = 0.2) -> str:
+    return cache.make_key(
+        base_url="http://llm.local/v1",
+        model="m",
+        messages=[{"role": "user", "content": content}],
+        temperature=temperature,
+        max_tokens=100,
+    )
+
+
+def test_put_get_and_key_covers_parameters(tmp_path):
+    cache = LlmResponseCache(str(tmp_path / "cache.db"), max_bytes=1024 * 1024, call_sites=["table_prompt"])
+    key = _key(cache, "q")
+    assert key != _key(cache, "q", temperature=0.3)
+    assert cache.get(key) is None
+
+    cache.put(key, '{"id": 1}', call_site="table_prompt", model="m")
+    assert cache.get(key) == '{"id": 1}'
+    assert cache.stats()["entries"]["table_prompt"]["hits"] == 1
+
+    cache.discard(key)
+    assert cache.get(key) is None
+
+
+def test_call_site_opt_in_and_bypass_header(tmp_path):
+    cache = LlmResponseCache(str(tmp_path / "cache.db"), max_bytes=1024, call_sites=["table_prompt"])
+    assert cache.enabled_for("table_prompt")
+    assert not cache.enabled_for("create_sql")
+    assert cache.enabled_for("create_sql", use_cache=True)
+    assert not cache.enabled_for("table_prompt", use_cache=False)
+
+    key = _key(cache, "q")
+    cache.put(key, "cached", call_site="table_prompt", model="m")
+    token = llm_cache_mode.set("bypass")
+    try:
+        assert not cache.enabled_for("table_prompt")
+    finally:
+        llm_cache_mode.reset(token)
+    token = llm_cache_mode.set("refresh")
+    try:
+        assert cache.get(key) is None
+    finally:
+        llm_cache_mode.reset(token)
+
+
+def test_evicts_least_recently_accessed_over_max_bytes(tmp_path):
+    cache = LlmResponseCache(str(tmp_path / "cache.db"), max_bytes=250, call_sites=[])
+    keys = [_key(cache, str(i)) for i in range(3)]
+    for key in keys:
+        cache.put(key, "x" * 100, call_site="s", model="m")
+    assert cache.get(keys[0]) is None
+    assert cache.get(keys[1]) == "x" * 100
+    assert cache.get(keys[2]) == "x" * 100
@@ -0,0 +1,135 @@
+import time
+
+import httpx
+import pytest
+from openai import APIStatusError, BadRequestError
+
+from app.core.config import settings
+from app.core.exceptions import GatewayTimeoutError, ServiceUnavailableError
+from app.devtools.mock_llm import run_mock_llm_server
+from app.models.llm_config import LlmConfig
+from app.services.llm_router import LlmRouter, is_failover_error, llm_router
+from app.services.openai_service import OpenAIService
+
+
+def _status_error(cls, status_code: int, headers=None):
+    response = httpx.Response(status_code, headers=headers, request=httpx.Request("POST", "http://llm/v1/chat/completions"))
+    return cls("error", response=response, body=None)
+
+
+def _config(config_id: int, base_url: str = "http://127.0.0.1:9/v1") -> LlmConfig:
+    return LlmConfig(id=config_id, base_url=base_url, api_key="k", model_name="m", status=1)
+
+
+def test_orders_by_latency_and_error_rate(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_ROUTER_EXPLORE_RATIO", 0.0)
+    router = LlmRouter()
+    primary, backup = _config(1), _config(2)
+    # 没有样本时保持配置顺序
+    assert router.order([primary, backup]) == [primary, backup]
+
+    router.record_success(1, 900)
+    router.record_success(2, 300)
+    assert router.order([primary, backup]) == [backup, primary]
+
+    router.record_failure(2, _status_error(APIStatusError, 502))
+    router.record_failure(2, _status_error(APIStatusError, 502))
+    assert router.order([primary, backup]) == [primary, backup]
+
+
+def test_circuit_opens_then_lets_one_probe_through(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_ROUTER_EXPLORE_RATIO", 0.0)
+    router = LlmRouter()
+    primary, backup = _config(1), _config(2)
+    router.record_success(1, 100)
+    router.record_success(2, 500)
+    router.record_failure(1, _status_error(APIStatusError, 429, headers={"retry-after": "12"}))
+
+    # 熔断中的端点不参与路由
+    assert router.order([primary, backup]) == [backup]
+    health = router.stats()["1"]
+    assert health["state"] == "open"
+    assert 0 < health["cooldown_remaining_seconds"] <= 12
+    assert not router.begin(1)
+
+    router._health[1].cooldown_until = time.time() - 1
+    assert router.stats()["1"]["state"] == "half_open"
+    assert router.begin(1)
+    assert not router.begin(1)
+    router.record_failure(1, _status_error(APIStatusError, 502))
+    assert router.stats()["1"]["state"] == "open"
+
+    router._health[1].cooldown_until = time.time() - 1
+    assert router.begin(1)
+    router.record_success(1, 100)
+    assert router.stats()["1"]["state"] == "closed"
+
+
+def test_only_transient_errors_fail_over():
+    assert is_failover_error(_status_error(APIStatusError, 503))
+    assert is_failover_error(_status_error(APIStatusError, 429))
+    assert not is_failover_error(_status_error(BadRequestError, 400))
+    assert not is_failover_error(ValueError("bad"))
+
+
+async def test_service_fails_over_to_next_config(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_ROUTER_EXPLORE_RATIO", 0.0)
+    llm_router.reset()
+    with run_mock_llm_server() as base_url:
+        broken, healthy = _config(901), _config(902, base_url)
+        service = OpenAIService(broken, pool=[healthy])
+        messages = [{"role": "user", "content": "hello"}]
+
+        response = await service.async_chat_completion(messages)
+        assert response.choices[0].message.content
+        assert service.generate_chat_response(messages)
+
+    stats = llm_router.stats()
+    assert stats["901"]["failures"] == 1
+    assert stats["902"]["calls"] == 2
+    llm_router.reset()
+
+
+async def test_open_circuit_fails_fast():
+    llm_router.reset()
+    broken = _config(903)
+    for _ in range(settings.LLM_ROUTER_FAILURE_THRESHOLD):
+        llm_router.record_failure(903, _status_error(APIStatusError, 503))
+    with pytest.raises(ServiceUnavailableError) as exc_info:
+        await OpenAIService(broken).async_chat_completion([{"role": "user", "content": "hello"}])
+    assert exc_info.value.retry_after >= 1
+    llm_router.reset()
+
+
+async def test_call_site_deadline(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_CALL_SITE_DEADLINES", "select_table=0.2")
+    llm_router.reset()
+    with run_mock_llm_server(latency={"default": {"mean_ms": 1000}}) as base_url:
+        service = OpenAIService(_config(904, base_url))
+        begin = time.perf_counter()
+        with pytest.raises(GatewayTimeoutError):
+            await service.async_chat_completion([{"role": "user", "content": "hello"}], call_site="select_table")
+        assert time.perf_counter() - begin < 0.8
+    llm_router.reset()
+
+
+async def test_hedge_goes_to_another_config(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_ROUTER_EXPLORE_RATIO", 0.0)
+    monkeypatch.setattr(settings, "LLM_HEDGE_ENABLED", True)
+    llm_router.reset()
+    with run_mock_llm_server(latency={"default": {"mean_ms": 1500}}) as slow_url, run_mock_llm_server() as fast_url:
+        slow, fast = _config(905, slow_url), _config(906, fast_url)
+        # 慢端点的历史延迟更低，会被选为首选；对冲等待时间为最小值 200ms
+        for _ in range(settings.LLM_HEDGE_MIN_SAMPLES):
+            llm_router.record_success(905, 50)
+        llm_router.record_success(906, 400)
+
+        begin = time.perf_counter()
+        response = await OpenAIService(slow, pool=[fast]).async_chat_completion(
+            [{"role": "user", "content": "hello"}],
+            call_site="select_table",
+        )
+        assert response.choices[0].message.content
+        assert time.perf_counter() - begin < 1
+    assert llm_router.stats()["906"]["calls"] == 2
+    llm_router.reset()
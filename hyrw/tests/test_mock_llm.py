@@ -0,0 +1,52 @@
+import json
+
+from httpx import ASGITransport, AsyncClient
+
+from app.devtools.mock_llm import create_mock_llm_app, prompt_key, run_mock_llm_server
+from app.models.llm_config import LlmConfig
+from app.services.create_sql_agent import parse_sql_response
+from app.services.openai_service import OpenAIService
+
+
+def _create_sql_messages(prompt: str):
+    return [
+        {"role": "system", "content": "你是SQL生成专家。请按格式返回【SQL】和【理由】。"},
+        {"role": "user", "content": prompt},
+    ]
+
+
+async def test_replays_recording_before_scripted_reply(tmp_path):
+    recorded = [{"role": "system", "content": "你是一个严谨的数据分析选表助手。"}, {"role": "user", "content": "q"}]
+    recordings = tmp_path / "recordings.jsonl"
+    recordings.write_text(
+        json.dumps({"key": prompt_key(recorded), "agent": "select_table", "content": "recorded"}) + "\n",
+        encoding="utf-8",
+    )
+    app = create_mock_llm_app(recordings=str(recordings))
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://mock") as client:
+        response = await client.post("/v1/chat/completions", json={"model": "m", "messages": recorded})
+        assert response.json()["choices"][0]["message"]["content"] == "recorded"
+
+        scripted = _create_sql_messages("选择的表：\n表: t_person\n列补丁: {\"column_patches\": {}}")
+        response = await client.post("/v1/chat/completions", json={"model": "m", "messages": scripted})
+        content = response.json()["choices"][0]["message"]["content"]
+        assert parse_sql_response(content)["sql"] == "SELECT * FROM t_person LIMIT 10"
+        assert response.json()["usage"]["prompt_tokens"] > 0
+
+        stats = (await client.get("/mock/stats")).json()
+        assert stats["calls"] == {"select_table": {"recorded": 1}, "create_sql": {"scripted": 1}}
+
+
+async def test_openai_client_streams_from_mock_server():
+    with run_mock_llm_server() as base_url:
+        service = OpenAIService(LlmConfig(id=None, base_url=base_url, api_key="k", model_name="m"))
+        messages = [
+            {"role": "system", "content": "你是一个严谨的数据分析选表助手。"},
+            {"role": "user", "content": "用户问题:\nt_org 有多少\n候选表:\n1. table_name=t_person\n2. table_name=t_org"},
+        ]
+        response = await service.async_chat_completion(messages)
+        assert json.loads(response.choices[0].message.content)["selected_tables"] == ["t_org"]
+
+        parts = [delta async for delta in service.async_chat_completion_stream(_create_sql_messages("表: t_org"))]
+        assert len(parts) > 1
+        assert parse_sql_response("".join(parts))["sql"] == "SELECT * FROM t_org LIMIT 10"
@@ -0,0 +1,150 @@
+import time
+
+import app.services.qa_embedding as qa_embedding_module
+from app.core.config import settings
+from app.models.llm_config import LlmConfig
+from app.services.qa_embedding import prepare_import_items, qa_dedupe_key, qa_embedding_service
+
+
+def test_dedupe_key_ignores_formatting_only():
+    assert qa_dedupe_key("今天的航班数量？", "SELECT  count(*)\nFROM flight;") == qa_dedupe_key(
+        "今天的 航班数量", "SELECT count(*) FROM flight"
+    )
+    # SQL 中的字面量大小写不同视为不同的问答对
+    assert qa_dedupe_key("q", "SELECT 1 WHERE a = 'A'") != qa_dedupe_key("q", "SELECT 1 WHERE a = 'a'")
+
+
+def test_prepare_import_items_validates_and_dedupes():
+    existing = {qa_dedupe_key("已有问题", "SELECT 1")}
+    accepted, duplicate_count, invalid = prepare_import_items(
+        [
+            {"question": "已有问题。", "sql": "SELECT 1;"},
+            {"question": "新问题", "sql": "SELECT 2", "where_conditions": [{"field": "a", "operator": "eq", "value": 1}]},
+            {"question": "新问题", "sql": "SELECT   2"},
+            {"question": "  ", "sql": "SELECT 3"},
+            {"question": "缺少SQL"},
+            {"question": "条件格式错误", "sql": "SELECT 4", "where_conditions": [{"field": "a"}]},
+        ],
+        existing,
+    )
+    assert [item.question for item in accepted] == ["新问题"]
+    assert accepted[0].where_conditions[0].value == 1
+    assert duplicate_count == 2
+    assert [item["index"] for item in invalid] == [3, 4, 5]
+    assert "sql" in invalid[1]["reason"]
+
+
+def test_where_concurrency_prefers_request_then_llm_config(monkeypatch):
+    monkeypatch.setattr(settings, "QA_WHERE_DEFAULT_CONCURRENCY", 4)
+    monkeypatch.setattr(settings, "QA_WHERE_MAX_CONCURRENCY", 16)
+    assert qa_embedding_service._where_concurrency(LlmConfig(max_concurrency=None), None) == 4
+    assert qa_embedding_service._where_concurrency(LlmConfig(max_concurrency=6), None) == 6
+    assert qa_embedding_service._where_concurrency(LlmConfig(max_concurrency=6), 2) == 2
+    assert qa_embedding_service._where_concurrency(LlmConfig(max_concurrency=100), None) == 16
+
+
+class _FakeJob:
+    def __init__(self, ids, attempts=1, events=None):
+        self.job_id = "job"
+        self.task_id = 1
+        self.attempts = attempts
+        self.params = {"qa_embedding_ids": ids, "llm_config_id": 1, "overwrite": True, "embed": False}
+        self.events = events if events is not None else []
+
+    async def report(self, *, stage=None, progress=None):
+        if progress is not None:
+            self.events.append(("report", progress["processed"]))
+
+
+class _FakeOpenAIService:
+    calls = []
+
+    def __init__(self, llm_config):
+        pass
+
+    def generate_where_conditions_from_qa(self, question, sql):
+        _FakeOpenAIService.calls.append(question)
+        # 先提交的请求后完成，检验结果仍按行的顺序对应
+        time.sleep(0.01 * (10 - int(question)))
+        if question == "3":
+            raise ValueError("bad json")
+        return [{"field": "f", "operator": "eq", "value": question}], ["t"]
+
+
+def _patch_enrich(monkeypatch, events, checkpoint=None):
+    _FakeOpenAIService.calls = []
+    saved = {}
+    monkeypatch.setattr(settings, "QA_ENRICH_BATCH_SIZE", 2)
+    monkeypatch.setattr(qa_embedding_module, "OpenAIService", _FakeOpenAIService)
+    monkeypatch.setattr(
+        qa_embedding_service, "_enrich_configs", lambda task_id, llm_config_id: (LlmConfig(id=1), None)
+    )
+    monkeypatch.setattr(
+        qa_embedding_service,
+        "_load_enrich_rows",
+        lambda ids: [
+            {"id": i, "question": str(i), "sql": f"SELECT {i}", "has_where_conditions": False, "embedding_model": None}
+            for i in ids
+        ],
+    )
+
+    def save(updates):
+        events.append(("save", sorted(updates)))
+        saved.update(updates)
+
+    monkeypatch.setattr(qa_embedding_service, "_save_enrich_updates", save)
+
+    async def get_job(job_id, **kwargs):
+        return {"progress": checkpoint}
+
+    monkeypatch.setattr(qa_embedding_module.job_runner, "get_job", get_job)
+    return saved
+
+
+async def test_enrich_job_commits_each_batch_before_reporting(monkeypatch):
+    events = []
+    saved = _patch_enrich(monkeypatch, events)
+    result = await qa_embedding_service.run_enrich_job(_FakeJob([1, 2, 3, 4, 5], events=events))
+    assert events == [
+        ("report", 0),
+        ("save", [1, 2]),
+        ("report", 2),
+        ("save", [4]),
+        ("report", 4),
+        ("save", [5]),
+        ("report", 5),
+    ]
+    # 失败的行只记录，不影响同批其他行
+    assert result["where_generated"] == 4 and result["where_failed"] == 1
+    assert result["failed_items"] == [{"id": 3, "error": "bad json"}]
+    assert saved[4]["where_conditions"] == '[{"field": "f", "operator": "eq", "value": "4"}]'
+
+
+async def test_enrich_job_resumes_from_checkpoint(monkeypatch):
+    events = []
+    checkpoint = {
+        "total": 6,
+        "processed": 4,
+        "where_generated": 3,
+        "where_skipped": 0,
+        "where_failed": 1,
+        "embedded": 0,
+        "failed_items": [{"id": 3, "error": "bad json"}],
+    }
+    _patch_enrich(monkeypatch, events, checkpoint)
+    result = await qa_embedding_service.run_enrich_job(_FakeJob([1, 2, 3, 4, 5, 6], attempts=2, events=events))
+    assert sorted(_FakeOpenAIService.calls) == ["5", "6"]
+    assert events == [("report", 4), ("save", [5, 6]), ("report", 6)]
+    assert result["where_generated"] == 5 and result["where_failed"] == 1
+    assert result["failed_items"] == [{"id": 3, "error": "bad json"}]
+
+
+async def test_generate_where_concurrently_keeps_row_order():
+    _FakeOpenAIService.calls = []
+    rows = [{"id": i, "question": str(i), "sql": f"SELECT {i}"} for i in (1, 2, 3, 4)]
+    results = await qa_embedding_service._generate_where_concurrently(
+        _FakeOpenAIService(None), LlmConfig(id=1), rows, concurrency=4
+    )
+    assert [result[0][0]["value"] for result in results if not isinstance(result, Exception)] == ["1", "2", "4"]
+    assert isinstance(results[2], ValueError)
+    assert len(_FakeOpenAIService.calls) == 4
@@ -0,0 +1,37 @@
+from app.core.config import settings
+from app.services.shot_gate import ShotGate
+
+
+def test_gate_calibrates_from_hit_scores(monkeypatch):
+    monkeypatch.setattr(settings, "SHOT_GATE_MIN_HITS", 5)
+    monkeypatch.setattr(settings, "SHOT_GATE_HIT_PERCENTILE", 0)
+    monkeypatch.setattr(settings, "SHOT_GATE_MARGIN", 0.5)
+    monkeypatch.setattr(settings, "SHOT_GATE_AUDIT_RATIO", 0)
+    gate = ShotGate(window=100)
+
+    # 命中样本不足时不跳过
+    decision = gate.decide("bm25", 0.01)
+    assert not decision.skip and decision.source == "warmup"
+    gate.observe(gate.decide("bm25", 0.05), 20)
+    for score in (0.6, 0.7, 0.8, 0.9, 1.0):
+        gate.observe(gate.decide("bm25", score), 95)
+
+    decision = gate.decide("bm25", 0.2)
+    assert decision.skip and decision.source == "calibrated"
+    assert abs(decision.threshold - 0.3) < 1e-6
+    assert not gate.decide("bm25", 0.4).skip
+    # 其他检索方式单独校准
+    assert not gate.decide("embedding:e", 0.2).skip
+
+    stats = gate.stats()["bm25"]
+    assert stats["hits"] == 5 and stats["samples"] == 6 and stats["skipped"] == 1
+
+
+def test_gate_static_threshold_and_audit(monkeypatch):
+    monkeypatch.setattr(settings, "SHOT_GATE_MIN_SCORES", "embedding=0.5")
+    monkeypatch.setattr(settings, "SHOT_GATE_AUDIT_RATIO", 1)
+    gate = ShotGate(window=100)
+    decision = gate.decide("embedding:e", 0.3)
+    assert decision.skip and decision.audit and decision.source == "static"
+    gate.observe(decision, 95)
+    assert gate.stats()["embedding:e"]["false_skips"] == 1
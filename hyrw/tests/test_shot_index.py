@@ -0,0 +1,98 @@
+from dataclasses import replace
+import time
+
+import numpy as np
+
+from app.core.config import settings
+from app.devtools.mock_llm import run_mock_llm_server
+from app.models.llm_config import LlmConfig
+from app.services.lexical_index import LexicalIndex, tokenize
+from app.services.shot_index import ShotIndex, ShotInfo, decode_vector, embed_texts, encode_vector
+from app.services.shot_tool import ShotTool
+
+
+def _index(questions, vectors) -> ShotIndex:
+    shots = tuple(ShotInfo(id=i, question=q, sql=f"SELECT {i}", where_conditions=None) for i, q in enumerate(questions))
+    matrix = np.vstack([decode_vector(blob) for blob in vectors]) if vectors else None
+    positions = np.arange(len(vectors), dtype=np.int64) if vectors else None
+    return ShotIndex(task_id=1, version=1, embedding_model="e", shots=shots, matrix=matrix, positions=positions)
+
+
+def test_encode_normalizes_to_float32():
+    vector = decode_vector(encode_vector([3.0, 4.0]))
+    assert vector.dtype == np.float32
+    assert np.allclose(vector, [0.6, 0.8])
+
+
+def test_top_k_orders_by_cosine_similarity():
+    index = _index(
+        ["a", "b", "c", "d"],
+        [encode_vector(v) for v in ([1, 0, 0], [0.9, 0.1, 0], [0, 1, 0], [0, 0, 1])],
+    )
+    matched = index.top_k(decode_vector(encode_vector([1, 0.05, 0])), 2)
+    assert [shot.question for shot, _ in matched] == ["a", "b"]
+    assert matched[0][1] > matched[1][1]
+    assert len(index.top_k(decode_vector(encode_vector([0, 0, 1])), 10)) == 4
+    # 维度不一致（换了向量模型）时不检索
+    assert index.top_k(np.ones(5, dtype=np.float32), 2) == []
+
+
+async def test_shot_tool_retrieves_similar_questions(monkeypatch):
+    monkeypatch.setattr(settings, "SHOT_TOP_K", 2)
+    questions = ["北京有多少人口", "上海有多少人口", "今天的航班数量", "昨天的航班数量", "机型统计"]
+    with run_mock_llm_server() as base_url:
+        llm_config = LlmConfig(id=None, base_url=base_url, api_key="k", model_name="m", embedding_model="e")
+        index = _index(questions, embed_texts(llm_config, questions))
+        candidates = await ShotTool(llm_config).retrieve_shots("今天航班数量是多少", index)
+        assert candidates.gate_key == "embedding:e"
+        assert {shot.question for shot in candidates.shots} == {"今天的航班数量", "昨天的航班数量"}
+
+        # 没有向量时按字面检索，字面索引也没有时放入全部问答对
+        lexical = replace(_index(questions, []), lexical=LexicalIndex(questions))
+        candidates = await ShotTool(llm_config).retrieve_shots("今天航班数量是多少", lexical)
+        assert [shot.question for shot in candidates.shots] == ["今天的航班数量", "昨天的航班数量"]
+        assert candidates.method == "bm25" and 0 < candidates.top_score <= 1
+        candidates = await ShotTool(llm_config).retrieve_shots("今天航班数量是多少", _index(questions, []))
+        assert len(candidates.shots) == len(questions) and candidates.method is None
+
+
+async def test_slow_query_embedding_falls_back_to_bm25(monkeypatch):
+    monkeypatch.setattr(settings, "SHOT_TOP_K", 2)
+    monkeypatch.setattr(settings, "LLM_CALL_SITE_DEADLINES", "shot_embedding=0.2")
+    questions = ["今天的航班数量", "昨天的航班数量", "机型统计"]
+    vectors = [encode_vector([1.0, float(i)]) for i in range(len(questions))]
+    index = replace(_index(questions, vectors), lexical=LexicalIndex(questions))
+    with run_mock_llm_server(latency={"embedding": {"mean_ms": 2000}}) as base_url:
+        llm_config = LlmConfig(id=None, base_url=base_url, api_key="k", model_name="m", embedding_model="e")
+        started = time.monotonic()
+        candidates = await ShotTool(llm_config).retrieve_shots("今天航班数量是多少", index)
+        assert time.monotonic() - started < 1.5
+    assert candidates.method == "bm25"
+    assert [shot.question for shot in candidates.shots] == ["今天的航班数量", "昨天的航班数量"]
+
+
+def test_tokenize_uses_cjk_ngrams_and_ascii_words():
+    assert tokenize("C-17航班") == ["c", "17", "航班"]
+    assert tokenize("今天航班数") == ["今天", "天航", "航班", "班数", "今天航", "天航班", "航班数"]
+    assert tokenize("Ｃ１７") == ["c17"]
+
+
+def test_lexical_index_ranks_by_bm25():
+    index = LexicalIndex(["今天的航班数量", "昨天的航班数量", "北京有多少人口", "C-17 机型统计"])
+    matched = index.top_k("今天航班数量是多少", 3)
+    assert [doc_id for doc_id, _ in matched[:2]] == [0, 1]
+    assert all(score > 0 for _, score in matched)
+    assert [doc_id for doc_id, _ in index.top_k("c-17 的架次", 3)] == [3]
+    assert index.top_k("完全无关", 3) == []
+    assert LexicalIndex([]).top_k("航班", 3) == []
+
+
+def test_lexical_score_normalization():
+    # 文档等长时，查询与某文档完全相同得满分；索引中没有的词项按只出现过一次的 idf 计入满分
+    index = LexicalIndex(["今天航班", "昨天人口", "机型统计"])
+    once = float(np.log1p((3 - 1 + 0.5) / 1.5))
+    assert np.isclose(index.max_score("今天航班"), 5 * once)
+    assert np.isclose(index.max_score("今天航班 xyz"), 6 * once)
+    shot_index = replace(_index(["今天航班", "昨天人口", "机型统计"], []), lexical=index)
+    assert np.isclose(shot_index.lexical_top_k("今天航班", 1)[0][1], 1.0)
+    assert np.isclose(shot_index.lexical_top_k("今天航班 xyz", 1)[0][1], 5 / 6)
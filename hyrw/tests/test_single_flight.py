@@ -0,0 +1,122 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+import app.models  # noqa: F401  注册所有表
+import app.services.single_flight as single_flight_module
+from app.core.config import settings
+from app.core.database import Base
+from app.models.ask_flight import AskFlight
+from app.services.single_flight import SingleFlight
+
+KEY = (1, "目前掌握台湾多少人")
+
+
+@pytest.fixture
+async def flights(tmp_path, monkeypatch):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'flights.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_local = async_sessionmaker(autocommit=False, autoflush=False, bind=engine, class_=AsyncSession)
+
+    async def run_sync_session(fn):
+        async with session_local() as session:
+            return await session.run_sync(fn)
+
+    monkeypatch.setattr(single_flight_module, "run_sync_session", run_sync_session)
+    monkeypatch.setattr(settings, "ASK_SINGLE_FLIGHT_LEASE_SECONDS", 30)
+    monkeypatch.setattr(settings, "ASK_SINGLE_FLIGHT_WAIT_SECONDS", 5)
+    monkeypatch.setattr(settings, "ASK_SINGLE_FLIGHT_POLL_SECONDS", 0.01)
+    # 两个实例相当于两个 worker 进程，共用同一个协调表
+    first, second = SingleFlight(), SingleFlight()
+    first.process_id, second.process_id = "worker-a:1", "worker-b:2"
+    yield first, second
+    await engine.dispose()
+
+
+async def _row(digest: str) -> AskFlight:
+    return await single_flight_module.run_sync_session(lambda db: db.get(AskFlight, digest))
+
+
+async def _expire(digest: str) -> None:
+    def save(db):
+        db.execute(
+            update(AskFlight)
+            .where(AskFlight.flight_key == digest)
+            .values(lease_until=datetime.utcnow() - timedelta(seconds=1))
+        )
+        db.commit()
+
+    await single_flight_module.run_sync_session(save)
+
+
+async def test_local_follower_receives_leader_result(flights):
+    flight, _ = flights
+    leader = await flight.acquire(KEY)
+    follower = await flight.acquire(KEY)
+    assert leader.is_leader and not follower.is_leader and follower.remote_owner is None
+
+    waiting = asyncio.create_task(follower.wait())
+    await leader.publish({"sql_generated": "SELECT 1"})
+    assert await waiting == {"sql_generated": "SELECT 1"}
+    row = await _row(leader.digest)
+    assert row.status == "done" and row.owner == leader.owner
+
+
+async def test_fail_after_publish_is_noop(flights):
+    flight, _ = flights
+    leader = await flight.acquire(KEY)
+    await leader.publish({"sql_generated": "SELECT 1"})
+    await leader.fail()
+    row = await _row(leader.digest)
+    assert row.status == "done" and row.result is not None
+    assert await leader.wait() == {"sql_generated": "SELECT 1"}
+    # 已结束的记录可以被下一次相同问题重新领取
+    again = await flight.acquire(KEY)
+    assert again.is_leader
+    await again.fail()
+
+
+async def test_follower_computes_itself_when_leader_fails(flights):
+    flight, other = flights
+    leader = await flight.acquire(KEY)
+    local = await flight.acquire(KEY)
+    remote = await other.acquire(KEY)
+    assert remote.remote_owner == leader.owner
+
+    waiting = [asyncio.create_task(local.wait()), asyncio.create_task(remote.wait())]
+    await leader.fail()
+    assert await asyncio.gather(*waiting) == [None, None]
+    assert (await _row(leader.digest)).status == "failed"
+
+
+async def test_remote_follower_stops_waiting_when_lease_expires(flights):
+    flight, other = flights
+    leader = await flight.acquire(KEY)
+    remote = await other.acquire(KEY)
+    waiting = asyncio.create_task(remote.wait())
+    await asyncio.sleep(0.05)
+    assert not waiting.done()
+
+    # 计算方所在进程退出，不再续约
+    await _expire(leader.digest)
+    assert await asyncio.wait_for(waiting, timeout=1) is None
+    await leader.fail()
+
+
+async def test_stale_claim_is_taken_over(flights):
+    flight, other = flights
+    stale = await flight.acquire(KEY)
+    await _expire(stale.digest)
+    takeover = await other.acquire(KEY)
+    assert takeover.is_leader and takeover.owner != stale.owner
+    # 原计算方之后发布的结果不覆盖新计算方的记录
+    await stale.publish({"sql_generated": "SELECT stale"})
+    row = await _row(stale.digest)
+    assert row.owner == takeover.owner and row.status == "running" and row.result is None
+
+    await takeover.publish({"sql_generated": "SELECT 2"})
+    assert (await _row(stale.digest)).status == "done"
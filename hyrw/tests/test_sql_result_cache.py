@@ -0,0 +1,99 @@
+from types import SimpleNamespace
+
+from app.services.sql_result_cache import (
+    SqlResultCache,
+    canonicalize_sql,
+    extract_table_names,
+    sql_fingerprint,
+)
+
+
+def _db_config(**kwargs):
+    values = {
+        "id": 1,
+        "type": "pg",
+        "ip": "127.0.0.1",
+        "port": 5432,
+        "database_name": "demo",
+        "schema_name": "public",
+        "username": "u",
+        "result_cache_ttl": 60,
+        "result_cache_freshness_check": False,
+    }
+    values.update(kwargs)
+    return SimpleNamespace(**values)
+
+
+def test_fingerprint_ignores_formatting_but_not_literals():
+    assert canonicalize_sql("SELECT  *\n FROM t -- c\n WHERE a = 'X';") == "select * from t where a = 'X'"
+    assert sql_fingerprint("select * from t where a='X'") == sql_fingerprint("SELECT *\nFROM t\nWHERE a='X';")
+    assert sql_fingerprint("select * from t where a='X'") != sql_fingerprint("select * from t where a='x'")
+
+
+def test_fingerprint_keeps_comment_markers_inside_literals():
+    assert canonicalize_sql("SELECT * FROM t WHERE code = 'A--1' /* c */") == "select * from t where code = 'A--1'"
+    assert sql_fingerprint("select * from t where code = 'A--1'") != sql_fingerprint("select * from t where code = 'A--2'")
+    assert sql_fingerprint("select * from t where code = '/*x*/1'") != sql_fingerprint("select * from t where code = '/*x*/2'")
+    # 各方言对反斜杠的解释不同，含反斜杠时不去注释
+    assert sql_fingerprint("select * from t where a = 'x\\'' -- 1'") != sql_fingerprint("select * from t where a = 'x\\'' -- 2'")
+
+
+def test_fingerprint_keeps_identifier_case():
+    # ClickHouse 的标识符区分大小写
+    assert canonicalize_sql("SELECT UserID FROM Events") == "select UserID from Events"
+    assert sql_fingerprint("select UserID from events") != sql_fingerprint("select userid from events")
+
+
+def test_extract_table_names():
+    sql = 'select * from public."t_person" p join db.t_org o on p.org_id = o.id'
+    assert extract_table_names(sql) == ["t_person", "t_org"]
+
+
+async def test_result_cache_hits_and_respects_freshness():
+    cache = SqlResultCache(max_bytes=1024, max_entry_bytes=1024)
+    calls = []
+    token = {"value": "v1"}
+
+    async def execute():
+        calls.append(1)
+        return [{"n": len(calls)}]
+
+    async def freshness(tables):
+        return token["value"]
+
+    cfg = _db_config(result_cache_freshness_check=True)
+    assert await cache.get_or_execute(cfg, "select count(*) from t", None, execute, freshness) == [{"n": 1}]
+    assert await cache.get_or_execute(cfg, "SELECT count(*) FROM t", None, execute, freshness) == [{"n": 1}]
+    token["value"] = "v2"
+    assert await cache.get_or_execute(cfg, "select count(*) from t", None, execute, freshness) == [{"n": 2}]
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["stale"] == 1
+
+
+async def test_result_cache_skips_disabled_ttl_and_writes():
+    cache = SqlResultCache(max_bytes=1024, max_entry_bytes=1024)
+    calls = []
+
+    async def execute():
+        calls.append(1)
+        return []
+
+    await cache.get_or_execute(_db_config(result_cache_ttl=0), "select 1", None, execute)
+    await cache.get_or_execute(_db_config(result_cache_ttl=0), "select 1", None, execute)
+    await cache.get_or_execute(_db_config(), "delete from t", None, execute)
+    await cache.get_or_execute(_db_config(), "delete from t", None, execute)
+    assert len(calls) == 4
+
+
+async def test_result_cache_evicts_by_bytes():
+    cache = SqlResultCache(max_bytes=200, max_entry_bytes=200)
+
+    async def execute():
+        return [{"v": "x" * 80}]
+
+    cfg = _db_config()
+    for index in range(3):
+        await cache.get_or_execute(cfg, f"select {index}", None, execute)
+    stats = cache.stats()
+    assert stats["bytes"] <= 200
+    assert stats["evictions"] >= 1
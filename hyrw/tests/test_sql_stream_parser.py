@@ -0,0 +1,26 @@
+from app.services.create_sql_agent import SqlStreamParser, parse_sql_response
+
+
+def _feed(text: str, size: int):
+    parser = SqlStreamParser()
+    ready_at = None
+    for i in range(0, len(text), size):
+        if parser.feed(text[i:i + size]) is not None and ready_at is None:
+            ready_at = i + size
+    return parser, ready_at
+
+
+def test_sql_ready_once_reason_marker_arrives_even_if_split():
+    text = "【SQL】\nSELECT 1 FROM t\n【理由】\n" + "理由" * 50
+    for size in (1, 2, 3, 7):
+        parser, ready_at = _feed(text, size)
+        assert parser.sql == "SELECT 1 FROM t"
+        assert ready_at is not None and ready_at < len(text) // 2
+        assert parser.result() == parse_sql_response(text)
+
+
+def test_falls_back_to_full_parse_without_reason_marker():
+    text = "```sql\nSELECT 2\n```"
+    parser, ready_at = _feed(text, 4)
+    assert ready_at is None
+    assert parser.result() == {"sql": "SELECT 2", "reason": ""}
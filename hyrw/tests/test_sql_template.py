@@ -0,0 +1,109 @@
+from datetime import date
+
+from app.services.sql_template import build_template, parse_date_expression
+
+
+FLIGHT_SQL = "SELECT COUNT(1) FROM f WHERE day_key = '2025-12-06' AND aircraft_model LIKE '%C-17%'"
+FLIGHT_CONDITIONS = [
+    {"field": "day_key", "operator": "eq", "value": "2025-12-06"},
+    {"field": "aircraft_model", "operator": "like", "value": "%C-17%"},
+]
+
+
+def test_fill_dates_and_codes():
+    template = build_template("2025-12-06 C-17 有多少航班", FLIGHT_SQL, FLIGHT_CONDITIONS)
+    assert template.fill("2025年12月7日 c-5 有多少航班？") == (
+        "SELECT COUNT(1) FROM f WHERE day_key = '2025-12-07' AND aircraft_model LIKE '%C-5%'"
+    )
+    assert "'2026-01-01'" in template.fill("昨天 C-130 有多少航班", today=date(2026, 1, 2))
+    # 问题其余部分不同时交给模型
+    assert template.fill("2025-12-06 C-17 有多少架飞机") is None
+
+
+def test_fill_text_slot_and_keeps_unanchored_values():
+    template = build_template(
+        "目前掌握六军团多少人",
+        "SELECT count(*) FROM t WHERE unit = '六军团' AND region = 'TW' AND age > 30",
+        [
+            {"field": "unit", "operator": "eq", "value": "六军团"},
+            {"field": "region", "operator": "eq", "value": "TW"},
+            {"field": "age", "operator": "gt", "value": 30},
+        ],
+    )
+    assert template.fill("目前掌握第八军团多少人") == (
+        "SELECT count(*) FROM t WHERE unit = '第八军团' AND region = 'TW' AND age > 30"
+    )
+    # 多个取值、引号都不直接填入
+    assert template.fill("目前掌握六军团和八军团多少人") is None
+    assert "'O''Neil'" in template.fill("目前掌握O'Neil多少人")
+
+
+def test_relative_date_surface_and_sql_format():
+    template = build_template(
+        "今天的航班数量",
+        "SELECT count(*) FROM f WHERE day_key = '20251206'",
+        [{"field": "day_key", "operator": "eq", "value": "20251206"}],
+    )
+    assert template.fill("前天的航班数量", today=date(2026, 1, 2)) == "SELECT count(*) FROM f WHERE day_key = '20251231'"
+    assert parse_date_expression("12月1日", today=date(2026, 3, 1)) == date(2026, 12, 1)
+
+
+def test_unusable_templates():
+    # 条件值在 SQL 中找不到、两个槽位之间没有固定文字、IN 列表
+    assert build_template("q", "SELECT 1", [{"field": "a", "value": "x"}]) is None
+    assert build_template(
+        "六军团七军团多少人",
+        "SELECT 1 WHERE a = '六军团' AND b = '七军团'",
+        [{"field": "a", "value": "六军团"}, {"field": "b", "value": "七军团"}],
+    ) is None
+    assert build_template("q", "SELECT 1 WHERE a IN ('x')", [{"field": "a", "operator": "in", "value": ["x"]}]) is None
+
+
+def test_number_slot_only_rewrites_the_field_comparison():
+    template = build_template(
+        "level为2的员工",
+        "SELECT name, round(score, 2) FROM emp WHERE e.level = 2 LIMIT 2",
+        [{"field": "level", "operator": "eq", "value": 2}],
+    )
+    assert template.fill("level为7的员工") == "SELECT name, round(score, 2) FROM emp WHERE e.level = 7 LIMIT 2"
+    # 同一字段的比较出现多处、或只在其他位置出现时不参数化
+    assert build_template(
+        "level为2的员工",
+        "SELECT 1 FROM emp WHERE level = 2 OR level = 2",
+        [{"field": "level", "operator": "eq", "value": 2}],
+    ) is None
+    assert build_template(
+        "前2名",
+        "SELECT name FROM emp ORDER BY score DESC LIMIT 2",
+        [{"field": "rank", "operator": "lte", "value": 2}],
+    ) is None
+
+
+def test_text_slot_rejects_backslash_and_control_characters():
+    template = build_template(
+        "查询单位是六军团的人数",
+        "SELECT count(*) FROM t WHERE unit = '六军团'",
+        [{"field": "unit", "operator": "eq", "value": "六军团"}],
+    )
+    assert template.fill("查询单位是x\\' or 1=1 --的人数") is None
+    assert template.fill("查询单位是x\x001的人数") is None
+    assert template.fill("查询单位是八军团的人数") == "SELECT count(*) FROM t WHERE unit = '八军团'"
+
+
+def test_text_slot_rejects_extra_words_unless_known_value():
+    template = build_template(
+        "目前掌握台湾多少人",
+        "SELECT count(*) FROM t WHERE region = '台湾'",
+        [{"field": "t.region", "operator": "eq", "value": "台湾"}],
+    )
+    # 非贪婪的文本槽位会吞入限定词，这些都应交给模型
+    assert template.fill("目前掌握台湾以外地区多少人") is None
+    assert template.fill("目前掌握不在台湾的多少人") is None
+    assert template.fill("目前掌握台湾男性多少人") is None
+    assert template.fill("目前掌握西藏自治区多少人") is None
+    assert template.fill("目前掌握上海多少人") == "SELECT count(*) FROM t WHERE region = '上海'"
+    # 字段的已知取值不受上述限制
+    known = {"region": {"西藏自治区"}}
+    assert template.fill(
+        "目前掌握西藏自治区多少人", known_values=lambda field: known.get(field.split(".")[-1], ())
+    ) == "SELECT count(*) FROM t WHERE region = '西藏自治区'"
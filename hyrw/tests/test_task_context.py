@@ -0,0 +1,124 @@
+from dataclasses import replace
+
+import pytest
+
+from app.services import task_context as task_context_module
+from app.services.generate_prompt import GeneratePrompt
+from app.services.task_context import (
+    FieldMetadataInfo,
+    FieldPromptInfo,
+    RelationInfo,
+    TableInfo,
+    TablePromptInfo,
+    TaskContext,
+    TaskContextStore,
+)
+
+
+def _prompt(prompt_id: int, table_name: str, metadata_id: int) -> TablePromptInfo:
+    return TablePromptInfo(
+        id=prompt_id,
+        table_name=table_name,
+        table_metadata_id=metadata_id,
+        table_description=f"{table_name} 描述",
+        query_scenarios=[],
+        aggregation_scenarios=[],
+        data_role=[],
+        usage_not_scenarios=[],
+    )
+
+
+def _context(version: int = 1) -> TaskContext:
+    return TaskContext(
+        task_id=1,
+        version=version,
+        db_type="postgresql",
+        tables=(
+            TableInfo(metadata_id=10, table_name="person", table_ddl="create table person()", table_row_count=100, table_description=None),
+            TableInfo(metadata_id=11, table_name="person", table_ddl="duplicate", table_row_count=1, table_description=None),
+            TableInfo(metadata_id=12, table_name="org", table_ddl="create table org()", table_row_count=5, table_description=None),
+        ),
+        prompts=(_prompt(1, "person", 10), _prompt(2, "org", 12), _prompt(3, "other", 13)),
+        relations=(
+            RelationInfo(1, 2, "org_id", "id", "many_to_one", None),
+            RelationInfo(1, 3, "id", "person_id", "one_to_many", None),
+        ),
+    )
+
+
+def test_lookup_uses_first_row_per_table_name():
+    context = _context()
+    assert context.table("person").metadata_id == 10
+    assert context.table_by_id(11).table_ddl == "duplicate"
+    assert context.prompt("org").id == 2
+    assert context.table("missing") is None
+
+
+def test_relationships_only_between_requested_tables():
+    relations = _context().relationships(["person", "org"])
+    assert relations == [{
+        "source_table": "person",
+        "target_table": "org",
+        "source_field": "org_id",
+        "target_field": "id",
+        "relation_type": "many_to_one",
+        "description": None,
+    }]
+    prompt = GeneratePrompt(_context()).build_table_relationship_prompt(["person", "org"])
+    assert "person.org_id = org.id" in prompt
+
+
+async def test_store_reloads_only_when_version_changes(monkeypatch):
+    loads = []
+
+    async def fake_run_sync_session(fn):
+        return fn(None)
+
+    def fake_load(db, task_id):
+        loads.append(task_id)
+        return _context(version=len(loads))
+
+    monkeypatch.setattr(task_context_module, "run_sync_session", fake_run_sync_session)
+    monkeypatch.setattr(task_context_module, "load_task_context", fake_load)
+    store = TaskContextStore(max_tasks=4)
+
+    first = await store.get(1, version=1)
+    assert await store.get(1, version=1) is first
+    assert len(loads) == 1
+
+    second = await store.get(1, version=2)
+    assert second.version == 2
+    assert len(loads) == 2
+    assert store.stats()["hits"] == 1
+
+
+def test_snapshot_is_immutable():
+    context = _context()
+    with pytest.raises(AttributeError):
+        context.version = 2
+
+
+def test_column_values_collects_samples():
+    context = TaskContext(
+        task_id=1,
+        version=1,
+        db_type="postgresql",
+        tables=(
+            TableInfo(
+                metadata_id=10,
+                table_name="person",
+                table_ddl=None,
+                table_row_count=None,
+                table_description=None,
+                samples=('[{"region": "台湾", "age": 30}, {"Region": "上海"}]',),
+                fields=(FieldMetadataInfo("region", "text", '["北京", null]', None, None),),
+            ),
+        ),
+        prompts=(replace(_prompt(1, "person", 10), fields=(
+            FieldPromptInfo("region", None, None, None, None, None, None, None, None, ["西藏自治区", True]),
+        )),),
+        relations=(),
+    )
+    assert context.column_values("p.region") == {"台湾", "上海", "北京", "西藏自治区"}
+    assert context.column_values("age") == {"30"}
+    assert context.column_values("missing") == frozenset()
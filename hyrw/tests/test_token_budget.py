@@ -0,0 +1,102 @@
+import json
+
+from app.core.config import settings
+from app.devtools.mock_llm import run_mock_llm_server
+from app.models.llm_config import LlmConfig
+from app.services.openai_service import OpenAIService
+from app.services.token_budget import (
+    OutputTokenStats,
+    TokenBudget,
+    TokenCalibration,
+    estimate_message_tokens,
+    output_token_stats,
+    token_calibration,
+)
+
+
+def _messages(payload):
+    return [{"role": "user", "content": "x" * (payload["rows"] * 400)}]
+
+
+def _halve_rows(payload):
+    if payload["rows"] <= 1:
+        return None
+    return {"rows": payload["rows"] // 2}
+
+
+def test_fit_trims_locally_until_prompt_and_completion_fit(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_CONTEXT_SAFETY_MARGIN", 0.0)
+    monkeypatch.setattr(settings, "LLM_MIN_COMPLETION_TOKENS", 512)
+    budget = TokenBudget(context_window=4096, max_tokens=1024)
+
+    fitted = budget.fit({"rows": 16}, _messages, [_halve_rows])
+    assert fitted.fits
+    assert fitted.trimmed == 0
+    assert fitted.max_tokens == 1024
+
+    # 裁剪到放得下为止；补全空间不足 max_tokens 时收缩补全上限
+    fitted = budget.fit({"rows": 64}, _messages, [_halve_rows])
+    assert fitted.fits
+    assert fitted.payload == {"rows": 32}
+    assert fitted.trimmed == 1
+    assert fitted.max_tokens == 4096 - fitted.prompt_tokens
+
+
+def test_fit_reports_when_nothing_left_to_trim(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_CONTEXT_SAFETY_MARGIN", 0.0)
+    budget = TokenBudget(context_window=1024, max_tokens=512)
+    fitted = budget.fit({"rows": 8}, _messages, [lambda payload: None])
+    assert not fitted.fits
+    assert fitted.payload == {"rows": 8}
+
+
+def test_calibration_scales_estimates_per_model(monkeypatch):
+    calibration = TokenCalibration(alpha=0.5)
+    calibration.observe("m", estimated=100, actual=150)
+    assert calibration.ratio("m") == 1.5
+    calibration.observe("m", estimated=100, actual=100)
+    assert calibration.ratio("m") == 1.25
+    assert calibration.ratio("other") == 1.0
+
+    monkeypatch.setattr(token_calibration, "_ratios", {"m": 2.0})
+    messages = [{"role": "user", "content": "abcd" * 100}]
+    assert TokenBudget(context_window=4096, max_tokens=None, model="m").prompt_tokens(messages) == (
+        estimate_message_tokens(messages) * 2 + 1
+    )
+
+
+def test_output_token_stats_suggests_high_percentile_with_margin(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_ADAPTIVE_MAX_TOKENS_MIN_SAMPLES", 10)
+    monkeypatch.setattr(settings, "LLM_ADAPTIVE_MAX_TOKENS_PERCENTILE", 90)
+    monkeypatch.setattr(settings, "LLM_ADAPTIVE_MAX_TOKENS_MARGIN", 0.5)
+    monkeypatch.setattr(settings, "LLM_ADAPTIVE_MAX_TOKENS_FLOOR", 100)
+    stats = OutputTokenStats(window=100)
+    for value in range(1, 10):
+        stats.observe("create_sql", value * 100)
+    # 样本不足时按调用方的上限
+    assert stats.suggest("create_sql", 4096) == 4096
+
+    stats.observe("create_sql", 1000)
+    assert stats.suggest("create_sql", 4096) == 1350
+    assert stats.suggest("create_sql", 1024) == 1024
+    assert stats.stats()["create_sql"]["histogram"] == {"128": 1, "256": 1, "512": 3, "1024": 5}
+
+
+async def test_truncated_adaptive_call_retries_at_cap(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_ADAPTIVE_MAX_TOKENS_FLOOR", 1)
+    monkeypatch.setattr(output_token_stats, "_samples", {})
+    monkeypatch.setattr(output_token_stats, "_retries", {})
+    for _ in range(settings.LLM_ADAPTIVE_MAX_TOKENS_MIN_SAMPLES):
+        output_token_stats.observe("select_table", 4)
+
+    messages = [
+        {"role": "system", "content": "你是一个严谨的数据分析选表助手。"},
+        {"role": "user", "content": "用户问题:\nt_org 有多少\n候选表:\n1. table_name=t_org"},
+    ]
+    with run_mock_llm_server() as base_url:
+        service = OpenAIService(LlmConfig(id=None, base_url=base_url, api_key="k", model_name="m"))
+        response = await service.async_chat_completion(messages, max_tokens=1024, call_site="select_table")
+
+    assert response.choices[0].finish_reason == "stop"
+    assert json.loads(response.choices[0].message.content)["selected_tables"] == ["t_org"]
+    assert output_token_stats.stats()["select_table"]["retries"] == 1
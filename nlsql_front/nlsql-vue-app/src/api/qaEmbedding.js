@@ -61,13 +61,20 @@ export function importQaEmbedding(data) {
   })
 }
 
-// AI 生成 where 条件
+// AI 生成 where 条件（提交后台任务）
 export function generateQaWhereConditions(data) {
   return request({
     url: '/qa-embedding/generate-where-conditions',
     method: 'post',
-    data,
-    timeout: 180000
+    data
+  })
+}
+
+// 查询问答对后台任务进度
+export function getQaEmbeddingJob(jobId) {
+  return request({
+    url: `/qa-embedding/jobs/${jobId}`,
+    method: 'get'
   })
 }
 